@@ -0,0 +1,71 @@
+"""
+Command-line client for POST /invoke/batch.
+
+Streams an NDJSON file (one /invoke request body per line) to the backend
+and prints per-item results as the server finishes them.
+
+    python -m backend.batch_invoke transcripts.ndjson
+    cat transcripts.ndjson | python -m backend.batch_invoke - --url http://localhost:8000
+"""
+import argparse
+import json
+import sys
+import time
+
+import requests
+
+
+def _read_lines(path: str):
+    handle = sys.stdin.buffer if path == "-" else open(path, "rb")
+    try:
+        for line in handle:
+            if line.strip():
+                yield line if line.endswith(b"\n") else line + b"\n"
+    finally:
+        if handle is not sys.stdin.buffer:
+            handle.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-ingest transcripts through /invoke/batch")
+    parser.add_argument("path", help="NDJSON file of /invoke request bodies, or - for stdin")
+    parser.add_argument("--url", default="http://localhost:8000", help="Backend base URL")
+    parser.add_argument("--timeout", type=float, default=None, help="Read timeout in seconds")
+    parser.add_argument("--quiet", action="store_true", help="Only print the summary")
+    args = parser.parse_args()
+
+    counts = {"enqueued": 0, "duplicate": 0, "error": 0}
+    started = time.perf_counter()
+    with requests.post(
+        f"{args.url.rstrip('/')}/invoke/batch",
+        data=_read_lines(args.path),
+        headers={"Content-Type": "application/x-ndjson"},
+        stream=True,
+        timeout=(10, args.timeout),
+    ) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            item = json.loads(line)
+            if "error" in item:
+                counts["error"] += 1
+            elif item.get("enqueued"):
+                counts["enqueued"] += 1
+            else:
+                counts["duplicate"] += 1
+            if not args.quiet:
+                print(json.dumps(item))
+
+    elapsed = time.perf_counter() - started
+    total = sum(counts.values())
+    rate = total / elapsed if elapsed else 0.0
+    print(
+        f"[batch_invoke] {total} item(s) in {elapsed:.1f}s ({rate:.2f}/s): "
+        f"{counts['enqueued']} enqueued, {counts['duplicate']} duplicate, {counts['error']} error",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
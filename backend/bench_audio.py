@@ -0,0 +1,113 @@
+"""
+Before/after benchmark for the audio preprocessing in transcribe_audio.
+
+For each clip it reports the base64 payload size sent to the model as the raw
+WAV, then after preprocessing with each codec. It also reports how long the
+preprocessing takes and the estimated upload time at --uplink-mbps. Clips are
+WAV files given on the command line or, by default, synthetic calls: voiced
+bursts with silence around them, at Twilio's 8 kHz mono and at higher
+rates/stereo. With --live, each clip is also transcribed through OpenRouter
+with preprocessing off and on (needs OPENROUTER_API_KEY).
+
+    python -m backend.bench_audio
+    python -m backend.bench_audio call1.wav call2.wav --live --repeat 3
+"""
+import argparse
+import asyncio
+import base64
+import contextlib
+import io
+import statistics
+import time
+import wave
+from pathlib import Path
+
+import numpy as np
+
+from backend import transcribe_audio
+
+CODECS = ("wav", "mulaw")
+
+
+def _synthetic_call(rate: int, channels: int, lead: float, speech: float, tail: float, seed: int = 0) -> bytes:
+    """Harmonic 'speech' with a syllable-rate envelope, surrounded by low-level line noise."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(speech * rate)) / rate
+    f0 = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / rate
+    voice = sum(np.sin(k * phase) / k for k in range(1, 12))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t), 0, None) ** 0.5
+    voice = 0.25 * voice * envelope / np.max(np.abs(voice))
+    signal = np.concatenate([np.zeros(int(lead * rate)), voice, np.zeros(int(tail * rate))])
+    signal += rng.normal(0, 10 ** (-65 / 20), len(signal))  # about -65 dBFS of line noise
+    pcm = (np.clip(signal, -1, 1) * 32767).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(np.repeat(pcm[:, None], channels, axis=1).tobytes())
+    return buffer.getvalue()
+
+
+def _default_clips() -> dict:
+    return {
+        "8k mono 2.5+6+4s": _synthetic_call(8000, 1, 2.5, 6, 4),
+        "16k mono 1+10+1s": _synthetic_call(16000, 1, 1, 10, 1, seed=1),
+        "44.1k stereo 3+8+5s": _synthetic_call(44100, 2, 3, 8, 5, seed=2),
+    }
+
+
+def _upload_ms(payload_bytes: int, uplink_mbps: float) -> float:
+    return payload_bytes * 8 / (uplink_mbps * 1e6) * 1000
+
+
+async def _live_latency(audio: bytes, preprocess: bool, repeat: int) -> float:
+    transcribe_audio.TRANSCRIBE_PREPROCESS = preprocess
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            await transcribe_audio.transcribe_audio_bytes(audio, "00:00")
+        latencies.append(time.perf_counter() - started)
+    return statistics.median(latencies)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Measure upload size and time saved by audio preprocessing")
+    parser.add_argument("paths", nargs="*", help="WAV clips (default: synthetic calls)")
+    parser.add_argument("--uplink-mbps", type=float, default=10.0)
+    parser.add_argument("--live", action="store_true", help="Also time real transcriptions (uses OpenRouter)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    clips = {Path(path).name: Path(path).read_bytes() for path in args.paths} or _default_clips()
+    print(
+        f"{'clip':>22} | {'codec':>5} | {'b64 before':>10} | {'b64 after':>9} | {'saved':>6} | "
+        f"{'trim s':>6} | {'prep ms':>7} | {'upload ms':>15}"
+    )
+    for name, audio in clips.items():
+        before = len(base64.b64encode(audio))
+        for codec in CODECS:
+            transcribe_audio.TRANSCRIBE_AUDIO_CODEC = codec
+            started = time.perf_counter()
+            data, _, trimmed, _, _ = transcribe_audio.preprocess_audio(audio)
+            prep_ms = (time.perf_counter() - started) * 1000
+            after = len(base64.b64encode(data))
+            print(
+                f"{name:>22} | {codec:>5} | {before:>10} | {after:>9} | {1 - after / before:>6.1%} | "
+                f"{trimmed:>6.2f} | {prep_ms:>7.2f} | "
+                f"{_upload_ms(before, args.uplink_mbps):>6.0f} -> {_upload_ms(after, args.uplink_mbps):>5.0f}"
+            )
+
+    if args.live:
+        print(f"\n{'clip':>22} | {'raw s':>6} | {'prepped s':>9}")
+        for name, audio in clips.items():
+            raw = await _live_latency(audio, False, args.repeat)
+            prepped = await _live_latency(audio, True, args.repeat)
+            print(f"{name:>22} | {raw:>6.2f} | {prepped:>9.2f}")
+        await transcribe_audio.aclose_http_client()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,162 @@
+"""
+Benchmark the Redis side of enqueue and duplicate-merge.
+
+Compares issuing every command as its own awaited round trip (how enqueue_node
+used to work) with the pipelined/transactional batches in triage_queue.py.
+Reports round trips per operation, throughput and latency at several
+concurrency levels. Runs against REDIS_HOST/REDIS_PORT on a separate database
+(default 15), which is flushed first.
+
+    python -m backend.bench_enqueue --ops 2000 --concurrency 1 16 64
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import ulid
+
+from backend import incident_store, postal_geo, triage_queue
+from backend.incident_events import INCIDENT_EVENTS_KEY
+from backend.incident_store import TRIAGE_FULL_PAYLOADS_KEY, TRIAGE_HOT_ORDER_KEY
+from backend.leases import TRIAGE_LEASES_KEY
+from backend.redis_client import create_client
+from backend.triage_queue import TRIAGE_QUEUE_KEY, enqueued_at_key
+from backend.serialization import dumps, loads
+
+LOCATIONS = ["M5V2T6", "M5H2N2", "V6B4Y8", "H2Y1B6", "K1P1J1", "T2P2V6"]
+
+
+class RoundTripCounter:
+    """Count commands and pipeline executions sent through a client."""
+
+    def __init__(self, client):
+        self.count = 0
+        execute_command = client.execute_command
+        make_pipeline = client.pipeline
+
+        async def counted_command(*args, **kwargs):
+            self.count += 1
+            return await execute_command(*args, **kwargs)
+
+        def counted_pipeline(*args, **kwargs):
+            pipe = make_pipeline(*args, **kwargs)
+            execute = pipe.execute
+
+            async def counted_execute(*e_args, **e_kwargs):
+                self.count += 1
+                return await execute(*e_args, **e_kwargs)
+
+            pipe.execute = counted_execute
+            return pipe
+
+        client.execute_command = counted_command
+        client.pipeline = counted_pipeline
+
+
+def _entry(incident_id: str, i: int, callers: int = 1) -> bytes:
+    return dumps({
+        "id": incident_id, "incidentType": "Fire", "location": LOCATIONS[i % len(LOCATIONS)],
+        "time": "14:30", "severity_level": str(1 + i % 3),
+        "suggested_actions": "dispatch firefighters", "callers": callers, "provisional": False,
+    })
+
+
+async def sequential_enqueue(client, incident_id: str, i: int) -> None:
+    now = time.time()
+    member = _entry(incident_id, i)
+    lat, lon = postal_geo.postal_centroids.lookup(LOCATIONS[i % len(LOCATIONS)]) or (0.0, 0.0)
+    await client.zadd(TRIAGE_QUEUE_KEY, {member: now})
+    await client.hset(enqueued_at_key(TRIAGE_QUEUE_KEY), incident_id, now)
+    await client.geoadd(postal_geo.TRIAGE_GEO_KEY, (lon, lat, incident_id))
+    await client.zcard(TRIAGE_QUEUE_KEY)
+    await client.hset(TRIAGE_FULL_PAYLOADS_KEY, incident_id, member)
+    await client.zadd(TRIAGE_HOT_ORDER_KEY, {incident_id: now}, nx=True)
+
+
+async def pipelined_enqueue(client, incident_id: str, i: int) -> None:
+    now = time.time()
+    member = _entry(incident_id, i)
+    async with client.pipeline(transaction=True) as pipe:
+        triage_queue.stage_replace(pipe, incident_id, None, member, now, now)
+        postal_geo.stage_index_incident(pipe, incident_id, LOCATIONS[i % len(LOCATIONS)])
+        incident_store.stage_put_hot(pipe, incident_id, member)
+        pipe.zcard(TRIAGE_QUEUE_KEY)
+        await pipe.execute()
+
+
+async def sequential_merge(client, incident_id: str, i: int) -> None:
+    for raw_entry, score in await client.zrange(TRIAGE_QUEUE_KEY, 0, -1, withscores=True):
+        entry = loads(raw_entry)
+        if entry["id"] != incident_id:
+            continue
+        await client.zrem(TRIAGE_QUEUE_KEY, raw_entry)
+        await client.zadd(TRIAGE_QUEUE_KEY, {_entry(incident_id, i, entry["callers"] + 1): score - 300})
+        await client.hset(enqueued_at_key(TRIAGE_QUEUE_KEY), incident_id, score)
+        break
+    payload = await client.hget(TRIAGE_FULL_PAYLOADS_KEY, incident_id)
+    if payload is not None and await client.hexists(TRIAGE_FULL_PAYLOADS_KEY, incident_id):
+        await client.hset(TRIAGE_FULL_PAYLOADS_KEY, incident_id, payload)
+
+
+async def pipelined_merge(client, incident_id: str, i: int) -> None:
+    # Atomic caller increment over the entry and hot payload, then the re-score (as in main.py)
+    async with client.pipeline(transaction=True) as pipe:
+        triage_queue.stage_add_caller(
+            pipe, incident_id, TRIAGE_FULL_PAYLOADS_KEY, INCIDENT_EVENTS_KEY, TRIAGE_LEASES_KEY,
+            [TRIAGE_QUEUE_KEY], 1, time.time(),
+        )
+        _, found = triage_queue.parse_added_caller((await pipe.execute())[0])
+    if found is not None:
+        await client.zadd(TRIAGE_QUEUE_KEY, {found[0]: found[1] - 300}, xx=True)
+
+
+async def _run(op, client, ids: list, concurrency: int) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int, incident_id: str):
+        async with semaphore:
+            started = time.perf_counter()
+            await op(client, incident_id, i)
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one(i, incident_id) for i, incident_id in enumerate(ids)))
+    return latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark enqueue/merge round trips")
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--db", type=int, default=15, help="Redis database to use (flushed)")
+    args = parser.parse_args()
+
+    print(f"{'mode':>10} | {'op':>7} | {'conc':>4} | {'rtt/op':>6} | {'ops/s':>8} | {'p50 ms':>7} | {'p99 ms':>7}")
+    for concurrency in args.concurrency:
+        for mode, enqueue, merge in (
+            ("sequential", sequential_enqueue, sequential_merge),
+            ("pipelined", pipelined_enqueue, pipelined_merge),
+        ):
+            client = create_client(decode_responses=False, db=args.db)
+            await client.flushdb()
+            counter = RoundTripCounter(client)
+            ids = [str(ulid.new()) for _ in range(args.ops)]
+            for name, op in (("enqueue", enqueue), ("merge", merge)):
+                counter.count = 0
+                started = time.perf_counter()
+                latencies = await _run(op, client, ids, concurrency)
+                elapsed = time.perf_counter() - started
+                latencies.sort()
+                print(
+                    f"{mode:>10} | {name:>7} | {concurrency:>4} | {counter.count / len(ids):>6.1f} | "
+                    f"{len(ids) / elapsed:>8.0f} | {statistics.median(latencies) * 1000:>7.2f} | "
+                    f"{latencies[int(len(latencies) * 0.99) - 1] * 1000:>7.2f}"
+                )
+            await client.flushdb()
+            await client.aclose()
+            await client.connection_pool.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
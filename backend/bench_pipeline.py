@@ -0,0 +1,159 @@
+"""
+Benchmark time-to-queue of the triage graph.
+
+Runs the pipeline against a stand-in LLM that answers each agent prompt with
+valid JSON after --llm-ms (± --jitter-ms, or lognormal with --tail-sigma).
+The duplicate search is a stub that takes --search-ms. The clock stops when
+the enqueue node is reached. The enqueue node itself is replaced, so neither
+Redis nor Pinecone is touched.
+Two graphs are compared:
+
+  linear  call_agent -> assessment_agent -> triage_agent -> enqueue, with the
+          duplicate search run inside enqueue (the old topology)
+  dag     the graph built by main._compile_graphs: assessment and triage in
+          parallel, duplicate search overlapping with triage
+
+With --hedge, the DAG is run again with hedged LLM calls (hedging.py) to
+show the effect on the tail; use it with --tail-sigma.
+
+    python -m backend.bench_pipeline --runs 50 --llm-ms 600 --search-ms 250
+    python -m backend.bench_pipeline --runs 200 --tail-sigma 0.8 --hedge
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import random
+import statistics
+import time
+
+from backend import main
+from backend.hedging import llm_hedger
+
+_CALL_AGENT_REPLY = {"incidentType": "Fire", "location": "M5V2T6", "date": "1/10/2026", "time": "14:30"}
+_ASSESSMENT_REPLY = {"desc": "Kitchen fire spreading to the hallway, residents evacuating",
+                     "suggested_actions": "dispatch firefighters"}
+_TRIAGE_REPLY = {"severity_level": "2"}
+
+
+class StandInModel:
+    """Answers the three agent prompts with fixed JSON after a simulated delay."""
+
+    def __init__(self, latency: float, jitter: float, tail_sigma: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.tail_sigma = tail_sigma
+        self.calls = 0
+
+    def _delay(self) -> float:
+        if self.tail_sigma:
+            # Median `latency`, long right tail
+            return random.lognormvariate(math.log(self.latency), self.tail_sigma)
+        return max(self.latency + random.uniform(-self.jitter, self.jitter), 0.0)
+
+    async def ainvoke(self, prompt: str):
+        self.calls += 1
+        await asyncio.sleep(self._delay())
+        if "Extract the following information" in prompt:
+            reply = _CALL_AGENT_REPLY
+        elif "Classify the severity" in prompt:
+            reply = _TRIAGE_REPLY
+        else:
+            reply = _ASSESSMENT_REPLY
+        return type("Reply", (), {"content": json.dumps(reply)})()
+
+
+def _graphs(search_seconds: float, reached: dict) -> dict:
+    from langgraph.graph import StateGraph, START, END
+
+    def fake_search(*args, **kwargs):
+        time.sleep(search_seconds)
+        return []
+
+    async def linear_enqueue(state):
+        # The old enqueue_node searched for duplicates before writing
+        await asyncio.to_thread(fake_search)
+        reached[state["incident_id"]] = time.perf_counter()
+        return {}
+
+    async def dag_enqueue(state):
+        reached[state["incident_id"]] = time.perf_counter()
+        return {}
+
+    main.find_similar_incidents = fake_search
+    main.enqueue_node = dag_enqueue
+    dag = main._compile_graphs()["triage"]
+
+    linear = StateGraph(state_schema=main.AgentState)
+    for name, node in (
+        ("call_agent", main.call_agent_node), ("assessment_agent", main.assessment_agent_node),
+        ("triage_agent", main.triage_agent_node), ("finalize_triage", main.finalize_triage_node),
+        ("enqueue", linear_enqueue),
+    ):
+        linear.add_node(name, node)
+    linear.add_edge(START, "call_agent")
+    linear.add_edge("call_agent", "assessment_agent")
+    linear.add_edge("assessment_agent", "triage_agent")
+    linear.add_edge("triage_agent", "finalize_triage")
+    linear.add_edge("finalize_triage", "enqueue")
+    linear.add_edge("enqueue", END)
+    return {"linear": linear.compile(), "dag": dag}
+
+
+async def _run(graph, reached: dict, runs: int, concurrency: int) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int):
+        async with semaphore:
+            incident_id = f"bench-{i}"
+            started = time.perf_counter()
+            await graph.ainvoke({
+                "incident_id": incident_id,
+                "transcript": {"text": "There's a fire in my kitchen", "time": "14:30",
+                               "location": "M5V2T6", "duration": "00:42"},
+            })
+            latencies.append(reached.pop(incident_id) - started)
+
+    await asyncio.gather(*(one(i) for i in range(runs)))
+    return latencies
+
+
+async def main_async():
+    parser = argparse.ArgumentParser(description="Compare time-to-queue of the linear and parallel triage graphs")
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16])
+    parser.add_argument("--llm-ms", type=float, default=600.0)
+    parser.add_argument("--jitter-ms", type=float, default=100.0)
+    parser.add_argument("--search-ms", type=float, default=250.0)
+    parser.add_argument("--tail-sigma", type=float, default=0.0, help="Lognormal LLM latency with this sigma")
+    parser.add_argument("--hedge", action="store_true", help="Also run the DAG with hedged LLM calls")
+    args = parser.parse_args()
+
+    reached: dict = {}
+    graphs = _graphs(args.search_ms / 1000, reached)
+    if args.hedge:
+        graphs["hedged"] = graphs["dag"]
+    model = StandInModel(args.llm_ms / 1000, args.jitter_ms / 1000, args.tail_sigma)
+    # Same stand-in for every tier; its replies agree with the routing rules, so nothing escalates
+    main._models.update({tier: model for tier in main.model_router.TIERS})
+
+    print(f"{'graph':>6} | {'conc':>4} | {'llm/run':>7} | {'p50 ms':>7} | {'p99 ms':>7}")
+    for concurrency in args.concurrency:
+        for name, graph in graphs.items():
+            model.calls = 0
+            llm_hedger.enabled = name == "hedged"
+            with contextlib.redirect_stdout(io.StringIO()):
+                latencies = await _run(graph, reached, args.runs, concurrency)
+            latencies.sort()
+            print(
+                f"{name:>6} | {concurrency:>4} | {model.calls / args.runs:>7.1f} | "
+                f"{statistics.median(latencies) * 1000:>7.0f} | "
+                f"{latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000:>7.0f}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main_async())
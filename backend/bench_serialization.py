@@ -0,0 +1,68 @@
+"""
+Benchmark for the JSON serialization layer on /queue-sized payloads.
+
+Compares the old path (stdlib json.loads per ZSET member, then FastAPI
+re-encoding the list) with the serialization module (active backend, bytes
+end to end) for queue sizes from 1k to 50k entries. No Redis needed.
+
+    python -m backend.bench_serialization
+"""
+import json
+import random
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+from backend import serialization
+
+QUEUE_SIZES = [1_000, 5_000, 10_000, 50_000]
+INCIDENT_TYPES = ["Fire", "Theft", "Break In", "Armed Robbery", "Public Nuisance"]
+ACTIONS = ["dispatch firefighters", "dispatch officer", "console", "ask for more details"]
+
+
+def _sample_entry(i: int) -> dict:
+    return {
+        "id": f"01H8X{i:021d}",
+        "incidentType": random.choice(INCIDENT_TYPES),
+        "location": "M5V2T6",
+        "time": f"{random.randint(0, 23):02d}:{random.randint(0, 59):02d}",
+        "severity_level": random.choice(["1", "2", "3"]),
+        "suggested_actions": random.choice(ACTIONS),
+        "callers": random.randint(1, 5),
+    }
+
+
+def _timed(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def run():
+    print(f"[bench] serializer backend: {serialization.SERIALIZER_BACKEND}")
+    print(f"{'entries':>8} | {'stdlib decode+encode ms':>24} | {'backend decode+encode ms':>25} | {'raw join ms':>11}")
+    for size in QUEUE_SIZES:
+        entries = [_sample_entry(i) for i in range(size)]
+        stdlib_members = [json.dumps(e).encode("utf-8") for e in entries]
+        members = [serialization.dumps(e) for e in entries]
+
+        def old_path():
+            decoded = [json.loads(m) for m in stdlib_members]
+            json.dumps(jsonable_encoder(decoded)).encode("utf-8")
+
+        def backend_path():
+            serialization.dumps([serialization.loads(m) for m in members])
+
+        def raw_path():
+            b"[" + b",".join(members) + b"]"
+
+        print(
+            f"{size:>8} | {_timed(old_path):>24.2f} | {_timed(backend_path):>25.2f} | {_timed(raw_path):>11.2f}"
+        )
+
+
+if __name__ == "__main__":
+    run()
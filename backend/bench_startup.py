@@ -0,0 +1,72 @@
+"""
+Measure backend cold start.
+
+Imports backend.main in fresh interpreters and reports the median import
+time. Each child process blocks outgoing connections, so the run also fails
+if importing opens a network connection (Pinecone, Gemini, Redis). With
+--warm, the startup warm-up (model, graphs, Pinecone index, postal table) is
+timed afterwards with the network allowed; that needs real credentials.
+
+    python -m backend.bench_startup --runs 5
+    python -m backend.bench_startup --warm
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+_IMPORT_CHILD = """
+import socket, time
+
+def _no_network(self, address):
+    raise RuntimeError(f"network connection to {address} during import")
+
+socket.socket.connect = _no_network
+socket.socket.connect_ex = _no_network
+started = time.perf_counter()
+import backend.main
+print(time.perf_counter() - started)
+"""
+
+_WARM_CHILD = """
+import time
+started = time.perf_counter()
+import backend.main
+imported = time.perf_counter()
+backend.main._warm_up()
+print(imported - started, time.perf_counter() - imported)
+"""
+
+
+def _run_child(code: str) -> list:
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=Path(__file__).resolve().parent.parent,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        raise SystemExit(f"[bench_startup] child process failed (exit {result.returncode})")
+    return [float(value) for value in result.stdout.strip().splitlines()[-1].split()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure backend import and warm-up time")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warm", action="store_true", help="Also time the startup warm-up (uses the network)")
+    args = parser.parse_args()
+
+    import_times = [_run_child(_IMPORT_CHILD)[0] for _ in range(args.runs)]
+    print(
+        f"[bench_startup] import backend.main: median {statistics.median(import_times) * 1000:.0f} ms, "
+        f"max {max(import_times) * 1000:.0f} ms over {args.runs} run(s), no network access"
+    )
+    if args.warm:
+        imported, warmed = _run_child(_WARM_CHILD)
+        print(f"[bench_startup] import {imported * 1000:.0f} ms + warm-up {warmed * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
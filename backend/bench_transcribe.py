@@ -0,0 +1,174 @@
+"""
+Benchmark per-recording HTTP overhead in transcribe_audio.
+
+Starts a local fake Twilio/OpenRouter server (HTTPS with a throwaway
+self-signed certificate, made with the openssl CLI) and transcribes the same
+recording repeatedly in two ways:
+
+  legacy  requests.get + requests.post per recording, re-reading example.json
+          (how transcribe_url used to work)
+  pooled  transcribe_audio.transcribe_url on the shared async client
+
+The fake model answers immediately (or after --model-latency-ms), so the
+numbers are the overhead around the model call. The server counts distinct
+client connections.
+
+    python -m backend.bench_transcribe --recordings 200 --concurrency 1 8
+"""
+import argparse
+import asyncio
+import base64
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import requests
+import uvicorn
+from fastapi import FastAPI, Request, Response
+
+from backend import transcribe_audio
+
+EXAMPLE_CONTENT = (Path(__file__).resolve().parent / "example.json").read_text(encoding="utf-8")
+
+
+def _fake_app(recording: bytes, model_latency: float, client_ports: set) -> FastAPI:
+    app = FastAPI()
+
+    @app.middleware("http")
+    async def count_connections(request: Request, call_next):
+        client_ports.add(request.client.port)
+        return await call_next(request)
+
+    @app.get("/recording.wav")
+    async def get_recording():
+        return Response(content=recording, media_type="audio/wav")
+
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request):
+        await request.body()
+        if model_latency:
+            await asyncio.sleep(model_latency)
+        return {"choices": [{"message": {"content": EXAMPLE_CONTENT}}]}
+
+    return app
+
+
+def _self_signed_cert(directory: str) -> tuple:
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-keyout", key, "-out", cert, "-subj", "/CN=localhost",
+         "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1"],
+        check=True, capture_output=True,
+    )
+    return cert, key
+
+
+def _legacy_transcribe_url(src: str, url: str, call_start_time: str, verify) -> dict:
+    resp = requests.get(src, timeout=30, verify=verify)
+    resp.raise_for_status()
+    example_json = (Path(__file__).resolve().parent / "example.json").read_text(encoding="utf-8").strip()
+    payload = {
+        "model": transcribe_audio.TRANSCRIBE_MODEL,
+        "messages": [{"role": "user", "content": [
+            {"type": "text", "text": f"Example: {example_json}. Start: {call_start_time}"},
+            {"type": "input_audio", "input_audio": {"data": base64.b64encode(resp.content).decode("utf-8"), "format": "wav"}},
+        ]}],
+    }
+    response = requests.post(url, headers={"Content-Type": "application/json"}, json=payload, verify=verify)
+    return json.loads(response.json()["choices"][0]["message"]["content"])
+
+
+async def _run_legacy(src: str, url: str, verify, recordings: int, concurrency: int) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await asyncio.to_thread(_legacy_transcribe_url, src, url, "00:00", verify)
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one() for _ in range(recordings)))
+    return latencies
+
+
+async def _run_pooled(src: str, recordings: int, concurrency: int) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await transcribe_audio.transcribe_url(src, "00:00")
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one() for _ in range(recordings)))
+    return latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark transcription HTTP overhead against a fake server")
+    parser.add_argument("--recordings", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--recording-kb", type=int, default=160, help="Size of the fake recording")
+    parser.add_argument("--model-latency-ms", type=float, default=0.0)
+    parser.add_argument("--no-tls", action="store_true", help="Serve plain HTTP")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    client_ports: set = set()
+    app = _fake_app(os.urandom(args.recording_kb * 1024), args.model_latency_ms / 1000, client_ports)
+    with tempfile.TemporaryDirectory() as tmp:
+        ssl_options = {}
+        verify = True
+        if not args.no_tls:
+            cert, key = _self_signed_cert(tmp)
+            ssl_options = {"ssl_certfile": cert, "ssl_keyfile": key}
+            verify = cert
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=args.port, log_level="warning", **ssl_options))
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        while not server.started:
+            await asyncio.sleep(0.05)
+
+        scheme = "http" if args.no_tls else "https"
+        base = f"{scheme}://localhost:{args.port}"
+        src, url = f"{base}/recording.wav", f"{base}/chat/completions"
+        transcribe_audio.OPENROUTER_URL = url
+
+        print(f"{'mode':>7} | {'conc':>4} | {'conns':>5} | {'rec/s':>7} | {'p50 ms':>7} | {'p99 ms':>7}")
+        for concurrency in args.concurrency:
+            for mode in ("legacy", "pooled"):
+                client_ports.clear()
+                if mode == "pooled":
+                    transcribe_audio._http_client = transcribe_audio.create_http_client(verify=verify)
+                started = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    if mode == "legacy":
+                        latencies = await _run_legacy(src, url, verify, args.recordings, concurrency)
+                    else:
+                        latencies = await _run_pooled(src, args.recordings, concurrency)
+                elapsed = time.perf_counter() - started
+                if mode == "pooled":
+                    await transcribe_audio.aclose_http_client()
+                latencies.sort()
+                print(
+                    f"{mode:>7} | {concurrency:>4} | {len(client_ports):>5} | {len(latencies) / elapsed:>7.1f} | "
+                    f"{statistics.median(latencies) * 1000:>7.2f} | "
+                    f"{latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000:>7.2f}"
+                )
+
+        server.should_exit = True
+        thread.join(timeout=5)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
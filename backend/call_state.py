@@ -0,0 +1,37 @@
+"""
+Per-call state shared by every worker.
+
+Twilio sends a call's webhooks (/call, /recording-finished) and its media
+stream to whichever worker the load balancer picks. Anything one request
+learns about a call must therefore live in Redis, not in module globals. Each
+call is one hash, call:<CallSid>, that expires after CALL_STATE_TTL_SECONDS.
+"""
+import os
+from typing import Optional
+
+from backend.redis_client import redis_client
+
+CALL_STATE_KEY_PREFIX = "call:"
+CALL_STATE_TTL_SECONDS = int(os.getenv("CALL_STATE_TTL_SECONDS", "3600"))
+
+
+def _call_key(call_sid: str) -> str:
+    return f"{CALL_STATE_KEY_PREFIX}{call_sid}"
+
+
+async def update_call(call_sid: Optional[str], **fields) -> None:
+    """Set fields on a call's hash (None values are skipped) and refresh its TTL."""
+    fields = {name: value for name, value in fields.items() if value is not None}
+    if not call_sid or not fields:
+        return
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.hset(_call_key(call_sid), mapping=fields)
+        pipe.expire(_call_key(call_sid), CALL_STATE_TTL_SECONDS)
+        await pipe.execute()
+
+
+async def get_call(call_sid: Optional[str]) -> dict:
+    """Everything recorded for a call, or {} if it is unknown or expired."""
+    if not call_sid:
+        return {}
+    return await redis_client.hgetall(_call_key(call_sid))
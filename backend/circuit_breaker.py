@@ -0,0 +1,130 @@
+"""
+Circuit breakers for the external services (Pinecone, the LLM).
+
+A breaker opens after BREAKER_FAILURE_THRESHOLD consecutive failures. While
+open, calls fail immediately with CircuitOpenError instead of each waiting
+for its own timeout. After BREAKER_RESET_SECONDS one trial call is let
+through (half-open). If it succeeds the breaker closes, and if it fails the
+breaker opens again.
+
+Breakers are per process. Every breaker reports its state under "breakers"
+in GET /metrics.
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import Awaitable, Callable, Dict, TypeVar
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(RuntimeError):
+    """The breaker is open; the call was not attempted."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker. Safe to share across threads."""
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.failures = 0
+        self.opens = 0
+        self.rejected = 0
+        _breakers[name] = self
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+            self._state = HALF_OPEN
+        return self._state
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may go through now."""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            self.rejected += 1
+        raise CircuitOpenError(f"{self.name} circuit breaker is open")
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != CLOSED:
+                print(f"[breaker] {self.name} closed")
+            self._state = CLOSED
+            self._consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._consecutive_failures += 1
+            self._trial_in_flight = False
+            if self._state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self.opens += 1
+                    print(
+                        f"[breaker] {self.name} opened after {self._consecutive_failures} consecutive "
+                        f"failure(s); retrying in {self.reset_seconds:.0f}s"
+                    )
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """Give back a half-open trial that ended without an outcome (e.g. it was cancelled)."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    async def call(self, make_call: Callable[[], Awaitable[T]]) -> T:
+        """Await make_call() through the breaker; any exception counts as a failure."""
+        self.before_call()
+        try:
+            result = await make_call()
+        except asyncio.CancelledError:
+            self.release()
+            raise
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "consecutive_failures": self._consecutive_failures,
+                "failures": self.failures,
+                "opens": self.opens,
+                "rejected": self.rejected,
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def stats() -> dict:
+    return {name: breaker.stats() for name, breaker in _breakers.items()}
@@ -0,0 +1,171 @@
+"""
+Degraded triage for when the LLM or Pinecone is unavailable.
+
+A call still has to reach the queue when Gemini is down or too slow, or when
+Pinecone cannot be searched. Each pipeline step has a stand-in that needs
+neither:
+
+    call_agent        incident type from the keyword rules (model_router),
+                      "Other" if they are not sure; location, date and time
+                      from the transcript metadata
+    assessment_agent  the caller's own words as desc; the usual action for the type
+    triage_agent      the usual severity for the type (RULE_SEVERITY), else
+                      DEGRADED_DEFAULT_SEVERITY
+    dedupe_search     local_duplicates(): open incidents near the location,
+                      of the same type, date and time window, whose desc
+                      shares enough words with this one
+
+Queue entries built this way are flagged `degraded` so dispatchers know the
+triage was not done by the model. DEGRADED_TRIAGE=0 makes the pipeline fail
+instead (the old behaviour) when the LLM is unavailable.
+"""
+import os
+import re
+from datetime import datetime
+from typing import List, Optional
+
+from backend import model_router
+from backend import postal_geo
+from backend.incident_store import TRIAGE_FULL_PAYLOADS_KEY
+from backend.redis_client import redis_bytes_client
+from backend.schemas import AssessmentIncident, CallIncident, IncidentType, SuggestedAction, TranscriptIn
+from backend.serialization import loads
+
+DEGRADED_TRIAGE = os.getenv("DEGRADED_TRIAGE", "1") == "1"
+# Severity when the rules do not know the incident type; errs on the urgent side
+DEGRADED_DEFAULT_SEVERITY = os.getenv("DEGRADED_DEFAULT_SEVERITY", "2")
+# Minimum share of desc words (Jaccard) for a local duplicate
+LOCAL_DEDUPE_MIN_OVERLAP = float(os.getenv("LOCAL_DEDUPE_MIN_OVERLAP", "0.3"))
+# Nearest open incidents compared per call
+LOCAL_DEDUPE_MAX_CANDIDATES = int(os.getenv("LOCAL_DEDUPE_MAX_CANDIDATES", "50"))
+
+_RULE_ACTIONS = {
+    "Fire": SuggestedAction.DISPATCH_FIREFIGHTERS,
+    "Mass Fire": SuggestedAction.DISPATCH_FIREFIGHTERS,
+    "Crowd Stampede": SuggestedAction.DISPATCH_FIRST_AIDERS,
+    "Terrorist Attack": SuggestedAction.DISPATCH_OFFICER,
+    "Armed Robbery": SuggestedAction.DISPATCH_OFFICER,
+    "Break In": SuggestedAction.DISPATCH_OFFICER,
+    "Car Theft": SuggestedAction.DISPATCH_OFFICER,
+    "Theft": SuggestedAction.DISPATCH_OFFICER,
+    "PickPocket": SuggestedAction.DISPATCH_OFFICER,
+    "Public Nuisance": SuggestedAction.DISPATCH_OFFICER,
+}
+_POSTAL_CODE_RE = re.compile(r"\b([A-Z]\d[A-Z])\s?(\d[A-Z]\d)\b", re.IGNORECASE)
+_WORD_RE = re.compile(r"[a-z0-9']{3,}")
+DESC_MAX_CHARS = 150
+
+
+def _location(transcript: TranscriptIn) -> str:
+    hint = postal_geo.normalize_postal_code(transcript.location)
+    if postal_geo.postal_centroids.lookup(hint) is not None:
+        return hint
+    spoken = _POSTAL_CODE_RE.search(transcript.text or "")
+    return (spoken.group(1) + spoken.group(2)).upper() if spoken else hint
+
+
+def _clock(value: str, now: datetime) -> str:
+    for parse in (lambda v: datetime.strptime(v, "%H:%M"), datetime.fromisoformat):
+        try:
+            return parse(value.strip()).strftime("%H:%M")
+        except (ValueError, TypeError, AttributeError):
+            continue
+    return now.strftime("%H:%M")
+
+
+def call_incident(transcript: TranscriptIn, incident_id: str) -> CallIncident:
+    """call_agent's output built without the LLM."""
+    now = datetime.now()
+    return CallIncident(
+        id=incident_id,
+        incidentType=model_router.classify_rules(transcript.text) or IncidentType.OTHER.value,
+        location=_location(transcript),
+        date=f"{now.month}/{now.day}/{now.year}",
+        time=_clock(transcript.time, now),
+        duration=transcript.duration,
+        message=transcript.text,
+    )
+
+
+def assessment(call: CallIncident) -> AssessmentIncident:
+    """assessment_agent's output built without the LLM."""
+    desc = " ".join((call.message or "").split()) or call.incidentType.value
+    if len(desc) > DESC_MAX_CHARS:
+        desc = desc[:DESC_MAX_CHARS - 3].rsplit(" ", 1)[0] + "..."
+    action = _RULE_ACTIONS.get(call.incidentType.value, SuggestedAction.ASK_FOR_MORE_DETAILS)
+    return AssessmentIncident(**call.model_dump(), desc=desc, suggested_actions=action)
+
+
+def severity(call: CallIncident) -> str:
+    """triage_agent's output without the LLM."""
+    return model_router.RULE_SEVERITY.get(call.incidentType.value, DEGRADED_DEFAULT_SEVERITY)
+
+
+def _norm(text: str) -> str:
+    return " ".join((text or "").lower().split())
+
+
+def _words(text: str) -> set:
+    return set(_WORD_RE.findall((text or "").lower()))
+
+
+def _minutes_apart(time1: str, time2: str) -> Optional[float]:
+    try:
+        delta = datetime.strptime(time1, "%H:%M") - datetime.strptime(time2, "%H:%M")
+    except (ValueError, TypeError):
+        return None
+    return abs(delta.total_seconds()) / 60
+
+
+async def local_duplicates(incident: dict, radius_km: Optional[float] = None,
+                           time_window_minutes: int = 30) -> List[dict]:
+    """
+    Duplicate candidates for `incident` among the open incidents in Redis,
+    for when Pinecone cannot be searched. Same result shape as
+    vector_store.find_similar_incidents, best match first; "score" is the
+    share of desc words in common. Only incidents in the geo index (open,
+    with a known location) are considered.
+    """
+    nearby = await postal_geo.incidents_near(incident.get("location", ""), radius_km)
+    nearby = [(incident_id, distance) for incident_id, distance in nearby or [] if incident_id != incident.get("id")]
+    nearby = nearby[:LOCAL_DEDUPE_MAX_CANDIDATES]
+    if not nearby:
+        return []
+    payloads = await redis_bytes_client.hmget(TRIAGE_FULL_PAYLOADS_KEY, [incident_id for incident_id, _ in nearby])
+
+    words = _words(incident.get("desc"))
+    matches = []
+    for (candidate_id, distance), payload in zip(nearby, payloads):
+        if payload is None:
+            continue
+        candidate = loads(payload)
+        if candidate.get("incidentType") != incident.get("incidentType") or candidate.get("date") != incident.get("date"):
+            continue
+        minutes = _minutes_apart(incident.get("time"), candidate.get("time"))
+        if minutes is None or minutes > time_window_minutes:
+            continue
+        candidate_words = _words(candidate.get("desc"))
+        union = words | candidate_words
+        overlap = len(words & candidate_words) / len(union) if union else 0.0
+        is_exact = _norm(candidate.get("desc")) == _norm(incident.get("desc"))
+        if not is_exact and overlap < LOCAL_DEDUPE_MIN_OVERLAP:
+            continue
+        matches.append({
+            "id": candidate_id,
+            "score": round(1.0 if is_exact else overlap, 4),
+            "is_exact_duplicate": is_exact,
+            "desc": candidate.get("desc", ""),
+            "incidentType": candidate.get("incidentType", ""),
+            "location": candidate.get("location", ""),
+            "date": candidate.get("date", ""),
+            "time": candidate.get("time", ""),
+            "metadata_match": {
+                "incidentType": True,
+                "location": candidate.get("location") == incident.get("location"),
+                "distance_km": round(distance, 2),
+                "date": True,
+                "time_within_window": True,
+            },
+        })
+    matches.sort(key=lambda match: match["score"], reverse=True)
+    return matches
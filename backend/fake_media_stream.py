@@ -0,0 +1,106 @@
+"""
+Fake Twilio media stream for exercising /media-stream without a phone call.
+
+Sends the same messages Twilio does (connected, start, 20 ms mu-law media
+frames, stop). Audio comes from a WAV file, or silence when none is given.
+The transcript is passed as a custom parameter so the server can run with
+STREAM_TRANSCRIBER=fake and reveal it word by word as audio arrives.
+
+    python -m backend.fake_media_stream --transcript "there is a fire on king street ..."
+    python -m backend.fake_media_stream --wav call.wav --speed 4 --url ws://localhost:8000/media-stream
+"""
+import argparse
+import asyncio
+import base64
+import json
+import time
+import uuid
+import wave
+
+import numpy as np
+import websockets
+
+from backend.media_stream import TWILIO_SAMPLE_RATE, pcm16_to_mulaw
+
+FRAME_SAMPLES = TWILIO_SAMPLE_RATE // 50  # 20 ms, the frame size Twilio sends
+
+
+def load_wav_8k(path: str) -> np.ndarray:
+    """Read a 16-bit WAV file as mono 8 kHz samples."""
+    with wave.open(path, "rb") as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError("Only 16-bit PCM WAV files are supported")
+        rate = wav.getframerate()
+        samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype="<i2")
+        samples = samples.reshape(-1, wav.getnchannels()).mean(axis=1)
+    if rate != TWILIO_SAMPLE_RATE:
+        positions = np.arange(0, len(samples), rate / TWILIO_SAMPLE_RATE)
+        samples = np.interp(positions, np.arange(len(samples)), samples)
+    return samples.astype(np.int16)
+
+
+async def stream_call(url: str, samples: np.ndarray, transcript: str, speed: float,
+                      seconds_per_word: float) -> None:
+    call_sid = f"CA{uuid.uuid4().hex}"
+    stream_sid = f"MZ{uuid.uuid4().hex}"
+    payload = pcm16_to_mulaw(samples)
+    frame_bytes = FRAME_SAMPLES  # one mu-law byte per sample
+    frame_interval = FRAME_SAMPLES / TWILIO_SAMPLE_RATE / speed
+
+    async with websockets.connect(url) as ws:
+        await ws.send(json.dumps({"event": "connected", "protocol": "Call", "version": "1.0.0"}))
+        await ws.send(json.dumps({
+            "event": "start",
+            "sequenceNumber": "1",
+            "streamSid": stream_sid,
+            "start": {
+                "streamSid": stream_sid,
+                "callSid": call_sid,
+                "tracks": ["inbound"],
+                "mediaFormat": {"encoding": "audio/x-mulaw", "sampleRate": TWILIO_SAMPLE_RATE, "channels": 1},
+                "customParameters": {"transcript": transcript, "seconds_per_word": str(seconds_per_word)},
+            },
+        }))
+        print(f"[fake_media_stream] Streaming {len(samples) / TWILIO_SAMPLE_RATE:.1f}s of audio for {call_sid}")
+
+        started = time.perf_counter()
+        for seq, offset in enumerate(range(0, len(payload), frame_bytes), start=2):
+            await ws.send(json.dumps({
+                "event": "media",
+                "sequenceNumber": str(seq),
+                "streamSid": stream_sid,
+                "media": {
+                    "track": "inbound",
+                    "chunk": str(seq - 1),
+                    "timestamp": str(offset * 1000 // TWILIO_SAMPLE_RATE),
+                    "payload": base64.b64encode(payload[offset:offset + frame_bytes]).decode("ascii"),
+                },
+            }))
+            # Pace frames like a live call (scaled by --speed)
+            delay = started + (seq - 1) * frame_interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        await ws.send(json.dumps({"event": "stop", "streamSid": stream_sid, "stop": {"callSid": call_sid}}))
+        print(f"[fake_media_stream] Done in {time.perf_counter() - started:.1f}s, call_sid={call_sid}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send a fake Twilio media stream to the backend")
+    parser.add_argument("--url", default="ws://localhost:8000/media-stream", help="Media stream WebSocket URL")
+    parser.add_argument("--wav", help="16-bit WAV file to stream (default: silence sized to the transcript)")
+    parser.add_argument("--transcript", default="", help="Scripted transcript for STREAM_TRANSCRIBER=fake")
+    parser.add_argument("--seconds-per-word", type=float, default=0.5)
+    parser.add_argument("--speed", type=float, default=1.0, help="Playback speed factor (2 = twice real time)")
+    args = parser.parse_args()
+
+    if args.wav:
+        samples = load_wav_8k(args.wav)
+    else:
+        seconds = max(len(args.transcript.split()) * args.seconds_per_word, 1.0)
+        samples = np.zeros(int(seconds * TWILIO_SAMPLE_RATE), dtype=np.int16)
+    asyncio.run(stream_call(args.url, samples, args.transcript, args.speed, args.seconds_per_word))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Hedged requests for the LLM agent calls.
+
+Gemini's p99 latency is several times its median, and the pipeline makes
+three calls per incident, so slow tails add up. With LLM_HEDGE=1, a call
+still running after the LLM_HEDGE_PERCENTILE of recent latencies for that
+agent gets a second, identical request. Whichever finishes first is used and
+the other is cancelled. Hedges are capped at LLM_HEDGE_MAX_RATE of recent
+calls, so a slow provider is not flooded with duplicates. No hedge is sent
+until LLM_HEDGE_MIN_SAMPLES latencies have been seen.
+
+Latencies are tracked per agent in-process (a sliding window of
+LLM_LATENCY_WINDOW samples) whether or not hedging is on. They are reported
+under "llm" in GET /metrics. A cancelled attempt records the time it ran,
+which is a lower bound. That way hedging does not hide the tail it is
+reacting to.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+import numpy as np
+
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_MAX_RATE = float(os.getenv("LLM_HEDGE_MAX_RATE", "0.1"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# Never hedge sooner than this, however fast recent calls were
+LLM_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", "0.05"))
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "500"))
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """Sliding window of recent latencies (seconds) with quantile queries."""
+
+    def __init__(self, window: int):
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def quantile(self, percentile: float) -> Optional[float]:
+        with self._lock:
+            if not self._samples:
+                return None
+            return float(np.percentile(np.fromiter(self._samples, dtype=float), percentile))
+
+    def stats(self) -> dict:
+        with self._lock:
+            samples = np.fromiter(self._samples, dtype=float)
+        if not len(samples):
+            return {"count": self.count}
+        p50, p90, p99 = (float(value) for value in np.percentile(samples, [50, 90, 99]))
+        return {
+            "count": self.count,
+            "p50_ms": round(p50 * 1000, 1),
+            "p90_ms": round(p90 * 1000, 1),
+            "p99_ms": round(p99 * 1000, 1),
+            "max_ms": round(float(samples.max()) * 1000, 1),
+        }
+
+
+class Hedger:
+    """
+    Runs calls with an optional hedge after a latency-percentile delay.
+    One latency window per key (agent name); the hedge budget is shared.
+    """
+
+    def __init__(self, enabled: bool = LLM_HEDGE, percentile: float = LLM_HEDGE_PERCENTILE,
+                 max_rate: float = LLM_HEDGE_MAX_RATE, min_samples: int = LLM_HEDGE_MIN_SAMPLES,
+                 min_delay: float = LLM_HEDGE_MIN_DELAY_SECONDS, window: int = LLM_LATENCY_WINDOW):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.window = window
+        self._trackers: Dict[str, LatencyTracker] = {}
+        # One flag per recent call: True if it was hedged
+        self._recent_hedges: deque = deque(maxlen=window)
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def tracker(self, key: str) -> LatencyTracker:
+        tracker = self._trackers.get(key)
+        if tracker is None:
+            tracker = self._trackers.setdefault(key, LatencyTracker(self.window))
+        return tracker
+
+    def hedge_delay(self, key: str) -> Optional[float]:
+        """Seconds to wait before hedging a call for `key`, or None if it should not be hedged."""
+        tracker = self.tracker(key)
+        if not self.enabled or len(tracker) < self.min_samples:
+            return None
+        return max(tracker.quantile(self.percentile), self.min_delay)
+
+    def _budget_allows(self) -> bool:
+        recent = len(self._recent_hedges)
+        return recent > 0 and sum(self._recent_hedges) < self.max_rate * recent
+
+    async def _timed(self, key: str, make_call: Callable[[], Awaitable[T]]) -> T:
+        started = time.perf_counter()
+        try:
+            return await make_call()
+        finally:
+            # Cancelled attempts record how long they ran (a lower bound)
+            self.tracker(key).observe(time.perf_counter() - started)
+
+    async def call(self, key: str, make_call: Callable[[], Awaitable[T]]) -> T:
+        """
+        Await make_call(). If hedging is on and it has not finished after the
+        hedge delay, start a second make_call() and return whichever succeeds
+        first. The loser is cancelled. Exceptions are only raised once both
+        attempts have failed.
+        """
+        self.calls += 1
+        delay = self.hedge_delay(key)
+        if delay is None:
+            self._recent_hedges.append(False)
+            return await self._timed(key, make_call)
+
+        primary = asyncio.ensure_future(self._timed(key, make_call))
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done or not self._budget_allows():
+                self._recent_hedges.append(False)
+                return await primary
+
+            self._recent_hedges.append(True)
+            self.hedges += 1
+            hedge = asyncio.ensure_future(self._timed(key, make_call))
+            pending = {primary, hedge}
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "hedging": self.enabled,
+            "percentile": self.percentile,
+            "calls": self.calls,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_rate": round(self.hedges / self.calls, 4) if self.calls else 0.0,
+            "latency": {key: tracker.stats() for key, tracker in self._trackers.items()},
+        }
+
+
+llm_hedger = Hedger()
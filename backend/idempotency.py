@@ -0,0 +1,183 @@
+"""
+Idempotency keys and single-flight execution.
+
+Twilio retries webhooks it did not get an answer for, and clients retry
+/invoke on timeout. Without a key, every retry runs the whole pipeline again:
+three LLM calls, a vector search and an upsert, racing the duplicate detector.
+
+run_once(scope, key, ...) runs the work at most once per key:
+
+  - Requests with the same key in this worker attach to the running
+    execution (one asyncio task per key) instead of starting their own.
+  - The first worker to SET NX idem:<scope>:<key> owns the execution. The
+    record says "running" and expires after IDEMPOTENCY_LOCK_SECONDS, so a
+    worker that dies mid-run does not block the key forever.
+  - On success the record holds the result for IDEMPOTENCY_TTL_SECONDS.
+    Later retries get it from Redis. Retries that arrive while another worker
+    is running wait on idem_events:<scope>:<key> for up to
+    IDEMPOTENCY_WAIT_SECONDS.
+  - A failed run deletes its record, so the next attempt with the key runs
+    again. Only requests already attached in-process share the failure.
+
+The execution is a task of its own. If the request that started it goes
+away, as when a client times out and retries, the run still finishes and
+stores its result for the retry.
+
+A key can carry a fingerprint of the request. Reusing it with a different
+request raises IdempotencyKeyReused instead of replaying an unrelated result.
+"""
+import asyncio
+import os
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from backend.redis_client import redis_client, redis_pubsub_client
+from backend.serialization import dumps, loads
+
+IDEMPOTENCY_KEY_PREFIX = "idem:"
+IDEMPOTENCY_CHANNEL_PREFIX = "idem_events:"
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+# Longest a "running" record survives; should exceed the slowest pipeline run
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "300"))
+# How long a retry waits on a run owned by another worker
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "120"))
+
+# How a result was obtained
+EXECUTED = "executed"  # this call ran the work
+ATTACHED = "attached"  # joined a run in progress in this worker
+WAITED = "waited"      # waited for a run in progress in another worker
+STORED = "stored"      # replayed a finished result from Redis
+
+
+class IdempotencyKeyReused(ValueError):
+    """The key was already used for a different request."""
+
+
+class IdempotencyTimeout(TimeoutError):
+    """Another worker is still running the request for this key."""
+
+
+# record key -> (task, fingerprint). A task is removed as soon as it finishes.
+_inflight: Dict[str, Tuple[asyncio.Task, Optional[str]]] = {}
+_counts: Counter = Counter()
+
+
+def _record_key(scope: str, key: str) -> str:
+    return f"{IDEMPOTENCY_KEY_PREFIX}{scope}:{key}"
+
+
+def _channel(record_key: str) -> str:
+    return IDEMPOTENCY_CHANNEL_PREFIX + record_key[len(IDEMPOTENCY_KEY_PREFIX):]
+
+
+def _check_fingerprint(stored: Optional[str], fingerprint: Optional[str]) -> None:
+    if stored and fingerprint and stored != fingerprint:
+        raise IdempotencyKeyReused("Idempotency key was already used for a different request.")
+
+
+async def _get_record(record_key: str) -> Optional[dict]:
+    raw = await redis_client.get(record_key)
+    return loads(raw) if raw else None
+
+
+async def _execute(record_key: str, record: dict, fn: Callable[[], Awaitable[dict]]) -> dict:
+    try:
+        result = await fn()
+    except BaseException:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.delete(record_key)
+            pipe.publish(_channel(record_key), "failed")
+            await pipe.execute()
+        raise
+    record = dict(record, status="succeeded", result=result, finished_at=time.time())
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.set(record_key, dumps(record), ex=IDEMPOTENCY_TTL_SECONDS)
+        pipe.publish(_channel(record_key), "succeeded")
+        await pipe.execute()
+    return result
+
+
+async def _wait_for_record(record_key: str, fingerprint: Optional[str], deadline: float) -> Optional[dict]:
+    """
+    Wait until the record for `record_key` is finished; returns it, or None if
+    it disappeared (the run failed or its owner died). Subscribes before the
+    first read so the completion message cannot be missed. The subscription
+    uses its own connection pool, so waiting retries never hold connections
+    the request handlers need.
+    """
+    pubsub = redis_pubsub_client.pubsub()
+    await pubsub.subscribe(_channel(record_key))
+    try:
+        while True:
+            record = await _get_record(record_key)
+            if record is None:
+                return None
+            _check_fingerprint(record.get("fingerprint"), fingerprint)
+            if record["status"] == "succeeded":
+                return record
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise IdempotencyTimeout("A request with this idempotency key is still in progress.")
+            await pubsub.get_message(ignore_subscribe_messages=True, timeout=min(remaining, 5.0))
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.aclose()
+
+
+async def _resolve(record_key: str, fingerprint: Optional[str],
+                   fn: Callable[[], Awaitable[dict]]) -> Tuple[dict, str]:
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        running = {"status": "running", "fingerprint": fingerprint, "owner": os.getpid(), "started_at": time.time()}
+        if await redis_client.set(record_key, dumps(running), nx=True, ex=IDEMPOTENCY_LOCK_SECONDS):
+            return await _execute(record_key, running, fn), EXECUTED
+        record = await _get_record(record_key)
+        if record is not None and record["status"] == "succeeded":
+            _check_fingerprint(record.get("fingerprint"), fingerprint)
+            return record["result"], STORED
+        record = await _wait_for_record(record_key, fingerprint, deadline)
+        if record is not None:
+            return record["result"], WAITED
+        # The other run failed or expired; try to take the key over
+
+
+def _forget(record_key: str, task: asyncio.Task) -> None:
+    _inflight.pop(record_key, None)
+    if not task.cancelled():
+        # Mark the error retrieved even if every caller has gone away
+        task.exception()
+
+
+async def run_once(scope: str, key: str, fn: Callable[[], Awaitable[dict]],
+                   fingerprint: Optional[str] = None) -> Tuple[dict, str]:
+    """
+    Return the result of `fn()` for `key`, running it only if no other request
+    with the same scope and key has run it or is running it. The result must
+    be JSON-serializable. Returns (result, how) where `how` is one of
+    EXECUTED, ATTACHED, WAITED or STORED.
+
+    Raises IdempotencyKeyReused if `fingerprint` differs from the one the key
+    was first used with, and IdempotencyTimeout if another worker's run does
+    not finish within IDEMPOTENCY_WAIT_SECONDS. Errors from `fn` propagate
+    to every caller attached to that run.
+    """
+    record_key = _record_key(scope, key)
+    inflight = _inflight.get(record_key)
+    if inflight is not None:
+        task, running_fingerprint = inflight
+        _check_fingerprint(running_fingerprint, fingerprint)
+        _counts[ATTACHED] += 1
+        result, _ = await asyncio.shield(task)
+        return result, ATTACHED
+
+    task = asyncio.ensure_future(_resolve(record_key, fingerprint, fn))
+    _inflight[record_key] = (task, fingerprint)
+    task.add_done_callback(lambda done: _forget(record_key, done))
+    result, how = await asyncio.shield(task)
+    _counts[how] += 1
+    return result, how
+
+
+def stats() -> dict:
+    return {"in_flight": len(_inflight), **{how: _counts[how] for how in (EXECUTED, ATTACHED, WAITED, STORED)}}
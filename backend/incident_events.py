@@ -0,0 +1,273 @@
+"""
+Event log of the incident lifecycle.
+
+The queue and payload keys are updated in place and keep no history. Every
+lifecycle transition is therefore also appended to the Redis Stream
+`incident_events`, in the same transaction (or Lua script) as the change:
+
+    created    queued, or a streamed call's provisional entry created or
+               replaced: entry, score, enqueued_at, shard, and payload (the
+               full payload, or the provisional one while the call streams)
+    merged     a duplicate call was merged into it: entry and score (if it
+               is queued), callers
+    removed    a provisional entry dropped because its call was a duplicate
+    rescored   a re-scoring sweep changed scores: scores ({id: score}), shard
+    claimed    leased to a dispatcher: dispatcher, expires_at
+    released   back on the queue after a release or an expired lease:
+               entry, score, shard, reason
+    completed  taken off the queue by /remove or a completed lease
+    demoted    payloads moved to the warm store: ids
+
+Every event also carries type, id (the incident; empty for batch events) and
+at (epoch seconds). Values are absolute, e.g. the new callers count rather
+than "+1", so applying an event twice is harmless.
+
+incident_snapshots.py folds the log into snapshots and rebuilds the queue from
+them. Consumers read the log instead of polling the hot keys:
+GET /events streams it as server-sent events, and consumer groups
+(read_group/ack) suit analytics jobs:
+
+    python -m backend.incident_events tail
+    python -m backend.incident_events tail --group analytics --consumer worker-1
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import AsyncIterator, List, Optional, Set
+
+from backend.redis_client import REDIS_SOCKET_TIMEOUT, create_client, redis_bytes_client
+from backend.serialization import dumps, loads
+
+INCIDENT_EVENTS_KEY = "incident_events"
+# How long the shared reader blocks per read, and followers wait before a keep-alive;
+# kept below the Redis socket timeout
+INCIDENT_EVENTS_BLOCK_MS = int(min(4.0, REDIS_SOCKET_TIMEOUT * 0.8) * 1000)
+INCIDENT_EVENTS_READ_COUNT = 100
+# Batches buffered per follower; a slower follower re-reads from the log
+INCIDENT_EVENTS_FOLLOWER_BACKLOG = int(os.getenv("INCIDENT_EVENTS_FOLLOWER_BACKLOG", "64"))
+
+CREATED = "created"
+MERGED = "merged"
+REMOVED = "removed"
+RESCORED = "rescored"
+CLAIMED = "claimed"
+RELEASED = "released"
+COMPLETED = "completed"
+DEMOTED = "demoted"
+
+_FLOAT_FIELDS = ("at", "score", "enqueued_at", "expires_at")
+_INT_FIELDS = ("callers",)
+_JSON_FIELDS = ("scores", "ids")
+
+
+def _event_fields(event_type: str, incident_id: Optional[str], fields: dict) -> dict:
+    event = {"type": event_type, "id": incident_id or "", "at": time.time()}
+    for name, value in fields.items():
+        if value is None:
+            continue
+        event[name] = dumps(value) if isinstance(value, (dict, list)) else value
+    return event
+
+
+def stage_event(pipe, event_type: str, incident_id: Optional[str] = None, **fields) -> None:
+    """Queue an event append on `pipe`, so it commits with the change it records. None values are left out."""
+    pipe.xadd(INCIDENT_EVENTS_KEY, _event_fields(event_type, incident_id, fields))
+
+
+async def append(event_type: str, incident_id: Optional[str] = None, **fields) -> str:
+    """Append an event on its own; returns its stream id."""
+    event_id = await redis_bytes_client.xadd(INCIDENT_EVENTS_KEY, _event_fields(event_type, incident_id, fields))
+    return event_id.decode()
+
+
+def _text(value) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+def decode_event(event_id, raw: dict) -> dict:
+    """
+    A stream entry as a dict with "event_id". Numbers are parsed, and
+    `entry`/`payload` stay JSON text (see public_event).
+    """
+    event = {_text(name): _text(value) for name, value in raw.items()}
+    event["event_id"] = _text(event_id)
+    for name in _FLOAT_FIELDS:
+        if name in event:
+            event[name] = float(event[name])
+    for name in _INT_FIELDS:
+        if name in event:
+            event[name] = int(event[name])
+    for name in _JSON_FIELDS:
+        if name in event:
+            event[name] = loads(event[name])
+    return event
+
+
+def public_event(event: dict) -> dict:
+    """An event for push consumers: the queue entry parsed, the full payload (transcript) left out."""
+    public = {name: value for name, value in event.items() if name != "payload"}
+    if "entry" in public:
+        public["entry"] = loads(public["entry"])
+    return public
+
+
+async def last_event_id() -> str:
+    """Id of the newest event, "0-0" if there is none."""
+    newest = await redis_bytes_client.xrevrange(INCIDENT_EVENTS_KEY, count=1)
+    return _text(newest[0][0]) if newest else "0-0"
+
+
+async def read_range(after: str, count: int) -> List[dict]:
+    """Up to `count` events after stream id `after`, oldest first."""
+    entries = await redis_bytes_client.xrange(INCIDENT_EVENTS_KEY, min=f"({after}", max="+", count=count)
+    return [decode_event(event_id, raw) for event_id, raw in entries]
+
+
+class _Fanout:
+    """
+    One blocking XREAD per process, shared by every follower. Its connection
+    comes from a pool of its own, so open /events streams never hold
+    connections the request handlers need. Each batch is handed to the
+    followers' queues together with the id it was read after; a follower
+    that is not at that id (it joined later, or fell behind and had batches
+    dropped) catches up with non-blocking XRANGE reads instead.
+    """
+
+    def __init__(self):
+        self._client = None
+        self._task: Optional[asyncio.Task] = None
+        self._queues: Set[asyncio.Queue] = set()
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=INCIDENT_EVENTS_FOLLOWER_BACKLOG)
+        self._queues.add(queue)
+        if self._task is None:
+            self._task = asyncio.create_task(self._read_loop())
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._queues.discard(queue)
+
+    async def _read_loop(self) -> None:
+        if self._client is None:
+            self._client = create_client(decode_responses=False, max_connections=1)
+        after = None
+        while self._queues:
+            try:
+                if after is None:
+                    after = await last_event_id()
+                response = await self._client.xread(
+                    {INCIDENT_EVENTS_KEY: after}, count=INCIDENT_EVENTS_READ_COUNT, block=INCIDENT_EVENTS_BLOCK_MS
+                )
+            except Exception as e:
+                print(f"[incident_events] Stream read failed: {e}")
+                after = None
+                await asyncio.sleep(1.0)
+                continue
+            if not response:
+                continue
+            batch = (after, [decode_event(event_id, raw) for event_id, raw in response[0][1]])
+            after = batch[1][-1]["event_id"]
+            for queue in list(self._queues):
+                if queue.full():
+                    # Drop what the follower has not read; the gap makes it catch up from the log
+                    while not queue.empty():
+                        queue.get_nowait()
+                queue.put_nowait(batch)
+        self._task = None
+
+
+_fanout = _Fanout()
+
+
+async def follow(after: Optional[str] = None) -> AsyncIterator[Optional[dict]]:
+    """
+    Yield events after stream id `after` (only new ones if None), forever.
+    Yields None whenever no event arrives for a block interval, so callers
+    can send keep-alives.
+    """
+    after = after or await last_event_id()
+    queue = _fanout.subscribe()
+    try:
+        caught_up = False
+        while True:
+            if not caught_up:
+                events = await read_range(after, INCIDENT_EVENTS_READ_COUNT)
+                for event in events:
+                    after = event["event_id"]
+                    yield event
+                caught_up = len(events) < INCIDENT_EVENTS_READ_COUNT
+                continue
+            try:
+                batch_after, events = await asyncio.wait_for(queue.get(), INCIDENT_EVENTS_BLOCK_MS / 1000)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            if batch_after != after:
+                caught_up = False
+                continue
+            for event in events:
+                after = event["event_id"]
+                yield event
+    finally:
+        _fanout.unsubscribe(queue)
+
+
+async def ensure_group(group: str, start: str = "$") -> None:
+    """Create a consumer group (reading from `start`) unless it exists."""
+    try:
+        await redis_bytes_client.xgroup_create(INCIDENT_EVENTS_KEY, group, id=start, mkstream=True)
+    except Exception as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+async def read_group(group: str, consumer: str, count: int = INCIDENT_EVENTS_READ_COUNT,
+                     block_ms: int = INCIDENT_EVENTS_BLOCK_MS) -> List[dict]:
+    """
+    The next events for `consumer` in `group`. They stay pending until
+    acked, so a consumer that dies mid-batch gets them again.
+    """
+    response = await redis_bytes_client.xreadgroup(
+        group, consumer, {INCIDENT_EVENTS_KEY: ">"}, count=count, block=block_ms
+    )
+    return [decode_event(event_id, raw) for event_id, raw in response[0][1]] if response else []
+
+
+async def ack(group: str, event_ids: List[str]) -> int:
+    return await redis_bytes_client.xack(INCIDENT_EVENTS_KEY, group, *event_ids) if event_ids else 0
+
+
+async def _tail(args) -> None:
+    if args.group:
+        await ensure_group(args.group, args.after or "$")
+        while True:
+            events = await read_group(args.group, args.consumer)
+            for event in events:
+                sys.stdout.buffer.write(dumps(public_event(event)) + b"\n")
+            sys.stdout.flush()
+            await ack(args.group, [event["event_id"] for event in events])
+    async for event in follow(args.after):
+        if event is not None:
+            sys.stdout.buffer.write(dumps(public_event(event)) + b"\n")
+            sys.stdout.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print incident lifecycle events as NDJSON")
+    commands = parser.add_subparsers(dest="command", required=True)
+    tail = commands.add_parser("tail", help="Follow the event stream")
+    tail.add_argument("--after", help="Start after this stream id (0 for the whole retained log)")
+    tail.add_argument("--group", help="Read through this consumer group, acking what was printed")
+    tail.add_argument("--consumer", default="cli")
+    args = parser.parse_args()
+    try:
+        asyncio.run(_tail(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
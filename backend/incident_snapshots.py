@@ -0,0 +1,348 @@
+"""
+Snapshots of the incident event log, and rebuilding the queue from them.
+
+Recovering from a lost or corrupted queue used to mean flush.py and a
+reseed. The event log (incident_events.py) records every change to the queue
+and the hot payloads instead, and this module folds it into a compact state:
+
+    incident_events_snapshot  hash: last_id (last event folded in), taken_at,
+                              incidents, state (gzipped JSON, id -> record)
+
+A record holds the queue entry, score, enqueue time, shard, status (queued,
+claimed or completed) and the hot payload with its stored and completed
+times. Every INCIDENT_SNAPSHOT_INTERVAL_SECONDS one worker folds the events
+since the last snapshot into it. Events older than both the snapshot and
+INCIDENT_EVENTS_RETENTION_SECONDS are then trimmed from the stream, so
+consumers can still replay the last day. The first snapshot is seeded from
+the live keys, so incidents queued before the log existed are covered too.
+
+Rebuild replays the tail after the snapshot and rewrites the queue shards, id
+index, enqueue times, geo index and hot payloads in one transaction. Leases
+are left as they are; a claimed incident whose lease is gone goes back on the
+queue. Rebuild refuses to run before the first snapshot exists (see
+rebuild). Stop the API workers first so nothing writes while it runs:
+
+    python -m backend.incident_snapshots snapshot
+    python -m backend.incident_snapshots rebuild [--dry-run] [--seed]
+"""
+import argparse
+import asyncio
+import gzip
+import os
+import time
+from typing import Optional, Tuple
+
+from backend import incident_events
+from backend import postal_geo
+from backend import triage_queue
+from backend.incident_events import INCIDENT_EVENTS_KEY
+from backend.incident_store import TRIAGE_COMPLETED_KEY, TRIAGE_FULL_PAYLOADS_KEY, TRIAGE_HOT_ORDER_KEY
+from backend.leases import TRIAGE_LEASES_KEY
+from backend.postal_geo import TRIAGE_GEO_KEY
+from backend.redis_client import acquire_interval_lock, redis_bytes_client
+from backend.serialization import dumps, loads
+
+INCIDENT_SNAPSHOT_KEY = "incident_events_snapshot"
+
+INCIDENT_SNAPSHOT_INTERVAL_SECONDS = float(os.getenv("INCIDENT_SNAPSHOT_INTERVAL_SECONDS", "300"))
+# Events kept after they are in a snapshot, for consumers catching up
+INCIDENT_EVENTS_RETENTION_SECONDS = float(os.getenv("INCIDENT_EVENTS_RETENTION_SECONDS", "86400"))
+# Events read per XRANGE while replaying
+REPLAY_PAGE_SIZE = int(os.getenv("INCIDENT_EVENTS_REPLAY_PAGE", "1000"))
+
+QUEUED = "queued"
+CLAIMED = "claimed"
+COMPLETED = "completed"
+
+
+def _record(**fields) -> dict:
+    record = {
+        "status": QUEUED, "entry": None, "score": None, "enqueued_at": None, "shard": None,
+        "payload": None, "stored_at": None, "completed_at": None,
+    }
+    record.update(fields)
+    return record
+
+
+def _with_fields(payload: str, **fields) -> str:
+    record = loads(payload)
+    record.update(fields)
+    return dumps(record).decode("utf-8")
+
+
+def apply(state: dict, event: dict) -> None:
+    """Fold one decoded event into `state` (id -> record, as stored in snapshots)."""
+    kind, incident_id = event["type"], event["id"]
+    record = state.get(incident_id)
+
+    if kind == incident_events.CREATED:
+        if record is None:
+            record = state[incident_id] = _record()
+        record.update(
+            status=QUEUED, entry=event["entry"], score=event["score"],
+            enqueued_at=event.get("enqueued_at"), shard=event["shard"],
+        )
+        if "payload" in event:
+            record["payload"] = event["payload"]
+            record["stored_at"] = record["stored_at"] or event["at"]
+    elif kind == incident_events.RESCORED:
+        for rescored_id, score in event["scores"].items():
+            rescored = state.get(rescored_id)
+            if rescored is not None and rescored["status"] == QUEUED:
+                rescored["score"] = score
+    elif kind == incident_events.DEMOTED:
+        for demoted_id in event["ids"]:
+            demoted = state.get(demoted_id)
+            if demoted is None:
+                continue
+            if demoted["status"] == COMPLETED:
+                del state[demoted_id]
+            else:
+                # Open incidents demoted for the hot cap stay queued
+                demoted.update(payload=None, stored_at=None)
+    elif record is None:
+        # Created before the log (or the snapshot it was seeded from) covered it
+        return
+    elif kind == incident_events.MERGED:
+        if "entry" in event:
+            record.update(entry=event["entry"], score=event["score"])
+        if record["payload"] is not None:
+            record["payload"] = _with_fields(record["payload"], callers=event["callers"])
+    elif kind == incident_events.REMOVED:
+        del state[incident_id]
+    elif kind == incident_events.CLAIMED:
+        record["status"] = CLAIMED
+    elif kind == incident_events.RELEASED:
+        record.update(status=QUEUED, entry=event["entry"], score=event["score"], shard=event["shard"])
+    elif kind == incident_events.COMPLETED:
+        record.update(status=COMPLETED, completed_at=event["at"])
+        if record["payload"] is not None:
+            record["payload"] = _with_fields(record["payload"], status="completed")
+
+
+def _text(value) -> Optional[str]:
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+async def _replay(state: dict, after: str) -> Tuple[str, int]:
+    """Apply every event after `after` to `state`; returns (last event id, events applied)."""
+    applied = 0
+    while True:
+        events = await incident_events.read_range(after, REPLAY_PAGE_SIZE)
+        for event in events:
+            apply(state, event)
+        applied += len(events)
+        if len(events) < REPLAY_PAGE_SIZE:
+            return (events[-1]["event_id"] if events else after), applied
+        after = events[-1]["event_id"]
+
+
+async def _live_state() -> dict:
+    """State read from the live queue, lease and payload keys (seeds the first snapshot)."""
+    shards = await triage_queue.shard_keys()
+    async with redis_bytes_client.pipeline(transaction=False) as pipe:
+        for shard in shards:
+            pipe.zrange(shard, 0, -1, withscores=True)
+            pipe.hgetall(triage_queue.members_key(shard))
+            pipe.hgetall(triage_queue.enqueued_at_key(shard))
+        pipe.hgetall(TRIAGE_LEASES_KEY)
+        pipe.hgetall(TRIAGE_FULL_PAYLOADS_KEY)
+        pipe.zrange(TRIAGE_HOT_ORDER_KEY, 0, -1, withscores=True)
+        pipe.zrange(TRIAGE_COMPLETED_KEY, 0, -1, withscores=True)
+        results = await pipe.execute()
+    leased, payloads, hot_order, completed = results[-4:]
+
+    state = {}
+    for i, shard in enumerate(shards):
+        queued, members, enqueued = results[3 * i:3 * i + 3]
+        scores = dict(queued)
+        for raw_id, member in members.items():
+            if member not in scores:
+                continue
+            enqueued_at = enqueued.get(raw_id)
+            state[_text(raw_id)] = _record(
+                entry=_text(member), score=scores[member], shard=shard,
+                enqueued_at=float(enqueued_at) if enqueued_at else None,
+            )
+    for raw_lease in leased.values():
+        lease = loads(raw_lease)
+        state[lease["id"]] = _record(
+            status=CLAIMED, entry=lease["member"], score=float(lease["score"]), shard=lease["shard"],
+            enqueued_at=float(lease["enqueued_at"]) if lease.get("enqueued_at") else None,
+        )
+    stored_at = {_text(incident_id): at for incident_id, at in hot_order}
+    completed_at = {_text(incident_id): at for incident_id, at in completed}
+    for raw_id, payload in payloads.items():
+        incident_id = _text(raw_id)
+        record = state.get(incident_id)
+        if record is None:
+            # A hot payload with no queue entry or lease has left the queue
+            record = state[incident_id] = _record(status=COMPLETED)
+        record.update(payload=_text(payload), stored_at=stored_at.get(incident_id))
+        if incident_id in completed_at:
+            record.update(status=COMPLETED, completed_at=completed_at[incident_id])
+    queued_count = sum(1 for record in state.values() if record["status"] == QUEUED)
+    print(f"[incident_snapshots] Seeded state from live keys: {queued_count} queued, {len(leased)} leased, "
+          f"{len(payloads)} hot payload(s)")
+    return state
+
+
+async def load_snapshot() -> Optional[Tuple[str, dict]]:
+    """(last event id, state) of the stored snapshot, or None if there is none yet."""
+    last_id, raw_state = await redis_bytes_client.hmget(INCIDENT_SNAPSHOT_KEY, ["last_id", "state"])
+    if raw_state is None:
+        return None
+    state = await asyncio.to_thread(lambda: loads(gzip.decompress(raw_state)))
+    return _text(last_id), state
+
+
+async def current_state(seed_from_live: bool = False) -> Tuple[dict, str, int]:
+    """
+    The state as of the newest event: the snapshot plus the events after it.
+    Without a snapshot, either seed from the live keys or replay the whole
+    retained log. Returns (state, last event id, events replayed).
+    """
+    snapshot = await load_snapshot()
+    if snapshot is not None:
+        last_id, state = snapshot
+    elif seed_from_live:
+        # Events written while the keys are read are replayed on top; applying them twice is harmless
+        last_id = await incident_events.last_event_id()
+        state = await _live_state()
+    else:
+        last_id, state = "0-0", {}
+    last_id, replayed = await _replay(state, last_id)
+    return state, last_id, replayed
+
+
+async def take_snapshot() -> dict:
+    """Fold new events into the snapshot and trim the stream; returns what was done."""
+    started = time.perf_counter()
+    state, last_id, replayed = await current_state(seed_from_live=True)
+    taken_at = time.time()
+    compressed = await asyncio.to_thread(gzip.compress, dumps(state), 1)
+    await redis_bytes_client.hset(INCIDENT_SNAPSHOT_KEY, mapping={
+        "last_id": last_id, "taken_at": taken_at, "incidents": len(state), "state": compressed,
+    })
+    # Keep everything after the snapshot, and everything within the retention window
+    retention_id = f"{int((taken_at - INCIDENT_EVENTS_RETENTION_SECONDS) * 1000)}-0"
+    trim_id = min(last_id, retention_id, key=lambda event_id: tuple(map(int, event_id.split("-"))))
+    trimmed = await redis_bytes_client.xtrim(INCIDENT_EVENTS_KEY, minid=trim_id, approximate=False)
+    return {
+        "last_id": last_id,
+        "incidents": len(state),
+        "events_applied": replayed,
+        "events_trimmed": trimmed,
+        "bytes": len(compressed),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+async def snapshot_loop():
+    """Background task: take_snapshot every INCIDENT_SNAPSHOT_INTERVAL_SECONDS (one worker per interval)."""
+    while True:
+        await asyncio.sleep(INCIDENT_SNAPSHOT_INTERVAL_SECONDS)
+        try:
+            if await acquire_interval_lock("incident_snapshot", INCIDENT_SNAPSHOT_INTERVAL_SECONDS):
+                result = await take_snapshot()
+                print(
+                    f"[incident_snapshots] Snapshot at {result['last_id']}: {result['incidents']} incident(s), "
+                    f"{result['events_applied']} event(s) applied, {result['events_trimmed']} trimmed "
+                    f"in {result['seconds']}s"
+                )
+        except Exception as e:
+            print(f"[incident_snapshots] Snapshot failed: {e}")
+
+
+async def rebuild(dry_run: bool = False, seed: bool = False) -> dict:
+    """
+    Rewrite the queue, id index, enqueue times, geo index and hot payloads
+    from the snapshot plus the events after it. Returns counts of what was
+    (or, with dry_run, would be) written.
+
+    Without a snapshot the log alone would miss incidents queued before it
+    existed, and the rewrite would drop them. Rebuild then refuses to run
+    unless `seed` is set, in which case a snapshot seeded from the live keys
+    is taken first (only useful while those keys are still intact).
+    """
+    started = time.perf_counter()
+    if await load_snapshot() is None:
+        if not seed:
+            raise RuntimeError(
+                "no snapshot yet; run 'snapshot' first (or rebuild with --seed) so incidents "
+                "queued before the event log are not dropped"
+            )
+        print("[incident_snapshots] No snapshot yet; seeding one from the live keys before rebuilding")
+        await take_snapshot()
+    state, last_id, replayed = await current_state()
+    leased = {_text(incident_id) for incident_id in await redis_bytes_client.hkeys(TRIAGE_LEASES_KEY)}
+    counts = {"queued": 0, "claimed": 0, "requeued": 0, "payloads": 0, "completed": 0, "unlocated": 0}
+    old_shards = await triage_queue.shard_keys()
+
+    async with redis_bytes_client.pipeline(transaction=True) as pipe:
+        pipe.delete(
+            *triage_queue.shard_index_keys(old_shards), triage_queue.TRIAGE_QUEUE_SHARDS_KEY, TRIAGE_GEO_KEY,
+            TRIAGE_FULL_PAYLOADS_KEY, TRIAGE_HOT_ORDER_KEY, TRIAGE_COMPLETED_KEY,
+        )
+        now = time.time()
+        for incident_id, record in state.items():
+            entry = record["entry"]
+            if record["status"] != COMPLETED and entry is not None:
+                if record["status"] == CLAIMED and incident_id in leased:
+                    # Off the queue while leased; the lease keeps what release needs
+                    counts["claimed"] += 1
+                else:
+                    triage_queue.stage_add(
+                        pipe, incident_id, entry, record["score"], record["enqueued_at"] or now, record["shard"]
+                    )
+                    counts["requeued" if record["status"] == CLAIMED else "queued"] += 1
+                if not postal_geo.stage_index_incident(pipe, incident_id, loads(entry).get("location")):
+                    counts["unlocated"] += 1
+            if record["payload"] is not None:
+                pipe.hset(TRIAGE_FULL_PAYLOADS_KEY, incident_id, record["payload"])
+                pipe.zadd(TRIAGE_HOT_ORDER_KEY, {incident_id: record["stored_at"] or now})
+                counts["payloads"] += 1
+                if record["status"] == COMPLETED:
+                    pipe.zadd(TRIAGE_COMPLETED_KEY, {incident_id: record["completed_at"] or now})
+                    counts["completed"] += 1
+        if not dry_run:
+            await pipe.execute()
+
+    counts.update(last_id=last_id, events_replayed=replayed, seconds=round(time.perf_counter() - started, 3))
+    return counts
+
+
+async def stats() -> dict:
+    """Stream length and the last snapshot, for GET /metrics."""
+    async with redis_bytes_client.pipeline(transaction=False) as pipe:
+        pipe.xlen(INCIDENT_EVENTS_KEY)
+        pipe.hmget(INCIDENT_SNAPSHOT_KEY, ["last_id", "taken_at", "incidents"])
+        length, (last_id, taken_at, incidents) = await pipe.execute()
+    return {
+        "stream_length": length,
+        "snapshot_last_id": _text(last_id),
+        "snapshot_age_seconds": round(time.time() - float(taken_at), 1) if taken_at else None,
+        "snapshot_incidents": int(incidents) if incidents else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incident event log snapshots and queue rebuild")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("snapshot", help="Fold new events into the snapshot now")
+    rebuild_parser = commands.add_parser("rebuild", help="Rebuild the queue and hot payloads from the log")
+    rebuild_parser.add_argument("--dry-run", action="store_true", help="Replay and count, but write nothing")
+    rebuild_parser.add_argument("--seed", action="store_true",
+                                help="With no snapshot yet, seed one from the live keys first")
+    args = parser.parse_args()
+    if args.command == "snapshot":
+        print(asyncio.run(take_snapshot()))
+    else:
+        try:
+            print(asyncio.run(rebuild(dry_run=args.dry_run, seed=args.seed)))
+        except RuntimeError as e:
+            raise SystemExit(f"[incident_snapshots] Rebuild refused: {e}")
+
+
+if __name__ == "__main__":
+    main()
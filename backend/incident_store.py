@@ -0,0 +1,227 @@
+"""
+Tiered storage for full incident payloads.
+
+    hot  - Redis hash keyed by incident id (open incidents, recently completed)
+    warm - local SQLite file with an id primary key (completed incidents)
+    cold - Pinecone, kept for semantic search and as the last-resort lookup
+
+Completed incidents stay hot for HOT_COMPLETED_TTL_SECONDS and are then
+demoted to the warm store by a periodic sweep. The hot tier is also capped at
+HOT_MAX_INCIDENTS (oldest completed first, then oldest open) and the warm tier
+at WARM_MAX_INCIDENTS, so memory and disk stay bounded by configuration.
+Payloads are stored as the same JSON bytes the enqueue path produces.
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+from backend import incident_events
+from backend.redis_client import acquire_interval_lock, redis_bytes_client
+
+# Hot tier keys
+TRIAGE_FULL_PAYLOADS_KEY = "triage_full_payloads_by_id"  # hash: id -> payload
+TRIAGE_HOT_ORDER_KEY = "triage_full_payloads_order"  # zset: id -> time stored hot
+TRIAGE_COMPLETED_KEY = "triage_full_payloads_completed"  # zset: id -> time completed
+
+HOT_COMPLETED_TTL_SECONDS = float(os.getenv("HOT_COMPLETED_TTL_SECONDS", "900"))
+HOT_MAX_INCIDENTS = int(os.getenv("HOT_MAX_INCIDENTS", "5000"))
+DEMOTION_INTERVAL_SECONDS = float(os.getenv("DEMOTION_INTERVAL_SECONDS", "60"))
+DEMOTION_BATCH_SIZE = int(os.getenv("DEMOTION_BATCH_SIZE", "500"))
+
+WARM_STORE_PATH = os.getenv(
+    "WARM_STORE_PATH", str(Path(__file__).parent / "warm_incidents.sqlite3")
+)
+WARM_MAX_INCIDENTS = int(os.getenv("WARM_MAX_INCIDENTS", "100000"))
+
+
+class WarmStore:
+    """SQLite-backed incident store indexed by id. Safe to share across threads."""
+
+    def __init__(self, path: str = WARM_STORE_PATH, max_incidents: int = WARM_MAX_INCIDENTS):
+        self.path = path
+        self.max_incidents = max_incidents
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS incidents (
+                    id TEXT PRIMARY KEY,
+                    payload BLOB NOT NULL,
+                    demoted_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS incidents_demoted_at ON incidents (demoted_at)")
+            self._conn = conn
+        return self._conn
+
+    def get(self, incident_id: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT payload FROM incidents WHERE id = ?", (incident_id,)
+            ).fetchone()
+        return bytes(row[0]) if row else None
+
+    def put_many(self, items: list) -> int:
+        """Insert or replace (id, payload) pairs, then trim to max_incidents."""
+        if not items:
+            return 0
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO incidents (id, payload, demoted_at) VALUES (?, ?, ?)",
+                    [(incident_id, payload, now) for incident_id, payload in items],
+                )
+                # Oldest warm rows are dropped first; Pinecone still holds them
+                conn.execute(
+                    """
+                    DELETE FROM incidents WHERE id IN (
+                        SELECT id FROM incidents ORDER BY demoted_at DESC LIMIT -1 OFFSET ?
+                    )
+                    """,
+                    (self.max_incidents,),
+                )
+        return len(items)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM incidents").fetchone()[0]
+
+
+warm_store = WarmStore()
+
+
+def stage_put_hot(pipe, incident_id: str, payload: bytes) -> None:
+    """Queue the writes that store (or replace) a hot payload on `pipe`."""
+    pipe.hset(TRIAGE_FULL_PAYLOADS_KEY, incident_id, payload)
+    pipe.zadd(TRIAGE_HOT_ORDER_KEY, {incident_id: time.time()}, nx=True)
+
+
+async def get_hot(incident_id: str) -> Optional[bytes]:
+    return await redis_bytes_client.hget(TRIAGE_FULL_PAYLOADS_KEY, incident_id)
+
+
+async def mark_completed(incident_id: str, payload: bytes) -> None:
+    """Store the completed payload hot and schedule it for demotion after the TTL."""
+    async with redis_bytes_client.pipeline(transaction=False) as pipe:
+        pipe.hset(TRIAGE_FULL_PAYLOADS_KEY, incident_id, payload)
+        pipe.zadd(TRIAGE_HOT_ORDER_KEY, {incident_id: time.time()}, nx=True)
+        pipe.zadd(TRIAGE_COMPLETED_KEY, {incident_id: time.time()})
+        await pipe.execute()
+
+
+async def get_incident(incident_id: str) -> Tuple[Optional[bytes], Optional[str]]:
+    """Read through the local tiers. Returns (payload, tier) or (None, None) for a cold miss."""
+    payload = await get_hot(incident_id)
+    if payload is not None:
+        return payload, "hot"
+    payload = await asyncio.to_thread(warm_store.get, incident_id)
+    if payload is not None:
+        return payload, "warm"
+    return None, None
+
+
+# KEYS: 1 payload hash, 2 hot order zset, 3 completed zset, 4 event stream
+# ARGV: 1 now, then (id, payload copied to the warm store or '' if there was none) pairs
+# Deletes each hot payload only if it is still the copied one, so a caller merged after
+# the copy keeps the payload hot until the next sweep. Returns the ids deleted.
+_DEMOTE_IF_UNCHANGED_LUA = """
+local demoted = {}
+for i = 2, #ARGV, 2 do
+  local id, copied = ARGV[i], ARGV[i + 1]
+  local current = redis.call('HGET', KEYS[1], id)
+  if (current or '') == copied then
+    redis.call('HDEL', KEYS[1], id)
+    redis.call('ZREM', KEYS[2], id)
+    redis.call('ZREM', KEYS[3], id)
+    demoted[#demoted + 1] = id
+  end
+end
+if #demoted > 0 then
+  redis.call('XADD', KEYS[4], '*', 'type', 'demoted', 'id', '', 'at', ARGV[1], 'ids', cjson.encode(demoted))
+end
+return demoted
+"""
+_demote_if_unchanged_script = redis_bytes_client.register_script(_DEMOTE_IF_UNCHANGED_LUA)
+
+
+async def _demote(incident_ids: list) -> int:
+    if not incident_ids:
+        return 0
+    payloads = await redis_bytes_client.hmget(TRIAGE_FULL_PAYLOADS_KEY, incident_ids)
+    items = [
+        (incident_id, payload)
+        for incident_id, payload in zip(incident_ids, payloads)
+        if payload is not None
+    ]
+    # Write warm before deleting hot so a crash never loses a payload
+    await asyncio.to_thread(warm_store.put_many, items)
+    args = [time.time()]
+    for incident_id, payload in zip(incident_ids, payloads):
+        args += [incident_id, payload if payload is not None else b""]
+    demoted = set(_ids(await _demote_if_unchanged_script(
+        keys=[TRIAGE_FULL_PAYLOADS_KEY, TRIAGE_HOT_ORDER_KEY, TRIAGE_COMPLETED_KEY,
+              incident_events.INCIDENT_EVENTS_KEY],
+        args=args,
+    )))
+    return sum(1 for incident_id, _ in items if incident_id in demoted)
+
+
+def _ids(raw_ids: list) -> list:
+    return [i.decode("utf-8") if isinstance(i, bytes) else i for i in raw_ids]
+
+
+async def demote_expired(now: Optional[float] = None) -> int:
+    """
+    Move completed incidents past their hot TTL to the warm store, then enforce
+    the hot-tier cap. Returns the number of incidents demoted.
+    """
+    now = time.time() if now is None else now
+    demoted = 0
+
+    expired = _ids(await redis_bytes_client.zrangebyscore(
+        TRIAGE_COMPLETED_KEY, "-inf", now - HOT_COMPLETED_TTL_SECONDS, start=0, num=DEMOTION_BATCH_SIZE
+    ))
+    demoted += await _demote(expired)
+
+    overflow = await redis_bytes_client.hlen(TRIAGE_FULL_PAYLOADS_KEY) - HOT_MAX_INCIDENTS
+    if overflow > 0:
+        # Completed incidents go first, then the oldest open ones
+        victims = _ids(await redis_bytes_client.zrange(TRIAGE_COMPLETED_KEY, 0, overflow - 1))
+        if len(victims) < overflow:
+            oldest = _ids(await redis_bytes_client.zrange(TRIAGE_HOT_ORDER_KEY, 0, overflow - 1))
+            victims += [i for i in oldest if i not in victims][: overflow - len(victims)]
+        demoted += await _demote(victims)
+
+    if demoted:
+        print(f"[incident_store] Demoted {demoted} incident(s) to warm store {warm_store.path}")
+    return demoted
+
+
+async def demotion_loop():
+    """
+    Background task: run demote_expired every DEMOTION_INTERVAL_SECONDS. With
+    several workers, only the one holding the interval lock sweeps, and it
+    writes to its own warm store. Point WARM_STORE_PATH at storage every
+    worker shares (one host, or a shared volume) so any worker can read the
+    demoted payloads; otherwise lookups on other nodes fall back to Pinecone.
+    """
+    while True:
+        try:
+            if await acquire_interval_lock("demotion_sweep", DEMOTION_INTERVAL_SECONDS):
+                await demote_expired()
+        except Exception as e:
+            print(f"[incident_store] Demotion sweep failed: {e}")
+        await asyncio.sleep(DEMOTION_INTERVAL_SECONDS)
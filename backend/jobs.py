@@ -0,0 +1,156 @@
+"""
+Job records for asynchronous /invoke submissions.
+
+A job is a Redis hash (job:<id>) so any worker can answer a status request,
+not only the one running the graph. Every state change is also published on
+job_events:<id> for clients that subscribe instead of polling.
+
+The graph runs as a task in the worker that accepted the job, which records
+itself as the job's owner and refreshes heartbeat_at every
+JOB_HEARTBEAT_SECONDS while the job is open. If that worker dies, the job
+would otherwise say "running" until it expires; reading a job whose
+heartbeat is older than JOB_STALE_SECONDS marks it failed instead.
+"""
+import asyncio
+import os
+import socket
+import time
+from typing import AsyncIterator, Optional
+
+import ulid
+
+from backend.redis_client import redis_client, redis_pubsub_client
+from backend.serialization import dumps, loads
+
+JOB_KEY_PREFIX = "job:"
+JOB_CHANNEL_PREFIX = "job_events:"
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "86400"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "15"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "60"))
+
+TERMINAL_STATUSES = {"succeeded", "failed"}
+
+# This worker, as recorded in the jobs it runs
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# KEYS: job hash; ARGV: 1 heartbeat cutoff, 2 now, 3 error, 4 channel
+# Fails an open job whose owner stopped sending heartbeats; returns 1 if it did.
+_FAIL_IF_STALE_LUA = """
+local status = redis.call('HGET', KEYS[1], 'status')
+if status ~= 'queued' and status ~= 'running' then return 0 end
+local beat = redis.call('HGET', KEYS[1], 'heartbeat_at') or redis.call('HGET', KEYS[1], 'updated_at')
+if tonumber(beat or '0') >= tonumber(ARGV[1]) then return 0 end
+redis.call('HSET', KEYS[1], 'status', 'failed', 'error', ARGV[3], 'updated_at', ARGV[2])
+redis.call('PUBLISH', ARGV[4], 'failed')
+return 1
+"""
+_fail_if_stale_script = redis_client.register_script(_FAIL_IF_STALE_LUA)
+
+
+def _job_key(job_id: str) -> str:
+    return f"{JOB_KEY_PREFIX}{job_id}"
+
+
+def _decode_job(raw: dict) -> Optional[dict]:
+    if not raw:
+        return None
+    job = dict(raw)
+    if job.get("result"):
+        job["result"] = loads(job["result"])
+    for field in ("created_at", "updated_at", "heartbeat_at"):
+        if field in job:
+            job[field] = float(job[field])
+    return job
+
+
+async def create_job() -> dict:
+    """Register a queued job owned by this worker."""
+    job_id = str(ulid.new())
+    now = time.time()
+    job = {
+        "job_id": job_id,
+        "status": "queued",
+        "owner": WORKER_ID,
+        "created_at": now,
+        "updated_at": now,
+        "heartbeat_at": now,
+    }
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.hset(_job_key(job_id), mapping=job)
+        pipe.expire(_job_key(job_id), JOB_TTL_SECONDS)
+        await pipe.execute()
+    return job
+
+
+async def update_job(job_id: str, status: str, result: Optional[dict] = None,
+                     error: Optional[str] = None, **fields) -> None:
+    """Record a state change (and any extra `fields`) and publish it to subscribers."""
+    fields = {**fields, "status": status, "updated_at": time.time()}
+    if result is not None:
+        fields["result"] = dumps(result)
+    if error is not None:
+        fields["error"] = error
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.hset(_job_key(job_id), mapping=fields)
+        pipe.expire(_job_key(job_id), JOB_TTL_SECONDS)
+        pipe.publish(f"{JOB_CHANNEL_PREFIX}{job_id}", status)
+        await pipe.execute()
+
+
+async def heartbeat(job_id: str) -> None:
+    """Refresh the job's heartbeat until cancelled; run it next to the job's task."""
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+        try:
+            await redis_client.hset(_job_key(job_id), "heartbeat_at", time.time())
+        except Exception as e:
+            print(f"[jobs] Heartbeat for job {job_id} failed: {e}")
+
+
+async def get_job(job_id: str) -> Optional[dict]:
+    """The job's current state. An open job whose owner has gone silent is marked failed first."""
+    job = _decode_job(await redis_client.hgetall(_job_key(job_id)))
+    if job is None or job["status"] in TERMINAL_STATUSES:
+        return job
+    now = time.time()
+    if job.get("heartbeat_at", job["updated_at"]) >= now - JOB_STALE_SECONDS:
+        return job
+    failed = await _fail_if_stale_script(
+        keys=[_job_key(job_id)],
+        args=[now - JOB_STALE_SECONDS, now, f"Worker {job.get('owner')} stopped running the job",
+              f"{JOB_CHANNEL_PREFIX}{job_id}"],
+    )
+    if failed:
+        print(f"[jobs] Marked job {job_id} failed; its worker {job.get('owner')} stopped")
+    return _decode_job(await redis_client.hgetall(_job_key(job_id)))
+
+
+async def job_events(job_id: str, timeout: float) -> AsyncIterator[dict]:
+    """
+    Yield the job's current state, then every change until it finishes or
+    `timeout` seconds pass. Subscribes before the first read so no update
+    between the read and the subscription is missed. The subscription uses
+    its own connection pool (see redis_client.py).
+    """
+    pubsub = redis_pubsub_client.pubsub()
+    await pubsub.subscribe(f"{JOB_CHANNEL_PREFIX}{job_id}")
+    try:
+        job = await get_job(job_id)
+        if job is None:
+            return
+        yield job
+        deadline = time.monotonic() + timeout
+        while job["status"] not in TERMINAL_STATUSES:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=min(remaining, 5.0))
+            previous, job = job, await get_job(job_id)
+            if job is None:
+                return
+            # Without a message the job is re-read only to notice a dead owner
+            if message is not None or job["status"] != previous["status"]:
+                yield job
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.aclose()
@@ -0,0 +1,296 @@
+"""
+Server-side claiming of queue entries by dispatchers.
+
+POST /queue/claim atomically takes the most urgent entry (optionally only from
+one sector, i.e. postal-code prefix) off the triage queue and records a lease
+for the dispatcher:
+
+    triage_leases    hash: id -> lease JSON (dispatcher, token, queue member,
+                     score, shard, enqueue time, claimed_at, expires_at)
+    triage_assigned  zset: id -> lease expiry (epoch seconds)
+
+The holder renews the lease before it expires. At the end it either completes
+the incident or releases it back to the queue. An expired lease is put back
+on the queue by the next claim or by the periodic sweep, whichever comes
+first, and its token stops working. Duplicate calls merged while the incident
+is leased update the member held in the lease (see
+triage_queue.stage_add_caller), so it goes back with the current caller
+count; a release re-scores it at once, an expiry at the next re-scoring
+sweep.
+
+Each operation is a single Lua script, so two dispatchers can never hold the
+same entry. A claim reads one ZSET head per shard, so it costs O(log N) per
+shard instead of a full /queue fetch. Every key a script touches, including
+the shard an expired or released lease goes back to, is passed in KEYS.
+Claims, releases and expiries are also appended to the incident event stream
+(incident_events.py) by the scripts.
+"""
+import asyncio
+import os
+import secrets
+import time
+from typing import Iterable, List, Optional
+
+from backend.incident_events import INCIDENT_EVENTS_KEY
+from backend.postal_geo import normalize_postal_code
+from backend.redis_client import acquire_interval_lock, redis_bytes_client
+from backend.serialization import loads
+from backend import scoring, triage_queue
+from backend.triage_queue import TRIAGE_QUEUE_KEY
+
+TRIAGE_LEASES_KEY = "triage_leases"  # hash: id -> lease JSON
+TRIAGE_ASSIGNED_KEY = "triage_assigned"  # zset: id -> lease expiry
+
+LEASE_TTL_SECONDS = float(os.getenv("LEASE_TTL_SECONDS", "60"))
+LEASE_MAX_TTL_SECONDS = float(os.getenv("LEASE_MAX_TTL_SECONDS", "900"))
+LEASE_SWEEP_INTERVAL_SECONDS = float(os.getenv("LEASE_SWEEP_INTERVAL_SECONDS", "5"))
+# Expired leases returned to the queue per script call
+LEASE_SWEEP_BATCH = int(os.getenv("LEASE_SWEEP_BATCH", "100"))
+# With a sector filter or excluded ids, entries examined per shard before giving up
+CLAIM_SCAN_LIMIT = int(os.getenv("CLAIM_SCAN_LIMIT", "200"))
+
+# Shared by every script. KEYS: 1 assigned zset, 2 leases hash, 3 event stream,
+# then (shard, members hash, enqueued_at hash) for every queue shard
+# (triage_queue.shard_index_keys), so a lease can go back to any of them.
+_LEASE_LUA_HELPERS = """
+local function shard_slot(shard)
+  for k = 4, #KEYS, 3 do
+    if KEYS[k] == shard then return k end
+  end
+  return nil
+end
+
+-- Returns false (and leaves the lease alone) if its shard was not passed in
+local function requeue(id, lease_json, reason, now)
+  local lease = cjson.decode(lease_json)
+  local k = shard_slot(lease.shard)
+  if not k then return false end
+  redis.call('ZADD', KEYS[k], lease.score, lease.member)
+  redis.call('HSET', KEYS[k + 1], id, lease.member)
+  if lease.enqueued_at then redis.call('HSET', KEYS[k + 2], id, lease.enqueued_at) end
+  redis.call('HDEL', KEYS[2], id)
+  redis.call('ZREM', KEYS[1], id)
+  redis.call('XADD', KEYS[3], '*', 'type', 'released', 'id', id, 'at', tostring(now),
+    'entry', lease.member, 'score', lease.score, 'shard', lease.shard, 'reason', reason)
+  return true
+end
+
+local function requeue_expired(now, batch)
+  local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now, 'LIMIT', 0, batch)
+  local requeued = 0
+  for _, id in ipairs(expired) do
+    local lease_json = redis.call('HGET', KEYS[2], id)
+    if not lease_json then
+      redis.call('ZREM', KEYS[1], id)
+    elseif requeue(id, lease_json, 'expired', now) then
+      requeued = requeued + 1
+    end
+  end
+  return {#expired, requeued}
+end
+"""
+
+# The first ARGV[8] shards in KEYS are the ones to claim from.
+# ARGV: 1 now, 2 lease seconds, 3 dispatcher, 4 token, 5 sector prefix or '',
+#       6 scan limit, 7 sweep batch, 8 shards to claim from, 9.. excluded ids
+# Returns the lease JSON, or nil if nothing matched.
+_CLAIM_LUA = _LEASE_LUA_HELPERS + """
+local now = tonumber(ARGV[1])
+requeue_expired(now, tonumber(ARGV[7]))
+local prefix = ARGV[5]
+local limit = tonumber(ARGV[6])
+local excluded = {}
+for i = 9, #ARGV do excluded[ARGV[i]] = true end
+local page = (prefix ~= '' or #ARGV >= 9) and 32 or 1
+
+local best_k, best_member, best_score, best_raw_score, best_id
+for k = 4, 3 + 3 * tonumber(ARGV[8]), 3 do
+  local start = 0
+  local done = false
+  while not done and start < limit do
+    local head = redis.call('ZRANGE', KEYS[k], start, start + page - 1, 'WITHSCORES')
+    if #head == 0 then break end
+    for j = 1, #head, 2 do
+      local score = tonumber(head[j + 1])
+      if best_score and score >= best_score then done = true break end
+      local ok, entry = pcall(cjson.decode, head[j])
+      if ok and type(entry) == 'table' and type(entry.id) == 'string' and not excluded[entry.id] then
+        local location = string.gsub(string.upper(tostring(entry.location or '')), '[^%w]', '')
+        if string.sub(location, 1, #prefix) == prefix then
+          best_k, best_member, best_score, best_raw_score, best_id = k, head[j], score, head[j + 1], entry.id
+          done = true
+          break
+        end
+      end
+    end
+    start = start + page
+  end
+end
+if not best_member then return nil end
+
+-- The lease carries the entry and its enqueue time until it is released or completed
+local enqueued_at = redis.call('HGET', KEYS[best_k + 2], best_id) or false
+redis.call('ZREM', KEYS[best_k], best_member)
+redis.call('HDEL', KEYS[best_k + 1], best_id)
+redis.call('HDEL', KEYS[best_k + 2], best_id)
+local expires_at = now + tonumber(ARGV[2])
+local lease = cjson.encode({
+  id = best_id, dispatcher = ARGV[3], token = ARGV[4], member = best_member,
+  score = best_raw_score, shard = KEYS[best_k], enqueued_at = enqueued_at,
+  claimed_at = now, expires_at = expires_at,
+})
+redis.call('HSET', KEYS[2], best_id, lease)
+redis.call('ZADD', KEYS[1], expires_at, best_id)
+redis.call('XADD', KEYS[3], '*', 'type', 'claimed', 'id', best_id, 'at', ARGV[1],
+  'dispatcher', ARGV[3], 'expires_at', tostring(expires_at))
+return lease
+"""
+
+# ARGV: 1 id, 2 token, 3 op (renew|release|complete), 4 now, 5 lease seconds
+# Returns the lease JSON (after renewal), or nil if the token does not hold a lease.
+_LEASE_OP_LUA = _LEASE_LUA_HELPERS + """
+local lease_json = redis.call('HGET', KEYS[2], ARGV[1])
+if not lease_json then return nil end
+local lease = cjson.decode(lease_json)
+if lease.token ~= ARGV[2] then return nil end
+local op = ARGV[3]
+if op == 'renew' then
+  lease.expires_at = tonumber(ARGV[4]) + tonumber(ARGV[5])
+  lease_json = cjson.encode(lease)
+  redis.call('HSET', KEYS[2], ARGV[1], lease_json)
+  redis.call('ZADD', KEYS[1], lease.expires_at, ARGV[1])
+elseif op == 'release' then
+  if not requeue(ARGV[1], lease_json, 'release', ARGV[4]) then
+    return redis.error_reply('shard ' .. tostring(lease.shard) .. ' not passed in KEYS')
+  end
+else
+  redis.call('HDEL', KEYS[2], ARGV[1])
+  redis.call('ZREM', KEYS[1], ARGV[1])
+end
+return lease_json
+"""
+
+# ARGV: 1 now, 2 batch. Returns {expired leases looked at, leases put back on the queue}.
+_SWEEP_LUA = _LEASE_LUA_HELPERS + """
+return requeue_expired(tonumber(ARGV[1]), tonumber(ARGV[2]))
+"""
+
+_claim_script = redis_bytes_client.register_script(_CLAIM_LUA)
+_lease_op_script = redis_bytes_client.register_script(_LEASE_OP_LUA)
+_sweep_script = redis_bytes_client.register_script(_SWEEP_LUA)
+
+
+def _lease_keys(shards: List[str]) -> list:
+    return [TRIAGE_ASSIGNED_KEY, TRIAGE_LEASES_KEY, INCIDENT_EVENTS_KEY, *triage_queue.shard_index_keys(shards)]
+
+
+def _clamp_ttl(lease_seconds: Optional[float]) -> float:
+    if lease_seconds is None:
+        return LEASE_TTL_SECONDS
+    return min(max(lease_seconds, 1.0), LEASE_MAX_TTL_SECONDS)
+
+
+def _decode_lease(raw) -> Optional[dict]:
+    """Lease as returned by the API: the queue entry replaces the stored member."""
+    if not raw:
+        return None
+    lease = loads(raw)
+    member = lease.pop("member", None)
+    lease["entry"] = loads(member) if member else None
+    for field in ("score", "enqueued_at"):
+        lease[field] = float(lease[field]) if lease.get(field) else None
+    return lease
+
+
+def _in_sector(key: str, sector: str) -> bool:
+    # Shard keys look like triage_queue:{M5V}; keep the ones overlapping the sector
+    region = key[len(TRIAGE_QUEUE_KEY) + 2:-1] if key != TRIAGE_QUEUE_KEY else ""
+    return not sector or not region or region.startswith(sector) or sector.startswith(region)
+
+
+async def claim(dispatcher: str, sector: Optional[str] = None, lease_seconds: Optional[float] = None,
+                exclude: Iterable[str] = ()) -> Optional[dict]:
+    """
+    Take the most urgent queued entry (in `sector`, a postal-code prefix, if
+    given and skipping `exclude` ids) and lease it to `dispatcher`. Returns the
+    lease, including its token and the queue entry, or None if nothing matched.
+    """
+    prefix = normalize_postal_code(sector)
+    shards = await triage_queue.shard_keys()
+    # Shards to claim from first; the rest are only there for expired leases going back
+    candidates = [key for key in shards if _in_sector(key, prefix)]
+    others = [key for key in shards if not _in_sector(key, prefix)]
+    raw = await _claim_script(
+        keys=_lease_keys(candidates + others),
+        args=[
+            time.time(), _clamp_ttl(lease_seconds), dispatcher, secrets.token_hex(16), prefix,
+            CLAIM_SCAN_LIMIT, LEASE_SWEEP_BATCH, len(candidates), *exclude,
+        ],
+    )
+    return _decode_lease(raw)
+
+
+async def _lease_op(incident_id: str, token: str, op: str, lease_seconds: Optional[float] = None):
+    return await _lease_op_script(
+        keys=_lease_keys(await triage_queue.shard_keys()),
+        args=[incident_id, token, op, time.time(), _clamp_ttl(lease_seconds)],
+    )
+
+
+async def renew(incident_id: str, token: str, lease_seconds: Optional[float] = None) -> Optional[dict]:
+    """Extend a lease; None if `token` no longer holds it."""
+    return _decode_lease(await _lease_op(incident_id, token, "renew", lease_seconds))
+
+
+async def release(incident_id: str, token: str) -> Optional[dict]:
+    """
+    Put a leased entry back on the queue, then re-score it (its callers may
+    have changed, and it has waited longer).
+    """
+    raw = await _lease_op(incident_id, token, "release")
+    if raw:
+        lease = loads(raw)
+        await scoring.rescore([(lease["member"].encode("utf-8"), float(lease["score"]))], queue_key=lease["shard"])
+    return _decode_lease(raw)
+
+
+async def complete(incident_id: str, token: str) -> Optional[dict]:
+    """End a lease for good; the caller then marks the incident completed."""
+    return _decode_lease(await _lease_op(incident_id, token, "complete"))
+
+
+async def active_leases() -> List[dict]:
+    """Every lease not yet completed, released or swept, soonest expiry first (tokens omitted)."""
+    leases = []
+    for raw in (await redis_bytes_client.hgetall(TRIAGE_LEASES_KEY)).values():
+        lease = _decode_lease(raw)
+        lease.pop("token", None)
+        leases.append(lease)
+    leases.sort(key=lambda lease: lease["expires_at"])
+    return leases
+
+
+async def sweep_expired(now: Optional[float] = None) -> int:
+    """Return expired leases to the queue; returns how many were requeued."""
+    now = time.time() if now is None else now
+    keys = _lease_keys(await triage_queue.shard_keys())
+    total = 0
+    while True:
+        expired, requeued = await _sweep_script(keys=keys, args=[now, LEASE_SWEEP_BATCH])
+        total += requeued
+        # A lease whose shard appeared after shard_keys() was read stays for the next sweep
+        if expired < LEASE_SWEEP_BATCH or not requeued:
+            return total
+
+
+async def lease_sweep_loop():
+    """Background task: requeue expired leases every LEASE_SWEEP_INTERVAL_SECONDS (one worker per interval)."""
+    while True:
+        try:
+            if await acquire_interval_lock("lease_sweep", LEASE_SWEEP_INTERVAL_SECONDS):
+                requeued = await sweep_expired()
+                if requeued:
+                    print(f"[leases] Returned {requeued} expired lease(s) to the queue")
+        except Exception as e:
+            print(f"[leases] Lease sweep failed: {e}")
+        await asyncio.sleep(LEASE_SWEEP_INTERVAL_SECONDS)
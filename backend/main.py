@@ -1,25 +1,31 @@
 import asyncio
+import functools
+import operator
 import os
+from contextlib import asynccontextmanager
 from pathlib import Path
 from dotenv import load_dotenv
-from typing import TypedDict, NotRequired, Optional
-from langgraph.graph import StateGraph, START, END
-from langchain_google_genai import ChatGoogleGenerativeAI
-from fastapi import FastAPI, Body, Response, Request, Form, HTTPException, BackgroundTasks
+from typing import Annotated, TypedDict, NotRequired, Optional, Literal
+from langchain_core.runnables import RunnableConfig
+from fastapi import FastAPI, Header, Response, Request, Form, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, ValidationError
 from typing import List, Dict, Any
 from datetime import datetime
 import traceback
-from twilio.twiml.voice_response import VoiceResponse
-from backend.transcribe_audio import transcribe_url
+from twilio.twiml.voice_response import VoiceResponse, Start
+from backend.transcribe_audio import transcribe_url, transcribe_audio_bytes, aclose_http_client
+from backend.media_stream import MediaStreamSession, fake_transcriber, STREAM_TRANSCRIBER
 from backend.schemas import (
     TranscriptIn,
     CallIncident,
     AssessmentIncident,
     TriageIncident,
     IncidentType,
-    SuggestedAction
+    SuggestedAction,
+    QueueEntry,
 )
+from backend import model_router
 import ulid
 
 
@@ -27,25 +33,86 @@ import ulid
 env_path = Path(__file__).parent / '.env'
 load_dotenv(dotenv_path=env_path)
 
-# Global model init (critical for Gemini to avoid blocking errors)
-model = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",  # Or your preferred Gemini model
-    google_api_key=os.getenv("GOOGLE_API_KEY"),
-    temperature=0.7
-)
+# One shared model instance per tier (critical for Gemini to avoid blocking
+# errors). They are built on first use or during startup warm-up;
+# langchain_google_genai alone takes about a second to import.
+_models: dict = {}
+
+
+def get_model(tier: str = model_router.STRONG):
+    """The shared Gemini chat model for a tier (see model_router.py)."""
+    if tier not in _models:
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        settings = model_router.TIERS[tier]
+        _models[tier] = ChatGoogleGenerativeAI(
+            model=settings["model"],
+            google_api_key=os.getenv("GOOGLE_API_KEY"),
+            temperature=settings["temperature"],
+        )
+    return _models[tier]
 
+import hashlib
 import json
 import time
-from backend.redis_client import redis_client
-from backend.vector_store import find_similar_incidents, add_incident, get_incident_by_id
-
+from backend.redis_client import redis_client, redis_bytes_client
+from backend.serialization import (
+    dumps,
+    dumps_model,
+    loads,
+    to_str,
+    json_array,
+    RawJSONResponse,
+    wrap_result,
+)
+from backend import vector_store
+from backend.vector_store import (
+    VectorStoreUnavailable,
+    find_similar_incidents,
+    add_incident,
+    update_incident,
+    get_incident_by_id,
+    incident_cache,
+    embedding_cache,
+    UpsertBatcher,
+)
+from backend.transcript_codec import encode_transcript, decode_record_transcript
+from backend import incident_store
+from backend.incident_store import TRIAGE_FULL_PAYLOADS_KEY
+from backend import jobs
+from backend import postal_geo
+from backend import scoring
+from backend import triage_queue
+from backend import call_state
+from backend import leases
+from backend import idempotency
+from backend import vector_maintenance
+from backend import outbox
+from backend import degraded
+from backend import circuit_breaker
+from backend import incident_events
+from backend import incident_snapshots
+from backend.circuit_breaker import CircuitBreaker, CircuitOpenError
+from backend.hedging import llm_hedger
 
-app = FastAPI()
 
 from fastapi.middleware.cors import CORSMiddleware
 
 
-TRIAGE_FULL_PAYLOADS_LIST_KEY = "triage_full_payloads"
+# Serve /queue by joining the stored ZSET members instead of decoding them.
+# Members are validated as QueueEntry when they are written.
+QUEUE_RAW_MODE = os.getenv("QUEUE_RAW_MODE", "1") != "0"
+
+# Duplicate candidates farther apart than this (postal-code centroids) are not merged; 0 disables
+DUPLICATE_RADIUS_KM = float(os.getenv("DUPLICATE_RADIUS_KM", "5"))
+
+# Longest a single LLM call may take, and the LLM time budget of one triage
+# run (all agents together). Past either, the step falls back to degraded
+# triage (see degraded.py) instead of holding the call out of the queue.
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "10"))
+TRIAGE_LLM_BUDGET_SECONDS = float(os.getenv("TRIAGE_LLM_BUDGET_SECONDS", "20"))
+# One breaker per model tier, so a light-tier outage does not also block the strong tier
+llm_breakers = {tier: CircuitBreaker(f"llm_{tier}") for tier in model_router.TIERS}
 
 
 """ 
@@ -54,11 +121,74 @@ NOTE: this function is commented out; run the script for every demo instead!
 async def startup_event():
     # Clear full payload list for a clean slate (demo/dev behavior)
     Reset full payload storage on dev server startup
-    deleted = await redis_client.delete(TRIAGE_FULL_PAYLOADS_LIST_KEY)
+    deleted = await redis_client.delete(TRIAGE_FULL_PAYLOADS_KEY)
     print(
-        f"[startup] Cleared full payload list ({TRIAGE_FULL_PAYLOADS_LIST_KEY}), deleted={deleted}"
+        f"[startup] Cleared full payload hash ({TRIAGE_FULL_PAYLOADS_KEY}), deleted={deleted}"
     ) """
 
+
+# Startup waits at most this long for clients and graphs to warm up; anything
+# not ready by then is initialized by the first request that needs it.
+STARTUP_WARMUP_TIMEOUT_SECONDS = float(os.getenv("STARTUP_WARMUP_TIMEOUT_SECONDS", "10"))
+# Set STARTUP_WARMUP=0 to skip warm-up entirely (e.g. offline development)
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "1") != "0"
+# Longest shutdown waits for the background loops to exit once cancelled
+SHUTDOWN_TASK_TIMEOUT_SECONDS = float(os.getenv("SHUTDOWN_TASK_TIMEOUT_SECONDS", "5"))
+
+
+def _warm_up() -> None:
+    """Build the model, graphs, Pinecone index handle and postal table ahead of the first call."""
+    for name, step in (
+        ("graphs", get_graph),
+        ("model", lambda: [get_model(tier) for tier in model_router.TIERS]),
+        ("pinecone", vector_store.warm_up),
+        ("postal centroids", lambda: len(postal_geo.postal_centroids)),
+    ):
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            print(f"[startup] Warm-up of {name} failed, will retry on first use: {e}")
+            continue
+        print(f"[startup] Warmed {name} in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if STARTUP_WARMUP:
+        try:
+            await asyncio.wait_for(asyncio.to_thread(_warm_up), STARTUP_WARMUP_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            print(f"[startup] Warm-up still running after {STARTUP_WARMUP_TIMEOUT_SECONDS}s; serving anyway")
+    # Periodically demote completed incidents from Redis to the warm store
+    app.state.demotion_task = asyncio.create_task(incident_store.demotion_loop())
+    # Periodically re-score the queue so waiting incidents escalate
+    app.state.rescore_task = asyncio.create_task(scoring.rescore_loop())
+    # Return expired dispatcher leases to the queue
+    app.state.lease_sweep_task = asyncio.create_task(leases.lease_sweep_loop())
+    # Archive vector partitions past their retention window
+    app.state.vector_maintenance_task = asyncio.create_task(vector_maintenance.maintenance_loop())
+    # Replay Pinecone writes queued during an outage
+    app.state.outbox_replay_task = asyncio.create_task(vector_store.outbox_replay_loop())
+    # Fold the incident event log into snapshots and trim it
+    app.state.snapshot_task = asyncio.create_task(incident_snapshots.snapshot_loop())
+    yield
+    tasks = (app.state.demotion_task, app.state.rescore_task, app.state.lease_sweep_task,
+             app.state.vector_maintenance_task, app.state.outbox_replay_task, app.state.snapshot_task)
+    for task in tasks:
+        task.cancel()
+    # Let each loop unwind before the HTTP client closes. A cancellation that
+    # lands just as a Redis reply arrives can be lost (asyncio.wait_for before
+    # Python 3.12), so the wait is bounded; timing out cancels the rest again.
+    try:
+        await asyncio.wait_for(asyncio.gather(*tasks, return_exceptions=True), SHUTDOWN_TASK_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        print(f"[shutdown] Background tasks still running after {SHUTDOWN_TASK_TIMEOUT_SECONDS}s; cancelled again")
+    await aclose_http_client()
+
+
+app = FastAPI(lifespan=lifespan)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"],
@@ -71,13 +201,62 @@ class AgentState(TypedDict, total=False):
     """State for the incident triage pipeline"""
     transcript: NotRequired[TranscriptIn]
     timestamped_transcript: NotRequired[Any]
+    # Pre-assigned ULID (async jobs and streamed calls hand it out before the graph runs)
+    incident_id: NotRequired[str]
+    # Original queue time for calls first triaged while still in progress
+    enqueued_at: NotRequired[float]
+    # Model tier the agents start on (set by call_agent, see model_router.py)
+    model_tier: NotRequired[str]
+    # time.monotonic() by which this run's LLM calls must finish (set by call_agent)
+    llm_deadline: NotRequired[float]
+    # Steps that ran without the LLM or Pinecone (see degraded.py); parallel steps both append
+    degraded: Annotated[list, operator.add]
     call_incident: NotRequired[CallIncident]
     assessment_incident: NotRequired[AssessmentIncident]
+    # Severity from triage_agent, joined with assessment_incident by finalize_triage
+    severity_level: NotRequired[str]
     triage_incident: NotRequired[TriageIncident]
+    # Duplicate candidates from the speculative search (set by dedupe_search)
+    similar_incidents: NotRequired[list]
     # Similarity suppression metadata (set by enqueue_node)
     duplicate_of: NotRequired[str]
 
 
+async def _invoke_model(agent: str, prompt: str, tier: str = model_router.STRONG,
+                        deadline: Optional[float] = None):
+    """
+    Call one tier's LLM for an agent, hedged when LLM_HEDGE=1 (see hedging.py).
+    The call goes through that tier's breaker and may take LLM_TIMEOUT_SECONDS,
+    or until `deadline` (time.monotonic()) if sooner. Every failure is raised
+    as model_router.LLMUnavailable.
+    """
+    timeout = LLM_TIMEOUT_SECONDS if deadline is None else min(LLM_TIMEOUT_SECONDS, deadline - time.monotonic())
+    if timeout <= 0:
+        raise model_router.LLMUnavailable(f"triage LLM budget of {TRIAGE_LLM_BUDGET_SECONDS}s used up")
+    try:
+        return await llm_breakers[tier].call(lambda: asyncio.wait_for(
+            llm_hedger.call(f"{agent}:{tier}", lambda: get_model(tier).ainvoke(prompt)), timeout
+        ))
+    except CircuitOpenError as e:
+        raise model_router.LLMUnavailable(str(e)) from e
+    except asyncio.TimeoutError as e:
+        raise model_router.LLMUnavailable(f"no answer from the {tier} model within {timeout:.1f}s") from e
+    except Exception as e:
+        raise model_router.LLMUnavailable(f"{tier} model call failed: {e}") from e
+
+
+def _fall_back(agent: str, error: Exception) -> None:
+    """Log an agent falling back to degraded triage; with DEGRADED_TRIAGE=0 fail the run instead."""
+    if not degraded.DEGRADED_TRIAGE:
+        raise HTTPException(status_code=503, detail=f"LLM unavailable: {error}")
+    print(f"[{agent}] LLM unavailable ({error}); using degraded triage")
+
+
+def _triaged_by_rules(state: dict) -> bool:
+    """Whether any agent fell back to degraded triage (a local duplicate search alone does not count)."""
+    return bool(set(state.get("degraded", [])) - {"dedupe_search"})
+
+
 def _extract_json_block(content: str) -> str:
     """Extract JSON from LLM response, handling code blocks"""
     text = content.strip()
@@ -114,30 +293,45 @@ EXTREMELY_IMPORTANT: Do not enclose the JSON with 3 backticks, ```.
 Output ONLY valid JSON with these exact fields: incidentType, location, date, time
 JSON:"""
     
-    try:
-        print(f"[call_agent] Prompt: {prompt}")
-        response = await model.ainvoke(prompt)
-        json_str = _extract_json_block(response.content)
-        parsed = json.loads(json_str)
-        
-        # Generate ULID and add required fields
-        incident_id = str(ulid.new())
+    # Generate ULID (unless one was pre-assigned)
+    incident_id = state.get("incident_id") or str(ulid.new())
+    # Every LLM call of this run, including assessment and triage, shares the budget
+    deadline = time.monotonic() + TRIAGE_LLM_BUDGET_SECONDS
+
+    def parse(content: str) -> CallIncident:
+        parsed = json.loads(_extract_json_block(content))
+        # Add required fields
         parsed["id"] = incident_id
         parsed["message"] = transcript.text  # Force original transcript text
         # Ensure duration is present (LLM prompt does not request it)
         if "duration" not in parsed or parsed["duration"] in (None, ""):
             parsed["duration"] = transcript.duration
-        
         # Validate with Pydantic
-        call_incident = CallIncident(**parsed)
+        return CallIncident(**parsed)
+
+    # Easy calls start on the light tier; the type must match the rules classifier
+    rules_type = model_router.classify_rules(transcript.text)
+    tier = state.get("model_tier") or model_router.starting_tier(transcript.text)
+
+    try:
+        print(f"[call_agent] Prompt: {prompt}")
+        call_incident, tier = await model_router.run_agent(
+            "call_agent", prompt, tier, functools.partial(_invoke_model, deadline=deadline), parse,
+            agrees=lambda incident: incident.incidentType.value == rules_type,
+        )
         
-        print(f"[call_agent] Extracted incident: {call_incident.incidentType}, location: {call_incident.location}")
+        print(f"[call_agent] Extracted incident: {call_incident.incidentType}, location: {call_incident.location} ({tier} tier)")
         print(f"[call_incident] FULL JSON OUTPUT: {call_incident.model_dump_json()}") # check output of agent 1 
-        return {"call_incident": call_incident}
+        return {"call_incident": call_incident, "model_tier": tier, "llm_deadline": deadline}
         
+    except model_router.LLMUnavailable as e:
+        _fall_back("call_agent", e)
+        call_incident = degraded.call_incident(transcript, incident_id)
+        print(f"[call_agent] Rules classified incident as {call_incident.incidentType}, location: {call_incident.location}")
+        return {"call_incident": call_incident, "model_tier": tier, "llm_deadline": deadline,
+                "degraded": ["call_agent"]}
     except (json.JSONDecodeError, ValidationError) as e:
         print(f"[call_agent] Error parsing LLM output: {e}")
-        print(f"[call_agent] Raw LLM output: {response.content if 'response' in locals() else 'N/A'}")
         raise HTTPException(status_code=422, detail=f"Failed to parse call agent output: {str(e)}")
     except Exception as e:
         print(f"[call_agent] Unexpected error: {e}")
@@ -152,6 +346,9 @@ async def assessment_agent_node(state: AgentState):
     Outputs: desc (summary), suggested_actions
     """
     call_incident = state["call_incident"]
+    if "call_agent" in state.get("degraded", []):
+        # The LLM just failed call_agent; don't spend the budget finding that out again
+        return {"assessment_incident": degraded.assessment(call_incident), "degraded": ["assessment_agent"]}
     
     prompt = f"""You are a 911 dispatcher assistant. Based on the incident details, generate a concise one-line description and suggest an appropriate action.
 
@@ -167,29 +364,33 @@ Output ONLY a JSON object with these exact fields:
 
 JSON:"""
     
-    try:
-        print(f"[assessment_agent] Prompt: {prompt}")
-        response = await model.ainvoke(prompt)
-        json_str = _extract_json_block(response.content)
-        parsed = json.loads(json_str)
-        
+    def parse(content: str) -> AssessmentIncident:
+        parsed = json.loads(_extract_json_block(content))
         # Merge with call_incident data and add hard-coded fields
         incident_data = call_incident.model_dump()
         incident_data.update(parsed)
         incident_data["status"] = "called"  # Hard-coded
         incident_data["severity_level"] = "none"  # Hard-coded
-        
         # Validate with Pydantic
-        assessment_incident = AssessmentIncident(**incident_data)
+        return AssessmentIncident(**incident_data)
+
+    try:
+        print(f"[assessment_agent] Prompt: {prompt}")
+        assessment_incident, _ = await model_router.run_agent(
+            "assessment_agent", prompt, state.get("model_tier", model_router.STRONG),
+            functools.partial(_invoke_model, deadline=state.get("llm_deadline")), parse,
+        )
         
         print(f"[assessment_agent] Added desc: {assessment_incident.desc[:50]}...")
         print(f"[assessment_agent] Suggested action: {assessment_incident.suggested_actions}")
         print(f"[assessment_agent] FULL JSON FROM AGENT 2: {assessment_incident.model_dump_json()}") # check the full JSON output 
         return {"assessment_incident": assessment_incident}
         
+    except model_router.LLMUnavailable as e:
+        _fall_back("assessment_agent", e)
+        return {"assessment_incident": degraded.assessment(call_incident), "degraded": ["assessment_agent"]}
     except (json.JSONDecodeError, ValidationError) as e:
         print(f"[assessment_agent] Error parsing LLM output: {e}")
-        print(f"[assessment_agent] Raw LLM output: {response.content if 'response' in locals() else 'N/A'}")
         raise HTTPException(status_code=422, detail=f"Failed to parse assessment agent output: {str(e)}")
     except Exception as e:
         print(f"[assessment_agent] Unexpected error: {e}")
@@ -200,10 +401,13 @@ JSON:"""
 # Agent 3: triage_agent - Assign severity level
 async def triage_agent_node(state: AgentState):
     """
-    Classifies incident severity and prepares for queue.
+    Classifies incident severity from the call_agent output, so it runs in
+    parallel with assessment_agent.
     Outputs: severity_level ("1", "2", or "3")
     """
-    assessment_incident = state["assessment_incident"]
+    call_incident = state["call_incident"]
+    if "call_agent" in state.get("degraded", []):
+        return {"severity_level": degraded.severity(call_incident), "degraded": ["triage_agent"]}
     
     prompt = f"""You are a 911 triage specialist. Classify the severity of this incident from 1 to 3:
 
@@ -213,38 +417,38 @@ Severity levels:
 - "3": Life-threatening, urgent, immediate action required (e.g., armed robbery, mass fire, terrorist attack)
 
 Incident details:
-- Type: {assessment_incident.incidentType}
-- Description: {assessment_incident.desc}
-- Location: {assessment_incident.location}
-- Message: {assessment_incident.message}
+- Type: {call_incident.incidentType}
+- Location: {call_incident.location}
+- Message: {call_incident.message}
 
 Output ONLY a JSON object with this exact field:
 - severity_level: must be "1", "2", or "3" (as a string)
 
 JSON:"""
     
+    def parse(content: str) -> str:
+        return str(json.loads(_extract_json_block(content))["severity_level"])
+
+    # On the light tier, the severity must be the usual one for the incident type
+    expected_severity = model_router.RULE_SEVERITY.get(call_incident.incidentType.value)
+
     try:
         print(f"[triage_agent] Prompt: {prompt}")
-        response = await model.ainvoke(prompt)
-        json_str = _extract_json_block(response.content)
-        parsed = json.loads(json_str)
-        
-        # Merge with assessment data and override status
-        incident_data = assessment_incident.model_dump()
-        incident_data["severity_level"] = parsed["severity_level"]
-        incident_data["status"] = "in progress"  # Hard-coded for queue
-        
-        # Validate with Pydantic
-        triage_incident = TriageIncident(**incident_data)
-        
-        print(f"[triage_agent] Assigned severity: {triage_incident.severity_level}")
-        print(f"[triage_agent] FULL JSON FROM AGENT 3: {triage_incident.model_dump_json()}") 
-        # check the full JSON output of agent 3
-        return {"triage_incident": triage_incident}
+        severity_level, tier = await model_router.run_agent(
+            "triage_agent", prompt, state.get("model_tier", model_router.STRONG),
+            functools.partial(_invoke_model, deadline=state.get("llm_deadline")), parse,
+            agrees=lambda severity: severity == expected_severity,
+        )
+        print(f"[triage_agent] Assigned severity: {severity_level} ({tier} tier)")
+        return {"severity_level": severity_level}
         
-    except (json.JSONDecodeError, ValidationError) as e:
+    except model_router.LLMUnavailable as e:
+        _fall_back("triage_agent", e)
+        severity_level = degraded.severity(call_incident)
+        print(f"[triage_agent] Rules assigned severity: {severity_level}")
+        return {"severity_level": severity_level, "degraded": ["triage_agent"]}
+    except (json.JSONDecodeError, KeyError) as e:
         print(f"[triage_agent] Error parsing LLM output: {e}")
-        print(f"[triage_agent] Raw LLM output: {response.content if 'response' in locals() else 'N/A'}")
         raise HTTPException(status_code=422, detail=f"Failed to parse triage agent output: {str(e)}")
     except Exception as e:
         print(f"[triage_agent] Unexpected error: {e}")
@@ -252,37 +456,111 @@ JSON:"""
         raise
 
 
+# Join: assessment (desc, suggested action) + triage (severity) -> queue-ready incident
+async def finalize_triage_node(state: AgentState):
+    """
+    Runs once assessment_agent and triage_agent have both finished.
+    Outputs: triage_incident
+    """
+    # Merge with assessment data and override status
+    incident_data = state["assessment_incident"].model_dump()
+    incident_data["severity_level"] = state["severity_level"]
+    incident_data["status"] = "in progress"  # Hard-coded for queue
+
+    try:
+        # Validate with Pydantic
+        triage_incident = TriageIncident(**incident_data)
+    except ValidationError as e:
+        print(f"[triage_agent] Error validating triage output: {e}")
+        raise HTTPException(status_code=422, detail=f"Failed to parse triage agent output: {str(e)}")
+
+    print(f"[triage_agent] FULL JSON FROM AGENT 3: {triage_incident.model_dump_json()}")
+    # check the full JSON output of agent 3
+    return {"triage_incident": triage_incident}
+
+
+# Speculative duplicate search, overlapping with triage_agent
+async def dedupe_search_node(state: AgentState):
+    """
+    Searches Pinecone for duplicates as soon as assessment_agent has produced
+    `desc`. The search only reads desc, type, location, date and time, so the
+    severity is not needed. enqueue_node uses the result instead of searching
+    again; if triage then fails, the search was wasted.
+    Outputs: similar_incidents
+    """
+    # Same fields the search would read from the full payload
+    similar_incidents, local = await _search_duplicates(state["assessment_incident"].model_dump(mode="json"))
+    if local:
+        return {"similar_incidents": similar_incidents, "degraded": ["dedupe_search"]}
+    return {"similar_incidents": similar_incidents}
+
+
+async def _search_duplicates(incident: dict) -> tuple:
+    """
+    Duplicate candidates from Pinecone, or from the open incidents in Redis
+    when Pinecone is unavailable. Returns (candidates, searched locally).
+    """
+    try:
+        similar_incidents = await asyncio.to_thread(
+            find_similar_incidents, dumps(incident), similarity_threshold=0.7, radius_km=DUPLICATE_RADIUS_KM or None
+        )
+    except VectorStoreUnavailable as e:
+        print(f"[dedupe] {e}; searching open incidents locally")
+        return await degraded.local_duplicates(incident, DUPLICATE_RADIUS_KM or None), True
+    return similar_incidents, False
+
+
+async def _find_queue_entry(incident_id: str):
+    """Return (raw member, score, enqueued_at, shard key) of the queue entry for an incident, or None."""
+    return await triage_queue.find_entry(incident_id)
+
+
+def _stage_drop_provisional(pipe, incident_id: str, found) -> bool:
+    """
+    Queue removal of a streamed call's provisional entry and payload on
+    `pipe`, if `found` is one (mark it finalized first, see triage_queue.mark_finalized).
+    """
+    if found is None or not loads(found[0]).get("provisional"):
+        return False
+    triage_queue.stage_remove(pipe, incident_id, found)
+    postal_geo.stage_unindex_incident(pipe, incident_id)
+    pipe.hdel(TRIAGE_FULL_PAYLOADS_KEY, incident_id)
+    pipe.zrem(incident_store.TRIAGE_HOT_ORDER_KEY, incident_id)
+    incident_events.stage_event(pipe, incident_events.REMOVED, incident_id)
+    return True
+
+
 # Enqueue node: Add to Redis sorted set
-async def enqueue_node(state: AgentState):
+async def enqueue_node(state: AgentState, config: RunnableConfig):
     """
     Add the final triage incident to Redis ZSET for queue processing.
     Lower score = higher priority (more urgent).
     Skips adding if a similar incident already exists.
+    Batch runs pass an UpsertBatcher as config["configurable"]["upsert_batcher"]
+    so Pinecone writes are grouped into fewer requests.
     """
     triage_incident = state["triage_incident"]
     
     print(f"TRIAGE CHECKPOINT: {triage_incident.model_dump_json()}")
 
-    def _enum_value(value: Any):
-        return value.value if hasattr(value, "value") else value
-
-    # Build the full payload first for duplicate checking
-    triage_full_payload = triage_incident.model_dump()
-    # Convert enum values to strings for JSON serialization
-    triage_full_payload["incidentType"] = _enum_value(triage_full_payload.get("incidentType"))
-    triage_full_payload["suggested_actions"] = _enum_value(triage_full_payload.get("suggested_actions"))
+    # Build the full payload first for duplicate checking (mode="json" emits enum values as strings)
+    triage_full_payload = triage_incident.model_dump(mode="json")
     
     timestamped = state.get("timestamped_transcript")
     if timestamped is not None:
-        triage_full_payload["transcript"] = timestamped
-        print(f"[enqueue] Appending timestamped transcript with {len(timestamped) if isinstance(timestamped, list) else 'unknown count'} segments")
+        # Encode once; the same compact string goes to Redis and Pinecone
+        triage_full_payload["transcript"] = encode_transcript(timestamped)
+        print(f"[enqueue] Appending timestamped transcript with {len(timestamped) if isinstance(timestamped, list) else 'unknown count'} segments ({len(triage_full_payload['transcript'])} chars encoded)")
     else:
         print("[enqueue] No timestamped transcript to append to Pinecone payload")
 
-    pinecone_json = json.dumps(triage_full_payload)
+    pinecone_json = dumps(triage_full_payload)
 
-    # Check for similar/duplicate incidents before adding
-    similar_incidents = find_similar_incidents(pinecone_json, similarity_threshold=0.7)
+    # Check for similar/duplicate incidents before adding (normally already
+    # searched by dedupe_search while triage_agent ran)
+    similar_incidents = state.get("similar_incidents")
+    if similar_incidents is None:
+        similar_incidents, _ = await _search_duplicates(triage_full_payload)
     if similar_incidents:
         print(f"[enqueue] Found {len(similar_incidents)} similar incident(s), skipping duplicate:")
         # here
@@ -292,92 +570,125 @@ async def enqueue_node(state: AgentState):
         duplicate_id = similar_incidents[0]["id"]
         
         # Fetch the existing incident and increment callers
-        existing_incident = get_incident_by_id(duplicate_id)
+        # Transcript is only written back, so leave it encoded; the hit's date picks its partition
+        try:
+            existing_incident = await asyncio.to_thread(
+                get_incident_by_id, duplicate_id, decode_transcript=False,
+                date=similar_incidents[0]["date"], time_=similar_incidents[0]["time"],
+            )
+        except VectorStoreUnavailable as e:
+            print(f"[enqueue] {e}; reading duplicate {duplicate_id} locally")
+            existing_incident = None
+        if existing_incident is None:
+            # Pinecone is unavailable or the duplicate's upsert is still in the outbox; use the local copy
+            local_payload, _ = await incident_store.get_incident(duplicate_id)
+            existing_incident = loads(local_payload) if local_payload is not None else None
+        # The caller count is incremented in Redis, in one script over the queue entry and hot
+        # payload, so concurrent merges of the same incident each add one; Pinecone and the
+        # record cache then get that count. The Pinecone copy is only the starting point
+        # when Redis holds neither (e.g. demoted).
+        known_callers = existing_incident.get("callers", 1) if existing_incident else 1
+        callers = None
+        try:
+            # The duplicate's own shard is looked at first
+            shards = await triage_queue.shard_keys()
+            hint = triage_queue.shard_key(similar_incidents[0].get("location"))
+            shards.sort(key=lambda shard: shard != hint)
+            provisional = None
+            if state.get("incident_id"):
+                await triage_queue.mark_finalized(triage_incident.id)
+                async with redis_bytes_client.pipeline(transaction=False) as pipe:
+                    triage_queue.stage_find_entry(pipe, triage_incident.id, shards)
+                    provisional = triage_queue.parse_found_entry((await pipe.execute())[0])
+            async with redis_bytes_client.pipeline(transaction=True) as pipe:
+                triage_queue.stage_add_caller(
+                    pipe, duplicate_id, TRIAGE_FULL_PAYLOADS_KEY, incident_events.INCIDENT_EVENTS_KEY,
+                    leases.TRIAGE_LEASES_KEY, shards, known_callers, time.time(),
+                )
+                dropped = _stage_drop_provisional(pipe, triage_incident.id, provisional)
+                callers, found = triage_queue.parse_added_caller((await pipe.execute())[0])
+            if found is not None:
+                # Re-score for the extra caller; skipped if another merge replaced the entry meanwhile
+                raw_entry, score, _, shard = found
+                await scoring.rescore([(raw_entry, score)], queue_key=shard)
+                print(f"[enqueue] Updated Redis queue entry with callers={callers} for incident {duplicate_id}")
+            if dropped:
+                print(f"[enqueue] Removed provisional queue entry for {triage_incident.id}")
+        except Exception as e:
+            print(f"[enqueue] Failed to update Redis queue for incident {duplicate_id}: {e}")
+
         if existing_incident:
-            current_callers = existing_incident.get("callers", 1)
-            existing_incident["callers"] = current_callers + 1
-            updated = add_incident(json.dumps(existing_incident))
+            existing_incident["callers"] = callers if callers is not None else known_callers + 1
+            # Metadata-only update: the stored vector is kept, nothing is re-embedded. It also
+            # refreshes the shared record cache the other workers read.
+            updated = await asyncio.to_thread(update_incident, existing_incident, ["callers"])
             if updated:
-                print(f"[enqueue] Incremented callers to {existing_incident['callers']} for incident {duplicate_id}")
+                print(f"[enqueue] Set callers to {existing_incident['callers']} for incident {duplicate_id}")
             else:
                 print(f"[enqueue] Failed to update callers for incident {duplicate_id}")
 
-            try:
-                raw_entries = await redis_client.zrange("triage_queue", 0, -1, withscores=True)
-                for raw_entry, score in raw_entries:
-                    try:
-                        entry = json.loads(raw_entry)
-                    except json.JSONDecodeError:
-                        continue
-                    if entry.get("id") == duplicate_id:
-                        # Remove old entry
-                        await redis_client.zrem("triage_queue", raw_entry)
-                        # Update callers count
-                        entry["callers"] = current_callers + 1
-                        # Re-add with same score
-                        new_entry_json = json.dumps(entry)
-                        await redis_client.zadd("triage_queue", {new_entry_json: score})
-                        print(f"[enqueue] Updated Redis queue entry with callers={entry['callers']} for incident {duplicate_id}")
-                        break
-            except Exception as e:
-                print(f"[enqueue] Failed to update Redis queue for incident {duplicate_id}: {e}")
-
-            # Also update the full payload list in Redis
-            try:
-                cached_entries = await redis_client.lrange(TRIAGE_FULL_PAYLOADS_LIST_KEY, 0, -1)
-                for idx, cached_payload in enumerate(cached_entries):
-                    try:
-                        record = json.loads(cached_payload)
-                    except json.JSONDecodeError:
-                        continue
-                    if record.get("id") == duplicate_id:
-                        record["callers"] = current_callers + 1
-                        # Remove old and insert updated at same position
-                        await redis_client.lrem(TRIAGE_FULL_PAYLOADS_LIST_KEY, 1, cached_payload)
-                        await redis_client.rpush(TRIAGE_FULL_PAYLOADS_LIST_KEY, json.dumps(record))
-                        print(f"[enqueue] Updated Redis full payload with callers={record['callers']} for incident {duplicate_id}")
-                        break
-            except Exception as e:
-                print(f"[enqueue] Failed to update Redis full payload for incident {duplicate_id}: {e}")
-            
         print(f"[enqueue] Incident {triage_incident.id} NOT added (duplicate of {similar_incidents[0]['id']})")
         return {"duplicate_of": similar_incidents[0]["id"]}
 
-    # Calculate priority score: current time - (severity * 30 minutes)
-    # Higher severity gets a lower score (higher priority)
-    severity_int = int(triage_incident.severity_level)
-    score = time.time() - (severity_int * 1800)
+    # Streamed calls keep the time their provisional entry was first queued
+    enqueued_at = state.get("enqueued_at", time.time())
     
-    # Store only the minimal queue payload
-    queue_entry = {
-        "id": triage_incident.id,
-        "incidentType": _enum_value(triage_incident.incidentType),
-        "location": triage_incident.location,
-        "time": triage_incident.time,
-        "severity_level": triage_incident.severity_level,
-        "suggested_actions": _enum_value(triage_incident.suggested_actions),
-        "callers": 1,
-    }
-    item_json = json.dumps(queue_entry)
-    print(f"[enqueue] Queue entry payload: {item_json}")
-    print(f"ACTION: enqueue_queue {item_json}")
+    # Store only the minimal queue payload, validated here so /queue can serve it raw
+    queue_entry = QueueEntry(
+        id=triage_incident.id,
+        incidentType=triage_incident.incidentType,
+        location=triage_incident.location,
+        time=triage_incident.time,
+        severity_level=triage_incident.severity_level,
+        suggested_actions=triage_incident.suggested_actions,
+        callers=1,
+        degraded=_triaged_by_rules(state),
+    )
+    item_json = dumps_model(queue_entry)
+    # Lower score = higher priority; see scoring.py
+    score = scoring.compute_score(queue_entry.model_dump(), enqueued_at)
+    print(f"[enqueue] Queue entry payload: {to_str(item_json)}")
+    print(f"ACTION: enqueue_queue {to_str(item_json)}")
     
-    print(f"[enqueue] Adding to queue - ID: {triage_incident.id}, Severity: {severity_int}, Score: {score}")
-    await redis_client.zadd("triage_queue", {item_json: score})
+    print(f"[enqueue] Adding to queue - ID: {triage_incident.id}, Severity: {triage_incident.severity_level}, Score: {score}")
+    # Region shard for this incident (the single triage_queue key unless sharding is on)
+    shard = triage_queue.shard_key(triage_incident.location)
+    # A streamed call may already have a provisional entry under this id; replace it in place.
+    # Marking the call finalized first means no provisional update can land after the lookup.
+    existing = None
+    if state.get("incident_id"):
+        await triage_queue.mark_finalized(triage_incident.id)
+        existing = await _find_queue_entry(triage_incident.id)
+    # Queue entry, id index, enqueue time, geo index and hot payload (demoted
+    # after completion) are written in one transaction
+    async with redis_client.pipeline(transaction=True) as pipe:
+        triage_queue.stage_replace(pipe, triage_incident.id, existing, item_json, score, enqueued_at, shard)
+        located = postal_geo.stage_index_incident(pipe, triage_incident.id, triage_incident.location)
+        incident_store.stage_put_hot(pipe, triage_incident.id, pinecone_json)
+        incident_events.stage_event(
+            pipe, incident_events.CREATED, triage_incident.id,
+            entry=item_json, score=score, enqueued_at=enqueued_at, shard=shard, payload=pinecone_json,
+        )
+        pipe.zcard(shard)
+        results = await pipe.execute()
+    if existing is not None:
+        print(f"[enqueue] Replaced provisional queue entry for {triage_incident.id}")
+    if not located:
+        print(f"[enqueue] No centroid for location {triage_incident.location!r}; not in geo index")
     
     # Log queue state
-    queue_size = await redis_client.zcard("triage_queue")
-    print(f"[enqueue] Queue size: {queue_size}")
-
-    # Store full payload in Redis using a separate data structure (list) (before Pinecone, no TTL)
-    await redis_client.rpush(TRIAGE_FULL_PAYLOADS_LIST_KEY, pinecone_json)
+    print(f"[enqueue] Queue size: {results[-1]} ({shard})")
     print(
-        f"[enqueue] Appended full payload for {triage_incident.id} to {TRIAGE_FULL_PAYLOADS_LIST_KEY}"
+        f"[enqueue] Stored full payload for {triage_incident.id} in {TRIAGE_FULL_PAYLOADS_KEY}"
     )
 
     # Add to Pinecone for downstream analytics
-    print(f"ACTION: enqueue_pinecone {pinecone_json}")
-    pinecone_ok = add_incident(pinecone_json)
+    print(f"ACTION: enqueue_pinecone {to_str(pinecone_json)}")
+    upsert_batcher = (config or {}).get("configurable", {}).get("upsert_batcher")
+    if upsert_batcher is not None:
+        pinecone_ok = await upsert_batcher.add(pinecone_json)
+    else:
+        pinecone_ok = await asyncio.to_thread(add_incident, pinecone_json)
     if pinecone_ok:
         print(f"[enqueue] Pinecone: indexed incident {triage_incident.id}")
     else:
@@ -385,21 +696,55 @@ async def enqueue_node(state: AgentState):
     
     return {}  # No state changes, just side effect
 
-# Build the incident triage pipeline graph
-# Flow: START -> call_agent -> assessment_agent -> triage_agent -> enqueue -> END
-workflow = StateGraph(state_schema=AgentState)
-workflow.add_node("call_agent", call_agent_node)
-workflow.add_node("assessment_agent", assessment_agent_node)
-workflow.add_node("triage_agent", triage_agent_node)
-workflow.add_node("enqueue", enqueue_node)
-
-workflow.add_edge(START, "call_agent")
-workflow.add_edge("call_agent", "assessment_agent")
-workflow.add_edge("assessment_agent", "triage_agent")
-workflow.add_edge("triage_agent", "enqueue")
-workflow.add_edge("enqueue", END)
-
-graph = workflow.compile()
+def _compile_graphs() -> dict:
+    """Compile the pipeline graphs (importing langgraph is deferred to here)."""
+    from langgraph.graph import StateGraph, START, END
+
+    # Build the incident triage pipeline graph
+    # Flow: START -> call_agent -+-> assessment_agent -> dedupe_search -+-> finalize_triage -> enqueue -> END
+    #                            +-> triage_agent ----------------------+
+    # Severity and desc/action only need the call_agent output, and the
+    # duplicate search only needs desc, so it overlaps with triage_agent.
+    workflow = StateGraph(state_schema=AgentState)
+    workflow.add_node("call_agent", call_agent_node)
+    workflow.add_node("assessment_agent", assessment_agent_node)
+    workflow.add_node("triage_agent", triage_agent_node)
+    workflow.add_node("dedupe_search", dedupe_search_node)
+    workflow.add_node("finalize_triage", finalize_triage_node)
+    workflow.add_node("enqueue", enqueue_node)
+
+    workflow.add_edge(START, "call_agent")
+    workflow.add_edge("call_agent", "assessment_agent")
+    workflow.add_edge("call_agent", "triage_agent")
+    workflow.add_edge("assessment_agent", "dedupe_search")
+    workflow.add_edge(["dedupe_search", "triage_agent"], "finalize_triage")
+    workflow.add_edge("finalize_triage", "enqueue")
+    workflow.add_edge("enqueue", END)
+
+    # Same agents without the duplicate search and enqueue side effects, for
+    # partial transcripts of calls still in progress (see /media-stream)
+    provisional_workflow = StateGraph(state_schema=AgentState)
+    provisional_workflow.add_node("call_agent", call_agent_node)
+    provisional_workflow.add_node("assessment_agent", assessment_agent_node)
+    provisional_workflow.add_node("triage_agent", triage_agent_node)
+    provisional_workflow.add_node("finalize_triage", finalize_triage_node)
+    provisional_workflow.add_edge(START, "call_agent")
+    provisional_workflow.add_edge("call_agent", "assessment_agent")
+    provisional_workflow.add_edge("call_agent", "triage_agent")
+    provisional_workflow.add_edge(["assessment_agent", "triage_agent"], "finalize_triage")
+    provisional_workflow.add_edge("finalize_triage", END)
+
+    return {"triage": workflow.compile(), "provisional": provisional_workflow.compile()}
+
+
+_graphs: dict = {}
+
+
+def get_graph(name: str = "triage"):
+    """A compiled graph: "triage" (full pipeline) or "provisional" (no enqueue)."""
+    if not _graphs:
+        _graphs.update(_compile_graphs())
+    return _graphs[name]
 
 
 class InvokeRequest(BaseModel):
@@ -408,67 +753,104 @@ class InvokeRequest(BaseModel):
     timestamped_transcript: Any = None
 
 
+async def run_pipeline(request: InvokeRequest, config: Optional[RunnableConfig] = None,
+                       initial_state: Optional[dict] = None) -> dict:
+    """Run one transcript through the graph and build the /invoke response payload."""
+    # Debug logging to verify request payload
+    transcript = request.transcript
+    timestamped = request.timestamped_transcript
+    print(
+        "[invoke] Received body:",
+        {
+            "text_len": len(transcript.text) if transcript and transcript.text else 0,
+            "time": transcript.time if transcript else None,
+            "location": transcript.location if transcript else None,
+            "duration": transcript.duration if transcript else None,
+            "timestamped_count": len(timestamped) if isinstance(timestamped, list) else "n/a",
+        },
+    )
+
+    graph_input = {
+        "transcript": request.transcript,
+        "timestamped_transcript": request.timestamped_transcript,
+    }
+    if initial_state:
+        graph_input.update(initial_state)
+    result = await get_graph().ainvoke(graph_input, config=config)
+
+    # Return the final triage incident
+    triage_incident = result.get("triage_incident")
+    if not triage_incident:
+        raise HTTPException(status_code=500, detail="Pipeline did not produce triage incident")
+
+    duplicate_of = result.get("duplicate_of")
+    enqueued = duplicate_of is None
+    if duplicate_of is not None:
+        notice = "Similar incident detected; this call was not added to the live queue."
+    else:
+        notice = None
+
+    # NOTE: clients can use `enqueued=false` to show a toast/banner for this specific call
+    response_payload = {
+        "result": triage_incident.model_dump(mode="json"),
+        "enqueued": enqueued,
+        "duplicate_of": duplicate_of,
+        "notice": notice,
+        # Steps that ran without the LLM or Pinecone (see degraded.py)
+        "degraded": result.get("degraded", []),
+    }
+    # Safe print: do NOT print transcript/message text (PII risk)
+    print(
+        "[invoke] Response summary:",
+        json.dumps(
+            {
+                "incidentId": getattr(triage_incident, "id", None),
+                "enqueued": enqueued,
+                "duplicate_of": duplicate_of,
+                "notice": notice,
+                "degraded": response_payload["degraded"],
+            }
+        ),
+    )
+    return response_payload
+
+
+def _request_fingerprint(request: InvokeRequest) -> str:
+    return hashlib.sha256(request.model_dump_json().encode()).hexdigest()
+
+
+async def _run_idempotent(scope: str, key: Optional[str], request: InvokeRequest, fn) -> RawJSONResponse:
+    """
+    Run `fn()` once per Idempotency-Key (see idempotency.py); without a key it
+    just runs. Replays are marked with an Idempotent-Replayed header.
+    """
+    if not key:
+        return RawJSONResponse(await fn())
+    try:
+        payload, how = await idempotency.run_once(scope, key, fn, _request_fingerprint(request))
+    except idempotency.IdempotencyKeyReused as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except idempotency.IdempotencyTimeout as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if how != idempotency.EXECUTED:
+        print(f"[idempotency] {scope} key {key}: {how}")
+    return RawJSONResponse(payload, headers={"Idempotent-Replayed": str(how != idempotency.EXECUTED).lower()})
+
+
 @app.post("/invoke")
-async def invoke_workflow(request: InvokeRequest):
+async def invoke_workflow(request: InvokeRequest,
+                          idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
     """
     Process a transcript through the 3-agent pipeline and enqueue for triage.
     
     Input: TranscriptIn (text, time, location)
     Output: TriageIncident JSON (the final incident that was enqueued)
+
+    With an Idempotency-Key header, retries of the same request get the first
+    run's response instead of triaging the transcript again.
     """
     try:
-        # Debug logging to verify request payload
-        transcript = request.transcript
-        timestamped = request.timestamped_transcript
-        print(
-            "[invoke] Received body:",
-            {
-                "text_len": len(transcript.text) if transcript and transcript.text else 0,
-                "time": transcript.time if transcript else None,
-                "location": transcript.location if transcript else None,
-                "duration": transcript.duration if transcript else None,
-                "timestamped_count": len(timestamped) if isinstance(timestamped, list) else "n/a",
-            },
-        )
-
-        result = await graph.ainvoke({
-            "transcript": request.transcript,
-            "timestamped_transcript": request.timestamped_transcript,
-        })
-        
-        # Return the final triage incident
-        triage_incident = result.get("triage_incident")
-        if not triage_incident:
-            raise HTTPException(status_code=500, detail="Pipeline did not produce triage incident")
-
-        duplicate_of = result.get("duplicate_of")
-        enqueued = duplicate_of is None
-        if duplicate_of is not None:
-            notice = "Similar incident detected; this call was not added to the live queue."
-        else:
-            notice = None
-
-        # NOTE: clients can use `enqueued=false` to show a toast/banner for this specific call
-        response_payload = {
-            "result": triage_incident.model_dump(),
-            "enqueued": enqueued,
-            "duplicate_of": duplicate_of,
-            "notice": notice,
-        }
-        # Safe print: do NOT print transcript/message text (PII risk)
-        print(
-            "[invoke] Response summary:",
-            json.dumps(
-                {
-                    "incidentId": getattr(triage_incident, "id", None),
-                    "enqueued": enqueued,
-                    "duplicate_of": duplicate_of,
-                    "notice": notice,
-                }
-            ),
-        )
-        return response_payload
-        
+        return await _run_idempotent("invoke", idempotency_key, request, lambda: run_pipeline(request))
     except HTTPException:
         raise
     except Exception as e:
@@ -476,120 +858,491 @@ async def invoke_workflow(request: InvokeRequest):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Pipeline execution failed: {str(e)}")
 
-@app.get("/queue")
-async def get_queue():
+
+# Strong references to running async jobs so they are not garbage collected
+_job_tasks: set = set()
+JOB_EVENTS_TIMEOUT_SECONDS = float(os.getenv("JOB_EVENTS_TIMEOUT_SECONDS", "120"))
+
+
+async def _run_job(job_id: str, request: InvokeRequest):
+    await jobs.update_job(job_id, "running")
+    heartbeat = asyncio.create_task(jobs.heartbeat(job_id))
+    try:
+        payload = await run_pipeline(request)
+    except HTTPException as e:
+        await jobs.update_job(job_id, "failed", error=str(e.detail))
+    except Exception as e:
+        print(f"[jobs] Job {job_id} failed: {e}")
+        traceback.print_exc()
+        await jobs.update_job(job_id, "failed", error=f"Pipeline execution failed: {str(e)}")
+    else:
+        incident_id = payload["result"]["id"]
+        await jobs.update_job(job_id, "succeeded", result=payload, incident_id=incident_id)
+        print(f"[jobs] Job {job_id} succeeded for incident {incident_id}")
+    finally:
+        heartbeat.cancel()
+
+
+@app.post("/invoke/async", status_code=202)
+async def invoke_async(request: InvokeRequest,
+                       idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    """
+    Submit a transcript without waiting for the pipeline.
+
+    Returns a job id right away; the graph runs in this worker in the
+    background. Poll GET /jobs/{job_id} or subscribe to GET
+    /jobs/{job_id}/events for the result. The final payload has the same
+    shape as the /invoke response, and the job then carries its incident_id.
+
+    With an Idempotency-Key header, a retry returns the job that was already
+    submitted instead of starting another.
+    """
+    response = await _run_idempotent("invoke_async", idempotency_key, request, lambda: _submit_job(request))
+    response.status_code = 202
+    return response
+
+
+async def _submit_job(request: InvokeRequest) -> dict:
+    job = await jobs.create_job()
+    task = asyncio.create_task(_run_job(job["job_id"], request))
+    _job_tasks.add(task)
+    task.add_done_callback(_job_tasks.discard)
+    print(f"[jobs] Queued job {job['job_id']}")
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "status_url": f"/jobs/{job['job_id']}",
+        "events_url": f"/jobs/{job['job_id']}/events",
+    }
+
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Current state of an async job; answered from Redis by any worker."""
+    job = await jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return RawJSONResponse(job)
+
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """Server-sent events: the job's state now and on every change until it finishes."""
+    if await jobs.get_job(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+
+    async def event_stream():
+        async for job in jobs.job_events(job_id, JOB_EVENTS_TIMEOUT_SECONDS):
+            yield b"event: job\ndata: " + dumps(job) + b"\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+BATCH_INVOKE_CONCURRENCY = int(os.getenv("BATCH_INVOKE_CONCURRENCY", "8"))
+
+
+async def _ndjson_lines(request: Request):
+    """Yield non-empty lines from a streamed NDJSON request body."""
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+
+@app.post("/invoke/batch")
+async def invoke_batch(request: Request):
+    """
+    Bulk ingestion. The body is NDJSON, one /invoke request per line.
+
+    Items start as soon as their line arrives and run concurrently, up to
+    BATCH_INVOKE_CONCURRENCY at a time. Pinecone upserts are grouped by an
+    UpsertBatcher. Results are streamed back as NDJSON in completion order:
+    {"line", "id", "enqueued", "duplicate_of"} or {"line", "error"}.
+    """
+    semaphore = asyncio.Semaphore(BATCH_INVOKE_CONCURRENCY)
+    batcher = UpsertBatcher()
+    config: RunnableConfig = {"configurable": {"upsert_batcher": batcher}}
+    results: asyncio.Queue = asyncio.Queue()
+
+    async def run_item(line_no: int, line: bytes):
+        async with semaphore:
+            try:
+                item = InvokeRequest.model_validate(loads(line))
+                payload = await run_pipeline(item, config)
+                await results.put({
+                    "line": line_no,
+                    "id": payload["result"]["id"],
+                    "enqueued": payload["enqueued"],
+                    "duplicate_of": payload["duplicate_of"],
+                })
+            except HTTPException as e:
+                await results.put({"line": line_no, "error": e.detail})
+            except (json.JSONDecodeError, ValidationError) as e:
+                await results.put({"line": line_no, "error": f"Invalid request line: {e}"})
+            except Exception as e:
+                print(f"[invoke_batch] Line {line_no} failed: {e}")
+                await results.put({"line": line_no, "error": f"Pipeline execution failed: {str(e)}"})
+
+    # Read the body before the response starts (not every server/proxy allows
+    # reading the request while streaming the response), but start each item
+    # as soon as its line arrives so ingestion overlaps with the upload.
+    started = time.perf_counter()
+    tasks = []
+    try:
+        async for line in _ndjson_lines(request):
+            tasks.append(asyncio.create_task(run_item(len(tasks) + 1, line)))
+    except Exception:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    async def finish():
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            await batcher.close()
+            await results.put(None)
+
+    async def stream_results():
+        finisher = asyncio.create_task(finish())
+        count = 0
+        try:
+            while True:
+                item = await results.get()
+                if item is None:
+                    break
+                count += 1
+                yield dumps(item) + b"\n"
+        finally:
+            if not finisher.done():
+                finisher.cancel()
+            elapsed = time.perf_counter() - started
+            print(
+                f"[invoke_batch] Processed {count} item(s) in {elapsed:.2f}s "
+                f"({batcher.batches} Pinecone upsert batch(es))"
+            )
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
+@app.get("/queue", response_class=RawJSONResponse)
+async def get_queue(raw: Optional[bool] = None, near: Optional[str] = None,
+                    radius_km: Optional[float] = None, sort: Literal["priority", "distance"] = "priority",
+                    region: Optional[str] = None, limit: Optional[int] = None):
+    """
+    Return the triage queue, most urgent first.
+
+    When the queue is sharded by region (QUEUE_SHARD_PREFIX_LEN), the shard
+    heads are k-way merged into one view. `region` (a postal code or prefix)
+    reads only that region's shard, and `limit` caps how many entries are read
+    from each shard and returned.
+
+    In raw mode (QUEUE_RAW_MODE, on by default) the stored ZSET members are
+    joined into the response body without being parsed. Pass `?raw=false` to
+    decode each entry and drop any that are malformed.
+
+    `near` (a postal code or FSA for the dispatcher's sector) adds a
+    `distance_km` to each entry. `radius_km` keeps only entries within that
+    distance, and `sort=distance` orders nearest first. Entries whose location
+    is unknown are listed last, and only when no radius is given.
+    """
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be at least 1")
+    raw_entries = [member for member, _ in await triage_queue.merged_entries(limit, region)]
+    if near:
+        return await _queue_near(raw_entries, near, radius_km, sort)
+    if QUEUE_RAW_MODE if raw is None else raw:
+        print(f"[queue] Returning {len(raw_entries)} entries (raw)")
+        return RawJSONResponse(json_array(raw_entries))
+
     queue_summary = []
-    raw_entries = await redis_client.zrange("triage_queue", 0, -1)
     for raw_entry in raw_entries:
         try:
-            entry = json.loads(raw_entry)
+            entry = loads(raw_entry)
             queue_summary.append(entry)
         except json.JSONDecodeError:
             print("[queue] Failed to decode queue entry:", raw_entry)
+    body = dumps(queue_summary)
     print(f"[queue] Returning {len(queue_summary)} entries")
-    print(f"ACTION: queue_return {json.dumps(queue_summary)}")
-    return queue_summary
+    print(f"ACTION: queue_return {to_str(body)}")
+    return RawJSONResponse(body)
 
 
-@app.get("/agent/{incident_id}")
-async def get_agent(incident_id: str):
-    """Retrieve a single incident by ULID. Checks Redis cache first, falls back to Pinecone."""
-    
-    # First, check Redis list cache for a matching ULID
-    cached_entries = await redis_client.lrange(TRIAGE_FULL_PAYLOADS_LIST_KEY, 0, -1)
-    for cached_payload in cached_entries:
+async def _queue_near(raw_entries: list, near: str, radius_km: Optional[float], sort: str) -> RawJSONResponse:
+    nearby = await postal_geo.incidents_near(near, radius_km)
+    if nearby is None:
+        raise HTTPException(status_code=400, detail=f"Unknown postal code: {near}")
+    distances = dict(nearby)
+
+    located, unlocated = [], []
+    for raw_entry in raw_entries:
         try:
-            record = json.loads(cached_payload)
+            entry = loads(raw_entry)
         except json.JSONDecodeError:
             continue
-        if record.get("id") == incident_id:
-            print(
-                f"[get_agent] Found incident {incident_id} in Redis list {TRIAGE_FULL_PAYLOADS_LIST_KEY}"
-            )
-            return {"result": record}
+        distance = distances.get(entry.get("id"))
+        if distance is not None:
+            entry["distance_km"] = round(distance, 2)
+            located.append(entry)
+        elif radius_km is None:
+            entry["distance_km"] = None
+            unlocated.append(entry)
+    if sort == "distance":
+        located.sort(key=lambda entry: entry["distance_km"])
+    print(f"[queue] Returning {len(located) + len(unlocated)} entries near {near} (radius={radius_km}, sort={sort})")
+    return RawJSONResponse(dumps(located + unlocated))
+
+
+@app.get("/agent/{incident_id}", response_class=RawJSONResponse)
+async def get_agent(incident_id: str):
+    """
+    Retrieve a single incident by ULID. Reads through the tiers: Redis (hot),
+    the local warm store, Pinecone, then the archive of dropped partitions.
+    """
+    cached_payload, tier = await incident_store.get_incident(incident_id)
+    if cached_payload is not None:
+        try:
+            record = loads(cached_payload)
+        except json.JSONDecodeError:
+            record = None
+        if record is not None:
+            print(f"[get_agent] Found incident {incident_id} in {tier} tier")
+            if not isinstance(record.get("transcript"), str):
+                # No compact transcript to expand; stored bytes are already the response body
+                return RawJSONResponse(wrap_result(cached_payload))
+            return RawJSONResponse({"result": decode_record_transcript(record)})
     
     # Fall back to Pinecone
     if not os.getenv("PINECONE_API_KEY"):
         raise HTTPException(status_code=500, detail="Pinecone API key is not configured.")
 
     try:
-        record = get_incident_by_id(incident_id)
+        record = await asyncio.to_thread(get_incident_by_id, incident_id)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except VectorStoreUnavailable as e:
+        # Not a 404: the incident may well exist once Pinecone answers again
+        print(f"[get_agent] {e}; cannot look up {incident_id}")
+        raise HTTPException(status_code=503, detail="Incident store is temporarily unavailable.")
 
     if record is None:
-        raise HTTPException(status_code=404, detail="Incident not found.")
+        # Partitions past VECTOR_RETENTION_DAYS are archived and dropped from Pinecone
+        record = await asyncio.to_thread(vector_maintenance.find_archived, incident_id)
+        if record is None:
+            raise HTTPException(status_code=404, detail="Incident not found.")
+        print(f"[get_agent] Found incident {incident_id} in the vector archive")
+        return RawJSONResponse({"result": decode_record_transcript(record)})
 
     print(f"[get_agent] Found incident {incident_id} in Pinecone")
-    return {"result": record}
+    return RawJSONResponse({"result": record})
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """In-process performance counters for this worker."""
+    return {
+        "incident_cache": incident_cache.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "llm": llm_hedger.stats(),
+        "models": model_router.stats(),
+        "idempotency": idempotency.stats(),
+        "breakers": circuit_breaker.stats(),
+        "outbox": await asyncio.to_thread(outbox.stats),
+        "events": await incident_snapshots.stats(),
+    }
+
+
+@app.get("/events")
+async def stream_incident_events(after: Optional[str] = None,
+                                 last_event_id: Optional[str] = Header(None, alias="Last-Event-ID")):
+    """
+    Server-sent events: incident lifecycle events (see incident_events.py) as
+    they happen, read from the event stream rather than the queue keys. Pass a
+    stream id as `after` (or reconnect with Last-Event-ID) to resume without
+    gaps. Full payloads are not sent.
+    """
+    async def event_stream():
+        async for event in incident_events.follow(last_event_id or after):
+            if event is None:
+                yield b": keep-alive\n\n"
+                continue
+            header = f"id: {event['event_id']}\nevent: {event['type']}\ndata: ".encode()
+            yield header + dumps(incident_events.public_event(event)) + b"\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
 
 
 @app.delete("/remove/{incident_id}")
 async def remove_incident(incident_id: str):
-    raw_entries = await redis_client.zrange("triage_queue", 0, -1)
-    matched_entry = None
-    for entry in raw_entries:
-        try:
-            payload = json.loads(entry)
-        except json.JSONDecodeError:
-            continue
-        if payload.get("id") == incident_id:
-            matched_entry = entry
-            break
-
-    if not matched_entry:
+    found = await _find_queue_entry(incident_id)
+    if not found:
         print(f"[remove] No queue entry found for {incident_id}")
         raise HTTPException(status_code=404, detail="Incident not found in queue")
 
-    print(f"ACTION: remove_match {matched_entry}")
-    removed = await redis_client.zrem("triage_queue", matched_entry)
+    print(f"ACTION: remove_match {to_str(found[0])}")
+    async with redis_bytes_client.pipeline(transaction=True) as pipe:
+        triage_queue.stage_remove(pipe, incident_id, found)
+        _stage_close_incident(pipe, incident_id)
+        results = await pipe.execute()
+    removed, cached_payload = results[0], results[-1]
     print(f"[remove] Removed {removed} queue entries for {incident_id}")
     print(f"ACTION: remove_result {{\"removed\": {removed}}}")
+    return {"removed": removed, "status_update": await _mark_completed(incident_id, cached_payload)}
+
+
+def _stage_close_incident(pipe, incident_id: str) -> None:
+    """
+    Queue the geo-index removal, completed event and hot payload read for an
+    incident leaving the queue (payload is the last result).
+    """
+    postal_geo.stage_unindex_incident(pipe, incident_id)
+    incident_events.stage_event(pipe, incident_events.COMPLETED, incident_id)
+    pipe.hget(TRIAGE_FULL_PAYLOADS_KEY, incident_id)
+
 
-    matched_payload_raw = None
+async def _mark_completed(incident_id: str, cached_payload: Optional[bytes]) -> str:
+    """
+    Flag an incident's hot payload as completed and update its status in
+    Pinecone. An open incident the hot-tier cap has demoted is read from the
+    warm store, then from Pinecone. Returns the status_update value reported
+    by /remove.
+    """
+    if cached_payload is None:
+        cached_payload, tier = await incident_store.get_incident(incident_id)
+        if tier is not None:
+            print(f"[remove] Payload for {incident_id} read from the {tier} tier")
     matched_full_record = None
-    cached_entries = await redis_client.lrange(TRIAGE_FULL_PAYLOADS_LIST_KEY, 0, -1)
-    for cached_payload in cached_entries:
+    if cached_payload is not None:
         try:
-            record = json.loads(cached_payload)
+            matched_full_record = loads(cached_payload)
         except json.JSONDecodeError:
-            continue
-        if record.get("id") == incident_id:
-            matched_payload_raw = cached_payload
-            matched_full_record = record
-            break
+            matched_full_record = None
+    if not matched_full_record:
+        try:
+            matched_full_record = await asyncio.to_thread(
+                get_incident_by_id, incident_id, decode_transcript=False
+            )
+        except (ValueError, VectorStoreUnavailable):
+            matched_full_record = None
 
-    if not matched_full_record or not matched_payload_raw:
+    if not matched_full_record:
         print(
-            f"[remove] No cached full payload found for {incident_id} in {TRIAGE_FULL_PAYLOADS_LIST_KEY}"
+            f"[remove] No full payload found for {incident_id} in Redis, the warm store or Pinecone"
         )
         print(f"ACTION: remove_status_update {{\"status\": \"missing cached payload\"}}")
-        return {"removed": removed, "status_update": "missing cached payload"}
+        return "missing cached payload"
 
     previous_status = matched_full_record.get("status")
     matched_full_record["status"] = "completed"
-    print(f"ACTION: remove_status_update {json.dumps(matched_full_record)}")
-    status_updated = add_incident(json.dumps(matched_full_record))
+    status_payload = dumps(matched_full_record)
+    print(f"ACTION: remove_status_update {to_str(status_payload)}")
+    # Completed payloads stay hot until the TTL sweep demotes them to the warm store,
+    # whether or not the Pinecone status update succeeds
+    await incident_store.mark_completed(incident_id, status_payload)
+    status_updated = await asyncio.to_thread(update_incident, matched_full_record, ["status"])
     if status_updated:
         print(f"[remove] Updated status from {previous_status} to completed for {incident_id}")
-        # Remove the cached entry from the list (first occurrence)
-        await redis_client.lrem(TRIAGE_FULL_PAYLOADS_LIST_KEY, 1, matched_payload_raw)
     else:
         print(f"[remove] Failed to update Pinecone status for {incident_id}")
+    return "completed" if status_updated else "failed"
+
+
+class ClaimRequest(BaseModel):
+    """Request body for POST /queue/claim"""
+    dispatcher: str
+    # Postal-code prefix of the dispatcher's sector (e.g. "M5V"); any entry if omitted
+    sector: Optional[str] = None
+    lease_seconds: Optional[float] = None
+    # Entries the dispatcher should not be handed (e.g. one a human is looking at)
+    exclude: List[str] = []
+
+
+class LeaseRequest(BaseModel):
+    """Request body for the lease renew/release/complete endpoints"""
+    token: str
+    lease_seconds: Optional[float] = None
+
+
+@app.post("/queue/claim")
+async def claim_queue_entry(request: ClaimRequest):
+    """
+    Atomically take the most urgent unclaimed entry (optionally within a
+    sector) off the queue and lease it to a dispatcher. The response holds the
+    lease token, its expiry and the queue entry. 204 means nothing to claim.
+    """
+    lease = await leases.claim(request.dispatcher, request.sector, request.lease_seconds, request.exclude)
+    if lease is None:
+        return Response(status_code=204)
+    print(f"[claim] {request.dispatcher} claimed {lease['id']} until {lease['expires_at']:.0f}")
+    return lease
+
+
+@app.get("/queue/leases")
+async def list_leases():
+    """Entries currently assigned to dispatchers (tokens are not included)."""
+    return await leases.active_leases()
 
-    return {"removed": removed, "status_update": "completed" if status_updated else "failed"}
+
+def _lease_not_held(incident_id: str) -> HTTPException:
+    return HTTPException(
+        status_code=409, detail=f"No lease held on {incident_id} with this token (expired or claimed by someone else)"
+    )
+
+
+@app.post("/queue/leases/{incident_id}/renew")
+async def renew_lease(incident_id: str, request: LeaseRequest):
+    lease = await leases.renew(incident_id, request.token, request.lease_seconds)
+    if lease is None:
+        raise _lease_not_held(incident_id)
+    return lease
+
+
+@app.post("/queue/leases/{incident_id}/release")
+async def release_lease(incident_id: str, request: LeaseRequest):
+    """Give the entry back to the queue with its original priority."""
+    lease = await leases.release(incident_id, request.token)
+    if lease is None:
+        raise _lease_not_held(incident_id)
+    print(f"[claim] {lease['dispatcher']} released {incident_id}")
+    return {"released": True}
+
+
+@app.post("/queue/leases/{incident_id}/complete")
+async def complete_lease(incident_id: str, request: LeaseRequest):
+    """Finish a claimed incident (the lease equivalent of DELETE /remove)."""
+    lease = await leases.complete(incident_id, request.token)
+    if lease is None:
+        raise _lease_not_held(incident_id)
+    print(f"[claim] {lease['dispatcher']} completed {incident_id}")
+    async with redis_bytes_client.pipeline(transaction=True) as pipe:
+        _stage_close_incident(pipe, incident_id)
+        results = await pipe.execute()
+    return {"completed": True, "status_update": await _mark_completed(incident_id, results[-1])}
 
 
-call_times = {}
-call_numbers = {}
-# will add phone numbers
+# Call start times, caller numbers and streamed-incident ids live in Redis
+# (call_state.py) so any worker can serve any of a call's requests.
+
+# Fork call audio to /media-stream so triage starts while the caller is talking.
+# The recording below still runs and upgrades the provisional entry when it finishes.
+STREAMING_TRIAGE = os.getenv("STREAMING_TRIAGE", "0") == "1"
+MEDIA_STREAM_URL = os.getenv("MEDIA_STREAM_URL")  # e.g. wss://example.ngrok.app/media-stream
 
 # incoming web hook for Twilio calls 
 @app.post("/call")
-async def incoming_call(CallSid: str = Form(None)):
+async def incoming_call(request: Request, CallSid: str = Form(None), From: str = Form(None)):
     """Webhook to receive calls."""
     response = VoiceResponse()
-    call_times[CallSid] = datetime.utcnow().isoformat()
+    await call_state.update_call(CallSid, started_at=datetime.utcnow().isoformat(), caller_number=From)
+    if STREAMING_TRIAGE:
+        start = Start()
+        start.stream(url=MEDIA_STREAM_URL or f"wss://{request.url.netloc}/media-stream", track="inbound_track")
+        response.append(start)
     response.say("911, please describe your emergency. Press the star key when you are finished.")
     response.record(finish_on_key="*", action=f"/recording-finished?CallSid={CallSid}", method="POST")
     return Response(content=str(response), media_type="application/xml")
@@ -602,23 +1355,44 @@ async def upload_recording(request: Request, background: BackgroundTasks):
     recording_url = form.get("RecordingUrl")
     recording_sid = form.get("RecordingSid")
     call_sid = request.query_params.get("CallSid")
-    call_start_time = call_times.get(call_sid)
+    call_start_time = (await call_state.get_call(call_sid)).get("started_at")
     print(f"Recording URL: {recording_url}")
     print(f"Recording SID: {recording_sid}")
     print(f"Call SID: {call_sid}")
     print(f"Call started at: {call_start_time}")
 
     if recording_url:
-        background.add_task(transcribe_enqueue, recording_url, call_start_time)
+        background.add_task(transcribe_enqueue, recording_url, call_start_time, call_sid, recording_sid)
     
     response = VoiceResponse()
     response.say("Thank you for calling. A dispatcher will contact you shortly.")
     response.hangup()
     return Response(content=str(response), media_type="application/xml")
 
-async def transcribe_enqueue(src: str, call_start_time: str):
-    import asyncio
-    content = transcribe_url(src, call_start_time)
+async def transcribe_enqueue(src: str, call_start_time: str, call_sid: Optional[str] = None,
+                             recording_sid: Optional[str] = None):
+    """
+    Transcribe a finished recording and run it through the pipeline, once per
+    recording: Twilio retries of /recording-finished attach to or replay the
+    first run (keyed by RecordingSid, or CallSid when there is none).
+    """
+    key = recording_sid or call_sid
+    try:
+        if key is None:
+            await _transcribe_and_run(src, call_start_time, call_sid)
+            return
+        _, how = await idempotency.run_once(
+            "recording", key, lambda: _transcribe_and_run(src, call_start_time, call_sid)
+        )
+        if how != idempotency.EXECUTED:
+            print(f"[transcribe_enqueue] Duplicate webhook for recording {key}: {how}")
+    except Exception as e:
+        print(f"[transcribe_enqueue] Pipeline failed for call {call_sid}: {e}")
+        traceback.print_exc()
+
+
+async def _transcribe_and_run(src: str, call_start_time: str, call_sid: Optional[str]) -> dict:
+    content = await transcribe_url(src, call_start_time)
     transcript_payload = TranscriptIn(
         text=content.get("process_transcript", ""),
         time=content.get("call_start_time", ""),
@@ -630,7 +1404,109 @@ async def transcribe_enqueue(src: str, call_start_time: str):
         transcript=transcript_payload,
         timestamped_transcript=content.get("transcript"),
     )
-    await invoke_workflow(request_model)
+
+    # If the call was streamed, finish the provisional incident instead of creating a new one
+    initial_state = None
+    if call_sid:
+        call = await call_state.get_call(call_sid)
+        if call.get("incident_id"):
+            initial_state = {
+                "incident_id": call["incident_id"],
+                "enqueued_at": float(call["enqueued_at"]),
+            }
+    return await run_pipeline(request_model, initial_state=initial_state)
+
+
+async def _provisional_triage(call_sid: str, incident_id: str, enqueued_at: float,
+                              call_start_time: str, text: str, elapsed: float, final: bool):
+    """Triage a partial transcript and upsert its provisional queue entry in place."""
+    minutes, seconds = divmod(int(elapsed), 60)
+    result = await get_graph("provisional").ainvoke({
+        "transcript": TranscriptIn(
+            text=text,
+            time=call_start_time or "",
+            location="",
+            duration=f"{minutes:02d}:{seconds:02d}",
+        ),
+        "incident_id": incident_id,
+    })
+    triage_incident = result["triage_incident"]
+
+    entry = QueueEntry(
+        id=incident_id,
+        incidentType=triage_incident.incidentType,
+        location=triage_incident.location,
+        time=triage_incident.time,
+        severity_level=triage_incident.severity_level,
+        suggested_actions=triage_incident.suggested_actions,
+        callers=1,
+        provisional=True,
+        degraded=_triaged_by_rules(result),
+    )
+    score = scoring.compute_score(entry.model_dump(), enqueued_at)
+    # GET /agent serves this until the final triage replaces it
+    payload = triage_incident.model_dump(mode="json")
+    payload["provisional"] = True
+    # Queue entry, hot payload, geo point and event in one script, skipped once the final triage ran
+    outcome = await triage_queue.upsert_provisional(
+        incident_id, dumps_model(entry), score, enqueued_at, triage_queue.shard_key(triage_incident.location),
+        dumps(payload), postal_geo.postal_centroids.lookup(triage_incident.location), time.time(),
+    )
+    if outcome == triage_queue.PROVISIONAL_SKIPPED:
+        print(f"[media_stream] Final triage of {incident_id} already stored; provisional update dropped")
+        return
+    print(
+        f"[media_stream] {'Created' if outcome == triage_queue.PROVISIONAL_CREATED else 'Upgraded'} "
+        f"provisional entry {incident_id} "
+        f"for call {call_sid}: severity={triage_incident.severity_level}, "
+        f"words={len(text.split())}, elapsed={elapsed:.0f}s, final={final}"
+    )
+
+
+async def _transcribe_window(wav_bytes: bytes, offset_seconds: float, session: MediaStreamSession,
+                             call_start_time: str) -> str:
+    if STREAM_TRANSCRIBER == "fake":
+        return await fake_transcriber(wav_bytes, offset_seconds, session)
+    content = await transcribe_audio_bytes(wav_bytes, call_start_time, skip_silent=True)
+    return content.get("process_transcript", "")
+
+
+@app.websocket("/media-stream")
+async def media_stream(websocket: WebSocket):
+    """
+    Twilio media stream endpoint. Audio is transcribed in windows while the
+    call is in progress, and a provisional queue entry is created and then
+    upgraded in place as the transcript grows.
+    """
+    await websocket.accept()
+    incident_id = str(ulid.new())
+    enqueued_at = time.time()
+    call = {}  # call_state for this call, loaded on the start message
+
+    async def transcribe(wav_bytes: bytes, offset_seconds: float, session: MediaStreamSession) -> str:
+        return await _transcribe_window(wav_bytes, offset_seconds, session, call.get("started_at", ""))
+
+    async def on_transcript(text: str, elapsed: float, final: bool):
+        await _provisional_triage(
+            session.call_sid, incident_id, enqueued_at,
+            call.get("started_at", ""), text, elapsed, final,
+        )
+
+    session = MediaStreamSession(transcribe, on_transcript)
+    try:
+        while True:
+            event = session.handle_message(loads(await websocket.receive_text()))
+            if event == "start":
+                await call_state.update_call(session.call_sid, incident_id=incident_id, enqueued_at=enqueued_at)
+                call.update(await call_state.get_call(session.call_sid))
+                print(f"[media_stream] Stream started for call {session.call_sid} (incident {incident_id})")
+            elif event == "stop":
+                break
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await session.close()
+        print(f"[media_stream] Stream ended for call {session.call_sid} after {session.elapsed_seconds:.0f}s")
 
 
 if __name__ == "__main__":
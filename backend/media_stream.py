@@ -0,0 +1,186 @@
+"""
+Incremental transcription for Twilio media streams.
+
+Twilio forks call audio to a WebSocket as JSON messages (connected, start,
+media with base64 8 kHz mu-law frames, stop). MediaStreamSession buffers
+the inbound audio and cuts it into STREAM_WINDOW_SECONDS windows. Windows
+are transcribed one after another in the background and the text is
+appended. Each time the transcript has grown by STREAM_MIN_NEW_WORDS, the
+`on_transcript` callback runs so the caller can re-triage the partial call.
+
+Set STREAM_TRANSCRIBER=fake to skip the speech model. The fake reveals the
+`transcript` custom parameter from the start message in proportion to the
+audio received so far (see fake_media_stream.py).
+"""
+import asyncio
+import base64
+import io
+import os
+import struct
+import wave
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+
+STREAM_WINDOW_SECONDS = float(os.getenv("STREAM_WINDOW_SECONDS", "5"))
+STREAM_MIN_NEW_WORDS = int(os.getenv("STREAM_MIN_NEW_WORDS", "5"))
+STREAM_TRANSCRIBER = os.getenv("STREAM_TRANSCRIBER", "model")
+
+TWILIO_SAMPLE_RATE = 8000
+
+
+def _build_ulaw_table() -> np.ndarray:
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    sign = codes & 0x80
+    exponent = (codes >> 4) & 0x07
+    mantissa = codes & 0x0F
+    magnitude = (((mantissa << 3) + 0x84) << exponent) - 0x84
+    return np.where(sign, -magnitude, magnitude).astype(np.int16)
+
+
+_ULAW_TABLE = _build_ulaw_table()
+
+
+def mulaw_to_pcm16(data: bytes) -> np.ndarray:
+    """Decode G.711 mu-law bytes to 16-bit PCM samples."""
+    return _ULAW_TABLE[np.frombuffer(data, dtype=np.uint8)]
+
+
+def pcm16_to_wav(samples: np.ndarray, sample_rate: int = TWILIO_SAMPLE_RATE) -> bytes:
+    """Wrap mono 16-bit PCM samples in a WAV container."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(samples.astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+def pcm16_to_mulaw(samples: np.ndarray) -> bytes:
+    """Encode 16-bit PCM samples as G.711 mu-law."""
+    pcm = samples.astype(np.int32)
+    sign = np.where(pcm < 0, 0x80, 0)
+    magnitude = np.minimum(np.abs(pcm), 32635) + 0x84
+    exponent = np.floor(np.log2(magnitude)).astype(np.int32) - 7
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    return (~(sign | (exponent << 4) | mantissa) & 0xFF).astype(np.uint8).tobytes()
+
+
+def pcm16_to_mulaw_wav(samples: np.ndarray, sample_rate: int = TWILIO_SAMPLE_RATE) -> bytes:
+    """Encode mono 16-bit PCM samples as a mu-law WAV (8 bits per sample, as Twilio sends it)."""
+    data = pcm16_to_mulaw(samples)
+    # WAVE_FORMAT_MULAW, mono, byte rate = sample rate, block align 1, 8 bits, no extra format bytes
+    fmt = struct.pack("<HHIIHHH", 7, 1, sample_rate, sample_rate, 1, 8, 0)
+    body = b"".join([
+        b"WAVE",
+        b"fmt ", struct.pack("<I", len(fmt)), fmt,
+        b"fact", struct.pack("<II", 4, len(data)),  # required for non-PCM formats
+        b"data", struct.pack("<I", len(data)), data,
+        b"\x00" if len(data) % 2 else b"",
+    ])
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+
+Transcriber = Callable[[bytes, float, "MediaStreamSession"], Awaitable[str]]
+TranscriptCallback = Callable[[str, float, bool], Awaitable[None]]
+
+
+async def fake_transcriber(wav_bytes: bytes, offset_seconds: float, session: "MediaStreamSession") -> str:
+    """Reveal the scripted transcript in proportion to the audio received so far."""
+    script = session.custom_parameters.get("transcript", "").split()
+    seconds_per_word = float(session.custom_parameters.get("seconds_per_word", "0.5"))
+    window_seconds = len(wav_bytes) / (2 * TWILIO_SAMPLE_RATE)
+    start = int(offset_seconds / seconds_per_word)
+    end = int((offset_seconds + window_seconds) / seconds_per_word)
+    return " ".join(script[start:end])
+
+
+class MediaStreamSession:
+    """Incremental transcript state for one streamed call."""
+
+    def __init__(self, transcribe: Transcriber, on_transcript: TranscriptCallback,
+                 window_seconds: float = STREAM_WINDOW_SECONDS,
+                 min_new_words: int = STREAM_MIN_NEW_WORDS):
+        self.transcribe = transcribe
+        self.on_transcript = on_transcript
+        self.window_samples = int(window_seconds * TWILIO_SAMPLE_RATE)
+        self.min_new_words = min_new_words
+        self.call_sid: Optional[str] = None
+        self.stream_sid: Optional[str] = None
+        self.custom_parameters: dict = {}
+        self.text = ""
+        self._pending = bytearray()
+        self._samples_consumed = 0
+        self._words_at_last_callback = 0
+        self._windows: asyncio.Queue = asyncio.Queue()
+        self._worker: Optional[asyncio.Task] = None
+
+    @property
+    def elapsed_seconds(self) -> float:
+        return (self._samples_consumed + len(self._pending)) / TWILIO_SAMPLE_RATE
+
+    def handle_message(self, message: dict) -> str:
+        """Apply one Twilio media stream message and return its event name."""
+        event = message.get("event", "")
+        if event == "start":
+            start = message.get("start", {})
+            self.call_sid = start.get("callSid")
+            self.stream_sid = start.get("streamSid") or message.get("streamSid")
+            self.custom_parameters = start.get("customParameters") or {}
+            self._worker = asyncio.create_task(self._process_windows())
+        elif event == "media":
+            media = message.get("media", {})
+            if media.get("track", "inbound") == "inbound":
+                self._pending += base64.b64decode(media.get("payload", ""))
+                while len(self._pending) >= self.window_samples:
+                    self._cut_window(self.window_samples)
+        elif event == "stop":
+            self._cut_window(len(self._pending))
+        return event
+
+    def _cut_window(self, size: int) -> None:
+        if size <= 0:
+            return
+        window = bytes(self._pending[:size])
+        del self._pending[:size]
+        offset = self._samples_consumed / TWILIO_SAMPLE_RATE
+        self._samples_consumed += size
+        self._windows.put_nowait((window, offset))
+
+    async def _process_windows(self) -> None:
+        while True:
+            item = await self._windows.get()
+            if item is None:
+                break
+            window, offset = item
+            try:
+                wav_bytes = pcm16_to_wav(mulaw_to_pcm16(window))
+                piece = (await self.transcribe(wav_bytes, offset, self)).strip()
+            except Exception as e:
+                print(f"[media_stream] Transcription failed for {self.call_sid} at {offset:.1f}s: {e}")
+                continue
+            if piece:
+                self.text = f"{self.text} {piece}".strip()
+            await self._maybe_notify(final=False)
+
+    async def _maybe_notify(self, final: bool) -> None:
+        words = len(self.text.split())
+        if not words:
+            return
+        new_words = words - self._words_at_last_callback
+        if new_words < (1 if final else self.min_new_words):
+            return
+        self._words_at_last_callback = words
+        try:
+            await self.on_transcript(self.text, self.elapsed_seconds, final)
+        except Exception as e:
+            print(f"[media_stream] Partial triage failed for {self.call_sid}: {e}")
+
+    async def close(self) -> None:
+        """Drain outstanding windows and deliver any remaining words as a final update."""
+        if self._worker is None:
+            return
+        self._windows.put_nowait(None)
+        await self._worker
+        await self._maybe_notify(final=True)
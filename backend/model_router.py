@@ -0,0 +1,192 @@
+"""
+Model tiering for the triage agents.
+
+Every agent call used to go to the strong model. Now short, unambiguous
+transcripts start on a lighter, faster tier (MODEL_LIGHT). An answer from the
+light tier is kept only if it parses and validates, and only if it agrees
+with a keyword rules classifier:
+
+    call_agent        incidentType == the type the rules found in the transcript
+    assessment_agent  valid JSON / schema only
+    triage_agent      severity_level == the usual severity for the incident type
+
+Anything else, or the light tier being unavailable (an error, a timeout or
+its open circuit breaker), escalates that agent call to the strong tier
+(MODEL_STRONG), whose answer is used as-is. A transcript is "easy" when it has at most
+MODEL_ROUTER_EASY_MAX_WORDS words and the rules match exactly one incident
+type. Other transcripts go straight to the strong tier. MODEL_ROUTING=0
+sends everything to the strong tier.
+
+Per-tier calls, latency, tokens, estimated cost (MODEL_*_USD_PER_MTOK_*) and
+escalations are reported under "models" in GET /metrics.
+"""
+import os
+import re
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from backend.hedging import LatencyTracker, LLM_LATENCY_WINDOW
+
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "1") == "1"
+MODEL_STRONG = os.getenv("MODEL_STRONG", "gemini-2.5-flash")
+MODEL_STRONG_TEMPERATURE = float(os.getenv("MODEL_STRONG_TEMPERATURE", "0.7"))
+MODEL_LIGHT = os.getenv("MODEL_LIGHT", "gemini-2.5-flash-lite")
+MODEL_LIGHT_TEMPERATURE = float(os.getenv("MODEL_LIGHT_TEMPERATURE", "0.2"))
+MODEL_ROUTER_EASY_MAX_WORDS = int(os.getenv("MODEL_ROUTER_EASY_MAX_WORDS", "80"))
+# USD per million input/output tokens, for the cost estimate
+MODEL_STRONG_USD_PER_MTOK_IN = float(os.getenv("MODEL_STRONG_USD_PER_MTOK_IN", "0.30"))
+MODEL_STRONG_USD_PER_MTOK_OUT = float(os.getenv("MODEL_STRONG_USD_PER_MTOK_OUT", "2.50"))
+MODEL_LIGHT_USD_PER_MTOK_IN = float(os.getenv("MODEL_LIGHT_USD_PER_MTOK_IN", "0.10"))
+MODEL_LIGHT_USD_PER_MTOK_OUT = float(os.getenv("MODEL_LIGHT_USD_PER_MTOK_OUT", "0.40"))
+
+LIGHT = "light"
+STRONG = "strong"
+
+TIERS: Dict[str, dict] = {
+    LIGHT: {
+        "model": MODEL_LIGHT, "temperature": MODEL_LIGHT_TEMPERATURE,
+        "usd_per_mtok_in": MODEL_LIGHT_USD_PER_MTOK_IN, "usd_per_mtok_out": MODEL_LIGHT_USD_PER_MTOK_OUT,
+    },
+    STRONG: {
+        "model": MODEL_STRONG, "temperature": MODEL_STRONG_TEMPERATURE,
+        "usd_per_mtok_in": MODEL_STRONG_USD_PER_MTOK_IN, "usd_per_mtok_out": MODEL_STRONG_USD_PER_MTOK_OUT,
+    },
+}
+
+# Keyword rules per incident type (word-boundary regexes, case-insensitive)
+_RULES = {
+    "Terrorist Attack": r"terroris\w*|bomb\w*|explosion|explosive|suicide vest",
+    "Mass Fire": r"wildfire|forest fire|(?:whole|entire) (?:building|block|street) (?:is )?(?:on fire|burning)|buildings? (?:are )?on fire|massive fire|huge fire",
+    "Crowd Stampede": r"stampede|trampl\w*|crowd (?:crush|surge)|crushed in the crowd",
+    "Armed Robbery": r"gun\w*|knife|armed|weapon|gunpoint|knifepoint|hold[- ]?up|held up",
+    "Fire": r"fire|flames?|smoke|burning",
+    "Break In": r"break[- ]?in|broke in|breaking in|burglar\w*|intruder",
+    "Car Theft": r"car (?:was |got )?stolen|stole my (?:car|truck|vehicle)|carjack\w*|stolen (?:car|vehicle)",
+    "PickPocket": r"pick[- ]?pocket\w*|picked my pocket",
+    "Theft": r"stole|stolen|steal\w*|theft|shoplift\w*|robbed",
+    "Public Nuisance": r"noise|noisy|loud|music|party|yelling|shouting|drunk",
+}
+_RULE_PATTERNS = {kind: re.compile(rf"\b(?:{pattern})\b", re.IGNORECASE) for kind, pattern in _RULES.items()}
+# A more specific match absorbs the generic type it implies
+_SUBSUMES = {
+    "Mass Fire": {"Fire"}, "Armed Robbery": {"Theft"}, "Car Theft": {"Theft"},
+    "PickPocket": {"Theft"}, "Break In": {"Theft"},
+}
+# Usual severity per type, as described in the triage_agent prompt
+RULE_SEVERITY = {
+    "Terrorist Attack": "3", "Mass Fire": "3", "Crowd Stampede": "3", "Armed Robbery": "3",
+    "Fire": "2", "Break In": "2",
+    "Car Theft": "1", "Theft": "1", "PickPocket": "1", "Public Nuisance": "1",
+}
+
+T = TypeVar("T")
+
+
+class LLMUnavailable(RuntimeError):
+    """The LLM failed, timed out, is behind an open circuit breaker, or the triage budget ran out."""
+
+
+def classify_rules(text: str) -> Optional[str]:
+    """The incident type if the keyword rules match exactly one, else None."""
+    matched = {kind for kind, pattern in _RULE_PATTERNS.items() if pattern.search(text or "")}
+    for kind in list(matched):
+        matched -= _SUBSUMES.get(kind, set())
+    return matched.pop() if len(matched) == 1 else None
+
+
+def starting_tier(text: str) -> str:
+    """Tier the agents should try first for a transcript."""
+    if not MODEL_ROUTING:
+        return STRONG
+    easy = len((text or "").split()) <= MODEL_ROUTER_EASY_MAX_WORDS and classify_rules(text) is not None
+    return LIGHT if easy else STRONG
+
+
+class TierStats:
+    """Counters for one model tier."""
+
+    def __init__(self):
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost_usd = 0.0
+        self.escalations: Counter = Counter()  # (agent, reason) -> count
+        self.latency = LatencyTracker(LLM_LATENCY_WINDOW)
+
+    def record(self, tier: str, seconds: float, response) -> None:
+        usage = getattr(response, "usage_metadata", None) or {}
+        input_tokens = usage.get("input_tokens", 0)
+        output_tokens = usage.get("output_tokens", 0)
+        prices = TIERS[tier]
+        self.calls += 1
+        self.input_tokens += input_tokens
+        self.output_tokens += output_tokens
+        self.cost_usd += (input_tokens * prices["usd_per_mtok_in"] + output_tokens * prices["usd_per_mtok_out"]) / 1e6
+        self.latency.observe(seconds)
+
+    def stats(self, tier: str) -> dict:
+        escalated = sum(self.escalations.values())
+        return {
+            "model": TIERS[tier]["model"],
+            "calls": self.calls,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "est_cost_usd": round(self.cost_usd, 6),
+            "escalations": escalated,
+            "escalation_rate": round(escalated / self.calls, 4) if self.calls else 0.0,
+            "escalation_reasons": {f"{agent}:{reason}": count for (agent, reason), count in self.escalations.items()},
+            "latency": self.latency.stats(),
+        }
+
+
+tier_stats: Dict[str, TierStats] = {tier: TierStats() for tier in TIERS}
+
+
+async def run_agent(agent: str, prompt: str, tier: str,
+                    invoke: Callable[[str, str, str], Awaitable],
+                    parse: Callable[[str], T],
+                    agrees: Optional[Callable[[T], bool]] = None) -> Tuple[T, str]:
+    """
+    Call `invoke(agent, prompt, tier)` and `parse` the response content. On
+    the light tier, LLMUnavailable from `invoke`, a parse/validation error or
+    `agrees(result)` being False escalates to the strong tier. Strong-tier
+    errors, LLMUnavailable included, propagate to the caller.
+    Returns the result and the tier that produced it.
+    """
+    while True:
+        started = time.perf_counter()
+        try:
+            response = await invoke(agent, prompt, tier)
+        except LLMUnavailable as e:
+            if tier == STRONG:
+                raise
+            tier_stats[tier].escalations[(agent, "unavailable")] += 1
+            print(f"[router] {agent}: {TIERS[tier]['model']} unavailable ({e}); escalating to {MODEL_STRONG}")
+            tier = STRONG
+            continue
+        tier_stats[tier].record(tier, time.perf_counter() - started, response)
+        if tier == STRONG:
+            try:
+                return parse(response.content), tier
+            except (ValueError, KeyError):
+                print(f"[{agent}] Raw LLM output: {response.content}")
+                raise
+        try:
+            result = parse(response.content)
+            reason = None if agrees is None or agrees(result) else "disagrees with rules"
+        except (ValueError, KeyError) as e:
+            # ValueError covers json.JSONDecodeError and pydantic's ValidationError
+            result, reason = None, f"invalid output ({type(e).__name__})"
+        if reason is None:
+            return result, tier
+        tier_stats[tier].escalations[(agent, reason)] += 1
+        print(f"[router] {agent}: {TIERS[tier]['model']} {reason}; escalating to {MODEL_STRONG}")
+        tier = STRONG
+
+
+def stats() -> dict:
+    return {
+        "routing": MODEL_ROUTING,
+        "tiers": {tier: counters.stats(tier) for tier, counters in tier_stats.items()},
+    }
@@ -0,0 +1,122 @@
+"""
+Durable outbox for Pinecone writes that could not be made.
+
+When Pinecone is down, slow or behind an open circuit breaker, vector_store
+queues the write here instead of dropping it. Otherwise the incident would
+never be indexed and later calls about it would not be found as duplicates.
+There is one entry per incident:
+
+    pinecone_outbox        hash  id -> {"op", "fields", "record", "queued_at"}
+    pinecone_outbox_order  zset  id -> time first queued (replay order)
+
+`record` is always the latest full incident (with "id"). A second write for
+the same incident replaces the record and merges the operation. A full
+upsert absorbs a metadata update, and two metadata updates union their
+fields. The replayed write therefore carries every change, and the queue
+holds at most one entry per incident however long the outage lasts.
+
+vector_store.replay_outbox() drains the queue once the breaker lets calls
+through again. ack() removes an entry only if it was not replaced while being
+replayed, so a write queued during a replay is not lost.
+"""
+import time
+from typing import Iterable, List, Optional, Tuple
+
+import redis
+
+from backend.redis_client import create_sync_client
+from backend.serialization import dumps, loads
+
+OUTBOX_KEY = "pinecone_outbox"
+OUTBOX_ORDER_KEY = "pinecone_outbox_order"
+
+UPSERT = "upsert"
+UPDATE = "update"
+
+# Called from vector_store's worker threads, hence the sync client
+_redis = create_sync_client()
+
+# KEYS: outbox hash, order zset; ARGV: id, entry as read. Delete only if unchanged.
+_ACK_LUA = """
+if redis.call('HGET', KEYS[1], ARGV[1]) == ARGV[2] then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+    redis.call('ZREM', KEYS[2], ARGV[1])
+    return 1
+end
+return 0
+"""
+_ack_script = _redis.register_script(_ACK_LUA)
+
+
+def _merge(existing: Optional[dict], op: str, fields: List[str], record: dict) -> dict:
+    if existing is None:
+        return {"op": op, "fields": fields, "record": record, "queued_at": time.time()}
+    if UPSERT in (op, existing["op"]):
+        op, fields = UPSERT, []
+    else:
+        fields = list(dict.fromkeys(existing["fields"] + fields))
+    return {"op": op, "fields": fields, "record": record, "queued_at": existing["queued_at"]}
+
+
+def push(record: dict, fields: Optional[Iterable[str]] = None) -> None:
+    """
+    Queue a write of `record` (a full incident with "id"): a full upsert, or a
+    metadata update of `fields` only. Raises redis errors if it could not be queued.
+    """
+    incident_id = record["id"]
+    op = UPSERT if fields is None else UPDATE
+
+    def merge(pipe) -> None:
+        raw = pipe.hget(OUTBOX_KEY, incident_id)
+        entry = _merge(loads(raw) if raw else None, op, list(fields or []), record)
+        pipe.multi()
+        pipe.hset(OUTBOX_KEY, incident_id, dumps(entry))
+        pipe.zadd(OUTBOX_ORDER_KEY, {incident_id: entry["queued_at"]}, nx=True)
+
+    _redis.transaction(merge, OUTBOX_KEY)
+    print(f"[outbox] Queued {op} of {incident_id}" + (f" ({list(fields)})" if fields is not None else ""))
+
+
+def has(incident_id: str) -> bool:
+    """Whether a write for this incident is waiting; False if Redis cannot be read."""
+    try:
+        return bool(_redis.hexists(OUTBOX_KEY, incident_id))
+    except redis.RedisError as e:
+        print(f"[outbox] Lookup of {incident_id} failed: {e}")
+        return False
+
+
+def peek(limit: int) -> List[Tuple[str, bytes, dict]]:
+    """The oldest `limit` entries as (id, raw entry, entry); they stay queued until acked."""
+    ids = [incident_id.decode() for incident_id in _redis.zrange(OUTBOX_ORDER_KEY, 0, limit - 1)]
+    if not ids:
+        return []
+    entries = []
+    for incident_id, raw in zip(ids, _redis.hmget(OUTBOX_KEY, ids)):
+        if raw is None:
+            # Acked between the two reads
+            _redis.zrem(OUTBOX_ORDER_KEY, incident_id)
+            continue
+        entries.append((incident_id, raw, loads(raw)))
+    return entries
+
+
+def ack(incident_id: str, raw: bytes) -> bool:
+    """Remove a replayed entry unless it was replaced since `raw` was read."""
+    return bool(_ack_script(keys=[OUTBOX_KEY, OUTBOX_ORDER_KEY], args=[incident_id, raw]))
+
+
+def pending() -> int:
+    return _redis.hlen(OUTBOX_KEY)
+
+
+def oldest_age_seconds() -> Optional[float]:
+    oldest = _redis.zrange(OUTBOX_ORDER_KEY, 0, 0, withscores=True)
+    return round(time.time() - oldest[0][1], 1) if oldest else None
+
+
+def stats() -> dict:
+    try:
+        return {"pending": pending(), "oldest_age_seconds": oldest_age_seconds()}
+    except redis.RedisError as e:
+        return {"error": str(e)}
@@ -0,0 +1,216 @@
+"""
+Postal-code geography without an external geocoding service.
+
+Postal codes are resolved to approximate centroids from a local table
+(POSTAL_CENTROIDS_PATH, a "code,lat,lon" CSV holding full postal codes and/or
+3-character FSAs). The first load converts the CSV into a sorted .npy file
+next to it, and later loads memory-map that file, so every worker shares
+the same pages. A full postal code that is not in the table falls back to its
+FSA centroid.
+
+Open incidents are also kept in a Redis GEO set (TRIAGE_GEO_KEY, which is a
+geohash index). This lets /queue filter and sort by distance from a
+dispatcher's sector.
+
+    python -m backend.postal_geo build CA.txt   # GeoNames postal dump -> centroid CSV
+    python -m backend.postal_geo M5V2T6 M5H2N2  # look up codes and the distance between them
+"""
+import math
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from backend.redis_client import redis_client
+
+POSTAL_CENTROIDS_PATH = os.getenv(
+    "POSTAL_CENTROIDS_PATH", str(Path(__file__).parent / "postal_centroids.csv")
+)
+TRIAGE_GEO_KEY = "triage_geo"
+
+EARTH_RADIUS_KM = 6371.0088
+
+_CENTROID_DTYPE = np.dtype([("code", "S6"), ("lat", "<f4"), ("lon", "<f4")])
+_NON_ALNUM_RE = re.compile(r"[^A-Z0-9]")
+
+
+def normalize_postal_code(value: Optional[str]) -> str:
+    """Upper-case a postal code and drop spaces/punctuation ("m5v 2t6" -> "M5V2T6")."""
+    if not isinstance(value, str):
+        return ""
+    return _NON_ALNUM_RE.sub("", value.upper())
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in kilometres."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class PostalCentroids:
+    """Sorted, memory-mapped postal code -> (lat, lon) table."""
+
+    def __init__(self, csv_path: str = POSTAL_CENTROIDS_PATH):
+        self.csv_path = Path(csv_path)
+        self.npy_path = self.csv_path.with_suffix(".npy")
+        self._table: Optional[np.ndarray] = None
+        self._codes: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    def _read_csv(self) -> np.ndarray:
+        rows = {}
+        with open(self.csv_path, "r", encoding="utf-8") as handle:
+            for line in handle:
+                parts = line.strip().split(",")
+                if len(parts) < 3 or parts[0] == "code":
+                    continue
+                code = normalize_postal_code(parts[0])
+                try:
+                    rows[code] = (float(parts[1]), float(parts[2]))
+                except ValueError:
+                    continue
+        table = np.array(
+            [(code.encode("ascii"), lat, lon) for code, (lat, lon) in rows.items() if code],
+            dtype=_CENTROID_DTYPE,
+        )
+        table.sort(order="code")
+        return table
+
+    def _load(self) -> np.ndarray:
+        with self._lock:
+            if self._table is not None:
+                return self._table
+            if not self.csv_path.exists():
+                print(f"[postal_geo] No centroid table at {self.csv_path}; distance features disabled")
+                table = np.zeros(0, dtype=_CENTROID_DTYPE)
+            elif self.npy_path.exists() and self.npy_path.stat().st_mtime >= self.csv_path.stat().st_mtime:
+                table = np.load(self.npy_path, mmap_mode="r")
+            else:
+                table = self._read_csv()
+                try:
+                    np.save(self.npy_path, table)
+                    table = np.load(self.npy_path, mmap_mode="r")
+                except OSError as e:
+                    print(f"[postal_geo] Could not write {self.npy_path}, keeping table in memory: {e}")
+                print(f"[postal_geo] Loaded {len(table)} postal centroids from {self.csv_path}")
+            self._table = table
+            self._codes = table["code"]
+            return table
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+    def _find(self, key: bytes) -> Optional[Tuple[float, float]]:
+        table = self._load()
+        i = int(np.searchsorted(self._codes, key))
+        if i < len(table) and self._codes[i] == key:
+            return float(table["lat"][i]), float(table["lon"][i])
+        return None
+
+    def lookup(self, postal_code: Optional[str]) -> Optional[Tuple[float, float]]:
+        """Centroid for a full postal code or FSA, falling back to the FSA; None if unknown."""
+        code = normalize_postal_code(postal_code)
+        if len(code) < 3:
+            return None
+        if len(code) > 3:
+            found = self._find(code[:6].encode("ascii"))
+            if found is not None:
+                return found
+        return self._find(code[:3].encode("ascii"))
+
+    def distance_km(self, code_a: Optional[str], code_b: Optional[str]) -> Optional[float]:
+        """Distance between two postal-code centroids, or None if either is unknown."""
+        a = self.lookup(code_a)
+        b = self.lookup(code_b)
+        if a is None or b is None:
+            return None
+        return haversine_km(a[0], a[1], b[0], b[1])
+
+
+postal_centroids = PostalCentroids()
+
+
+# --- Open-incident geo index (Redis GEO) ---
+
+def stage_index_incident(pipe, incident_id: str, postal_code: Optional[str]) -> bool:
+    """Queue a GEOADD for an open incident on `pipe`. Returns False when its location is unknown."""
+    point = postal_centroids.lookup(postal_code)
+    if point is None:
+        return False
+    lat, lon = point
+    pipe.geoadd(TRIAGE_GEO_KEY, (lon, lat, incident_id))
+    return True
+
+
+def stage_unindex_incident(pipe, incident_id: str) -> None:
+    pipe.zrem(TRIAGE_GEO_KEY, incident_id)
+
+
+async def incidents_near(postal_code: str, radius_km: Optional[float] = None) -> Optional[List[Tuple[str, float]]]:
+    """
+    Open incidents around a postal code as (id, distance_km), nearest first.
+
+    Without a radius every indexed incident is returned, sorted by distance.
+    Returns None if the postal code itself cannot be located.
+    """
+    point = postal_centroids.lookup(postal_code)
+    if point is None:
+        return None
+    lat, lon = point
+    # GEOSEARCH needs a radius; half the earth's circumference covers everything
+    radius = radius_km if radius_km is not None else math.pi * EARTH_RADIUS_KM
+    results = await redis_client.geosearch(
+        TRIAGE_GEO_KEY, longitude=lon, latitude=lat, radius=radius, unit="km",
+        sort="ASC", withdist=True,
+    )
+    return [(incident_id, float(distance)) for incident_id, distance in results]
+
+
+def build_from_geonames(source: str, dest: str = POSTAL_CENTROIDS_PATH) -> int:
+    """
+    Convert a GeoNames postal-code dump (tab-separated; code in column 2,
+    latitude/longitude in columns 10/11) into the centroid CSV. FSA-only rows
+    and full codes are both kept. Returns the number of rows written.
+    """
+    rows = {}
+    with open(source, "r", encoding="utf-8") as handle:
+        for line in handle:
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) < 11:
+                continue
+            code = normalize_postal_code(parts[1])
+            try:
+                rows[code] = (float(parts[9]), float(parts[10]))
+            except ValueError:
+                continue
+    with open(dest, "w", encoding="utf-8") as out:
+        out.write("code,lat,lon\n")
+        for code in sorted(rows):
+            lat, lon = rows[code]
+            out.write(f"{code},{lat:.4f},{lon:.4f}\n")
+    return len(rows)
+
+
+def _main(argv: Iterable[str]) -> None:
+    args = list(argv)
+    if len(args) >= 2 and args[0] == "build":
+        count = build_from_geonames(args[1], args[2] if len(args) > 2 else POSTAL_CENTROIDS_PATH)
+        print(f"[postal_geo] Wrote {count} centroids")
+        return
+    for code in args:
+        print(f"{code}: {postal_centroids.lookup(code)}")
+    if len(args) == 2:
+        distance = postal_centroids.distance_km(args[0], args[1])
+        print(f"distance: {'unknown' if distance is None else f'{distance:.2f} km'}")
+
+
+if __name__ == "__main__":
+    import sys
+
+    _main(sys.argv[1:])
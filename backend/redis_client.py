@@ -1,12 +1,86 @@
 # backend/redis_client.py
+import redis as sync_redis
 import redis.asyncio as redis
 import os
 
 # Load connection details from environment variables
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+REDIS_DB = int(os.getenv("REDIS_DB", 0))
+
+# Pool sizing and timeouts. Each client has its own pool of up to
+# REDIS_MAX_CONNECTIONS; when it is exhausted, callers wait up to
+# REDIS_POOL_TIMEOUT seconds for a free connection instead of failing.
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 64))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", 5))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 5))
+REDIS_SOCKET_CONNECT_TIMEOUT = float(os.getenv("REDIS_SOCKET_CONNECT_TIMEOUT", 2))
+# Idle connections are PINGed before reuse after this many seconds
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
+
+
+def create_client(decode_responses: bool, db: int = REDIS_DB,
+                  max_connections: int = REDIS_MAX_CONNECTIONS) -> redis.Redis:
+    """Build a Redis client with the configured pool and timeouts."""
+    pool = redis.BlockingConnectionPool(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        db=db,
+        decode_responses=decode_responses,
+        max_connections=max_connections,
+        timeout=REDIS_POOL_TIMEOUT,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=REDIS_SOCKET_CONNECT_TIMEOUT,
+        socket_keepalive=True,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+        retry_on_timeout=True,
+    )
+    return redis.Redis(connection_pool=pool)
+
+
+def create_sync_client(socket_timeout: float = REDIS_SOCKET_TIMEOUT) -> sync_redis.Redis:
+    """
+    Blocking bytes-mode client with the same database, pool and timeouts, for
+    code that runs in worker threads (vector_store, outbox). A shorter
+    `socket_timeout` also caps the connect timeout.
+    """
+    pool = sync_redis.BlockingConnectionPool(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        db=REDIS_DB,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT,
+        socket_timeout=socket_timeout,
+        socket_connect_timeout=min(REDIS_SOCKET_CONNECT_TIMEOUT, socket_timeout),
+        socket_keepalive=True,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+        retry_on_timeout=True,
+    )
+    return sync_redis.Redis(connection_pool=pool)
+
 
 # Create a reusable async Redis client instance.
 # The client will manage connections from a connection pool automatically.
 # `decode_responses=True` ensures that data is returned as strings.
-redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True)
+redis_client = create_client(decode_responses=True)
+
+# Bytes-mode client with the same connection settings. Use it on hot read paths
+# (/queue, /agent) so stored JSON can be handed to the response without a
+# decode/re-encode round trip; values written through either client are identical.
+redis_bytes_client = create_client(decode_responses=False)
+
+# Pub/sub waits (job events, idempotency waiters) hold their connection until a
+# message arrives or they time out, so they get a pool of their own and can never
+# take the connections the clients above need for commands.
+REDIS_PUBSUB_MAX_CONNECTIONS = int(os.getenv("REDIS_PUBSUB_MAX_CONNECTIONS", 256))
+redis_pubsub_client = create_client(decode_responses=True, max_connections=REDIS_PUBSUB_MAX_CONNECTIONS)
+
+
+async def acquire_interval_lock(name: str, seconds: float) -> bool:
+    """
+    Let one worker out of many run a periodic job per interval. The lock is
+    not released; it expires just before the next interval so that a live
+    worker can take it again.
+    """
+    ttl_ms = max(int(seconds * 1000) - 100, 1)
+    return bool(await redis_client.set(f"lock:{name}", os.getpid(), nx=True, px=ttl_ms))
@@ -123,3 +123,20 @@ class TriageIncident(BaseModel):
             # Default to "2" if invalid
             return "2"
         return v
+
+
+class QueueEntry(BaseModel):
+    """Minimal queue payload stored as a triage_queue ZSET member.
+
+    Entries are validated here, at write time, so /queue can serve the stored
+    JSON members verbatim without parsing them again.
+    """
+    id: str  # ULID
+    incidentType: IncidentType
+    location: str
+    time: str
+    severity_level: Literal["1", "2", "3"]
+    suggested_actions: SuggestedAction
+    callers: int = 1
+    provisional: bool = False  # True while triaged from a call still in progress
+    degraded: bool = False  # True if triaged by rules because the LLM was unavailable
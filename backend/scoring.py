@@ -0,0 +1,228 @@
+"""
+Priority scoring for the triage queue.
+
+triage_queue is a ZSET in which a lower score means more urgent. The score
+used to be frozen at enqueue time (enqueued_at - severity * 30 min). It is
+now computed by a scorer from the queue entry, the time the incident was
+first queued (kept in each shard's enqueued_at hash) and the current time:
+
+    score = enqueued_at
+            - severity * SCORING_SEVERITY_SECONDS
+            - log2(callers) * SCORING_CALLER_SECONDS
+            - SCORING_TYPE_SECONDS[incidentType]
+            - aging boost once the wait exceeds the severity's SLA
+
+With one caller, no type weight and no overdue wait this is the same score
+as before. Scores are deterministic for a given (entry, enqueued_at, now).
+Entries are re-scored when a duplicate call merges into them, and the whole
+queue is re-scored every RESCORE_INTERVAL_SECONDS so waiting incidents
+escalate. Set SCORER="package.module:Class" to plug in another scorer.
+
+    python -m backend.scoring   # 10k-entry scoring benchmark (tests/test_scoring.py covers the formula)
+"""
+import asyncio
+import importlib
+import json
+import math
+import os
+import time
+from typing import Dict, Iterable, Optional, Protocol
+
+from backend import incident_events
+from backend.redis_client import acquire_interval_lock, redis_bytes_client
+from backend.serialization import loads
+from backend.triage_queue import TRIAGE_QUEUE_KEY, enqueued_at_key, shard_keys
+
+SCORING_SEVERITY_SECONDS = float(os.getenv("SCORING_SEVERITY_SECONDS", "1800"))
+SCORING_CALLER_SECONDS = float(os.getenv("SCORING_CALLER_SECONDS", "300"))
+SCORING_TYPE_SECONDS: Dict[str, float] = json.loads(os.getenv(
+    "SCORING_TYPE_SECONDS",
+    '{"Terrorist Attack": 1800, "Mass Fire": 900, "Crowd Stampede": 900, "Armed Robbery": 300}',
+))
+# Wait allowed per severity before an entry starts escalating
+SCORING_SLA_SECONDS: Dict[str, float] = json.loads(os.getenv(
+    "SCORING_SLA_SECONDS", '{"3": 120, "2": 600, "1": 1800}'
+))
+SCORING_AGING_RATE = float(os.getenv("SCORING_AGING_RATE", "1.0"))
+SCORING_MAX_AGING_SECONDS = float(os.getenv("SCORING_MAX_AGING_SECONDS", "3600"))
+
+RESCORE_INTERVAL_SECONDS = float(os.getenv("RESCORE_INTERVAL_SECONDS", "30"))
+# Skip writes for entries whose score moved less than this
+RESCORE_EPSILON_SECONDS = float(os.getenv("RESCORE_EPSILON_SECONDS", "1"))
+# Set of "<shard> <id>" whose enqueue time had no queue entry in the last sweep
+RESCORE_STALE_KEY = "rescore_sweep:stale"
+RESCORE_STALE_TTL_SECONDS = max(int(RESCORE_INTERVAL_SECONDS * 4), 1)
+
+
+class Scorer(Protocol):
+    def score(self, entry: dict, enqueued_at: float, now: float) -> float:
+        """Return the ZSET score for a queue entry (lower is more urgent)."""
+        ...
+
+
+class DefaultScorer:
+    """Severity, caller count, incident type and overdue wait."""
+
+    def __init__(self, severity_seconds: float = SCORING_SEVERITY_SECONDS,
+                 caller_seconds: float = SCORING_CALLER_SECONDS,
+                 type_seconds: Optional[Dict[str, float]] = None,
+                 sla_seconds: Optional[Dict[str, float]] = None,
+                 aging_rate: float = SCORING_AGING_RATE,
+                 max_aging_seconds: float = SCORING_MAX_AGING_SECONDS):
+        self.severity_seconds = severity_seconds
+        self.caller_seconds = caller_seconds
+        self.type_seconds = SCORING_TYPE_SECONDS if type_seconds is None else type_seconds
+        self.sla_seconds = SCORING_SLA_SECONDS if sla_seconds is None else sla_seconds
+        self.aging_rate = aging_rate
+        self.max_aging_seconds = max_aging_seconds
+
+    def score(self, entry: dict, enqueued_at: float, now: float) -> float:
+        severity = str(entry.get("severity_level", "1"))
+        callers = max(int(entry.get("callers", 1) or 1), 1)
+        boost = int(severity) * self.severity_seconds
+        boost += math.log2(callers) * self.caller_seconds
+        boost += self.type_seconds.get(entry.get("incidentType", ""), 0.0)
+        overdue = (now - enqueued_at) - self.sla_seconds.get(severity, float("inf"))
+        if overdue > 0:
+            boost += min(overdue * self.aging_rate, self.max_aging_seconds)
+        return enqueued_at - boost
+
+
+def _load_scorer() -> Scorer:
+    spec = os.getenv("SCORER")
+    if not spec:
+        return DefaultScorer()
+    module_name, _, attr = spec.partition(":")
+    scorer = getattr(importlib.import_module(module_name), attr)
+    return scorer() if isinstance(scorer, type) else scorer
+
+
+scorer: Scorer = _load_scorer()
+
+
+def compute_score(entry: dict, enqueued_at: float, now: Optional[float] = None) -> float:
+    return scorer.score(entry, enqueued_at, time.time() if now is None else now)
+
+
+def legacy_enqueued_at(entry: dict, score: float) -> float:
+    """Recover the enqueue time of an entry scored with the old static formula."""
+    return score + int(entry.get("severity_level", "1")) * SCORING_SEVERITY_SECONDS
+
+
+async def rescore(entries: Iterable[tuple], now: Optional[float] = None,
+                  queue_key: str = TRIAGE_QUEUE_KEY) -> int:
+    """
+    Re-score (member, current score) pairs from one queue shard in one batch.
+
+    Enqueue times are read with a single HMGET. Every changed score is then
+    written with one ZADD XX, so members removed in the meantime are not
+    re-added. Returns the number of entries whose score changed.
+    """
+    now = time.time() if now is None else now
+    parsed = []
+    for member, current in entries:
+        try:
+            entry = loads(member)
+        except json.JSONDecodeError:
+            continue
+        if entry.get("id"):
+            parsed.append((member, current, entry))
+    if not parsed:
+        return 0
+
+    stored = await redis_bytes_client.hmget(enqueued_at_key(queue_key), [entry["id"] for _, _, entry in parsed])
+    updates = {}
+    rescored = {}
+    backfill = {}
+    for (member, current, entry), enqueued_at in zip(parsed, stored):
+        if enqueued_at is None:
+            enqueued_at = legacy_enqueued_at(entry, current)
+            backfill[entry["id"]] = enqueued_at
+        else:
+            enqueued_at = float(enqueued_at)
+        new_score = scorer.score(entry, enqueued_at, now)
+        if abs(new_score - current) >= RESCORE_EPSILON_SECONDS:
+            updates[member] = new_score
+            rescored[entry["id"]] = new_score
+
+    async with redis_bytes_client.pipeline(transaction=False) as pipe:
+        if updates:
+            pipe.zadd(queue_key, updates, xx=True)
+            incident_events.stage_event(
+                pipe, incident_events.RESCORED, scores=rescored, shard=queue_key
+            )
+        if backfill:
+            pipe.hset(enqueued_at_key(queue_key), mapping=backfill)
+        await pipe.execute()
+    return len(updates)
+
+
+async def rescore_all(now: Optional[float] = None) -> int:
+    """
+    Re-score every queue shard and drop enqueue times of incidents no longer
+    queued. An id has to be missing in two consecutive sweeps before its time
+    is dropped, so an incident enqueued while the sweep runs keeps its time.
+    The ids missing in the last sweep are kept in Redis (RESCORE_STALE_KEY),
+    so the check holds when the next sweep runs on another worker.
+    """
+    changed = 0
+    missing = set()
+    for queue_key in await shard_keys():
+        entries = await redis_bytes_client.zrange(queue_key, 0, -1, withscores=True)
+        changed += await rescore(entries, now, queue_key)
+        queued_ids = set()
+        for member, _ in entries:
+            try:
+                queued_ids.add(loads(member).get("id"))
+            except json.JSONDecodeError:
+                continue
+        missing |= {
+            f"{queue_key} {incident_id}"
+            for incident_id in (raw_id.decode("utf-8") for raw_id in
+                                await redis_bytes_client.hkeys(enqueued_at_key(queue_key)))
+            if incident_id not in queued_ids
+        }
+    previous = {raw.decode("utf-8") for raw in await redis_bytes_client.smembers(RESCORE_STALE_KEY)}
+    stale = [candidate.split(" ", 1) for candidate in missing & previous]
+    async with redis_bytes_client.pipeline(transaction=True) as pipe:
+        for queue_key in {queue_key for queue_key, _ in stale}:
+            pipe.hdel(enqueued_at_key(queue_key), *[incident_id for key, incident_id in stale if key == queue_key])
+        pipe.delete(RESCORE_STALE_KEY)
+        if missing - previous:
+            pipe.sadd(RESCORE_STALE_KEY, *(missing - previous))
+            pipe.expire(RESCORE_STALE_KEY, RESCORE_STALE_TTL_SECONDS)
+        await pipe.execute()
+    return changed
+
+
+async def rescore_loop():
+    """
+    Background task: run rescore_all every RESCORE_INTERVAL_SECONDS. With
+    several workers, only the one holding the interval lock sweeps.
+    """
+    while True:
+        try:
+            if await acquire_interval_lock("rescore_sweep", RESCORE_INTERVAL_SECONDS):
+                started = time.perf_counter()
+                changed = await rescore_all()
+                if changed:
+                    print(f"[scoring] Re-scored {changed} queue entries in {time.perf_counter() - started:.3f}s")
+        except Exception as e:
+            print(f"[scoring] Re-score sweep failed: {e}")
+        await asyncio.sleep(RESCORE_INTERVAL_SECONDS)
+
+
+if __name__ == "__main__":
+    import random
+
+    now = 1_700_000_000.0
+    types = ["Theft", "Fire", "Mass Fire", "Armed Robbery", "Public Nuisance"]
+    entries = [
+        {"id": str(i), "severity_level": random.choice("123"), "callers": random.randint(1, 5),
+         "incidentType": random.choice(types)}
+        for i in range(10_000)
+    ]
+    started = time.perf_counter()
+    for entry in entries:
+        scorer.score(entry, now - random.uniform(0, 3600), now)
+    print(f"[scoring] Scored {len(entries)} entries in {(time.perf_counter() - started) * 1000:.1f} ms")
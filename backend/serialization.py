@@ -0,0 +1,103 @@
+"""
+Pluggable JSON serialization for Redis and Pinecone payloads.
+
+Uses orjson when it is installed and falls back to the standard library
+otherwise (set JSON_SERIALIZER=json to force the fallback). Everything this
+module produces is UTF-8 `bytes`, so a payload can travel from Pydantic to
+Redis to the HTTP response without being decoded and re-encoded on the way.
+"""
+import json
+import os
+from typing import Any, Iterable, Union
+
+from fastapi import Response
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; stdlib json is always available
+    orjson = None
+
+JSONBytes = Union[bytes, bytearray, memoryview]
+
+
+def _select_backend() -> str:
+    requested = os.getenv("JSON_SERIALIZER", "orjson").strip().lower()
+    if requested == "orjson" and orjson is None:
+        print("[serialization] orjson is not installed; falling back to stdlib json")
+        return "json"
+    if requested not in ("orjson", "json"):
+        print(f"[serialization] Unknown JSON_SERIALIZER={requested!r}; using stdlib json")
+        return "json"
+    return requested
+
+
+SERIALIZER_BACKEND = _select_backend()
+
+
+def _stdlib_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+if SERIALIZER_BACKEND == "orjson":
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+else:
+    _dumps = _stdlib_dumps
+    _loads = json.loads
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize `obj` to compact UTF-8 JSON bytes."""
+    if isinstance(obj, BaseModel):
+        return dumps_model(obj)
+    return _dumps(obj)
+
+
+def dumps_model(model: BaseModel) -> bytes:
+    """Serialize a Pydantic model using its compiled serializer."""
+    return model.model_dump_json().encode("utf-8")
+
+
+def loads(data: Union[str, JSONBytes]) -> Any:
+    """
+    Parse JSON from `str` or bytes.
+
+    Raises json.JSONDecodeError on invalid input (orjson's error type is a
+    subclass of it), so existing `except json.JSONDecodeError` blocks keep working.
+    """
+    if isinstance(data, memoryview):
+        data = bytes(data)
+    return _loads(data)
+
+
+def to_str(data: Union[str, JSONBytes]) -> str:
+    """Decode JSON bytes for logging or for string-only stores (Pinecone metadata)."""
+    if isinstance(data, str):
+        return data
+    return bytes(data).decode("utf-8")
+
+
+class RawJSONResponse(Response):
+    """
+    JSON response for bodies that are already encoded, e.g. values read straight
+    from Redis with the bytes-mode client. Bytes are sent as-is; anything else is
+    serialized once with the active backend instead of FastAPI's jsonable_encoder.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, (bytes, bytearray, memoryview)):
+            return bytes(content)
+        return dumps(content)
+
+
+def wrap_result(raw: JSONBytes) -> bytes:
+    """Build `{"result": <raw>}` around an already-encoded JSON object."""
+    return b'{"result":' + bytes(raw) + b"}"
+
+
+
+def json_array(members: Iterable[JSONBytes]) -> bytes:
+    """Join already-encoded JSON values into a JSON array without parsing them."""
+    return b"[" + b",".join(members) + b"]"
@@ -0,0 +1,368 @@
+"""
+Discrete-event simulation of the dispatch floor, for capacity planning.
+
+The dashboard simulation (client/hooks/useDispatchers.ts) runs in real time.
+This one jumps from event to event, so a night of calls takes well under a
+second. It reproduces the queue the backend would build:
+
+  - entries are ordered by scoring.scorer (the scorer enqueue_node uses) and
+    re-scored every RESCORE_INTERVAL_SECONDS, so overdue entries escalate
+  - a call that duplicates an incident still in the queue merges into it
+    (callers + 1, re-scored) instead of adding work, as in enqueue_node
+  - a dispatcher always takes the lowest-score entry, like POST /queue/claim
+
+Calls come from an NDJSON trace or a synthetic night. A synthetic night has
+uniform or hourly-profile arrivals, a severity/type mix, lognormal handle
+times and a duplicate rate. Every staffing level in a sweep replays the same
+calls. Levels run in parallel processes. The report gives wait-time
+percentiles per severity and the share of calls answered within their SLA
+(SCORING_SLA_SECONDS).
+
+    python -m backend.simulator --calls 2000 --hours 8 --dispatchers 4-12
+    python -m backend.simulator --trace night.ndjson --dispatchers 6 8 10 --target-sla 0.95
+
+Trace lines: {"id", "at" (seconds from start or ISO time), "severity_level",
+"incidentType", "handle_seconds" (optional), "duplicate_of" (optional id of
+an earlier line)}.
+"""
+import argparse
+import heapq
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from backend import scoring
+
+SEVERITIES = ("1", "2", "3")
+
+SIM_SEVERITY_MIX: Dict[str, float] = json.loads(os.getenv("SIM_SEVERITY_MIX", '{"1": 0.5, "2": 0.35, "3": 0.15}'))
+SIM_TYPE_MIX: Dict[str, float] = json.loads(os.getenv(
+    "SIM_TYPE_MIX",
+    '{"Public Nuisance": 0.2, "Break In": 0.12, "Theft": 0.15, "Car Theft": 0.08, "PickPocket": 0.08, '
+    '"Armed Robbery": 0.07, "Fire": 0.15, "Mass Fire": 0.03, "Crowd Stampede": 0.02, '
+    '"Terrorist Attack": 0.005, "Other": 0.095}',
+))
+SIM_HANDLE_MEAN_SECONDS = float(os.getenv("SIM_HANDLE_MEAN_SECONDS", "180"))
+SIM_HANDLE_SIGMA = float(os.getenv("SIM_HANDLE_SIGMA", "0.5"))
+# Calls that repeat an incident already reported; matched within the same window as find_similar_incidents
+SIM_DUPLICATE_RATE = float(os.getenv("SIM_DUPLICATE_RATE", "0.1"))
+SIM_DUPLICATE_WINDOW_SECONDS = float(os.getenv("SIM_DUPLICATE_WINDOW_SECONDS", "1800"))
+# Time from the call arriving to its queue entry (transcription + triage pipeline)
+SIM_TRIAGE_SECONDS = float(os.getenv("SIM_TRIAGE_SECONDS", "0"))
+
+# Column arrays, one row per call, sorted by arrival:
+#   at (float seconds), severity (str), incident_type (str),
+#   handle (float seconds), duplicate_of (int row index or -1)
+Trace = Dict[str, np.ndarray]
+
+
+def _mix(weights: Dict[str, float]) -> tuple:
+    keys = list(weights)
+    p = np.array([weights[k] for k in keys], dtype=float)
+    return np.array(keys, dtype=object), p / p.sum()
+
+
+def _handle_times(rng: np.random.Generator, n: int, mean: float, sigma: float) -> np.ndarray:
+    # Lognormal with the requested mean
+    return rng.lognormal(math.log(mean) - sigma ** 2 / 2, sigma, n)
+
+
+def synthetic_trace(calls: int, hours: float, severity_mix: Optional[Dict[str, float]] = None,
+                    type_mix: Optional[Dict[str, float]] = None,
+                    handle_mean: float = SIM_HANDLE_MEAN_SECONDS, handle_sigma: float = SIM_HANDLE_SIGMA,
+                    duplicate_rate: float = SIM_DUPLICATE_RATE,
+                    duplicate_window: float = SIM_DUPLICATE_WINDOW_SECONDS,
+                    hourly_profile: Optional[Sequence[float]] = None, seed: int = 0) -> Trace:
+    """
+    `calls` calls spread over `hours`: uniformly (a Poisson process conditioned
+    on the count) or in proportion to `hourly_profile` (one weight per hour,
+    repeated if shorter than `hours`). A `duplicate_rate` share of calls
+    repeat a random earlier incident from the previous `duplicate_window`
+    seconds and share its type and severity.
+    """
+    rng = np.random.default_rng(seed)
+    horizon = hours * 3600
+    if hourly_profile:
+        slots = math.ceil(hours)
+        weights = np.resize(np.asarray(hourly_profile, dtype=float), slots)
+        slot = rng.choice(slots, size=calls, p=weights / weights.sum())
+        at = np.minimum((slot + rng.random(calls)) * 3600, horizon)
+    else:
+        at = rng.random(calls) * horizon
+    at.sort()
+
+    severity_keys, severity_p = _mix(severity_mix or SIM_SEVERITY_MIX)
+    type_keys, type_p = _mix(type_mix or SIM_TYPE_MIX)
+    severity = severity_keys[rng.choice(len(severity_keys), size=calls, p=severity_p)]
+    incident_type = type_keys[rng.choice(len(type_keys), size=calls, p=type_p)]
+
+    duplicate_of = np.full(calls, -1, dtype=np.int64)
+    candidates = np.flatnonzero(rng.random(calls) < duplicate_rate)
+    if len(candidates):
+        originals = np.setdiff1d(np.arange(calls), candidates)
+        original_at = at[originals]
+        lo = np.searchsorted(original_at, at[candidates] - duplicate_window, side="left")
+        hi = np.searchsorted(original_at, at[candidates], side="left")
+        has_match = hi > lo
+        # Pick one original uniformly from each candidate's window
+        pick = lo + (rng.random(len(candidates)) * (hi - lo)).astype(np.int64)
+        matched = candidates[has_match]
+        duplicate_of[matched] = originals[pick[has_match]]
+        severity[matched] = severity[duplicate_of[matched]]
+        incident_type[matched] = incident_type[duplicate_of[matched]]
+
+    return {
+        "at": at,
+        "severity": severity,
+        "incident_type": incident_type,
+        "handle": _handle_times(rng, calls, handle_mean, handle_sigma),
+        "duplicate_of": duplicate_of,
+    }
+
+
+def _parse_at(value) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(value).timestamp()
+
+
+def load_trace(path: str, handle_mean: float = SIM_HANDLE_MEAN_SECONDS, handle_sigma: float = SIM_HANDLE_SIGMA,
+               seed: int = 0) -> Trace:
+    """Read an NDJSON call trace. Missing handle times are drawn from the lognormal."""
+    with open(path, "r", encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    rows.sort(key=lambda row: _parse_at(row["at"]))
+    start = _parse_at(rows[0]["at"]) if rows else 0.0
+    index = {str(row.get("id", i)): i for i, row in enumerate(rows)}
+
+    rng = np.random.default_rng(seed)
+    drawn = _handle_times(rng, len(rows), handle_mean, handle_sigma)
+    duplicate_of = np.full(len(rows), -1, dtype=np.int64)
+    for i, row in enumerate(rows):
+        original = index.get(str(row.get("duplicate_of")))
+        if original is not None and original < i:
+            duplicate_of[i] = original
+    return {
+        "at": np.array([_parse_at(row["at"]) - start for row in rows], dtype=float),
+        "severity": np.array([str(row.get("severity_level", "1")) for row in rows], dtype=object),
+        "incident_type": np.array([row.get("incidentType", "Other") for row in rows], dtype=object),
+        "handle": np.array([
+            float(row["handle_seconds"]) if row.get("handle_seconds") is not None else drawn[i]
+            for i, row in enumerate(rows)
+        ]),
+        "duplicate_of": duplicate_of,
+    }
+
+
+def simulate(trace: Trace, dispatchers: int, scorer: Optional[scoring.Scorer] = None,
+             rescore_interval: float = scoring.RESCORE_INTERVAL_SECONDS,
+             triage_seconds: float = SIM_TRIAGE_SECONDS) -> dict:
+    """
+    Run one staffing level to completion (every queued call answered).
+
+    Returns {"dispatchers", "waits", "merged", "busy_seconds", "makespan"}.
+    `waits` holds, per call, the seconds from arrival until a dispatcher took
+    it, or NaN for calls merged into an earlier incident. Events at the same
+    instant run in the order: completions, arrivals, re-score.
+    """
+    scorer = scorer or scoring.scorer
+    at, handle, duplicate_of = trace["at"], trace["handle"], trace["duplicate_of"]
+    n = len(at)
+    entries = [
+        {"severity_level": severity, "incidentType": incident_type, "callers": 1}
+        for severity, incident_type in zip(trace["severity"], trace["incident_type"])
+    ]
+    enqueue_at = at + triage_seconds
+    waits = np.full(n, np.nan)
+    queued: Dict[int, int] = {}  # row -> version of its live heap item
+    heap: list = []  # (score, arrival row, version); stale versions are skipped
+    busy: list = []  # completion times
+    idle = dispatchers
+    merged = 0
+    busy_seconds = 0.0
+    next_rescore = rescore_interval
+    now = 0.0
+    i = 0
+
+    def push(row: int, t: float) -> None:
+        version = queued.get(row, -1) + 1
+        queued[row] = version
+        heapq.heappush(heap, (scorer.score(entries[row], enqueue_at[row], t), row, version))
+
+    while i < n or queued or busy:
+        t_done = busy[0] if busy else math.inf
+        t_arrival = enqueue_at[i] if i < n else math.inf
+        t_rescore = next_rescore if queued else math.inf
+        now = min(t_done, t_arrival, t_rescore)
+
+        if t_done == now:
+            heapq.heappop(busy)
+            idle += 1
+        elif t_arrival == now:
+            original = duplicate_of[i]
+            if original >= 0:
+                merged += 1
+                if original in queued:
+                    # Same as enqueue_node: one more caller, re-scored in place
+                    entries[original]["callers"] += 1
+                    push(original, now)
+            else:
+                push(i, now)
+            i += 1
+        else:
+            # Periodic rescore_all: rebuild the order from fresh scores
+            for row in queued:
+                queued[row] += 1
+            heap = [(scorer.score(entries[row], enqueue_at[row], now), row, version) for row, version in queued.items()]
+            heapq.heapify(heap)
+            next_rescore += rescore_interval
+        while next_rescore <= now and not queued:
+            next_rescore += rescore_interval
+
+        while idle and heap:
+            _, row, version = heapq.heappop(heap)
+            if queued.get(row) != version:
+                continue
+            del queued[row]
+            waits[row] = now - at[row]
+            heapq.heappush(busy, now + handle[row])
+            busy_seconds += handle[row]
+            idle -= 1
+
+    return {
+        "dispatchers": dispatchers,
+        "waits": waits,
+        "merged": merged,
+        "busy_seconds": busy_seconds,
+        "makespan": now,
+    }
+
+
+def summarize(trace: Trace, result: dict, percentiles: Sequence[float] = (50, 90, 99)) -> dict:
+    """Wait-time percentiles and SLA attainment per severity, plus utilization."""
+    waits = result["waits"]
+    answered = ~np.isnan(waits)
+    by_severity = {}
+    for severity in SEVERITIES:
+        mask = answered & (trace["severity"] == severity)
+        values = waits[mask]
+        sla = scoring.SCORING_SLA_SECONDS.get(severity, math.inf)
+        stats = {"calls": int(mask.sum())}
+        if len(values):
+            stats.update({f"p{p:g}": float(v) for p, v in zip(percentiles, np.percentile(values, percentiles))})
+            stats["max"] = float(values.max())
+            stats["within_sla"] = float(np.mean(values <= sla))
+        by_severity[severity] = stats
+    capacity = result["dispatchers"] * result["makespan"]
+    return {
+        "dispatchers": result["dispatchers"],
+        "answered": int(answered.sum()),
+        "merged": result["merged"],
+        "utilization": result["busy_seconds"] / capacity if capacity else 0.0,
+        "makespan_hours": result["makespan"] / 3600,
+        "severity": by_severity,
+    }
+
+
+def _run_level(args: tuple) -> dict:
+    trace, dispatchers, rescore_interval, triage_seconds = args
+    return summarize(trace, simulate(trace, dispatchers, None, rescore_interval, triage_seconds))
+
+
+def sweep(trace: Trace, staffing: Iterable[int], rescore_interval: float = scoring.RESCORE_INTERVAL_SECONDS,
+          triage_seconds: float = SIM_TRIAGE_SECONDS, workers: Optional[int] = None) -> List[dict]:
+    """
+    Summaries for each staffing level, all replaying the same trace. With
+    workers > 1 the levels run in separate processes, which use the
+    configured scoring.scorer.
+    """
+    jobs = [(trace, level, rescore_interval, triage_seconds) for level in staffing]
+    if workers == 1 or len(jobs) == 1:
+        return [_run_level(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_run_level, jobs))
+
+
+def minimum_staffing(summaries: List[dict], target: float) -> Optional[int]:
+    """Fewest dispatchers for which every severity answers `target` of its calls within SLA."""
+    for summary in sorted(summaries, key=lambda s: s["dispatchers"]):
+        if all(stats.get("within_sla", 1.0) >= target for stats in summary["severity"].values()):
+            return summary["dispatchers"]
+    return None
+
+
+def _staffing_levels(values: List[str]) -> List[int]:
+    levels = []
+    for value in values:
+        low, _, high = value.partition("-")
+        levels.extend(range(int(low), int(high or low) + 1))
+    return sorted(set(levels))
+
+
+def _format_minutes(seconds: Optional[float]) -> str:
+    return "-" if seconds is None else f"{seconds / 60:.1f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate dispatcher staffing against a call trace")
+    parser.add_argument("--dispatchers", nargs="+", default=["4-12"], help="Levels, e.g. 6 8 10 or 4-12")
+    parser.add_argument("--trace", help="NDJSON call trace (default: synthetic)")
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--hours", type=float, default=8.0)
+    parser.add_argument("--hourly-profile", type=float, nargs="+", help="Relative call volume per hour")
+    parser.add_argument("--handle-mean", type=float, default=SIM_HANDLE_MEAN_SECONDS)
+    parser.add_argument("--handle-sigma", type=float, default=SIM_HANDLE_SIGMA)
+    parser.add_argument("--duplicate-rate", type=float, default=SIM_DUPLICATE_RATE)
+    parser.add_argument("--triage-seconds", type=float, default=SIM_TRIAGE_SECONDS)
+    parser.add_argument("--rescore-interval", type=float, default=scoring.RESCORE_INTERVAL_SECONDS)
+    parser.add_argument("--target-sla", type=float, default=0.9,
+                        help="Report the fewest dispatchers meeting this within-SLA share for every severity")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, help="Processes for the sweep (default: CPU count)")
+    parser.add_argument("--json", action="store_true", help="Print the summaries as JSON")
+    args = parser.parse_args()
+
+    if args.trace:
+        trace = load_trace(args.trace, args.handle_mean, args.handle_sigma, args.seed)
+    else:
+        trace = synthetic_trace(
+            args.calls, args.hours, handle_mean=args.handle_mean, handle_sigma=args.handle_sigma,
+            duplicate_rate=args.duplicate_rate, hourly_profile=args.hourly_profile, seed=args.seed,
+        )
+    summaries = sweep(trace, _staffing_levels(args.dispatchers), args.rescore_interval,
+                      args.triage_seconds, args.workers)
+
+    if args.json:
+        print(json.dumps(summaries, indent=2))
+        return
+
+    span = (trace["at"][-1] - trace["at"][0]) / 3600 if len(trace["at"]) else 0.0
+    print(
+        f"[simulator] {len(trace['at'])} calls over {span:.1f} h, "
+        f"{int((trace['duplicate_of'] >= 0).sum())} duplicates; waits in minutes (p50/p90/p99), SLA = within-SLA share"
+    )
+    header = f"{'disp':>4} | {'util':>5} | {'drain h':>7}"
+    for severity in reversed(SEVERITIES):
+        header += f" | {'sev ' + severity + ' p50/p90/p99':>22} | {'SLA':>5}"
+    print(header)
+    for summary in summaries:
+        row = f"{summary['dispatchers']:>4} | {summary['utilization']:>5.0%} | {summary['makespan_hours']:>7.1f}"
+        for severity in reversed(SEVERITIES):
+            stats = summary["severity"][severity]
+            waits = "/".join(_format_minutes(stats.get(p)) for p in ("p50", "p90", "p99"))
+            row += f" | {waits:>22} | {stats.get('within_sla', 1.0):>5.0%}"
+        print(row)
+    needed = minimum_staffing(summaries, args.target_sla)
+    if needed is None:
+        print(f"[simulator] No level tried answers {args.target_sla:.0%} of every severity within SLA")
+    else:
+        print(f"[simulator] {needed} dispatchers answer {args.target_sla:.0%} of every severity within SLA")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,7 @@ from dotenv import load_dotenv
 
 # NOTE: this script is run once to seed dummy data to demo the VDB and filtering logic to prevent 
 # redudant entries from calls. 
-from backend.vector_store import dense_index, add_incident
+from backend.vector_store import get_index, add_incident
 
 SCHEMA_FILE = Path("backend/db.json")
 
@@ -59,7 +59,7 @@ def load_and_add_incidents(json_file: str):
         time.sleep(10)
         
         print("Fetching index statistics...")
-        stats = dense_index.describe_index_stats()
+        stats = get_index().describe_index_stats()
         print("\n--- Pinecone Index Stats ---")
         print(stats)
         print("--------------------------\n")
@@ -0,0 +1,55 @@
+"""
+Shared test setup.
+
+Redis is replaced by fakeredis before any backend module builds its clients,
+so the suite needs no server and the Lua scripts run for real (through lupa).
+Every test starts from an empty database. Async code runs on one event loop
+for the whole session, as the module-level clients would in a worker.
+
+    cd backend && python -m pytest -q
+"""
+import asyncio
+import os
+
+import fakeredis
+import pytest
+import redis
+import redis.asyncio
+
+os.environ.setdefault("PINECONE_API_KEY", "test")
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+
+_server = fakeredis.FakeServer()
+
+
+def _fake_async_redis(*args, connection_pool=None, decode_responses=False, **kwargs):
+    if connection_pool is not None:
+        decode_responses = connection_pool.connection_kwargs.get("decode_responses", False)
+    return fakeredis.FakeAsyncRedis(server=_server, decode_responses=decode_responses)
+
+
+def _fake_redis(*args, decode_responses=False, **kwargs):
+    return fakeredis.FakeRedis(server=_server, decode_responses=decode_responses)
+
+
+redis.asyncio.Redis = _fake_async_redis
+redis.Redis = _fake_redis
+
+
+@pytest.fixture(scope="session")
+def _loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def run(_loop):
+    """Run a coroutine to completion on the session loop."""
+    return _loop.run_until_complete
+
+
+@pytest.fixture(autouse=True)
+def _flush_redis():
+    fakeredis.FakeRedis(server=_server).flushall()
+    yield
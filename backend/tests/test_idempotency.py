@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from backend import idempotency
+from backend.redis_client import redis_client
+from backend.serialization import dumps
+
+
+def _counting(result: dict, delay: float = 0.05):
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return result
+
+    return fn, calls
+
+
+def test_concurrent_requests_with_one_key_run_once(run):
+    fn, calls = _counting({"ok": 1})
+
+    async def burst():
+        return await asyncio.gather(*[idempotency.run_once("invoke", "k", fn, "fp") for _ in range(5)])
+
+    results = run(burst())
+    assert len(calls) == 1
+    assert [result for result, _ in results] == [{"ok": 1}] * 5
+    assert sorted(how for _, how in results) == [idempotency.ATTACHED] * 4 + [idempotency.EXECUTED]
+
+    # A later retry replays the stored result
+    assert run(idempotency.run_once("invoke", "k", fn, "fp")) == ({"ok": 1}, idempotency.STORED)
+    assert len(calls) == 1
+
+
+def test_a_key_reused_for_another_request_is_refused(run):
+    fn, calls = _counting({"ok": 1}, delay=0)
+    run(idempotency.run_once("invoke", "k", fn, "fp"))
+    with pytest.raises(idempotency.IdempotencyKeyReused):
+        run(idempotency.run_once("invoke", "k", fn, "other"))
+    assert len(calls) == 1
+
+
+def test_a_failed_run_lets_the_next_attempt_run_again(run):
+    async def fail():
+        raise RuntimeError("LLM down")
+
+    with pytest.raises(RuntimeError):
+        run(idempotency.run_once("invoke", "k", fail))
+    assert run(redis_client.exists("idem:invoke:k")) == 0
+
+    fn, calls = _counting({"ok": 2}, delay=0)
+    assert run(idempotency.run_once("invoke", "k", fn)) == ({"ok": 2}, idempotency.EXECUTED)
+
+
+def test_a_retry_waits_for_the_run_owned_by_another_worker(run):
+    fn, calls = _counting({"ok": 1}, delay=0)
+    running = {"status": "running", "fingerprint": "fp", "owner": 1, "started_at": 0.0}
+
+    async def other_worker_finishes():
+        await redis_client.set("idem:invoke:k", dumps(running))
+        waiter = asyncio.create_task(idempotency.run_once("invoke", "k", fn, "fp"))
+        await asyncio.sleep(0.1)
+        assert not waiter.done()
+        await redis_client.set("idem:invoke:k", dumps({**running, "status": "succeeded", "result": {"ok": 3}}))
+        await redis_client.publish("idem_events:invoke:k", "succeeded")
+        return await asyncio.wait_for(waiter, 2)
+
+    assert run(other_worker_finishes()) == ({"ok": 3}, idempotency.WAITED)
+    assert calls == []
+
+
+def test_a_retry_gives_up_after_the_wait_limit(run, monkeypatch):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_WAIT_SECONDS", 0.2)
+    fn, calls = _counting({"ok": 1}, delay=0)
+    run(redis_client.set("idem:invoke:k", dumps({"status": "running", "fingerprint": None})))
+    with pytest.raises(idempotency.IdempotencyTimeout):
+        run(idempotency.run_once("invoke", "k", fn))
+    assert calls == []
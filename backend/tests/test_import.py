@@ -0,0 +1,25 @@
+import subprocess
+import sys
+from pathlib import Path
+
+_IMPORT_WITHOUT_NETWORK = """
+import socket
+
+def _no_network(self, address):
+    raise RuntimeError(f"network connection to {address} during import")
+
+socket.socket.connect = _no_network
+socket.socket.connect_ex = _no_network
+import backend.main
+"""
+
+
+def test_importing_main_does_not_touch_the_network():
+    result = subprocess.run(
+        [sys.executable, "-c", _IMPORT_WITHOUT_NETWORK],
+        cwd=Path(__file__).resolve().parents[2],
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,52 @@
+import asyncio
+
+from backend import incident_events
+
+
+async def _collect(follower, count: int) -> list:
+    events = []
+    async for event in follower:
+        if event is not None:
+            events.append(event["id"])
+        if len(events) == count:
+            return events
+
+
+def test_followers_share_one_reader_and_resume_from_the_log(run, monkeypatch):
+    monkeypatch.setattr(incident_events, "INCIDENT_EVENTS_BLOCK_MS", 100)
+
+    async def scenario():
+        first = await incident_events.append(incident_events.COMPLETED, "a")
+        live = [asyncio.create_task(_collect(incident_events.follow(), 2)) for _ in range(3)]
+        history = asyncio.create_task(_collect(incident_events.follow("0-0"), 3))
+        late = asyncio.create_task(_collect(incident_events.follow(first), 2))
+        await asyncio.sleep(0.2)
+        reader = incident_events._fanout._task
+        await incident_events.append(incident_events.COMPLETED, "b")
+        await incident_events.append(incident_events.COMPLETED, "c")
+        results = await asyncio.wait_for(asyncio.gather(*live, history, late), 5)
+        assert incident_events._fanout._task is reader
+        # The reader stops once every follower has gone
+        await asyncio.sleep(0.3)
+        return results, incident_events._fanout._task
+
+    results, reader = run(scenario())
+    assert results == [["b", "c"]] * 3 + [["a", "b", "c"], ["b", "c"]]
+    assert reader is None
+
+
+def test_a_follower_that_falls_behind_catches_up_from_the_log(run, monkeypatch):
+    monkeypatch.setattr(incident_events, "INCIDENT_EVENTS_BLOCK_MS", 100)
+    monkeypatch.setattr(incident_events, "INCIDENT_EVENTS_FOLLOWER_BACKLOG", 1)
+
+    async def scenario():
+        follower = incident_events.follow()
+        assert await follower.__anext__() is None  # subscribed, nothing new yet
+        for incident_id in "abcde":
+            await incident_events.append(incident_events.COMPLETED, incident_id)
+            await asyncio.sleep(0.15)  # one batch each; only the first fits the backlog
+        events = await _collect(follower, 5)
+        await follower.aclose()
+        return events
+
+    assert run(scenario()) == ["a", "b", "c", "d", "e"]
@@ -0,0 +1,130 @@
+import pytest
+
+from backend import incident_events as events
+from backend import incident_snapshots, triage_queue
+from backend.incident_snapshots import CLAIMED, COMPLETED, QUEUED, apply
+from backend.redis_client import redis_bytes_client
+from backend.serialization import dumps, loads
+
+ENTRY = '{"id":"a","location":"M5V2T6","callers":1}'
+PAYLOAD = '{"id":"a","desc":"House fire","callers":1,"status":"open"}'
+
+
+def _event(kind: str, incident_id: str = "a", at: float = 100.0, **fields) -> dict:
+    return {"type": kind, "id": incident_id, "at": at, **fields}
+
+
+def _created(incident_id: str = "a", **fields) -> dict:
+    fields = {"entry": ENTRY, "score": 2.0, "enqueued_at": 90.0, "shard": "triage_queue", **fields}
+    return _event(events.CREATED, incident_id, **fields)
+
+
+def test_created_then_merged_updates_entry_and_payload():
+    state = {}
+    apply(state, _created(payload=PAYLOAD))
+    assert state["a"]["status"] == QUEUED
+    assert state["a"]["stored_at"] == 100.0
+
+    apply(state, _event(events.MERGED, entry='{"id":"a","callers":2}', score=1.5, callers=2))
+    assert state["a"]["score"] == 1.5
+    assert loads(state["a"]["entry"])["callers"] == 2
+    assert loads(state["a"]["payload"])["callers"] == 2
+
+
+def test_provisional_entry_is_replaced_and_keeps_payload_time():
+    state = {}
+    apply(state, _created())
+    assert state["a"]["payload"] is None
+    apply(state, _created(entry='{"id":"a","final":true}', score=1.0, payload=PAYLOAD, at=150.0))
+    apply(state, _created(payload=PAYLOAD, at=200.0))
+    assert state["a"]["stored_at"] == 150.0
+
+
+def test_claim_release_and_complete():
+    state = {}
+    apply(state, _created(payload=PAYLOAD))
+    apply(state, _event(events.CLAIMED, dispatcher="d1", expires_at=160.0))
+    assert state["a"]["status"] == CLAIMED
+
+    apply(state, _event(events.RELEASED, entry=ENTRY, score=2.0, shard="triage_queue:{M}", reason="expired"))
+    assert (state["a"]["status"], state["a"]["shard"]) == (QUEUED, "triage_queue:{M}")
+
+    apply(state, _event(events.COMPLETED, at=300.0))
+    assert (state["a"]["status"], state["a"]["completed_at"]) == (COMPLETED, 300.0)
+    assert loads(state["a"]["payload"])["status"] == "completed"
+
+
+def test_rescored_only_touches_queued_incidents():
+    state = {}
+    apply(state, _created("a"))
+    apply(state, _created("b"))
+    apply(state, _event(events.CLAIMED, "b"))
+    apply(state, _event(events.RESCORED, "", scores={"a": 0.5, "b": 0.5, "gone": 0.5}))
+    assert state["a"]["score"] == 0.5
+    assert state["b"]["score"] == 2.0
+    assert "gone" not in state
+
+
+def test_demoted_drops_completed_and_keeps_open_incidents_queued():
+    state = {}
+    apply(state, _created("a", payload=PAYLOAD))
+    apply(state, _created("b", payload=PAYLOAD))
+    apply(state, _event(events.COMPLETED, "b"))
+    apply(state, _event(events.DEMOTED, "", ids=["a", "b"]))
+    assert state["a"]["payload"] is None and state["a"]["status"] == QUEUED
+    assert "b" not in state
+
+
+def test_removed_and_events_for_unknown_incidents():
+    state = {}
+    apply(state, _created())
+    apply(state, _event(events.REMOVED))
+    assert state == {}
+    # Incidents created before the log covered them are ignored
+    for kind in (events.MERGED, events.CLAIMED, events.COMPLETED, events.REMOVED):
+        apply(state, _event(kind, "old", callers=2))
+    assert state == {}
+
+
+def test_applying_an_event_twice_is_harmless():
+    once, twice = {}, {}
+    for event in (_created(payload=PAYLOAD), _event(events.MERGED, callers=2), _event(events.COMPLETED)):
+        apply(once, event)
+        apply(twice, event)
+        apply(twice, event)
+    assert dumps(once) == dumps(twice)
+
+
+def test_replay_folds_the_stream(run):
+    async def scenario():
+        await events.append(events.CREATED, "a", entry=ENTRY, score=2.0, enqueued_at=90.0,
+                            shard="triage_queue", payload=PAYLOAD)
+        await events.append(events.MERGED, "a", callers=3)
+        return await incident_snapshots.current_state()
+
+    state, last_id, replayed = run(scenario())
+    assert replayed == 2
+    assert last_id != "0-0"
+    assert loads(state["a"]["payload"])["callers"] == 3
+
+
+async def _queue_before_the_log(incident_id: str) -> None:
+    member = dumps({"id": incident_id, "location": "M5V2T6", "severity_level": "2", "callers": 1})
+    async with redis_bytes_client.pipeline(transaction=True) as pipe:
+        triage_queue.stage_add(pipe, incident_id, member, 5.0, 1000.0)
+        await pipe.execute()
+
+
+def test_rebuild_refuses_without_a_snapshot(run):
+    run(_queue_before_the_log("old"))
+    with pytest.raises(RuntimeError):
+        run(incident_snapshots.rebuild())
+    assert run(triage_queue.find_entry("old", scan_fallback=False)) is not None
+
+
+def test_rebuild_with_seed_keeps_incidents_queued_before_the_log(run):
+    run(_queue_before_the_log("old"))
+    counts = run(incident_snapshots.rebuild(seed=True))
+    assert counts["queued"] == 1
+    member, score, enqueued_at, _ = run(triage_queue.find_entry("old", scan_fallback=False))
+    assert (loads(member)["id"], score, enqueued_at) == ("old", 5.0, 1000.0)
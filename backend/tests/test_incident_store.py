@@ -0,0 +1,105 @@
+import pytest
+import redis
+from fastapi.testclient import TestClient
+
+from backend import incident_events, incident_store, main, triage_queue
+from backend.incident_store import (
+    TRIAGE_COMPLETED_KEY,
+    TRIAGE_FULL_PAYLOADS_KEY,
+    TRIAGE_HOT_ORDER_KEY,
+    WarmStore,
+)
+from backend.redis_client import redis_bytes_client
+from backend.serialization import dumps, loads
+
+NOW = 1_700_000_000.0
+INCIDENT_ID = "01KEKQ4S7J4P2D0M9YQ3Z8W6XA"
+
+
+@pytest.fixture(autouse=True)
+def warm(monkeypatch, tmp_path):
+    store = WarmStore(str(tmp_path / "warm.sqlite3"))
+    monkeypatch.setattr(incident_store, "warm_store", store)
+    return store
+
+
+async def _store_hot(incident_id: str, stored_at: float, completed_at: float = None) -> bytes:
+    payload = dumps({"id": incident_id, "status": "open", "callers": 1})
+    async with redis_bytes_client.pipeline(transaction=True) as pipe:
+        pipe.hset(TRIAGE_FULL_PAYLOADS_KEY, incident_id, payload)
+        pipe.zadd(TRIAGE_HOT_ORDER_KEY, {incident_id: stored_at})
+        if completed_at is not None:
+            pipe.zadd(TRIAGE_COMPLETED_KEY, {incident_id: completed_at})
+        await pipe.execute()
+    return payload
+
+
+def test_completed_incidents_past_their_ttl_move_to_the_warm_store(run, warm):
+    old = run(_store_hot("old", NOW - 5000, completed_at=NOW - 2000))
+    run(_store_hot("recent", NOW - 5000, completed_at=NOW - 10))
+    run(_store_hot("open", NOW - 5000))
+
+    assert run(incident_store.demote_expired(now=NOW)) == 1
+    assert run(incident_store.get_incident("old")) == (old, "warm")
+    assert run(incident_store.get_incident("recent"))[1] == "hot"
+    assert run(incident_store.get_incident("open"))[1] == "hot"
+    assert run(redis_bytes_client.zscore(TRIAGE_HOT_ORDER_KEY, "old")) is None
+    events = run(incident_events.read_range("0-0", 100))
+    assert [(event["type"], event["ids"]) for event in events] == [("demoted", ["old"])]
+
+
+def test_cap_demotes_completed_first_then_the_oldest_open(run, monkeypatch, warm):
+    monkeypatch.setattr(incident_store, "HOT_MAX_INCIDENTS", 2)
+    run(_store_hot("open-old", NOW - 300))
+    run(_store_hot("open-new", NOW - 100))
+    run(_store_hot("done", NOW - 50, completed_at=NOW - 10))
+    run(_store_hot("open-newest", NOW - 10))
+
+    assert run(incident_store.demote_expired(now=NOW)) == 2
+    assert sorted(key.decode() for key in run(redis_bytes_client.hkeys(TRIAGE_FULL_PAYLOADS_KEY))) == [
+        "open-new", "open-newest",
+    ]
+    assert warm.count() == 2
+
+
+def test_a_payload_changed_during_demotion_stays_hot(run, monkeypatch, warm):
+    run(_store_hot("a", NOW - 5000, completed_at=NOW - 2000))
+    merged = dumps({"id": "a", "status": "open", "callers": 2})
+    put_many = warm.put_many
+
+    def put_many_then_merge(items):
+        # A caller merged between the copy and the delete
+        put_many(items)
+        redis.Redis().hset(TRIAGE_FULL_PAYLOADS_KEY, "a", merged)
+        return len(items)
+
+    monkeypatch.setattr(warm, "put_many", put_many_then_merge)
+    assert run(incident_store.demote_expired(now=NOW)) == 0
+    assert run(incident_store.get_incident("a")) == (merged, "hot")
+    assert run(incident_events.read_range("0-0", 100)) == []
+
+    # The next sweep copies the merged payload
+    monkeypatch.setattr(warm, "put_many", put_many)
+    assert run(incident_store.demote_expired(now=NOW)) == 1
+    assert run(incident_store.get_incident("a")) == (merged, "warm")
+
+
+def test_remove_completes_an_open_incident_demoted_by_the_cap(run, monkeypatch, warm):
+    monkeypatch.setattr(incident_store, "HOT_MAX_INCIDENTS", 0)
+    updates = []
+    monkeypatch.setattr(main, "update_incident", lambda record, fields: updates.append((record, fields)) or True)
+
+    async def enqueue_then_demote():
+        async with redis_bytes_client.pipeline(transaction=True) as pipe:
+            triage_queue.stage_add(pipe, INCIDENT_ID, dumps({"id": INCIDENT_ID, "callers": 1}), 1.0, NOW)
+            await pipe.execute()
+        await _store_hot(INCIDENT_ID, NOW)
+        return await incident_store.demote_expired(now=NOW)
+
+    assert run(enqueue_then_demote()) == 1
+    response = TestClient(main.app).delete(f"/remove/{INCIDENT_ID}").json()
+
+    assert response == {"removed": 1, "status_update": "completed"}
+    assert updates == [({"id": INCIDENT_ID, "status": "completed", "callers": 1}, ["status"])]
+    payload, tier = run(incident_store.get_incident(INCIDENT_ID))
+    assert (loads(payload)["status"], tier) == ("completed", "hot")
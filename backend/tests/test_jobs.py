@@ -0,0 +1,79 @@
+import asyncio
+import time
+
+from backend import jobs, main
+from backend.redis_client import redis_client
+from backend.schemas import TriageIncident
+
+
+def test_async_job_runs_the_graph_without_a_preassigned_incident_id(run, monkeypatch):
+    states = []
+
+    class Graph:
+        async def ainvoke(self, state, config=None):
+            states.append(state)
+            return {"triage_incident": TriageIncident(
+                id="01KEKQ4S7J4P2D0M9YQ3Z8W6XA", incidentType="Fire", location="M5V2T6", date="1/10/2026",
+                time="14:30", duration="00:35", message=state["transcript"].text, desc="Fire",
+                suggested_actions="dispatch firefighters", severity_level="3",
+            )}
+
+    monkeypatch.setattr(main, "get_graph", lambda name="triage": Graph())
+    request = main.InvokeRequest(transcript={
+        "text": "My house is on fire!", "time": "2026-01-10T09:15:00Z", "location": "V6B1A1", "duration": "00:35",
+    })
+
+    async def submit_and_finish():
+        submitted = await main._submit_job(request)
+        await asyncio.gather(*main._job_tasks)
+        return submitted, await jobs.get_job(submitted["job_id"])
+
+    submitted, job = run(submit_and_finish())
+    assert "incident_id" not in submitted
+    assert "incident_id" not in states[0]
+    assert (job["status"], job["incident_id"], job["owner"]) == ("succeeded", "01KEKQ4S7J4P2D0M9YQ3Z8W6XA", jobs.WORKER_ID)
+    assert job["result"]["result"]["id"] == job["incident_id"]
+
+
+def test_jobs_of_a_silent_worker_are_marked_failed(run, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_STALE_SECONDS", 60)
+
+    async def scenario():
+        live = await jobs.create_job()
+        dead = await jobs.create_job()
+        await jobs.update_job(live["job_id"], "running")
+        await jobs.update_job(dead["job_id"], "running")
+        await redis_client.hset(jobs._job_key(dead["job_id"]), "heartbeat_at", time.time() - 61)
+        return await jobs.get_job(live["job_id"]), await jobs.get_job(dead["job_id"])
+
+    live, dead = run(scenario())
+    assert live["status"] == "running"
+    assert dead["status"] == "failed"
+    assert dead["error"] == f"Worker {jobs.WORKER_ID} stopped running the job"
+
+
+def test_job_events_report_a_dead_owner(run, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_STALE_SECONDS", 0.2)
+
+    async def follow():
+        job = await jobs.create_job()
+        await jobs.update_job(job["job_id"], "running")
+        return [event["status"] async for event in jobs.job_events(job["job_id"], timeout=1.0)]
+
+    assert run(follow()) == ["running", "failed"]
+
+
+def test_heartbeat_keeps_a_running_job_alive(run, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_HEARTBEAT_SECONDS", 0.05)
+    monkeypatch.setattr(jobs, "JOB_STALE_SECONDS", 0.2)
+
+    async def scenario():
+        job = await jobs.create_job()
+        await jobs.update_job(job["job_id"], "running")
+        heartbeat = asyncio.create_task(jobs.heartbeat(job["job_id"]))
+        await asyncio.sleep(0.5)
+        status = (await jobs.get_job(job["job_id"]))["status"]
+        heartbeat.cancel()
+        return status
+
+    assert run(scenario()) == "running"
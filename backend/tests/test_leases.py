@@ -0,0 +1,108 @@
+import time
+
+from backend import incident_events, leases, scoring, triage_queue
+from backend.incident_store import TRIAGE_FULL_PAYLOADS_KEY
+from backend.redis_client import redis_bytes_client
+from backend.serialization import dumps, loads
+
+
+async def _enqueue(incident_id: str, score: float, location: str = "M5V 2T6") -> bytes:
+    member = dumps({"id": incident_id, "location": location, "severity_level": "2", "callers": 1})
+    async with redis_bytes_client.pipeline(transaction=True) as pipe:
+        triage_queue.stage_add(pipe, incident_id, member, score, 1000.0, triage_queue.shard_key(location))
+        await pipe.execute()
+    return member
+
+
+async def _event_types() -> list:
+    return [event["type"] for event in await incident_events.read_range("0-0", 100)]
+
+
+def test_claim_takes_most_urgent_and_leases_it(run):
+    run(_enqueue("a", 5.0))
+    member = run(_enqueue("b", 1.0))
+
+    lease = run(leases.claim("dispatcher-1"))
+    assert lease["id"] == "b"
+    assert lease["dispatcher"] == "dispatcher-1"
+    assert lease["entry"] == loads(member)
+    assert lease["score"] == 1.0
+    assert lease["enqueued_at"] == 1000.0
+    assert run(triage_queue.find_entry("b", scan_fallback=False)) is None
+    assert run(triage_queue.find_entry("a", scan_fallback=False)) is not None
+
+    # The next dispatcher gets the other entry, and then nothing
+    assert run(leases.claim("dispatcher-2"))["id"] == "a"
+    assert run(leases.claim("dispatcher-3")) is None
+    assert run(_event_types()) == ["claimed", "claimed"]
+
+
+def test_claim_filters_by_sector_and_exclusions(run):
+    run(_enqueue("downtown", 1.0, "M5V 2T6"))
+    run(_enqueue("scarborough", 2.0, "M1B 3C3"))
+
+    assert run(leases.claim("d1", sector="M1B"))["id"] == "scarborough"
+    assert run(leases.claim("d2", sector="M1B")) is None
+    assert run(leases.claim("d3", exclude=["downtown"])) is None
+    assert run(leases.claim("d4"))["id"] == "downtown"
+
+
+def test_release_puts_entry_back_rescored(run):
+    run(_enqueue("a", 3.0))
+    lease = run(leases.claim("d1"))
+
+    assert run(leases.release("a", "wrong-token")) is None
+    assert run(leases.release("a", lease["token"])) is not None
+    member, score, enqueued_at, _ = run(triage_queue.find_entry("a", scan_fallback=False))
+    assert enqueued_at == 1000.0
+    assert score == scoring.compute_score(loads(member), 1000.0)
+    assert run(leases.active_leases()) == []
+    # The old token is dead once released
+    assert run(leases.renew("a", lease["token"])) is None
+    assert run(_event_types()) == ["claimed", "released", "rescored"]
+
+
+def test_merge_while_leased_goes_back_with_the_new_callers(run):
+    run(_enqueue("a", 3.0))
+    lease = run(leases.claim("d1"))
+
+    async def merge():
+        async with redis_bytes_client.pipeline(transaction=True) as pipe:
+            triage_queue.stage_add_caller(
+                pipe, "a", TRIAGE_FULL_PAYLOADS_KEY, incident_events.INCIDENT_EVENTS_KEY,
+                leases.TRIAGE_LEASES_KEY, await triage_queue.shard_keys(), 1, time.time(),
+            )
+            return triage_queue.parse_added_caller((await pipe.execute())[0])
+
+    assert run(merge()) == (2, None)
+    assert run(leases.active_leases())[0]["entry"]["callers"] == 2
+
+    run(leases.release("a", lease["token"]))
+    member, score, _, _ = run(triage_queue.find_entry("a", scan_fallback=False))
+    assert loads(member)["callers"] == 2
+    assert score == scoring.compute_score(loads(member), 1000.0)
+    assert run(_event_types()) == ["claimed", "merged", "released", "rescored"]
+
+
+def test_complete_ends_the_lease_for_good(run):
+    run(_enqueue("a", 3.0))
+    lease = run(leases.claim("d1"))
+
+    assert run(leases.complete("a", lease["token"]))["id"] == "a"
+    assert run(leases.active_leases()) == []
+    assert run(triage_queue.find_entry("a", scan_fallback=False)) is None
+    assert run(leases.claim("d2")) is None
+
+
+def test_renew_extends_and_expired_leases_are_swept(run):
+    run(_enqueue("a", 3.0))
+    lease = run(leases.claim("d1", lease_seconds=30))
+
+    renewed = run(leases.renew("a", lease["token"], lease_seconds=120))
+    assert renewed["expires_at"] > lease["expires_at"]
+
+    assert run(leases.sweep_expired(now=time.time() + 60)) == 0
+    assert run(leases.sweep_expired(now=time.time() + 600)) == 1
+    assert run(triage_queue.find_entry("a", scan_fallback=False))[1] == 3.0
+    assert run(leases.complete("a", lease["token"])) is None
+    assert run(_event_types()) == ["claimed", "released"]
@@ -0,0 +1,155 @@
+import base64
+import json
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import incident_events, main, triage_queue
+from backend.fake_media_stream import FRAME_SAMPLES
+from backend.media_stream import (
+    TWILIO_SAMPLE_RATE,
+    MediaStreamSession,
+    mulaw_to_pcm16,
+    pcm16_to_mulaw,
+)
+from backend.schemas import TriageIncident
+from backend.serialization import loads
+
+TRANSCRIPT = "there is a fire on king street and people are trapped on the third floor"
+
+
+def test_mulaw_decodes_known_codes_and_round_trips():
+    # 0xFF and 0x7F are the two zeros, 0x00 and 0x80 the extremes
+    assert mulaw_to_pcm16(bytes([0xFF, 0x7F, 0x00, 0x80])).tolist() == [0, 0, -32124, 32124]
+    samples = (np.sin(np.arange(800) / 10) * 20000).astype(np.int16)
+    decoded = mulaw_to_pcm16(pcm16_to_mulaw(samples)).astype(np.int32)
+    # mu-law keeps about 3% relative error
+    assert np.all(np.abs(decoded - samples) <= np.abs(samples) * 0.04 + 8)
+
+
+def _messages(transcript: str, seconds: float, call_sid: str = "CA1") -> list:
+    """Twilio media stream messages, as fake_media_stream sends them, for `seconds` of silence."""
+    payload = pcm16_to_mulaw(np.zeros(int(seconds * TWILIO_SAMPLE_RATE), dtype=np.int16))
+    messages = [
+        {"event": "connected", "protocol": "Call", "version": "1.0.0"},
+        {"event": "start", "streamSid": "MZ1", "start": {
+            "streamSid": "MZ1", "callSid": call_sid, "tracks": ["inbound"],
+            "customParameters": {"transcript": transcript, "seconds_per_word": "0.5"},
+        }},
+    ]
+    for offset in range(0, len(payload), FRAME_SAMPLES):
+        messages.append({"event": "media", "streamSid": "MZ1", "media": {
+            "track": "inbound", "payload": base64.b64encode(payload[offset:offset + FRAME_SAMPLES]).decode("ascii"),
+        }})
+    messages.append({"event": "stop", "streamSid": "MZ1"})
+    return messages
+
+
+def test_session_cuts_windows_and_notifies_as_words_arrive(run):
+    windows, updates = [], []
+
+    async def transcribe(wav_bytes, offset, session):
+        windows.append((len(wav_bytes), offset))
+        return await main.fake_transcriber(wav_bytes, offset, session)
+
+    async def on_transcript(text, elapsed, final):
+        updates.append((len(text.split()), elapsed, final))
+
+    async def stream():
+        session = MediaStreamSession(transcribe, on_transcript, window_seconds=2, min_new_words=3)
+        for message in _messages(TRANSCRIPT, 5.2):
+            session.handle_message(message)
+        await session.close()
+        return session
+
+    session = run(stream())
+    # Three 2 s windows (the last cut short by stop), decoded to 16-bit WAV
+    assert [offset for _, offset in windows] == [0.0, 2.0, 4.0]
+    assert windows[0][0] == 44 + 2 * 2 * TWILIO_SAMPLE_RATE
+    assert session.text == " ".join(TRANSCRIPT.split()[:10])
+    assert updates == [(4, 5.2, False), (8, 5.2, False), (10, 5.2, True)]
+
+
+@pytest.fixture
+def streamed(monkeypatch):
+    """/media-stream with the fake transcriber and the agents replaced by a scripted triage."""
+    monkeypatch.setattr(main, "STREAM_TRANSCRIBER", "fake")
+    severities = iter(["2", "3", "3", "3"])
+
+    class Graph:
+        async def ainvoke(self, state):
+            return {"triage_incident": TriageIncident(
+                id=state["incident_id"], incidentType="Fire", location="M5V2T6", date="1/10/2026",
+                time="14:30", duration=state["transcript"].duration, message=state["transcript"].text,
+                desc="Fire on King Street", suggested_actions="dispatch firefighters",
+                severity_level=next(severities),
+            )}
+
+    monkeypatch.setattr(main, "get_graph", lambda name="triage": Graph())
+    return TestClient(main.app)
+
+
+def _stream(client: TestClient, seconds: float) -> str:
+    with client.websocket_connect("/media-stream") as ws:
+        for message in _messages(TRANSCRIPT, seconds):
+            ws.send_text(json.dumps(message))
+    return loads(client.get("/queue?raw=false").content)
+
+
+def test_media_stream_creates_then_upgrades_a_provisional_entry(streamed, run):
+    # 7 s at 0.5 s a word: a 5 s window of 10 words, then 4 more at stop
+    queue = _stream(streamed, 7.0)
+    assert len(queue) == 1
+    entry = queue[0]
+    assert entry["provisional"] is True
+    assert entry["severity_level"] == "3"  # the upgrade, not the first triage
+
+    assert [event["type"] for event in run(incident_events.read_range("0-0", 100))] == ["created", "created"]
+
+    # GET /agent serves the provisional payload until the final triage lands
+    agent = streamed.get(f"/agent/{entry['id']}").json()["result"]
+    assert agent["provisional"] is True
+    assert agent["message"] == " ".join(TRANSCRIPT.split()[:14])
+
+
+def test_final_triage_replaces_the_provisional_entry(streamed, monkeypatch, run):
+    entry = _stream(streamed, 7.0)[0]
+    monkeypatch.setattr(main, "add_incident", lambda payload: True)
+    call = run(main.call_state.get_call("CA1"))
+    final = TriageIncident(
+        id=entry["id"], incidentType="Fire", location="M5V2T6", date="1/10/2026", time="14:30",
+        duration="00:07", message=TRANSCRIPT, desc="Fire on King Street",
+        suggested_actions="dispatch firefighters", severity_level="3",
+    )
+    run(main.enqueue_node(
+        {"triage_incident": final, "similar_incidents": [], "incident_id": call["incident_id"],
+         "enqueued_at": float(call["enqueued_at"])},
+        None,
+    ))
+
+    queue = loads(streamed.get("/queue?raw=false").content)
+    assert [(e["id"], e["provisional"]) for e in queue] == [(entry["id"], False)]
+    assert "provisional" not in streamed.get(f"/agent/{entry['id']}").json()["result"]
+
+    # A provisional update still in flight when the final triage ran is dropped
+    outcome = run(triage_queue.upsert_provisional(
+        entry["id"], b'{"id":"x","provisional":true}', 0.0, 0.0, triage_queue.TRIAGE_QUEUE_KEY,
+        b'{"provisional":true}', None, 0.0,
+    ))
+    assert outcome == triage_queue.PROVISIONAL_SKIPPED
+    assert len(loads(streamed.get("/queue?raw=false").content)) == 1
+
+
+def test_provisional_update_never_replaces_a_final_entry(run):
+    async def final_then_provisional():
+        async with main.redis_bytes_client.pipeline(transaction=True) as pipe:
+            triage_queue.stage_add(pipe, "a", b'{"id":"a","provisional":false}', 1.0, 1000.0)
+            await pipe.execute()
+        return await triage_queue.upsert_provisional(
+            "a", b'{"id":"a","provisional":true}', 0.0, 1000.0, triage_queue.TRIAGE_QUEUE_KEY,
+            b'{"provisional":true}', None, 1000.0,
+        )
+
+    assert run(final_then_provisional()) == triage_queue.PROVISIONAL_SKIPPED
+    assert run(triage_queue.find_entry("a", scan_fallback=False))[0] == b'{"id":"a","provisional":false}'
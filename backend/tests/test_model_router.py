@@ -0,0 +1,57 @@
+import pytest
+
+from backend import model_router
+from backend.model_router import LIGHT, STRONG, LLMUnavailable, run_agent
+
+
+class _Response:
+    def __init__(self, content: str):
+        self.content = content
+        self.usage_metadata = {"input_tokens": 10, "output_tokens": 5}
+
+
+def _invoker(answers: dict):
+    """An invoke stand-in: answers[tier] is the content, or an exception to raise."""
+    calls = []
+
+    async def invoke(agent: str, prompt: str, tier: str):
+        calls.append(tier)
+        answer = answers[tier]
+        if isinstance(answer, Exception):
+            raise answer
+        return _Response(answer)
+
+    return invoke, calls
+
+
+def _parse(content: str) -> int:
+    return int(content)
+
+
+def test_light_answer_is_kept(run):
+    invoke, calls = _invoker({LIGHT: "1", STRONG: "2"})
+    assert run(run_agent("triage_agent", "p", LIGHT, invoke, _parse)) == (1, LIGHT)
+    assert calls == [LIGHT]
+
+
+def test_invalid_or_disagreeing_light_answer_escalates(run):
+    invoke, calls = _invoker({LIGHT: "not a number", STRONG: "2"})
+    assert run(run_agent("triage_agent", "p", LIGHT, invoke, _parse)) == (2, STRONG)
+    invoke, calls = _invoker({LIGHT: "1", STRONG: "2"})
+    assert run(run_agent("triage_agent", "p", LIGHT, invoke, _parse, agrees=lambda value: value == 2)) == (2, STRONG)
+    assert calls == [LIGHT, STRONG]
+
+
+def test_unavailable_light_tier_escalates(run):
+    before = model_router.tier_stats[LIGHT].escalations[("call_agent", "unavailable")]
+    invoke, calls = _invoker({LIGHT: LLMUnavailable("light breaker open"), STRONG: "2"})
+    assert run(run_agent("call_agent", "p", LIGHT, invoke, _parse)) == (2, STRONG)
+    assert calls == [LIGHT, STRONG]
+    assert model_router.tier_stats[LIGHT].escalations[("call_agent", "unavailable")] == before + 1
+
+
+def test_unavailable_strong_tier_propagates(run):
+    invoke, calls = _invoker({LIGHT: LLMUnavailable("down"), STRONG: LLMUnavailable("down too")})
+    with pytest.raises(LLMUnavailable):
+        run(run_agent("call_agent", "p", LIGHT, invoke, _parse))
+    assert calls == [LIGHT, STRONG]
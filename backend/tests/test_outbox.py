@@ -0,0 +1,57 @@
+from backend import outbox
+
+
+def _record(incident_id: str, **fields) -> dict:
+    return {"id": incident_id, "desc": "House fire", "callers": 1, **fields}
+
+
+def test_push_and_peek_in_queue_order():
+    outbox.push(_record("a"))
+    outbox.push(_record("b"), ["callers"])
+
+    entries = outbox.peek(10)
+    assert [incident_id for incident_id, _, _ in entries] == ["a", "b"]
+    assert entries[0][2]["op"] == outbox.UPSERT
+    assert entries[1][2]["op"] == outbox.UPDATE
+    assert entries[1][2]["fields"] == ["callers"]
+    assert outbox.has("a") and not outbox.has("c")
+    assert outbox.stats()["pending"] == 2
+
+
+def test_updates_union_their_fields_and_keep_the_latest_record():
+    outbox.push(_record("a"), ["callers"])
+    queued_at = outbox.peek(1)[0][2]["queued_at"]
+    outbox.push(_record("a", callers=2, status="completed"), ["status", "callers"])
+
+    (_, _, entry), = outbox.peek(10)
+    assert entry["op"] == outbox.UPDATE
+    assert entry["fields"] == ["callers", "status"]
+    assert entry["record"]["callers"] == 2
+    assert entry["queued_at"] == queued_at
+
+
+def test_upsert_absorbs_updates():
+    outbox.push(_record("a"), ["callers"])
+    outbox.push(_record("a", callers=3))
+    (_, _, entry), = outbox.peek(10)
+    assert (entry["op"], entry["fields"], entry["record"]["callers"]) == (outbox.UPSERT, [], 3)
+
+    outbox.push(_record("a", callers=4), ["callers"])
+    (_, _, entry), = outbox.peek(10)
+    assert (entry["op"], entry["record"]["callers"]) == (outbox.UPSERT, 4)
+
+
+def test_ack_removes_only_an_unchanged_entry():
+    outbox.push(_record("a"))
+    (incident_id, raw, _), = outbox.peek(10)
+
+    # Replaced while being replayed: the ack must keep the newer write
+    outbox.push(_record("a", callers=2), ["callers"])
+    assert not outbox.ack(incident_id, raw)
+    assert outbox.pending() == 1
+
+    (incident_id, raw, _), = outbox.peek(10)
+    assert outbox.ack(incident_id, raw)
+    assert outbox.pending() == 0
+    assert outbox.peek(10) == []
+    assert outbox.oldest_age_seconds() is None
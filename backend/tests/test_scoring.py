@@ -0,0 +1,98 @@
+import math
+
+import pytest
+
+from backend import scoring, triage_queue
+from backend.redis_client import redis_bytes_client
+from backend.scoring import DefaultScorer
+from backend.serialization import dumps
+
+NOW = 1_700_000_000.0
+BASE = {"severity_level": "2", "callers": 1, "incidentType": "Theft"}
+
+
+@pytest.fixture
+def scorer():
+    return DefaultScorer(
+        severity_seconds=1800, caller_seconds=300, type_seconds={"Mass Fire": 900},
+        sla_seconds={"3": 120, "2": 600, "1": 1800}, aging_rate=1.0, max_aging_seconds=3600,
+    )
+
+
+def test_fresh_single_caller_entry_matches_the_old_static_score(scorer):
+    assert scorer.score(BASE, NOW, NOW) == NOW - 2 * 1800
+
+
+def test_severity_moves_an_entry_forward(scorer):
+    for severity in ("1", "2", "3"):
+        assert scorer.score({**BASE, "severity_level": severity}, NOW, NOW) == NOW - int(severity) * 1800
+
+
+def test_callers_add_log2_boost(scorer):
+    for callers in (2, 3, 8):
+        expected = NOW - 2 * 1800 - math.log2(callers) * 300
+        assert scorer.score({**BASE, "callers": callers}, NOW, NOW) == pytest.approx(expected)
+    # Missing or zero callers count as one
+    assert scorer.score({**BASE, "callers": 0}, NOW, NOW) == scorer.score(BASE, NOW, NOW)
+    assert scorer.score({"severity_level": "2"}, NOW, NOW) == scorer.score(BASE, NOW, NOW)
+
+
+def test_type_weight(scorer):
+    assert scorer.score({**BASE, "incidentType": "Mass Fire"}, NOW, NOW) == NOW - 2 * 1800 - 900
+
+
+def test_aging_starts_after_the_sla(scorer):
+    within_sla = NOW - 600
+    assert scorer.score(BASE, within_sla, NOW) == within_sla - 2 * 1800
+    overdue = NOW - 900
+    assert scorer.score(BASE, overdue, NOW) == overdue - 2 * 1800 - 300
+    # The same entry escalates as time passes
+    assert scorer.score(BASE, overdue, NOW) < scorer.score(BASE, overdue, NOW - 300)
+
+
+def test_aging_is_capped():
+    capped = DefaultScorer(type_seconds={}, sla_seconds={"2": 600}, max_aging_seconds=60)
+    assert capped.score(BASE, NOW - 10_000, NOW) == NOW - 10_000 - 2 * 1800 - 60
+
+
+def test_scores_are_deterministic(scorer):
+    entry = {**BASE, "callers": 3, "incidentType": "Mass Fire"}
+    first = scorer.score(entry, NOW - 1234, NOW)
+    assert all(scorer.score(dict(entry), NOW - 1234, NOW) == first for _ in range(100))
+
+
+async def _enqueue(incident_id: str, entry: dict, score: float, enqueued_at: float) -> bytes:
+    member = dumps({"id": incident_id, **entry})
+    async with redis_bytes_client.pipeline(transaction=True) as pipe:
+        triage_queue.stage_add(pipe, incident_id, member, score, enqueued_at)
+        await pipe.execute()
+    return member
+
+
+def test_rescore_all_escalates_overdue_entries(run):
+    fresh = run(_enqueue("fresh", BASE, scoring.compute_score(BASE, NOW, NOW), NOW))
+    waiting = run(_enqueue("waiting", BASE, scoring.compute_score(BASE, NOW - 3000, NOW - 3000), NOW - 3000))
+
+    assert run(scoring.rescore_all(now=NOW)) == 1
+    assert run(redis_bytes_client.zscore(triage_queue.TRIAGE_QUEUE_KEY, fresh)) == NOW - 2 * 1800
+    assert run(redis_bytes_client.zscore(triage_queue.TRIAGE_QUEUE_KEY, waiting)) == pytest.approx(
+        scoring.compute_score(BASE, NOW - 3000, NOW)
+    )
+    # Nothing moves again at the same instant
+    assert run(scoring.rescore_all(now=NOW)) == 0
+
+
+def test_enqueue_times_are_dropped_after_two_sweeps_on_any_worker(run):
+    run(_enqueue("queued", BASE, NOW, NOW))
+    enqueued_at = triage_queue.enqueued_at_key(triage_queue.TRIAGE_QUEUE_KEY)
+    run(redis_bytes_client.hset(enqueued_at, "gone", NOW))
+
+    run(scoring.rescore_all(now=NOW))
+    assert run(redis_bytes_client.hexists(enqueued_at, "gone"))
+    # The candidates are in Redis, so the next sweep (on any worker) finishes the job
+    assert run(redis_bytes_client.smembers(scoring.RESCORE_STALE_KEY)) == {b"triage_queue gone"}
+    assert 0 < run(redis_bytes_client.ttl(scoring.RESCORE_STALE_KEY)) <= scoring.RESCORE_STALE_TTL_SECONDS
+
+    run(scoring.rescore_all(now=NOW))
+    assert run(redis_bytes_client.hkeys(enqueued_at)) == [b"queued"]
+    assert run(redis_bytes_client.exists(scoring.RESCORE_STALE_KEY)) == 0
@@ -0,0 +1,59 @@
+from backend.serialization import dumps
+from backend.transcript_codec import (
+    TRANSCRIPT_CODEC_PREFIX,
+    decode_record_transcript,
+    decode_transcript,
+    encode_transcript,
+    normalize_segments,
+)
+
+SEGMENTS = [
+    {"text": "911, what is your emergency?", "time": "0:00"},
+    {"text": "There is smoke coming out of the house next door.", "time": "0:04"},
+    {"text": "Is anyone still inside?", "time": "1:12"},
+    {"text": "I think so, the car is in the driveway.", "time": "1:02:09"},
+]
+
+
+def test_round_trip_compressed_and_plain():
+    for compress in (True, False):
+        encoded = encode_transcript(SEGMENTS, compress=compress)
+        assert encoded.startswith(TRANSCRIPT_CODEC_PREFIX)
+        assert decode_transcript(encoded) == SEGMENTS
+
+
+def test_times_are_normalised():
+    encoded = encode_transcript([{"text": "hello", "time": "[00:07]"}, {"text": "bye", "time": "75"}])
+    assert decode_transcript(encoded) == [{"text": "hello", "time": "0:07"}, {"text": "bye", "time": "1:15"}]
+
+
+def test_encoding_is_idempotent():
+    encoded = encode_transcript(SEGMENTS)
+    assert encode_transcript(encoded) == encoded
+
+
+def test_empty_transcript():
+    assert decode_transcript(encode_transcript([])) == []
+    assert decode_transcript("") == []
+    assert decode_transcript(None) == []
+
+
+def test_unparseable_times_fall_back_to_json():
+    segments = [{"text": "hello", "time": "soon"}]
+    encoded = encode_transcript(segments)
+    assert not encoded.startswith(TRANSCRIPT_CODEC_PREFIX)
+    assert decode_transcript(encoded) == segments
+
+
+def test_legacy_json_and_wrappers_decode():
+    legacy = dumps(SEGMENTS).decode("utf-8")
+    assert decode_transcript(legacy) == SEGMENTS
+    assert decode_transcript(legacy.encode("utf-8")) == SEGMENTS
+    assert normalize_segments({"transcript": SEGMENTS}) == SEGMENTS
+
+
+def test_decode_record_transcript_in_place():
+    record = {"id": "abc", "transcript": encode_transcript(SEGMENTS)}
+    assert decode_record_transcript(record)["transcript"] == SEGMENTS
+    untouched = {"id": "abc", "transcript": SEGMENTS}
+    assert decode_record_transcript(untouched)["transcript"] is SEGMENTS
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from backend import incident_events, leases, triage_queue
+from backend.incident_events import INCIDENT_EVENTS_KEY
+from backend.incident_store import TRIAGE_FULL_PAYLOADS_KEY
+from backend.redis_client import redis_bytes_client
+from backend.serialization import dumps, loads
+
+
+@pytest.fixture
+def sharded(monkeypatch):
+    monkeypatch.setattr(triage_queue, "QUEUE_SHARD_PREFIX_LEN", 1)
+
+
+async def _add(incident_id: str, location: str, score: float) -> bytes:
+    member = dumps({"id": incident_id, "location": location, "callers": 1})
+    async with redis_bytes_client.pipeline(transaction=True) as pipe:
+        triage_queue.stage_add(pipe, incident_id, member, score, 1000.0, triage_queue.shard_key(location))
+        await pipe.execute()
+    return member
+
+
+def test_index_lives_in_each_shard(run, sharded):
+    toronto = run(_add("t", "M5V 2T6", 1.0))
+    run(_add("v", "V6B 4Y8", 2.0))
+
+    keys = sorted(key.decode() for key in run(redis_bytes_client.keys("*")))
+    assert keys == [
+        "triage_queue:{M}", "triage_queue:{M}:enqueued_at", "triage_queue:{M}:members",
+        "triage_queue:{V}", "triage_queue:{V}:enqueued_at", "triage_queue:{V}:members",
+        "triage_queue_shards",
+    ]
+    assert run(triage_queue.find_entry("t", scan_fallback=False)) == (toronto, 1.0, 1000.0, "triage_queue:{M}")
+    assert run(triage_queue.find_entry("v", scan_fallback=False))[3] == "triage_queue:{V}"
+    assert run(triage_queue.find_entry("x", scan_fallback=False)) is None
+
+
+def test_replace_moves_an_entry_between_shards(run, sharded):
+    run(_add("a", "M5V 2T6", 1.0))
+    found = run(triage_queue.find_entry("a", scan_fallback=False))
+    member = dumps({"id": "a", "location": "V6B 4Y8", "callers": 2})
+
+    async def replace():
+        async with redis_bytes_client.pipeline(transaction=True) as pipe:
+            triage_queue.stage_replace(pipe, "a", found, member, 0.5, 1000.0, "triage_queue:{V}")
+            await pipe.execute()
+    run(replace())
+
+    assert run(triage_queue.find_entry("a", scan_fallback=False)) == (member, 0.5, 1000.0, "triage_queue:{V}")
+    assert run(redis_bytes_client.zcard("triage_queue:{M}")) == 0
+    assert run(redis_bytes_client.hlen(triage_queue.members_key("triage_queue:{M}"))) == 0
+
+
+def test_lease_goes_back_to_its_shard(run, sharded):
+    member = run(_add("a", "M5V 2T6", 1.0))
+    lease = run(leases.claim("d1", sector="M5V"))
+    assert run(redis_bytes_client.hlen(triage_queue.enqueued_at_key("triage_queue:{M}"))) == 0
+
+    run(leases.release("a", lease["token"]))
+    found = run(triage_queue.find_entry("a", scan_fallback=False))
+    assert (found[0], found[2], found[3]) == (member, 1000.0, "triage_queue:{M}")
+
+
+async def _add_caller(incident_id: str, shards: list, callers: int = 1):
+    async with redis_bytes_client.pipeline(transaction=True) as pipe:
+        triage_queue.stage_add_caller(
+            pipe, incident_id, TRIAGE_FULL_PAYLOADS_KEY, INCIDENT_EVENTS_KEY, leases.TRIAGE_LEASES_KEY,
+            shards, callers, 1000.0,
+        )
+        return triage_queue.parse_added_caller((await pipe.execute())[0])
+
+
+def test_concurrent_merges_each_add_a_caller(run):
+    run(_add("a", "M5V 2T6", 5.0))
+    payload = dumps({"id": "a", "desc": "Fire", "callers": 1, "transcript": '[{"callers":9}]'})
+    run(redis_bytes_client.hset(TRIAGE_FULL_PAYLOADS_KEY, "a", payload))
+    shards = run(triage_queue.shard_keys())
+
+    async def merge_many():
+        return await asyncio.gather(*[_add_caller("a", shards) for _ in range(20)])
+
+    results = run(merge_many())
+
+    assert sorted(callers for callers, _ in results) == list(range(2, 22))
+    member, score, enqueued_at, shard = run(triage_queue.find_entry("a", scan_fallback=False))
+    assert loads(member)["callers"] == 21
+    assert (score, enqueued_at, shard) == (5.0, 1000.0, "triage_queue")
+    assert run(redis_bytes_client.zcard("triage_queue")) == 1
+    stored = run(redis_bytes_client.hget(TRIAGE_FULL_PAYLOADS_KEY, "a"))
+    assert stored == payload.replace(b'"callers":1', b'"callers":21')
+    events = run(incident_events.read_range("0-0", 100))
+    assert [event["callers"] for event in events] == list(range(2, 22))
+
+
+def test_add_caller_without_a_redis_copy_starts_from_the_given_count(run):
+    assert run(_add_caller("gone", ["triage_queue"], callers=4)) == (5, None)
+    assert run(incident_events.read_range("0-0", 100)) == []
@@ -0,0 +1,22 @@
+import gzip
+from datetime import datetime, timezone
+
+import ulid
+
+from backend import vector_maintenance
+from backend.serialization import dumps
+from backend.vector_store import namespace_for
+
+
+def test_find_archived_reads_the_bucket_around_the_ulid(monkeypatch, tmp_path):
+    monkeypatch.setattr(vector_maintenance, "VECTOR_ARCHIVE_DIR", str(tmp_path))
+    minted = datetime(2025, 1, 2, 12, 0, tzinfo=timezone.utc)
+    incident_id = str(ulid.from_timestamp(minted))
+    other_id = str(ulid.from_timestamp(minted))
+    namespace = namespace_for("2025-01-02", "12:00")
+    with gzip.open(tmp_path / f"{namespace}.ndjson.gz", "wb") as archive:
+        archive.write(dumps({"id": other_id, "summary": f"mentions {incident_id}"}) + b"\n")
+        archive.write(dumps({"id": incident_id, "summary": "archived"}) + b"\n")
+
+    assert vector_maintenance.find_archived(incident_id) == {"id": incident_id, "summary": "archived"}
+    assert vector_maintenance.find_archived(str(ulid.from_timestamp(datetime(2025, 3, 1, tzinfo=timezone.utc)))) is None
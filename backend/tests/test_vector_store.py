@@ -0,0 +1,123 @@
+import pytest
+import requests
+import ulid
+
+from backend import vector_store
+from backend.serialization import dumps, loads
+
+LEGACY = vector_store.LEGACY_NAMESPACE
+
+
+class _Response:
+    def __init__(self, status_code: int, body: dict):
+        self.status_code = status_code
+        self.content = dumps(body)
+        self.text = self.content.decode("utf-8")
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code}", response=self)
+
+
+class _FakeIndex:
+    """/vectors/fetch and /vectors/update over {namespace: {id: metadata}}."""
+
+    def __init__(self):
+        self.namespaces = {}
+        self.fetched = []
+        self.updated = []
+
+    def get(self, url, headers=None, params=None, timeout=None):
+        namespace, (incident_id,) = params["namespace"], params["ids"]
+        self.fetched.append(namespace)
+        if namespace not in self.namespaces:
+            return _Response(404, {})
+        metadata = self.namespaces[namespace].get(incident_id)
+        vectors = {incident_id: {"id": incident_id, "metadata": dict(metadata)}} if metadata else {}
+        return _Response(200, {"vectors": vectors})
+
+    def post(self, url, data=None, headers=None, timeout=None):
+        assert url.endswith("/vectors/update"), url
+        body = loads(data)
+        stored = self.namespaces.get(body["namespace"], {}).get(body["id"])
+        self.updated.append(body["namespace"])
+        if stored is None:
+            return _Response(404, {})
+        stored.update(body["setMetadata"])
+        return _Response(200, {})
+
+
+@pytest.fixture
+def index(monkeypatch):
+    fake = _FakeIndex()
+    monkeypatch.setattr(vector_store.requests, "get", fake.get)
+    monkeypatch.setattr(vector_store.requests, "post", fake.post)
+    monkeypatch.setattr(vector_store, "get_index_host", lambda: "index.test")
+    monkeypatch.setattr(vector_store, "VECTOR_PARTITION_HOURS", 24)
+    vector_store.incident_cache._entries.clear()
+    vector_store._record_namespaces.clear()
+    return fake
+
+
+def _legacy_record(fake: _FakeIndex) -> dict:
+    incident_id = str(ulid.new())
+    record = {"id": incident_id, "date": "1/10/2026", "time": "14:30", "callers": 1, "status": "in progress"}
+    fake.namespaces[LEGACY] = {incident_id: dict(record)}
+    fake.namespaces["incidents-20260110"] = {}
+    return record
+
+
+def test_fetch_without_a_date_finds_a_legacy_record(index):
+    record = _legacy_record(index)
+    fetched = vector_store.get_incident_by_id(record["id"], decode_transcript=False)
+    assert fetched["callers"] == 1
+    # Every candidate namespace was looked up, the legacy one among them
+    assert LEGACY in index.fetched and len(index.fetched) > 1
+
+
+def test_update_goes_to_the_namespace_the_record_was_fetched_from(index):
+    record = _legacy_record(index)
+    fetched = vector_store.get_incident_by_id(record["id"], decode_transcript=False,
+                                              date=record["date"], time_=record["time"])
+    fetched["callers"] = 2
+    assert vector_store.update_incident(fetched, ["callers"])
+    assert index.updated == [LEGACY]
+    assert index.namespaces[LEGACY][record["id"]]["callers"] == 2
+    assert index.namespaces["incidents-20260110"] == {}
+
+
+def test_update_without_a_fetch_finds_the_legacy_record(index):
+    record = _legacy_record(index)
+    assert vector_store.update_incident({**record, "status": "completed"}, ["status"])
+    # The bucket for its date misses, then the record is located and updated in place
+    assert index.updated == ["incidents-20260110", LEGACY]
+    assert index.namespaces[LEGACY][record["id"]]["status"] == "completed"
+    assert index.namespaces["incidents-20260110"] == {}
+
+
+def test_fetch_during_an_outage_raises_instead_of_missing(index, monkeypatch):
+    record = _legacy_record(index)
+    monkeypatch.setattr(vector_store.requests, "get", lambda *args, **kwargs: _Response(503, {}))
+    try:
+        with pytest.raises(vector_store.VectorStoreUnavailable):
+            vector_store.get_incident_by_id(record["id"], decode_transcript=False)
+    finally:
+        vector_store.pinecone_breaker.record_success()
+
+
+def test_search_requests_time_out_at_the_callers_deadline(index, monkeypatch):
+    timeouts = []
+
+    def search(method, url, headers=None, timeout=None, json=None):
+        timeouts.append(timeout)
+        hits = [{"_id": url, "_score": 0.5 if "20260110" in url else 0.9, "fields": {}}]
+        return _Response(200, {"result": {"hits": hits}})
+
+    monkeypatch.setattr(vector_store.requests, "request", search)
+    hits = vector_store._search_all(["incidents-20260110", LEGACY], "smoke", top_k=1)
+    assert [hit["_id"] for hit in hits] == [f"https://index.test/records/namespaces/{LEGACY}/search"]
+    assert all(0 < timeout <= vector_store.PINECONE_TIMEOUT_SECONDS for timeout in timeouts)
+
+    # Searches the caller no longer waits for are not sent
+    assert vector_store._search_namespace(LEGACY, "smoke", 1, None, deadline=0) == []
+    assert len(timeouts) == 2
@@ -1,11 +1,36 @@
-import requests
+"""
+Transcription of call recordings through OpenRouter.
+
+All Twilio downloads and OpenRouter calls share one pooled async HTTP client
+(keep-alive, and HTTP/2 when the `h2` package is installed), so a recording
+does not pay for new TCP and TLS handshakes. The prompt is built from
+example.json once at import, and each request only fills in the call start time.
+
+Before upload, WAV audio is downmixed to mono, resampled down to
+TRANSCRIBE_SAMPLE_RATE, and stripped of leading and trailing silence (an
+energy-based VAD over 20 ms frames). It can optionally be re-encoded as 8-bit
+mu-law. Timestamps in the model's transcript are shifted back by the trimmed
+lead-in so they still match the original recording.
+"""
+import asyncio
+import importlib.util
+import io
 import os
-from dotenv import load_dotenv
 import json
 import base64
-from urllib.parse import urlparse
+import re
+import time
+import wave
+from typing import Optional, Tuple
+
+import httpx
+import numpy as np
+import requests
+from dotenv import load_dotenv
 from pathlib import Path
-from requests.auth import HTTPBasicAuth
+
+from backend.media_stream import pcm16_to_mulaw_wav, pcm16_to_wav
+from backend.serialization import dumps, loads
 
 load_dotenv()
 
@@ -18,55 +43,268 @@ OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 
+OPENROUTER_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+TRANSCRIBE_MODEL = os.getenv("TRANSCRIBE_MODEL", "google/gemini-3-flash-preview")
+
+# Timeouts (seconds). The read timeout covers the model call, so it is long.
+TRANSCRIBE_CONNECT_TIMEOUT_SECONDS = float(os.getenv("TRANSCRIBE_CONNECT_TIMEOUT_SECONDS", "5"))
+TRANSCRIBE_READ_TIMEOUT_SECONDS = float(os.getenv("TRANSCRIBE_READ_TIMEOUT_SECONDS", "120"))
+RECORDING_DOWNLOAD_TIMEOUT_SECONDS = float(os.getenv("RECORDING_DOWNLOAD_TIMEOUT_SECONDS", "30"))
+# Retries for connection failures and 429/5xx responses, with exponential backoff
+TRANSCRIBE_MAX_RETRIES = int(os.getenv("TRANSCRIBE_MAX_RETRIES", "2"))
+TRANSCRIBE_RETRY_BACKOFF_SECONDS = float(os.getenv("TRANSCRIBE_RETRY_BACKOFF_SECONDS", "0.5"))
+TRANSCRIBE_MAX_CONNECTIONS = int(os.getenv("TRANSCRIBE_MAX_CONNECTIONS", "20"))
+# HTTP/2 needs the optional h2 package (pip install "httpx[http2]"); set 0 to force HTTP/1.1
+TRANSCRIBE_HTTP2 = os.getenv("TRANSCRIBE_HTTP2", "1") != "0" and importlib.util.find_spec("h2") is not None
+
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Failures where the request never reached the server (or a pooled connection
+# had gone stale), so sending it again cannot duplicate a model call
+_RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout, httpx.RemoteProtocolError)
+
 example_json = (Path(__file__).resolve().parent / "example.json").read_text(encoding="utf-8").strip()
 
-def transcribe_url(src: str, call_start_time: str):
-    OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-    TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
-    TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
-    resp = requests.get(src, timeout=30, auth=HTTPBasicAuth(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN))
-    resp.raise_for_status()
-    url = "https://openrouter.ai/api/v1/chat/completions"
+# The transcription prompt is split around the call start time, its only per-call value
+_PROMPT_HEAD = f"""Respond in a JSON format. Please transcribe this audio file. Every sentence, attach a timestamp in the format [mm:ss] before the corresponding text. 
+                    Next, if you can determine the location from the caller's speech, create another object with key location and text that is the location or address, 
+                    otherwise create that object but leave the value as empty. Here is a complete example: {example_json}. Also, add in the """
+_PROMPT_TAIL = """ as shown in the example, the format is mm:ss. 
+                    Do not say anything other than what is asked. Also, return the process_transcript as shown. Store the call duration in seconds as shown. Do not include ```json in the output."""
+
+# Audio preprocessing. Phone audio carries nothing above 4 kHz, so 8 kHz loses nothing.
+TRANSCRIBE_PREPROCESS = os.getenv("TRANSCRIBE_PREPROCESS", "1") != "0"
+TRANSCRIBE_SAMPLE_RATE = int(os.getenv("TRANSCRIBE_SAMPLE_RATE", "8000"))
+# "wav" (16-bit PCM) or "mulaw" (8-bit G.711 in a WAV container, half the size)
+TRANSCRIBE_AUDIO_CODEC = os.getenv("TRANSCRIBE_AUDIO_CODEC", "wav")
+# Frames quieter than this are silence; VAD_PADDING_MS of audio is kept around speech
+VAD_THRESHOLD_DBFS = float(os.getenv("VAD_THRESHOLD_DBFS", "-45"))
+VAD_PADDING_MS = int(os.getenv("VAD_PADDING_MS", "300"))
+VAD_FRAME_MS = 20
+
+# data, format, seconds trimmed from the start, original duration in seconds (None if unknown), has speech
+PreparedAudio = Tuple[bytes, str, float, Optional[float], bool]
+
+_TIMESTAMP_RE = re.compile(r"^(\[?)(\d+):(\d{2})(\]?)$")
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def create_http_client(**overrides) -> httpx.AsyncClient:
+    """A pooled client with the configured timeouts and limits."""
+    options = dict(
+        http2=TRANSCRIBE_HTTP2,
+        timeout=httpx.Timeout(TRANSCRIBE_READ_TIMEOUT_SECONDS, connect=TRANSCRIBE_CONNECT_TIMEOUT_SECONDS),
+        limits=httpx.Limits(
+            max_connections=TRANSCRIBE_MAX_CONNECTIONS,
+            max_keepalive_connections=TRANSCRIBE_MAX_CONNECTIONS,
+            keepalive_expiry=60,
+        ),
+    )
+    options.update(overrides)
+    return httpx.AsyncClient(**options)
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """The shared client, created on first use."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = create_http_client()
+    return _http_client
+
+
+async def aclose_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+async def _request(method: str, url: str, **kwargs) -> httpx.Response:
+    """Send a request on the shared client, retrying transient failures."""
+    client = get_http_client()
+    for attempt in range(TRANSCRIBE_MAX_RETRIES + 1):
+        last_attempt = attempt == TRANSCRIBE_MAX_RETRIES
+        try:
+            response = await client.request(method, url, **kwargs)
+        except _RETRY_ERRORS as e:
+            if last_attempt:
+                raise
+            print(f"[transcribe] {method} {url} failed ({e!r}); retrying")
+        else:
+            if response.status_code not in _RETRY_STATUSES or last_attempt:
+                response.raise_for_status()
+                return response
+            print(f"[transcribe] {method} {url} returned {response.status_code}; retrying")
+        await asyncio.sleep(TRANSCRIBE_RETRY_BACKOFF_SECONDS * 2 ** attempt)
+
+
+def _decode_wav(audio: bytes) -> Optional[Tuple[np.ndarray, int]]:
+    """Mono float samples in [-1, 1] and the sample rate, or None for non-PCM/unreadable WAVs."""
+    try:
+        with wave.open(io.BytesIO(audio), "rb") as wav:
+            width, channels, rate = wav.getsampwidth(), wav.getnchannels(), wav.getframerate()
+            frames = wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError):
+        return None
+    if width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768
+    elif width == 4:
+        samples = np.frombuffer(frames, dtype="<i4").astype(np.float32) / 2 ** 31
+    else:
+        return None
+    samples = samples[: len(samples) - len(samples) % channels]
+    return samples.reshape(-1, channels).mean(axis=1), rate
+
+
+def _resample(samples: np.ndarray, rate: int, target_rate: int) -> Tuple[np.ndarray, int]:
+    """Downsample (box low-pass, then linear interpolation); lower rates are left alone."""
+    if rate <= target_rate or len(samples) < 2:
+        return samples, rate
+    ratio = rate / target_rate
+    width = int(round(ratio))
+    if width > 1:
+        samples = np.convolve(samples, np.full(width, 1 / width, dtype=np.float32), mode="same")
+    positions = np.arange(0, len(samples) - 1, ratio)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32), target_rate
+
+
+def _speech_bounds(samples: np.ndarray, rate: int) -> Optional[Tuple[int, int]]:
+    """Sample range from the first to the last voiced frame (plus padding), or None if all silent."""
+    frame = max(1, rate * VAD_FRAME_MS // 1000)
+    count = len(samples) // frame
+    if count == 0:
+        return None
+    frames = samples[: count * frame].reshape(count, frame)
+    level_dbfs = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-12)
+    voiced = np.flatnonzero(level_dbfs > VAD_THRESHOLD_DBFS)
+    if len(voiced) == 0:
+        return None
+    padding = rate * VAD_PADDING_MS // 1000
+    return max(int(voiced[0]) * frame - padding, 0), min((int(voiced[-1]) + 1) * frame + padding, len(samples))
+
+
+def preprocess_audio(audio: bytes, audio_format: str = "wav") -> PreparedAudio:
+    """
+    Shrink a recording before upload: downmix, resample to
+    TRANSCRIBE_SAMPLE_RATE, trim leading/trailing silence and re-encode with
+    TRANSCRIBE_AUDIO_CODEC. Audio that can't be decoded, or that would not
+    get smaller, is returned unchanged. All-silent audio is also returned
+    unchanged, flagged as having no speech.
+    """
+    decoded = _decode_wav(audio) if audio_format == "wav" else None
+    if decoded is None:
+        return audio, audio_format, 0.0, None, True
+    duration = len(decoded[0]) / decoded[1] if decoded[1] else None
+    samples, rate = _resample(*decoded, TRANSCRIBE_SAMPLE_RATE)
+    bounds = _speech_bounds(samples, rate)
+    if bounds is None:
+        return audio, audio_format, 0.0, duration, False
+    start, end = bounds
+    pcm = np.clip(np.round(samples[start:end] * 32767), -32768, 32767).astype(np.int16)
+    data = pcm16_to_mulaw_wav(pcm, rate) if TRANSCRIBE_AUDIO_CODEC == "mulaw" else pcm16_to_wav(pcm, rate)
+    if len(data) >= len(audio):
+        return audio, audio_format, 0.0, duration, True
+    return data, "wav", start / rate, duration, True
+
+
+def _shift_timestamp(value, seconds: int):
+    match = _TIMESTAMP_RE.match(value) if isinstance(value, str) else None
+    if not match:
+        return value
+    open_bracket, minutes, secs, close_bracket = match.groups()
+    minutes, secs = divmod(int(minutes) * 60 + int(secs) + seconds, 60)
+    minutes_text = f"{minutes:02d}" if len(match.group(2)) == 2 else str(minutes)
+    return f"{open_bracket}{minutes_text}:{secs:02d}{close_bracket}"
+
+
+def _restore_recording_times(parsed: dict, trimmed_seconds: float, duration: Optional[float]) -> None:
+    """Report timestamps and duration for the original recording rather than the trimmed upload."""
+    if not isinstance(parsed, dict):
+        return
+    if duration is not None and "duration" in parsed:
+        minutes, seconds = divmod(int(round(duration)), 60)
+        parsed["duration"] = f"{minutes:02d}:{seconds:02d}"
+    offset = int(round(trimmed_seconds))
+    if not offset or not isinstance(parsed.get("transcript"), list):
+        return
+    for segment in parsed["transcript"]:
+        if isinstance(segment, dict) and "time" in segment:
+            segment["time"] = _shift_timestamp(segment["time"], offset)
+
+
+async def transcribe_url(src: str, call_start_time: str):
+    """Download a Twilio recording and transcribe it."""
+    resp = await _request(
+        "GET", src,
+        auth=(os.getenv("TWILIO_ACCOUNT_SID") or "", os.getenv("TWILIO_AUTH_TOKEN") or ""),
+        timeout=httpx.Timeout(RECORDING_DOWNLOAD_TIMEOUT_SECONDS, connect=TRANSCRIBE_CONNECT_TIMEOUT_SECONDS),
+    )
+    return await transcribe_audio_bytes(resp.content, call_start_time)
+
+
+async def transcribe_audio_bytes(audio: bytes, call_start_time: str, audio_format: str = "wav",
+                                 skip_silent: bool = False):
+    """
+    Transcribe an in-memory recording (also used for media stream windows).
+
+    With `skip_silent`, audio in which the VAD finds no speech is not sent to
+    the model and an empty transcript is returned.
+    """
+    original_size = len(audio)
+    trimmed_seconds, duration = 0.0, None
+    if TRANSCRIBE_PREPROCESS:
+        started = time.perf_counter()
+        audio, audio_format, trimmed_seconds, duration, has_speech = await asyncio.to_thread(
+            preprocess_audio, audio, audio_format
+        )
+        print(
+            f"[transcribe] Preprocessed audio {original_size} -> {len(audio)} bytes "
+            f"(trimmed {trimmed_seconds:.1f}s lead-in, speech={has_speech}) "
+            f"in {(time.perf_counter() - started) * 1000:.1f} ms"
+        )
+        if skip_silent and not has_speech:
+            return {"process_transcript": "", "transcript": []}
+
     headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "Authorization": f"Bearer {os.getenv('OPENROUTER_API_KEY')}",
         "Content-Type": "application/json"
     }
 
-    base64_audio = base64.b64encode(resp.content).decode('utf-8')
-    example_json = (Path(__file__).resolve().parent / "example.json").read_text(encoding="utf-8").strip()
+    base64_audio = base64.b64encode(audio).decode('utf-8')
     messages = [{
             "role": "user",
             "content": [
                 {
                     "type": "text",
-                    "text": f"""Respond in a JSON format. Please transcribe this audio file. Every sentence, attach a timestamp in the format [mm:ss] before the corresponding text. 
-                    Next, if you can determine the location from the caller's speech, create another object with key location and text that is the location or address, 
-                    otherwise create that object but leave the value as empty. Here is a complete example: {example_json}. Also, add in the {call_start_time} as shown in the example, the format is mm:ss. 
-                    Do not say anything other than what is asked. Also, return the process_transcript as shown. Store the call duration in seconds as shown. Do not include ```json in the output."""
+                    "text": f"{_PROMPT_HEAD}{call_start_time}{_PROMPT_TAIL}"
                 },
                 {
                     "type": "input_audio",
                     "input_audio": {
                         "data": base64_audio,
-                        "format": "wav"
+                        "format": audio_format
                     }
                 }
             ]
     }]
     payload = {
-        "model": "google/gemini-3-flash-preview",
+        "model": TRANSCRIBE_MODEL,
         "messages": messages,
         "provider": {
             "sort": "throughput"
         }
     }
-    response = requests.post(url, headers=headers, json=payload)
-    data = response.json()
+    response = await _request("POST", OPENROUTER_URL, headers=headers, content=dumps(payload))
+    data = loads(response.content)
     print(data)
     content = data.get("choices", [{}])[0].get("message").get("content")
     
     print(content)
     parsed = json.loads(content)
+    if original_size != len(audio):
+        _restore_recording_times(parsed, trimmed_seconds, duration)
     return(parsed)
     
 
@@ -0,0 +1,208 @@
+"""
+Compact codec for timestamped transcripts.
+
+Transcripts arrive as lists of {"text", "time"} segments and used to be
+stored as a JSON string in both the Redis full payload and Pinecone metadata.
+The codec packs them column-wise instead:
+
+    flags (1 byte) | segment count (varint) | times as varint seconds | texts joined by \\x1f
+
+optionally zlib-compressed, then base85-encoded so the result is still a plain
+string (Pinecone metadata only accepts strings/numbers/bools/string lists).
+Encoded values start with TRANSCRIPT_CODEC_PREFIX; anything else is treated as
+a legacy JSON transcript so old records keep decoding.
+
+    python -m backend.transcript_codec   # size/latency report on sample calls
+"""
+import base64
+import os
+import re
+import zlib
+from typing import Any, List, Optional
+
+from backend.serialization import dumps, loads, to_str
+
+TRANSCRIPT_CODEC_PREFIX = "tc1:"
+TRANSCRIPT_COMPRESSION = os.getenv("TRANSCRIPT_COMPRESSION", "1") != "0"
+TRANSCRIPT_COMPRESSION_LEVEL = int(os.getenv("TRANSCRIPT_COMPRESSION_LEVEL", "6"))
+
+_FLAG_ZLIB = 0x01
+_TEXT_SEPARATOR = "\x1f"
+_TIME_RE = re.compile(r"^\[?\s*(\d+)(?::(\d{1,2}))?(?::(\d{1,2}))?\s*\]?$")
+
+
+def parse_time_seconds(value: str) -> Optional[int]:
+    """Parse "ss", "m:ss", "mm:ss" or "h:mm:ss" (optionally bracketed) into seconds."""
+    match = _TIME_RE.match(value.strip()) if isinstance(value, str) else None
+    if not match:
+        return None
+    parts = [int(p) for p in match.groups() if p is not None]
+    seconds = 0
+    for part in parts:
+        seconds = seconds * 60 + part
+    return seconds
+
+
+def format_time_seconds(seconds: int) -> str:
+    """Format seconds as "m:ss" (or "h:mm:ss" for calls longer than an hour)."""
+    hours, rem = divmod(seconds, 3600)
+    minutes, secs = divmod(rem, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes}:{secs:02d}"
+
+
+def normalize_segments(value: Any) -> List[dict]:
+    """
+    Return the transcript as a list of segments.
+
+    Accepts a segment list, the `{"transcript": [...]}` wrapper from the
+    speech-to-text output, a legacy JSON string or an encoded transcript.
+    """
+    if isinstance(value, dict) and "transcript" in value:
+        value = value["transcript"]
+    if isinstance(value, (str, bytes)):
+        return decode_transcript(value)
+    if value is None:
+        return []
+    return list(value)
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, pos: int):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def is_encoded(value: Any) -> bool:
+    return isinstance(value, str) and value.startswith(TRANSCRIPT_CODEC_PREFIX)
+
+
+def encode_transcript(value: Any, compress: Optional[bool] = None) -> str:
+    """
+    Encode a transcript into the compact string form.
+
+    Already-encoded values are returned unchanged, so a record can be
+    re-upserted without touching its transcript. If a segment time cannot be
+    parsed or a text contains the separator, the transcript is stored as a
+    plain JSON string instead so nothing is lost.
+    """
+    if is_encoded(value):
+        return value
+    segments = normalize_segments(value)
+    if compress is None:
+        compress = TRANSCRIPT_COMPRESSION
+
+    times = []
+    texts = []
+    for segment in segments:
+        seconds = parse_time_seconds(segment.get("time", ""))
+        text = segment.get("text", "")
+        if seconds is None or not isinstance(text, str) or _TEXT_SEPARATOR in text:
+            return to_str(dumps(segments))
+        times.append(seconds)
+        texts.append(text)
+
+    body = bytearray()
+    _write_varint(body, len(segments))
+    for seconds in times:
+        _write_varint(body, seconds)
+    body += _TEXT_SEPARATOR.join(texts).encode("utf-8")
+
+    flags = 0
+    payload = bytes(body)
+    if compress:
+        compressed = zlib.compress(payload, TRANSCRIPT_COMPRESSION_LEVEL)
+        if len(compressed) < len(payload):
+            flags |= _FLAG_ZLIB
+            payload = compressed
+
+    encoded = base64.b85encode(bytes([flags]) + payload).decode("ascii")
+    return TRANSCRIPT_CODEC_PREFIX + encoded
+
+
+def decode_transcript(value: Any) -> List[dict]:
+    """Decode an encoded or legacy transcript back into `{"text", "time"}` segments."""
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+    if isinstance(value, list):
+        return value
+    if not isinstance(value, str) or not value:
+        return []
+    if not is_encoded(value):
+        return normalize_segments(loads(value))
+
+    raw = base64.b85decode(value[len(TRANSCRIPT_CODEC_PREFIX):])
+    flags, payload = raw[0], raw[1:]
+    if flags & _FLAG_ZLIB:
+        payload = zlib.decompress(payload)
+
+    count, pos = _read_varint(payload, 0)
+    times = []
+    for _ in range(count):
+        seconds, pos = _read_varint(payload, pos)
+        times.append(seconds)
+    texts = payload[pos:].decode("utf-8").split(_TEXT_SEPARATOR) if count else []
+    return [
+        {"text": text, "time": format_time_seconds(seconds)}
+        for text, seconds in zip(texts, times)
+    ]
+
+
+def decode_record_transcript(record: dict) -> dict:
+    """Decode `record["transcript"]` in place if it is stored in compact form."""
+    if isinstance(record.get("transcript"), str):
+        try:
+            record["transcript"] = decode_transcript(record["transcript"])
+        except (ValueError, zlib.error) as e:
+            print(f"[transcript_codec] Could not decode transcript for {record.get('id')}: {e}")
+    return record
+
+
+if __name__ == "__main__":
+    import json
+    import random
+    import time
+    from pathlib import Path
+
+    sample_file = Path(__file__).resolve().parent / "sample_incidents.json"
+    words = " ".join(
+        segment["text"]
+        for incident in json.loads(sample_file.read_text())
+        for segment in incident.get("transcript", [])
+    ).split()
+
+    def synthetic_call(minutes: int) -> List[dict]:
+        segments, t = [], 0
+        while t < minutes * 60:
+            segments.append({"text": " ".join(random.choices(words, k=random.randint(4, 14))), "time": format_time_seconds(t)})
+            t += random.randint(2, 6)
+        return segments
+
+    print(f"{'call':>10} | {'segments':>8} | {'json bytes':>10} | {'codec bytes':>11} | {'encode us':>9} | {'decode us':>9}")
+    for minutes in (1, 3, 10, 30):
+        segments = synthetic_call(minutes)
+        legacy = json.dumps(segments)
+        runs = 200
+        start = time.perf_counter()
+        for _ in range(runs):
+            encoded = encode_transcript(segments)
+        encode_us = (time.perf_counter() - start) / runs * 1e6
+        start = time.perf_counter()
+        for _ in range(runs):
+            decode_transcript(encoded)
+        decode_us = (time.perf_counter() - start) / runs * 1e6
+        print(f"{minutes:>7} min | {len(segments):>8} | {len(legacy):>10} | {len(encoded):>11} | {encode_us:>9.1f} | {decode_us:>9.1f}")
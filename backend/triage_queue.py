@@ -0,0 +1,378 @@
+"""
+Batched Redis operations on the triage queue.
+
+Members of the triage queue ZSETs are the JSON queue entries themselves, so
+finding the entry for an incident used to mean reading the whole queue. Each
+queue shard therefore keeps its own id index next to it:
+
+    <shard>                  zset: queue entry -> score
+    <tag>:members            hash: id -> current ZSET member
+    <tag>:enqueued_at        hash: id -> first queued (epoch seconds)
+
+where <tag> is the shard key itself when it has a hash tag
+(triage_queue:{M5V}:members), or the key in braces for the unsharded queue
+({triage_queue}:members). A lookup is a single Lua call over the shards' keys (all passed in KEYS) that
+returns the member, its score, the incident's enqueue time and its shard.
+
+The queue can be sharded by region. With QUEUE_SHARD_PREFIX_LEN=N, entries go
+to triage_queue:{<first N characters of the postal code>}, for example
+triage_queue:{M} for Toronto with N=1. Each region then has its own ZSET,
+so claims and listings in one region do not read the others. The default is 0,
+which keeps the single triage_queue key. merged_entries k-way merges the shard heads
+into one most-urgent-first view. Sharded keys are listed in the
+TRIAGE_QUEUE_SHARDS_KEY set.
+
+Sharding splits the queue, not the keyspace: enqueue and merge also write the
+global hot payload hash, geo index and event stream in the same transaction,
+and the scripts take every shard's keys at once. They need a single Redis node
+(or one primary with replicas), not Redis Cluster.
+
+Writes go through `stage_*` helpers. These queue commands on a caller's
+pipeline, so enqueue and merge each cost one round trip, and the ZSET, the
+id index and the enqueue time never disagree.
+"""
+import heapq
+import json
+import os
+from itertools import islice
+from typing import List, Optional, Sequence, Tuple
+
+from backend.incident_events import INCIDENT_EVENTS_KEY
+from backend.incident_store import TRIAGE_FULL_PAYLOADS_KEY, TRIAGE_HOT_ORDER_KEY
+from backend.postal_geo import TRIAGE_GEO_KEY, normalize_postal_code
+from backend.redis_client import redis_bytes_client
+from backend.serialization import loads
+
+TRIAGE_QUEUE_KEY = "triage_queue"  # unsharded queue, and the fallback for old entries
+TRIAGE_QUEUE_SHARDS_KEY = "triage_queue_shards"  # set of sharded queue keys in use
+
+QUEUE_SHARD_PREFIX_LEN = int(os.getenv("QUEUE_SHARD_PREFIX_LEN", "0"))
+
+# Set once a streamed call's final triage has run; provisional updates stop at it
+FINALIZED_KEY_PREFIX = "triage_finalized:"
+FINALIZED_TTL_SECONDS = int(os.getenv("TRIAGE_FINALIZED_TTL_SECONDS", "86400"))
+
+FoundEntry = Tuple[bytes, float, Optional[float], str]  # member, score, enqueued_at, shard key
+
+# KEYS: (shard, members hash, enqueued_at hash) for each shard to look in; ARGV: incident id
+# Returns {member, score, enqueued_at or false, shard}, or nil if the id is not queued.
+_FIND_ENTRY_LUA = """
+for k = 1, #KEYS, 3 do
+  local member = redis.call('HGET', KEYS[k + 1], ARGV[1])
+  if member then
+    local score = redis.call('ZSCORE', KEYS[k], member)
+    if score then return {member, score, redis.call('HGET', KEYS[k + 2], ARGV[1]), KEYS[k]} end
+  end
+end
+return nil
+"""
+_find_entry_script = redis_bytes_client.register_script(_FIND_ENTRY_LUA)
+
+
+def shard_key(location: Optional[str]) -> str:
+    """Queue key for an incident's location."""
+    if QUEUE_SHARD_PREFIX_LEN <= 0:
+        return TRIAGE_QUEUE_KEY
+    region = normalize_postal_code(location)[:QUEUE_SHARD_PREFIX_LEN] or "_"
+    return f"{TRIAGE_QUEUE_KEY}:{{{region}}}"
+
+
+def _slot_tag(shard: str) -> str:
+    return shard if "{" in shard else f"{{{shard}}}"
+
+
+def members_key(shard: str) -> str:
+    """Hash of id -> current member for the entries in `shard`."""
+    return f"{_slot_tag(shard)}:members"
+
+
+def enqueued_at_key(shard: str) -> str:
+    """Hash of id -> first queue time for the entries in `shard`."""
+    return f"{_slot_tag(shard)}:enqueued_at"
+
+
+def shard_index_keys(shards: Sequence[str]) -> List[str]:
+    """(shard, members hash, enqueued_at hash) for each shard, flattened, as the Lua scripts take them."""
+    keys = []
+    for shard in shards:
+        keys += [shard, members_key(shard), enqueued_at_key(shard)]
+    return keys
+
+
+def stage_find_entry(pipe, incident_id: str, shards: Sequence[str]) -> None:
+    """
+    Queue an indexed lookup in `shards` (see shard_keys) on `pipe`; decode
+    its result with parse_found_entry.
+    """
+    keys = shard_index_keys(shards)
+    pipe.eval(_FIND_ENTRY_LUA, len(keys), *keys, incident_id)
+
+
+# KEYS: 1 hot payload hash, 2 event stream, 3 leases hash,
+#       then (shard, members hash, enqueued_at hash) per shard
+# ARGV: 1 incident id, 2 callers count to start from if Redis holds neither copy, 3 now
+# Adds a caller to the queue entry (keeping its score), or to the member held by its lease
+# while a dispatcher has it, and to the hot payload in one step, and records a merged event.
+# The count is edited in the JSON text, so the rest of it is kept byte for byte.
+# Returns {callers, new member or false, score or false, enqueued_at or false, shard or false};
+# the member is false unless the entry is on the queue.
+_ADD_CALLER_LUA = """
+local id = ARGV[1]
+local function callers_of(json)
+  return json and tonumber(string.match(json, '"callers":%s*(%d+)'))
+end
+local function with_callers(json, callers)
+  local updated, n = string.gsub(json, '"callers":%s*%d+', '"callers":' .. callers, 1)
+  if n == 1 then return updated end
+  local decoded = cjson.decode(json)
+  decoded.callers = callers
+  return cjson.encode(decoded)
+end
+
+local k, member, score
+for i = 4, #KEYS, 3 do
+  member = redis.call('HGET', KEYS[i + 1], id)
+  score = member and redis.call('ZSCORE', KEYS[i], member)
+  if score then k = i break end
+  member = nil
+end
+local lease
+if not member then
+  local lease_json = redis.call('HGET', KEYS[3], id)
+  if lease_json then lease = cjson.decode(lease_json) end
+end
+local payload = redis.call('HGET', KEYS[1], id)
+local callers = (callers_of(member) or callers_of(lease and lease.member) or callers_of(payload)
+  or tonumber(ARGV[2])) + 1
+
+local new_member, enqueued_at = false, false
+if member then
+  new_member = with_callers(member, callers)
+  redis.call('ZREM', KEYS[k], member)
+  redis.call('ZADD', KEYS[k], score, new_member)
+  redis.call('HSET', KEYS[k + 1], id, new_member)
+  enqueued_at = redis.call('HGET', KEYS[k + 2], id)
+end
+if lease then
+  -- Released or expired leases go back on the queue with this member
+  lease.member = with_callers(lease.member, callers)
+  redis.call('HSET', KEYS[3], id, cjson.encode(lease))
+end
+if payload then redis.call('HSET', KEYS[1], id, with_callers(payload, callers)) end
+if member then
+  redis.call('XADD', KEYS[2], '*', 'type', 'merged', 'id', id, 'at', ARGV[3],
+    'entry', new_member, 'score', score, 'callers', callers)
+elseif lease then
+  redis.call('XADD', KEYS[2], '*', 'type', 'merged', 'id', id, 'at', ARGV[3],
+    'entry', lease.member, 'score', lease.score, 'callers', callers)
+elseif payload then
+  redis.call('XADD', KEYS[2], '*', 'type', 'merged', 'id', id, 'at', ARGV[3], 'callers', callers)
+end
+return {callers, new_member, score or false, enqueued_at, member and KEYS[k] or false}
+"""
+
+MergedCaller = Tuple[int, Optional[FoundEntry]]  # new callers count, the updated queue entry if queued
+
+
+def stage_add_caller(pipe, incident_id: str, payloads_key: str, events_key: str, leases_key: str,
+                     shards: Sequence[str], callers: int, now: float) -> None:
+    """
+    Queue an atomic caller increment for a merged duplicate on `pipe`: its
+    queue entry (in `shards`) or, while it is leased, the member in its lease
+    in `leases_key`, and its hot payload in `payloads_key` get the new count,
+    so concurrent merges never lose one. `callers` is only the count to start
+    from when Redis holds none of them. Decode the result with
+    parse_added_caller; the entry keeps its old score until it is re-scored.
+    """
+    keys = [payloads_key, events_key, leases_key, *shard_index_keys(shards)]
+    pipe.eval(_ADD_CALLER_LUA, len(keys), *keys, incident_id, callers, now)
+
+
+def parse_added_caller(result) -> MergedCaller:
+    callers, member, score, enqueued_at, shard = result
+    if not member:
+        return int(callers), None
+    return int(callers), (member, float(score), float(enqueued_at) if enqueued_at else None, _text(shard))
+
+
+# KEYS: 1 finalized marker, 2 hot payload hash, 3 hot order zset, 4 geo index, 5 event stream,
+#       6 shards set, then (shard, members hash, enqueued_at hash) per shard
+# ARGV: 1 incident id, 2 member, 3 score, 4 enqueued_at, 5 target shard (one of KEYS), 6 payload,
+#       7 now, 8 longitude or '', 9 latitude or '', 10 '1' to list the target in the shards set
+# Returns 0 if the final triage got there first, 1 if the entry was created, 2 if it was upgraded.
+_UPSERT_PROVISIONAL_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 1 then return 0 end
+local id = ARGV[1]
+local function provisional(json) return string.find(json, '"provisional":true', 1, true) ~= nil end
+
+local target, old_k, old_member
+for k = 7, #KEYS, 3 do
+  if KEYS[k] == ARGV[5] then target = k end
+  local member = redis.call('HGET', KEYS[k + 1], id)
+  if member and redis.call('ZSCORE', KEYS[k], member) then old_k, old_member = k, member end
+end
+-- Entries and payloads from before the marker existed: never replace a final one
+if old_member and not provisional(old_member) then return 0 end
+local payload = redis.call('HGET', KEYS[2], id)
+if payload and not provisional(payload) then return 0 end
+
+if old_member then
+  redis.call('ZREM', KEYS[old_k], old_member)
+  redis.call('HDEL', KEYS[old_k + 1], id)
+  redis.call('HDEL', KEYS[old_k + 2], id)
+end
+redis.call('ZADD', KEYS[target], ARGV[3], ARGV[2])
+redis.call('HSET', KEYS[target + 1], id, ARGV[2])
+redis.call('HSET', KEYS[target + 2], id, ARGV[4])
+if ARGV[10] == '1' then redis.call('SADD', KEYS[6], ARGV[5]) end
+redis.call('HSET', KEYS[2], id, ARGV[6])
+redis.call('ZADD', KEYS[3], 'NX', ARGV[7], id)
+if ARGV[8] ~= '' then redis.call('GEOADD', KEYS[4], ARGV[8], ARGV[9], id) end
+redis.call('XADD', KEYS[5], '*', 'type', 'created', 'id', id, 'at', ARGV[7], 'entry', ARGV[2],
+  'score', ARGV[3], 'enqueued_at', ARGV[4], 'shard', ARGV[5], 'payload', ARGV[6])
+return old_member and 2 or 1
+"""
+_upsert_provisional_script = redis_bytes_client.register_script(_UPSERT_PROVISIONAL_LUA)
+
+PROVISIONAL_SKIPPED, PROVISIONAL_CREATED, PROVISIONAL_UPGRADED = 0, 1, 2
+
+
+def finalized_key(incident_id: str) -> str:
+    return f"{FINALIZED_KEY_PREFIX}{incident_id}"
+
+
+async def mark_finalized(incident_id: str) -> None:
+    """
+    Stop provisional updates of a streamed incident. Call before looking up
+    its provisional entry to replace or drop it: an update already running
+    has then finished, and no later one can bring it back.
+    """
+    await redis_bytes_client.set(finalized_key(incident_id), 1, ex=FINALIZED_TTL_SECONDS)
+
+
+async def upsert_provisional(incident_id: str, member: bytes, score: float, enqueued_at: float,
+                             shard: str, payload: bytes, point: Optional[Tuple[float, float]],
+                             now: float) -> int:
+    """
+    Create or upgrade a streamed call's provisional entry, its hot payload and
+    geo point (`point` is (lat, lon) or None), in one script that does nothing
+    once the call's final triage has run (see mark_finalized) or a final entry
+    or payload is already stored. Returns PROVISIONAL_SKIPPED, _CREATED or
+    _UPGRADED.
+    """
+    shards = await shard_keys()
+    if shard not in shards:
+        shards.append(shard)
+    keys = [
+        finalized_key(incident_id), TRIAGE_FULL_PAYLOADS_KEY, TRIAGE_HOT_ORDER_KEY, TRIAGE_GEO_KEY,
+        INCIDENT_EVENTS_KEY, TRIAGE_QUEUE_SHARDS_KEY, *shard_index_keys(shards),
+    ]
+    lat, lon = point if point is not None else ("", "")
+    return await _upsert_provisional_script(
+        keys=keys,
+        args=[incident_id, member, score, enqueued_at, shard, payload, now, lon, lat,
+              int(shard != TRIAGE_QUEUE_KEY)],
+    )
+
+
+def _text(value) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+def parse_found_entry(result) -> Optional[FoundEntry]:
+    if not result:
+        return None
+    member, score, enqueued_at, shard = result
+    return member, float(score), float(enqueued_at) if enqueued_at else None, _text(shard)
+
+
+async def _scan_for_entry(incident_id: str) -> Optional[FoundEntry]:
+    # Entries queued before the id index existed; index them on the way out
+    raw_entries = await redis_bytes_client.zrange(TRIAGE_QUEUE_KEY, 0, -1, withscores=True)
+    for raw_entry, score in raw_entries:
+        try:
+            payload = loads(raw_entry)
+        except json.JSONDecodeError:
+            continue
+        if payload.get("id") == incident_id:
+            await redis_bytes_client.hset(members_key(TRIAGE_QUEUE_KEY), incident_id, raw_entry)
+            enqueued_at = await redis_bytes_client.hget(enqueued_at_key(TRIAGE_QUEUE_KEY), incident_id)
+            return raw_entry, score, float(enqueued_at) if enqueued_at else None, TRIAGE_QUEUE_KEY
+    return None
+
+
+async def find_entry(incident_id: str, scan_fallback: bool = True) -> Optional[FoundEntry]:
+    """
+    Return (member, score, enqueued_at, shard key) for a queued incident, or None.
+
+    Unindexed entries (queued before the index existed) are found by a full
+    scan of the unsharded queue unless `scan_fallback` is False.
+    """
+    found = parse_found_entry(
+        await _find_entry_script(keys=shard_index_keys(await shard_keys()), args=[incident_id])
+    )
+    if found is None and scan_fallback:
+        found = await _scan_for_entry(incident_id)
+    return found
+
+
+def stage_add(pipe, incident_id: str, member: bytes, score: float, enqueued_at: float,
+              shard: str = TRIAGE_QUEUE_KEY) -> None:
+    """Queue the writes that add (or re-add) an entry."""
+    pipe.zadd(shard, {member: score})
+    pipe.hset(members_key(shard), incident_id, member)
+    pipe.hset(enqueued_at_key(shard), incident_id, enqueued_at)
+    if shard != TRIAGE_QUEUE_KEY:
+        pipe.sadd(TRIAGE_QUEUE_SHARDS_KEY, shard)
+
+
+def stage_replace(pipe, incident_id: str, old: Optional[FoundEntry], member: bytes,
+                  score: float, enqueued_at: float, shard: Optional[str] = None) -> None:
+    """
+    Queue the writes that swap an entry's member in place (e.g. a caller-count
+    update). If `shard` differs from the old entry's, the entry moves shards.
+    """
+    if shard is None:
+        shard = old[3] if old is not None else TRIAGE_QUEUE_KEY
+    if old is not None and old[3] != shard:
+        stage_remove(pipe, incident_id, old)
+    elif old is not None and old[0] != member:
+        pipe.zrem(shard, old[0])
+    stage_add(pipe, incident_id, member, score, enqueued_at, shard)
+
+
+def stage_remove(pipe, incident_id: str, found: FoundEntry) -> None:
+    """Queue the writes that take an entry off the queue."""
+    shard = found[3]
+    pipe.zrem(shard, found[0])
+    pipe.hdel(members_key(shard), incident_id)
+    pipe.hdel(enqueued_at_key(shard), incident_id)
+
+
+async def shard_keys() -> List[str]:
+    """Every queue key that may hold entries (the unsharded key is always included)."""
+    keys = {_text(key) for key in await redis_bytes_client.smembers(TRIAGE_QUEUE_SHARDS_KEY)}
+    keys.add(TRIAGE_QUEUE_KEY)
+    return sorted(keys)
+
+
+async def merged_entries(limit: Optional[int] = None, region: Optional[str] = None) -> List[Tuple[bytes, float]]:
+    """
+    (member, score) pairs, most urgent first, across all shards or only the
+    shard for `region` (a postal code or prefix).
+
+    Each shard returns at most `limit` entries from its head, and the sorted
+    lists are k-way merged, so the cost grows with the number of shards times
+    `limit`, not with the size of the whole queue.
+    """
+    keys = [shard_key(region)] if region else await shard_keys()
+    stop = limit - 1 if limit else -1
+    if len(keys) == 1:
+        return await redis_bytes_client.zrange(keys[0], 0, stop, withscores=True)
+    async with redis_bytes_client.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.zrange(key, 0, stop, withscores=True)
+        heads = await pipe.execute()
+    merged = heapq.merge(*heads, key=lambda item: item[1])
+    return list(islice(merged, limit)) if limit else list(merged)
+
@@ -0,0 +1,187 @@
+"""
+Archiving of old incident partitions.
+
+vector_store.py writes each incident to the namespace of its date's time
+bucket. The duplicate search only reads the buckets around the incident it
+checks, so old buckets are never searched again but still count towards
+index size and cost. Buckets that ended more than VECTOR_RETENTION_DAYS ago
+are archived and then dropped:
+
+    1. every record in the bucket is fetched (ids listed a page at a time)
+    2. records are written to VECTOR_ARCHIVE_DIR/<namespace>.ndjson.gz, one
+       JSON object per line in the shape get_incident_by_id returns
+    3. only if the archive holds every listed id is the namespace deleted
+
+find_archived reads an incident back from the archives of the buckets around
+its id's timestamp, so GET /agent/{id} still finds it. The archive is written
+by whichever worker holds the maintenance lock, so point VECTOR_ARCHIVE_DIR at
+storage every worker shares.
+
+The app runs this every VECTOR_MAINTENANCE_INTERVAL_SECONDS in one worker.
+It can also be run by hand:
+
+    python -m backend.vector_maintenance --dry-run
+    python -m backend.vector_maintenance --retention-days 14
+"""
+import argparse
+import asyncio
+import gzip
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from backend.redis_client import acquire_interval_lock
+from backend.serialization import dumps, loads
+from backend.vector_store import (
+    VECTOR_PARTITION_HOURS,
+    fetch_namespaces,
+    namespace_bucket_start,
+    pinecone_request,
+)
+
+VECTOR_RETENTION_DAYS = float(os.getenv("VECTOR_RETENTION_DAYS", "30"))
+VECTOR_MAINTENANCE_INTERVAL_SECONDS = float(os.getenv("VECTOR_MAINTENANCE_INTERVAL_SECONDS", "3600"))
+VECTOR_ARCHIVE_DIR = os.getenv("VECTOR_ARCHIVE_DIR", str(Path(__file__).parent / "vector_archive"))
+# Ids per list/fetch request (Pinecone's limit for both is 100)
+VECTOR_ARCHIVE_PAGE_SIZE = int(os.getenv("VECTOR_ARCHIVE_PAGE_SIZE", "100"))
+
+
+def _request(method: str, path: str, **kwargs) -> dict:
+    response = pinecone_request(method, path, **kwargs)
+    return loads(response.content) if response.content else {}
+
+
+def partition_namespaces() -> Dict[str, int]:
+    """Partition namespaces in the index and their vector counts."""
+    stats = _request("POST", "/describe_index_stats", json={})
+    return {
+        namespace: summary.get("vectorCount", 0)
+        for namespace, summary in stats.get("namespaces", {}).items()
+        if namespace_bucket_start(namespace) is not None
+    }
+
+
+def expired_namespaces(namespaces, now: Optional[datetime] = None,
+                       retention_days: float = VECTOR_RETENTION_DAYS) -> List[str]:
+    """The namespaces whose bucket ended more than `retention_days` before `now`, oldest first."""
+    cutoff = (now or datetime.now()) - timedelta(days=retention_days)
+    bucket = timedelta(hours=VECTOR_PARTITION_HOURS or 24)
+    expired = [namespace for namespace in namespaces if namespace_bucket_start(namespace) + bucket <= cutoff]
+    return sorted(expired, key=namespace_bucket_start)
+
+
+def _list_ids(namespace: str) -> Iterator[List[str]]:
+    token = None
+    while True:
+        params = {"namespace": namespace, "limit": VECTOR_ARCHIVE_PAGE_SIZE}
+        if token:
+            params["paginationToken"] = token
+        page = _request("GET", "/vectors/list", params=params)
+        ids = [vector["id"] for vector in page.get("vectors", [])]
+        if ids:
+            yield ids
+        token = (page.get("pagination") or {}).get("next")
+        if not token:
+            return
+
+
+def archive_namespace(namespace: str) -> int:
+    """
+    Write every record of `namespace` to the archive and delete the namespace.
+    Returns the number of records archived. Raises (and leaves the namespace
+    in place) if any listed record could not be fetched.
+    """
+    archive_dir = Path(VECTOR_ARCHIVE_DIR)
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    path = archive_dir / f"{namespace}.ndjson.gz"
+    partial = path.with_name(path.name + ".partial")
+
+    listed = archived = 0
+    with gzip.open(partial, "wb") as archive:
+        for ids in _list_ids(namespace):
+            listed += len(ids)
+            vectors = _request("GET", "/vectors/fetch", params={"ids": ids, "namespace": namespace}).get("vectors", {})
+            for incident_id in ids:
+                record = vectors.get(incident_id)
+                if not record:
+                    continue
+                metadata = dict(record.get("metadata") or {})
+                metadata["id"] = metadata.pop("_id", None) or incident_id
+                archive.write(dumps(metadata) + b"\n")
+                archived += 1
+    if archived != listed:
+        partial.unlink()
+        raise RuntimeError(f"Fetched {archived} of {listed} records from {namespace}; not deleting it")
+
+    partial.replace(path)
+    _request("POST", "/vectors/delete", json={"deleteAll": True, "namespace": namespace})
+    print(f"[vector_maintenance] Archived {archived} record(s) from {namespace} to {path} and dropped the namespace")
+    return archived
+
+
+def find_archived(incident_id: str) -> Optional[dict]:
+    """
+    An archived incident in the shape get_incident_by_id returns (transcript
+    still encoded), or None. Only the archives of the buckets get_incident_by_id
+    would have fetched from are read.
+    """
+    needle = dumps(incident_id)
+    for namespace in fetch_namespaces(incident_id, None, None):
+        path = Path(VECTOR_ARCHIVE_DIR) / f"{namespace}.ndjson.gz"
+        if not path.exists():
+            continue
+        with gzip.open(path, "rb") as archive:
+            for line in archive:
+                if needle in line:
+                    record = loads(line)
+                    if record.get("id") == incident_id:
+                        return record
+    return None
+
+
+def run_maintenance(now: Optional[datetime] = None, retention_days: float = VECTOR_RETENTION_DAYS,
+                    dry_run: bool = False) -> Dict[str, int]:
+    """Archive and drop every expired partition; returns records archived per namespace."""
+    if not VECTOR_PARTITION_HOURS or retention_days <= 0:
+        return {}
+    namespaces = partition_namespaces()
+    archived = {}
+    for namespace in expired_namespaces(namespaces, now, retention_days):
+        if dry_run:
+            print(f"[vector_maintenance] Would archive {namespace} ({namespaces[namespace]} records)")
+            archived[namespace] = namespaces[namespace]
+            continue
+        try:
+            archived[namespace] = archive_namespace(namespace)
+        except Exception as e:
+            print(f"[vector_maintenance] Archiving {namespace} failed: {e}")
+    return archived
+
+
+async def maintenance_loop():
+    """Background task: archive expired partitions every VECTOR_MAINTENANCE_INTERVAL_SECONDS (one worker per interval)."""
+    while True:
+        try:
+            if await acquire_interval_lock("vector_maintenance", VECTOR_MAINTENANCE_INTERVAL_SECONDS):
+                await asyncio.to_thread(run_maintenance)
+        except Exception as e:
+            print(f"[vector_maintenance] Maintenance run failed: {e}")
+        await asyncio.sleep(VECTOR_MAINTENANCE_INTERVAL_SECONDS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive and drop incident partitions past the retention window")
+    parser.add_argument("--retention-days", type=float, default=VECTOR_RETENTION_DAYS)
+    parser.add_argument("--dry-run", action="store_true", help="Only list the partitions that would be archived")
+    args = parser.parse_args()
+
+    namespaces = partition_namespaces()
+    print(f"{len(namespaces)} partition(s), {sum(namespaces.values())} record(s)")
+    archived = run_maintenance(retention_days=args.retention_days, dry_run=args.dry_run)
+    print(f"{'Would archive' if args.dry_run else 'Archived'} {sum(archived.values())} record(s) "
+          f"from {len(archived)} partition(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,28 @@
+import asyncio
+import hashlib
 import os
 import time
 import json
 import uuid
 import re
+import threading
 import requests
+import redis
+import numpy as np
+import ulid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 from datetime import datetime, timedelta
 from pathlib import Path
 from dotenv import load_dotenv
 from pinecone import Pinecone
-from typing import TypedDict, Literal, List, Optional
+from typing import Callable, Iterable, TypedDict, TypeVar, Literal, List, Optional, Tuple, Union
+from backend.serialization import dumps, loads
+from backend import outbox
+from backend import transcript_codec
+from backend.circuit_breaker import OPEN, CircuitBreaker, CircuitOpenError
+from backend.redis_client import acquire_interval_lock, create_sync_client
+from backend.postal_geo import postal_centroids
 
 env_path = Path(__file__).parent / ".env"
 print(f"Looking for env file at {env_path.resolve()}")
@@ -19,32 +33,261 @@ else:
     print("Env file not found; falling back to existing environment.")
     load_dotenv()
 
-pinecone_key = os.getenv("PINECONE_API_KEY")
-if pinecone_key:
-    print(f"PINECONE_API_KEY loaded: {pinecone_key}")
+if os.getenv("PINECONE_API_KEY"):
+    print("PINECONE_API_KEY loaded.")
 else:
     print("PINECONE_API_KEY is not set after loading env.")
 
-pc = Pinecone(pinecone_key)
-
 index_name = "dispatch-triage"
-if not pc.has_index(index_name):
+# Model the index embeds `desc` with (also used for client-side embeddings below)
+EMBED_MODEL = "llama-text-embed-v2"
+# Set to skip the describe_index call that otherwise resolves the data-plane host
+PINECONE_INDEX_HOST = os.getenv("PINECONE_INDEX_HOST", "")
+
+# The Pinecone client, index handle and index host are created on first use
+# (or by warm_up() at app startup) so importing this module never touches the network.
+_pinecone_lock = threading.Lock()
+_pc: Optional[Pinecone] = None
+_index_host: Optional[str] = None
+_dense_index = None
+
+
+def get_pinecone() -> Pinecone:
+    """The shared Pinecone client."""
+    global _pc
+    with _pinecone_lock:
+        if _pc is None:
+            _pc = Pinecone(os.getenv("PINECONE_API_KEY"))
+        return _pc
+
+
+def _ensure_index(pc: Pinecone) -> None:
+    if pc.has_index(index_name):
+        return
     print(f"Creating new Pinecone index '{index_name}'...")
     pc.create_index_for_model(
         name=index_name,
         cloud="aws",
         region="us-east-1",
         embed={
-            "model": "llama-text-embed-v2",
+            "model": EMBED_MODEL,
             # Updated to use the 'desc' field from the new schema for embeddings
             "field_map": {"text": "desc"}
         }
     )
     print("Index created.")
 
-# Get index host and connect using it (recommended approach for inference indexes)
-index_host = pc.describe_index(index_name).host
-dense_index = pc.Index(name=index_name, host=index_host)
+
+def get_index_host() -> str:
+    """Data-plane host of the index, resolved once per process (creating the index if needed)."""
+    global _index_host
+    if _index_host is not None:
+        return _index_host
+    if PINECONE_INDEX_HOST:
+        _index_host = PINECONE_INDEX_HOST
+        return _index_host
+    pc = get_pinecone()
+    with _pinecone_lock:
+        if _index_host is None:
+            _ensure_index(pc)
+            _index_host = pc.describe_index(index_name).host
+        return _index_host
+
+
+def get_index():
+    """The shared index handle (connects using the cached host, the recommended approach for inference indexes)."""
+    global _dense_index
+    if _dense_index is not None:
+        return _dense_index
+    host = get_index_host()
+    pc = get_pinecone()
+    with _pinecone_lock:
+        if _dense_index is None:
+            _dense_index = pc.Index(name=index_name, host=host)
+        return _dense_index
+
+
+def warm_up() -> None:
+    """Create the client and resolve the index now rather than on the first request."""
+    get_index()
+
+
+# Every Pinecone request has a timeout and goes through a circuit breaker, so
+# during an outage calls fail fast instead of each waiting out the timeout.
+# Writes that fail this way are queued in the outbox (outbox.py) and replayed
+# by replay_outbox() once Pinecone answers again.
+PINECONE_TIMEOUT_SECONDS = float(os.getenv("PINECONE_TIMEOUT_SECONDS", "5"))
+pinecone_breaker = CircuitBreaker("pinecone")
+# Client-side embeddings (Inference API) fail independently of the index
+inference_breaker = CircuitBreaker("pinecone_inference")
+
+T = TypeVar("T")
+
+
+class VectorStoreUnavailable(RuntimeError):
+    """Pinecone could not be searched or read (error, timeout or open circuit breaker)."""
+
+
+def _is_transient(e: Exception) -> bool:
+    """Whether an error means Pinecone is unhealthy (no answer, 429, 5xx) rather than the request being bad."""
+    if isinstance(e, CircuitOpenError):
+        return True
+    status = getattr(getattr(e, "response", None), "status_code", None) or getattr(e, "status", None)
+    return not isinstance(status, int) or status == 429 or status >= 500
+
+
+def _pinecone_call(call: Callable[[], T], breaker: CircuitBreaker = pinecone_breaker) -> T:
+    """Run one Pinecone request through `breaker`; only transient errors count against it."""
+    breaker.before_call()
+    try:
+        result = call()
+    except Exception as e:
+        if _is_transient(e):
+            breaker.record_failure()
+        else:
+            # Pinecone answered, it just rejected the request
+            breaker.record_success()
+        raise
+    breaker.record_success()
+    return result
+
+
+def _checked(response: requests.Response, allowed: tuple = ()) -> requests.Response:
+    """raise_for_status(), except for the `allowed` status codes."""
+    if response.status_code not in allowed:
+        response.raise_for_status()
+    return response
+
+
+def pinecone_request(method: str, path: str, allowed: tuple = (),
+                     timeout: float = PINECONE_TIMEOUT_SECONDS, **kwargs) -> requests.Response:
+    """One request to the index's REST API, with the timeout and circuit breaker every call gets."""
+    return _pinecone_call(lambda: _checked(requests.request(
+        method,
+        f"https://{get_index_host()}{path}",
+        headers={"Api-Key": os.getenv("PINECONE_API_KEY"), "X-Pinecone-Api-Version": "2025-10"},
+        timeout=timeout,
+        **kwargs,
+    ), allowed=allowed))
+
+
+# Incidents are written to one namespace per time bucket of their date/time,
+# e.g. "incidents-20260110" (day buckets) or "incidents-20260110-08" (8-hour
+# shifts), so a duplicate search only scans the buckets its match window
+# reaches instead of the whole history. VECTOR_PARTITION_HOURS must divide 24;
+# 0 keeps everything in the single legacy namespace.
+LEGACY_NAMESPACE = "incidents"
+VECTOR_PARTITION_HOURS = int(os.getenv("VECTOR_PARTITION_HOURS", "24"))
+if VECTOR_PARTITION_HOURS and 24 % VECTOR_PARTITION_HOURS:
+    raise ValueError(f"VECTOR_PARTITION_HOURS must divide 24, got {VECTOR_PARTITION_HOURS}")
+# A fetch by id alone looks in the buckets this close to the ULID's timestamp
+# (UTC, while bucket times are local), then in the legacy namespace
+VECTOR_FETCH_SPREAD_HOURS = float(os.getenv("VECTOR_FETCH_SPREAD_HOURS", "14"))
+_NAMESPACE_RE = re.compile(rf"^{LEGACY_NAMESPACE}-(\d{{8}})(?:-(\d{{2}}))?$")
+_search_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="pinecone-search")
+# Fetch-by-id lookups across candidate buckets run here, all at once
+_fetch_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="pinecone-fetch")
+
+
+def _parse_clock(time_: str) -> Optional[datetime]:
+    try:
+        return datetime.strptime(time_, "%H:%M")
+    except (ValueError, TypeError):
+        return None
+
+
+def _parse_moment(date: str, time_: str) -> Optional[datetime]:
+    """Incident date (MM/DD/YYYY) plus time (HH:MM) if it parses, else midnight; None without a date."""
+    try:
+        day = datetime.strptime(date, "%m/%d/%Y")
+    except (ValueError, TypeError):
+        return None
+    clock = _parse_clock(time_)
+    return day if clock is None else day.replace(hour=clock.hour, minute=clock.minute)
+
+
+def _bucket_start(moment: datetime) -> datetime:
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return day + timedelta(hours=moment.hour // VECTOR_PARTITION_HOURS * VECTOR_PARTITION_HOURS)
+
+
+def _bucket_namespace(start: datetime) -> str:
+    if VECTOR_PARTITION_HOURS == 24:
+        return f"{LEGACY_NAMESPACE}-{start:%Y%m%d}"
+    return f"{LEGACY_NAMESPACE}-{start:%Y%m%d-%H}"
+
+
+def _buckets_between(start: datetime, end: datetime) -> List[str]:
+    namespaces = []
+    bucket = _bucket_start(start)
+    while bucket <= end:
+        namespaces.append(_bucket_namespace(bucket))
+        bucket += timedelta(hours=VECTOR_PARTITION_HOURS)
+    return namespaces
+
+
+def namespace_bucket_start(namespace: str) -> Optional[datetime]:
+    """Start of the time bucket a partition namespace covers; None for other namespaces."""
+    match = _NAMESPACE_RE.match(namespace)
+    if not match:
+        return None
+    return datetime.strptime(match.group(1), "%Y%m%d") + timedelta(hours=int(match.group(2) or 0))
+
+
+def namespace_for(date: str, time_: str) -> str:
+    """Namespace an incident with this date and time is written to."""
+    moment = _parse_moment(date, time_) if VECTOR_PARTITION_HOURS else None
+    return LEGACY_NAMESPACE if moment is None else _bucket_namespace(_bucket_start(moment))
+
+
+def search_namespaces(date: str, time_: str, match_date: bool = True, match_time: bool = True,
+                      time_window_minutes: int = 30) -> List[str]:
+    """
+    Namespaces that can hold a match for an incident at `date` `time_`: the
+    buckets overlapping the time window (match_time), else the whole day
+    (match_date), else the incident's bucket and its neighbours. With
+    match_date the range never leaves the incident's day. An incident without
+    a usable date searches the current bucket and its neighbours.
+    """
+    if not VECTOR_PARTITION_HOURS:
+        return [LEGACY_NAMESPACE]
+    moment = _parse_moment(date, time_)
+    if moment is None:
+        moment, match_date, match_time = datetime.now(), False, False
+    step = timedelta(hours=VECTOR_PARTITION_HOURS)
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if match_time and _parse_clock(time_) is not None:
+        window = timedelta(minutes=time_window_minutes)
+        start, end = moment - window, moment + window
+    elif match_date:
+        start, end = day, day + timedelta(days=1) - timedelta(minutes=1)
+    else:
+        start, end = _bucket_start(moment) - step, _bucket_start(moment) + step
+    if match_date:
+        start, end = max(start, day), min(end, day + timedelta(days=1) - timedelta(minutes=1))
+    return _buckets_between(start, end)
+
+
+def fetch_namespaces(incident_id: str, date: Optional[str], time_: Optional[str]) -> List[str]:
+    """Namespaces to try, in order, when fetching an incident by id."""
+    if not VECTOR_PARTITION_HOURS:
+        return [LEGACY_NAMESPACE]
+    namespaces = []
+    if date:
+        namespaces.append(namespace_for(date, time_))
+    try:
+        minted = ulid.from_str(incident_id).timestamp().datetime.replace(tzinfo=None)
+    except ValueError:
+        minted = None
+    if minted is not None:
+        spread = timedelta(hours=VECTOR_FETCH_SPREAD_HOURS)
+        nearby = _buckets_between(minted - spread, minted + spread)
+        # Closest bucket first
+        midpoint = timedelta(hours=VECTOR_PARTITION_HOURS / 2)
+        nearby.sort(key=lambda namespace: abs(namespace_bucket_start(namespace) + midpoint - minted))
+        namespaces.extend(nearby)
+    namespaces.append(LEGACY_NAMESPACE)
+    return list(dict.fromkeys(namespaces))
 
 # --- New Schema Definitions (Triage Agent Spec) ---
 IncidentType = Literal[
@@ -149,7 +392,11 @@ def validate_record(record: dict) -> TriageRecord:
     if not isinstance(record["duration"], str) or not record["duration"].strip():
         raise ValueError("Invalid duration format. Must be a non-empty string.")
 
-    transcript_data = record.get("transcript")
+    # Accept segment lists as well as compact/legacy encoded transcripts
+    try:
+        transcript_data = transcript_codec.normalize_segments(record.get("transcript"))
+    except (ValueError, TypeError):
+        raise ValueError("Transcript could not be decoded.")
     if not isinstance(transcript_data, list) or not transcript_data:
         raise ValueError("Transcript must be a non-empty list of segments.")
     for idx, segment in enumerate(transcript_data):
@@ -163,61 +410,371 @@ def validate_record(record: dict) -> TriageRecord:
     return record
 
 
-def add_incident(json_data: str) -> bool:
+# Namespace each incident was last fetched from or written to, so a metadata
+# update goes where the record is (e.g. the legacy namespace for old records)
+# rather than to the bucket its date/time map to today.
+_record_namespaces: "OrderedDict[str, str]" = OrderedDict()
+_record_namespaces_lock = threading.Lock()
+_RECORD_NAMESPACES_MAX = 4096
+
+
+def _remember_namespace(incident_id: str, namespace: str) -> None:
+    with _record_namespaces_lock:
+        _record_namespaces[incident_id] = namespace
+        _record_namespaces.move_to_end(incident_id)
+        while len(_record_namespaces) > _RECORD_NAMESPACES_MAX:
+            _record_namespaces.popitem(last=False)
+
+
+def _known_namespace(incident_id: str) -> Optional[str]:
+    with _record_namespaces_lock:
+        return _record_namespaces.get(incident_id)
+
+
+INCIDENT_CACHE_MAX_ENTRIES = int(os.getenv("INCIDENT_CACHE_MAX_ENTRIES", "1024"))
+INCIDENT_CACHE_TTL_SECONDS = float(os.getenv("INCIDENT_CACHE_TTL_SECONDS", "300"))
+# Records are shared across workers through Redis unless INCIDENT_CACHE_REDIS=0
+# (only safe with a single worker: another worker's caller-count update would
+# not reach this process's copy)
+INCIDENT_CACHE_REDIS = os.getenv("INCIDENT_CACHE_REDIS", "1") == "1"
+# A per-process copy in front of the shared layer; off by default when shared,
+# since other workers cannot invalidate it
+INCIDENT_CACHE_LOCAL = os.getenv("INCIDENT_CACHE_LOCAL", "0" if INCIDENT_CACHE_REDIS else "1") == "1"
+INCIDENT_CACHE_REDIS_PREFIX = "incident_cache:"
+
+
+class IncidentCache:
+    """
+    Bounded LRU/TTL cache for records fetched by get_incident_by_id.
+
+    Records are kept as encoded JSON bytes so callers can mutate what they get
+    back without corrupting the cache. add_incident writes through on success
+    and invalidates on failure, which covers the caller-count and status
+    updates made from main.py. With `shared` a layer in Redis (SETEX, same
+    TTL) sits between the workers and Pinecone, and with `local` False the
+    per-process layer is skipped so every worker sees the latest write.
+    """
+
+    name = "incident_cache"
+    redis_prefix = INCIDENT_CACHE_REDIS_PREFIX
+
+    def __init__(self, max_entries: int, ttl_seconds: float, shared: bool = False, local: bool = True):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.local = local
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = (
+            # A slow cache lookup should not cost more than the Pinecone fetch it saves
+            create_sync_client(socket_timeout=0.5)
+            if shared else None
+        )
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, incident_id: str) -> Optional[dict]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(incident_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(incident_id)
+                self.hits += 1
+                return self._decode(entry[1])
+            if entry is not None:
+                del self._entries[incident_id]
+
+        if self._redis is not None:
+            try:
+                payload = self._redis.get(self.redis_prefix + incident_id)
+            except redis.RedisError as e:
+                print(f"[{self.name}] Shared cache read failed: {e}")
+                payload = None
+            if payload is not None:
+                self._store_local(incident_id, payload)
+                with self._lock:
+                    self.shared_hits += 1
+                return self._decode(payload)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _store_local(self, incident_id: str, payload: bytes) -> None:
+        if not self.local:
+            return
+        with self._lock:
+            self._entries[incident_id] = (time.monotonic() + self.ttl_seconds, payload)
+            self._entries.move_to_end(incident_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _encode(self, record: dict) -> bytes:
+        return dumps(record)
+
+    def _decode(self, payload: bytes) -> dict:
+        return loads(payload)
+
+    def put(self, incident_id: str, record: dict) -> None:
+        payload = self._encode(record)
+        self._store_local(incident_id, payload)
+        if self._redis is not None:
+            try:
+                self._redis.set(
+                    self.redis_prefix + incident_id, payload, ex=max(1, int(self.ttl_seconds))
+                )
+            except redis.RedisError as e:
+                print(f"[{self.name}] Shared cache write failed: {e}")
+
+    def invalidate(self, incident_id: str) -> None:
+        with self._lock:
+            self._entries.pop(incident_id, None)
+        if self._redis is not None:
+            try:
+                self._redis.delete(self.redis_prefix + incident_id)
+            except redis.RedisError as e:
+                print(f"[{self.name}] Shared cache invalidation failed: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "shared": self._redis is not None,
+                "local": self.local,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round((self.hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+
+incident_cache = IncidentCache(
+    INCIDENT_CACHE_MAX_ENTRIES, INCIDENT_CACHE_TTL_SECONDS, shared=INCIDENT_CACHE_REDIS,
+    local=INCIDENT_CACHE_LOCAL,
+)
+
+
+# With EMBED_PASSTHROUGH=1 each distinct `desc` is embedded once, through the
+# Inference API, and the vector is cached under a hash of the text. The
+# duplicate search and the upsert both send that vector, so the index does
+# not embed the same desc a second (or third) time. Set EMBED_PASSTHROUGH=0 to
+# let the index embed text server-side again. Passages are embedded with
+# input_type "passage" on both paths: the duplicate search compares a desc
+# with stored descs, and the reranker scores the hits against the text anyway.
+EMBED_PASSTHROUGH = os.getenv("EMBED_PASSTHROUGH", "1") == "1"
+PINECONE_INFERENCE_URL = os.getenv("PINECONE_INFERENCE_URL", "https://api.pinecone.io/embed")
+# Inputs per Inference API request (the model's limit)
+EMBED_BATCH_SIZE = 96
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "4096"))
+EMBEDDING_CACHE_TTL_SECONDS = float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", "86400"))
+# Set EMBEDDING_CACHE_REDIS=1 to share vectors across workers through Redis
+EMBEDDING_CACHE_REDIS = os.getenv("EMBEDDING_CACHE_REDIS", "0") == "1"
+EMBEDDING_CACHE_REDIS_PREFIX = "embedding:"
+
+
+class EmbeddingCache(IncidentCache):
+    """
+    The same LRU/TTL (and optional Redis) cache, holding embeddings keyed by
+    a hash of the model and text. Vectors are stored as float32 bytes.
+    """
+
+    name = "embedding_cache"
+    redis_prefix = EMBEDDING_CACHE_REDIS_PREFIX
+
+    def __init__(self, max_entries: int, ttl_seconds: float, shared: bool = False):
+        super().__init__(max_entries, ttl_seconds, shared)
+        self.api_calls = 0
+        self.texts_embedded = 0
+
+    def _encode(self, vector: List[float]) -> bytes:
+        return np.asarray(vector, dtype=np.float32).tobytes()
+
+    def _decode(self, payload: bytes) -> List[float]:
+        return np.frombuffer(payload, dtype=np.float32).tolist()
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats.update(passthrough=EMBED_PASSTHROUGH, api_calls=self.api_calls, texts_embedded=self.texts_embedded)
+        return stats
+
+
+embedding_cache = EmbeddingCache(
+    EMBEDDING_CACHE_MAX_ENTRIES, EMBEDDING_CACHE_TTL_SECONDS, shared=EMBEDDING_CACHE_REDIS
+)
+
+
+def _embedding_key(text: str) -> str:
+    return hashlib.sha256(f"{EMBED_MODEL}\n{text}".encode("utf-8")).hexdigest()
+
+
+def _embed_remote(texts: List[str]) -> List[List[float]]:
+    response = _pinecone_call(lambda: _checked(requests.post(
+        PINECONE_INFERENCE_URL,
+        data=dumps({
+            "model": EMBED_MODEL,
+            "parameters": {"input_type": "passage", "truncate": "END"},
+            "inputs": [{"text": text} for text in texts],
+        }),
+        headers={
+            "Api-Key": os.getenv("PINECONE_API_KEY"),
+            "Content-Type": "application/json",
+            "X-Pinecone-Api-Version": "2025-10",
+        },
+        timeout=PINECONE_TIMEOUT_SECONDS,
+    )), inference_breaker)
+    data = loads(response.content).get("data") or []
+    if len(data) != len(texts):
+        raise ValueError(f"Inference API returned {len(data)} embeddings for {len(texts)} inputs")
+    embedding_cache.api_calls += 1
+    embedding_cache.texts_embedded += len(texts)
+    return [item["values"] for item in data]
+
+
+def embed_texts(texts: List[str]) -> List[List[float]]:
+    """Embeddings for `texts`, computing only the ones not already cached. Raises on API errors."""
+    vectors = {}
+    for text in texts:
+        if text not in vectors:
+            vectors[text] = embedding_cache.get(_embedding_key(text))
+    missing = [text for text, vector in vectors.items() if vector is None]
+    for start in range(0, len(missing), EMBED_BATCH_SIZE):
+        batch = missing[start:start + EMBED_BATCH_SIZE]
+        for text, vector in zip(batch, _embed_remote(batch)):
+            embedding_cache.put(_embedding_key(text), vector)
+            vectors[text] = vector
+    return [vectors[text] for text in texts]
+
+
+def _passthrough_vectors(texts: List[str]) -> Optional[List[List[float]]]:
+    """Cached/computed embeddings, or None to fall back to server-side embedding."""
+    if not EMBED_PASSTHROUGH:
+        return None
+    try:
+        return embed_texts(texts)
+    except (requests.exceptions.RequestException, CircuitOpenError, ValueError, KeyError) as e:
+        print(f"[embeddings] Embedding {len(texts)} text(s) failed, index will embed server-side: {e}")
+        return None
+
+
+def _prepare_upsert_record(json_data: Union[str, bytes]) -> dict:
+    """Validate an incident and convert it to the record shape Pinecone expects."""
+    incident = loads(json_data)
+    validated = validate_record(incident)
+
+    # For integrated embedding indexes, upsert via REST API
+    # which converts the "desc" field to a vector automatically
+    record = dict(validated)
+    original_id = record.pop("id")
+    record["_id"] = original_id  # Rename "id" to "_id" for Pinecone
+
+    # Pinecone metadata only supports strings, numbers, booleans, or lists of strings
+    # Store the transcript in compact codec form (already-encoded values pass through)
+    if "transcript" in record and not transcript_codec.is_encoded(record["transcript"]):
+        record["transcript"] = transcript_codec.encode_transcript(record["transcript"])
+        print(f"[add_incident] Encoded transcript ({len(record['transcript'])} chars)")
+    return record
+
+
+def _post_upsert(records: List[dict]) -> None:
+    """
+    Upsert records with one request per partition namespace: as vectors with
+    metadata when their desc embeddings are available (EMBED_PASSTHROUGH),
+    else as NDJSON records for the index to embed. Raises requests exceptions
+    on failure.
+    """
+    vectors = _passthrough_vectors([record.get("desc", "") for record in records])
+    by_namespace: dict = {}
+    for pos, record in enumerate(records):
+        by_namespace.setdefault(namespace_for(record["date"], record["time"]), []).append(pos)
+
+    # Use REST API directly (more reliable than SDK for upsert_records)
+    api_key = os.getenv("PINECONE_API_KEY")
+    # Build REST API requests against the cached index host
+    host = get_index_host()
+    headers = {
+        "Api-Key": api_key,
+        "X-Pinecone-Api-Version": "2025-10"
+    }
+
+    for namespace, positions in by_namespace.items():
+        if vectors is not None:
+            url = f"https://{host}/vectors/upsert"
+            data = dumps({
+                "namespace": namespace,
+                "vectors": [
+                    {
+                        "id": records[pos]["_id"],
+                        "values": vectors[pos],
+                        "metadata": {field: value for field, value in records[pos].items() if field != "_id"},
+                    }
+                    for pos in positions
+                ],
+            })
+            content_type = "application/json"
+        else:
+            url = f"https://{host}/records/namespaces/{namespace}/upsert"
+            # Format as NDJSON (newline-delimited JSON)
+            data = b"".join(dumps(records[pos]) + b"\n" for pos in positions)
+            content_type = "application/x-ndjson"
+
+        print(f"[add_incident] Posting {len(positions)} record(s) to {url} ({namespace})")
+        response = _pinecone_call(lambda: _checked(requests.post(
+            url, data=data, headers={**headers, "Content-Type": content_type}, timeout=PINECONE_TIMEOUT_SECONDS
+        )))
+        print(f"[add_incident] REST API response: {response.status_code}")
+
+    # Write through so the next get_incident_by_id sees these versions
+    for record in records:
+        cached = _as_incident(record)
+        incident_cache.put(cached["id"], cached)
+        _remember_namespace(cached["id"], namespace_for(record["date"], record["time"]))
+
+
+def _as_incident(record: dict) -> dict:
+    """An upsert record (keyed "_id") back in incident form (keyed "id")."""
+    incident = dict(record)
+    incident["id"] = incident.pop("_id")
+    return incident
+
+
+def _queue_write(incident: dict, fields: Optional[List[str]] = None) -> bool:
+    """
+    Queue a write Pinecone could not take (see outbox.py) and cache the new
+    version meanwhile. Returns False if it could not be queued either.
+    """
+    try:
+        outbox.push(incident, fields)
+    except redis.RedisError as e:
+        print(f"[outbox] Could not queue write of {incident.get('id')}: {e}")
+        return False
+    incident_cache.put(incident["id"], incident)
+    return True
+
+
+def add_incident(json_data: Union[str, bytes]) -> bool:
     """
     Add an incident directly to Pinecone index from JSON string.
     
     Args:
-        json_data: JSON string containing incident data
+        json_data: JSON string or bytes containing incident data
         
     Returns:
-        bool: True if successful, False otherwise
+        bool: True if written, or queued for replay because Pinecone is
+        unavailable; False otherwise
     """
+    incident_id = None
     try:
-        incident = json.loads(json_data)
-        validated = validate_record(incident)
-        
-        # For integrated embedding indexes, upsert via REST API
-        # which converts the "desc" field to a vector automatically
-        record = dict(validated)
-        original_id = record.pop("id")
-        record["_id"] = original_id  # Rename "id" to "_id" for Pinecone
-        
-        # Pinecone metadata only supports strings, numbers, booleans, or lists of strings
-        # Convert transcript (list of objects) to a JSON string for storage
-        if "transcript" in record and isinstance(record["transcript"], list):
-            record["transcript"] = json.dumps(record["transcript"])
-            print(f"[add_incident] Serialized transcript to JSON string")
-        
-        print(f"[add_incident] Upserting record with _id={original_id}, fields={list(record.keys())}")
-        
-        # Use REST API directly (more reliable than SDK for upsert_records)
-        index_host = dense_index.describe_index_stats()  # Just to verify connection
-        
-        # Get the index host from the Pinecone client
-        namespace = "incidents"
-        api_key = os.getenv("PINECONE_API_KEY")
-        
-        # Build REST API request
-        # Get host from the index config
-        host = pc.describe_index(index_name).host
-        url = f"https://{host}/records/namespaces/{namespace}/upsert"
-        
-        headers = {
-            "Api-Key": api_key,
-            "Content-Type": "application/x-ndjson",
-            "X-Pinecone-Api-Version": "2025-10"
-        }
-        
-        # Format as NDJSON (newline-delimited JSON)
-        ndjson_data = json.dumps(record) + "\n"
-        
-        print(f"[add_incident] Posting to {url}")
-        response = requests.post(url, data=ndjson_data, headers=headers)
-        response.raise_for_status()
-        
-        print(f"[add_incident] REST API response: {response.status_code}")
-        print(f"Successfully added incident {original_id}")
+        record = _prepare_upsert_record(json_data)
+        incident_id = record["_id"]
+        print(f"[add_incident] Upserting record with _id={incident_id}, fields={list(record.keys())}")
+        _post_upsert([record])
+        print(f"Successfully added incident {incident_id}")
         return True
     except json.JSONDecodeError as e:
         print(f"JSON parsing error: {e}")
@@ -225,10 +782,15 @@ def add_incident(json_data: str) -> bool:
     except ValueError as e:
         print(f"Validation error: {e}")
         return False
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, CircuitOpenError) as e:
+        # The remote state is unknown after a failed write; drop the cached copy
+        if incident_id:
+            incident_cache.invalidate(incident_id)
         print(f"HTTP request error: {e}")
-        if hasattr(e, 'response') and e.response is not None:
+        if getattr(e, 'response', None) is not None:
             print(f"Response body: {e.response.text}")
+        if _is_transient(e):
+            return _queue_write(_as_incident(record))
         import traceback
         traceback.print_exc()
         return False
@@ -238,6 +800,182 @@ def add_incident(json_data: str) -> bool:
         traceback.print_exc()
         return False
 
+
+def _post_update(record: dict, fields: List[str], namespace: str) -> bool:
+    """Send a metadata update to `namespace`; False if the incident is not there. Raises on failure."""
+    incident_id = record["id"]
+    response = _pinecone_call(lambda: _checked(requests.post(
+        f"https://{get_index_host()}/vectors/update",
+        data=dumps({
+            "id": incident_id,
+            "setMetadata": {field: record[field] for field in fields},
+            "namespace": namespace,
+        }),
+        headers={
+            "Api-Key": os.getenv("PINECONE_API_KEY"),
+            "Content-Type": "application/json",
+            "X-Pinecone-Api-Version": "2025-10",
+        },
+        timeout=PINECONE_TIMEOUT_SECONDS,
+    ), allowed=(404,)))
+    if response.status_code == 404:
+        return False
+    incident_cache.put(incident_id, record)
+    _remember_namespace(incident_id, namespace)
+    return True
+
+
+def _update_where_stored(record: dict, fields: List[str]) -> bool:
+    """
+    Send a metadata update to the namespace that holds the incident: the one
+    it was last fetched from or written to, else the bucket of its date/time.
+    If that misses, the other candidate namespaces are looked up (as a fetch
+    would) so a record in the legacy namespace is updated there instead of
+    being copied into a bucket. False if no namespace has it. Raises on failure.
+    """
+    incident_id = record["id"]
+    namespace = _known_namespace(incident_id) or namespace_for(record.get("date"), record.get("time"))
+    if _post_update(record, fields, namespace):
+        return True
+    candidates = [
+        candidate for candidate in fetch_namespaces(incident_id, record.get("date"), record.get("time"))
+        if candidate != namespace
+    ]
+    located, _ = _fetch_first(incident_id, candidates)
+    return located is not None and _post_update(record, fields, located)
+
+
+def update_incident(record: dict, fields: Iterable[str]) -> bool:
+    """
+    Write `fields` of an incident that is already in the index as a
+    metadata-only update (e.g. callers, status), so its vector is kept and
+    nothing is re-embedded. `record` is the full updated incident: its
+    date/time pick the partition and it is written through to the cache. An
+    incident missing from the index is upserted in full instead.
+
+    While Pinecone is unavailable, and while an earlier write for the same
+    incident is still queued, the update goes to the outbox.
+    """
+    incident_id = record.get("id")
+    fields = list(fields)
+    if outbox.has(incident_id):
+        # Behind the queued write, so the two cannot land out of order
+        return _queue_write(record, fields)
+    try:
+        if not _update_where_stored(record, fields):
+            print(f"[update_incident] {incident_id} is not in the index; upserting it")
+            return add_incident(dumps(record))
+    except (requests.exceptions.RequestException, CircuitOpenError) as e:
+        if incident_id:
+            incident_cache.invalidate(incident_id)
+        print(f"[update_incident] HTTP request error for {incident_id}: {e}")
+        return _is_transient(e) and _queue_write(record, fields)
+    print(f"[update_incident] Set {fields} on {incident_id}")
+    return True
+
+
+def add_incidents(json_items: List[Union[str, bytes]]) -> List[bool]:
+    """
+    Add several incidents with a single NDJSON upsert.
+
+    Invalid items are reported as False and skipped. If the request fails
+    because Pinecone is unavailable, the valid items are queued for replay
+    (see outbox.py); any other failure reports every valid item as False.
+    """
+    results = [False] * len(json_items)
+    records = []
+    positions = []
+    for pos, json_data in enumerate(json_items):
+        try:
+            records.append(_prepare_upsert_record(json_data))
+            positions.append(pos)
+        except ValueError as e:  # includes JSON decode errors
+            print(f"[add_incidents] Skipping item {pos}: {e}")
+    if not records:
+        return results
+
+    try:
+        _post_upsert(records)
+    except (requests.exceptions.RequestException, CircuitOpenError) as e:
+        for record in records:
+            incident_cache.invalidate(record["_id"])
+        print(f"[add_incidents] HTTP request error for batch of {len(records)}: {e}")
+        if getattr(e, 'response', None) is not None:
+            print(f"Response body: {e.response.text}")
+        if _is_transient(e):
+            for pos, record in zip(positions, records):
+                results[pos] = _queue_write(_as_incident(record))
+        return results
+    except Exception as e:
+        print(f"[add_incidents] Error adding batch of {len(records)}: {e}")
+        return results
+
+    for pos in positions:
+        results[pos] = True
+    print(f"[add_incidents] Upserted {len(records)} incident(s) in one request")
+    return results
+
+
+UPSERT_BATCH_MAX_SIZE = int(os.getenv("UPSERT_BATCH_MAX_SIZE", "50"))
+UPSERT_BATCH_MAX_DELAY_SECONDS = float(os.getenv("UPSERT_BATCH_MAX_DELAY_SECONDS", "0.25"))
+
+
+class UpsertBatcher:
+    """
+    Collects concurrent add_incident calls into add_incidents batches.
+
+    A batch is flushed when it reaches UPSERT_BATCH_MAX_SIZE records or
+    UPSERT_BATCH_MAX_DELAY_SECONDS after its first record, whichever comes first.
+    `add` resolves with that record's result once its batch is written.
+    """
+
+    def __init__(self, max_size: int = UPSERT_BATCH_MAX_SIZE,
+                 max_delay: float = UPSERT_BATCH_MAX_DELAY_SECONDS):
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self._pending: list = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.batches = 0
+
+    async def add(self, json_data: Union[str, bytes]) -> bool:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((json_data, future))
+        if len(self._pending) >= self.max_size:
+            self._schedule_flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._schedule_flush)
+        return await future
+
+    def _schedule_flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._flush(batch))
+
+    async def _flush(self, batch: list) -> None:
+        self.batches += 1
+        try:
+            results = await asyncio.to_thread(add_incidents, [item for item, _ in batch])
+        except Exception as e:
+            print(f"[upsert_batcher] Batch flush failed: {e}")
+            results = [False] * len(batch)
+        for (_, future), ok in zip(batch, results):
+            if not future.done():
+                future.set_result(ok)
+
+    async def close(self) -> None:
+        """Flush anything still pending."""
+        pending = self._pending
+        self._pending = []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if pending:
+            await self._flush(pending)
+
+
 def _norm_text(s: str) -> str:
     return " ".join(s.lower().split()) if isinstance(s, str) else ""
 
@@ -251,15 +989,91 @@ def _time_within_window(time1: str, time2: str, window_minutes: int) -> bool:
     except (ValueError, TypeError):
         return False
 
-def find_similar_incidents(json_data: str, similarity_threshold: float = 0.85, top_k: int = 10, 
+def _search_namespace(namespace: str, query_text: str, top_k: int,
+                      vector: Optional[List[float]], deadline: float) -> list:
+    """
+    Reranked hits from one namespace, searched by `vector` if given, else by
+    text; a bucket nothing was written to has none. The request may only run
+    until `deadline` (time.monotonic()), so a search the caller has given up
+    on does not keep its _search_pool thread past that.
+    """
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        # The caller has already stopped waiting for this namespace
+        return []
+    if vector is not None:
+        query = {"top_k": top_k, "vector": {"values": vector}}
+    else:
+        query = {"top_k": top_k, "inputs": {'text': query_text}}
+    response = pinecone_request(
+        "POST",
+        f"/records/namespaces/{namespace}/search",
+        allowed=(404,),
+        timeout=remaining,
+        json={
+            "query": query,
+            "rerank": {
+                "model": "bge-reranker-v2-m3",
+                "top_n": top_k,
+                # Use 'desc' for reranking, against the query text even when searching by vector
+                "rank_fields": ["desc"],
+                "query": query_text,
+            },
+        },
+    )
+    if response.status_code == 404:
+        return []
+    return loads(response.content).get('result', {}).get('hits', [])
+
+
+def _search_all(namespaces: List[str], query_text: str, top_k: int,
+                vector: Optional[List[float]] = None) -> list:
+    """
+    The best `top_k` hits across `namespaces`, searched in parallel. Raises
+    VectorStoreUnavailable if a search fails or they take longer than
+    PINECONE_TIMEOUT_SECONDS together. Searches not yet started by then are
+    cancelled and running ones time out at the same deadline.
+    """
+    deadline = time.monotonic() + PINECONE_TIMEOUT_SECONDS
+    futures = [
+        _search_pool.submit(_search_namespace, namespace, query_text, top_k, vector, deadline)
+        for namespace in namespaces
+    ]
+    all_hits = []
+    try:
+        for future in futures:
+            all_hits.extend(future.result(timeout=max(deadline - time.monotonic(), 0)))
+    except FuturesTimeoutError:
+        pinecone_breaker.record_failure()
+        raise VectorStoreUnavailable(f"Pinecone search took longer than {PINECONE_TIMEOUT_SECONDS}s")
+    except Exception as e:
+        raise VectorStoreUnavailable(f"Pinecone search failed: {e}") from e
+    finally:
+        for future in futures:
+            future.cancel()
+    # Reranker scores are comparable across namespaces; keep the best top_k overall
+    all_hits.sort(key=lambda hit: float(hit.get('_score', 0.0)), reverse=True)
+    del all_hits[top_k:]
+    return all_hits
+
+
+def find_similar_incidents(json_data: Union[str, bytes], similarity_threshold: float = 0.85, top_k: int = 10, 
                            match_incident_type: bool = True, match_postal_code: bool = False, 
                            match_date: bool = True, match_time: bool = True, 
-                           time_window_minutes: int = 30) -> list:
+                           time_window_minutes: int = 30,
+                           radius_km: Optional[float] = None) -> list:
     """
     Find similar or duplicate incidents in the database, filtered by metadata.
+
+    With `radius_km`, hits whose postal-code centroid is farther than that from
+    the input location are dropped. Hits where either location cannot be
+    resolved are kept, since the distance is unknown.
+
+    Raises VectorStoreUnavailable when Pinecone cannot be searched, so that
+    an outage is not mistaken for "no duplicates".
     """
     try:
-        incident = json.loads(json_data)
+        incident = loads(json_data)
         # Use 'desc' for the query text, matching the new schema
         query_text = incident.get("desc", "")
         if not query_text:
@@ -275,23 +1089,14 @@ def find_similar_incidents(json_data: str, similarity_threshold: float = 0.85, t
         print(f"[find_similar] Query desc: {query_text[:100]}...")
         print(f"[find_similar] Input metadata: type={input_type}, location={input_location}, date={input_date}, time={input_time}")
 
-        results = dense_index.search(
-            namespace="incidents",
-            query={
-                "top_k": top_k,
-                "inputs": {'text': query_text}
-            },
-            rerank={
-                "model": "bge-reranker-v2-m3",
-                "top_n": top_k,
-                # Use 'desc' for reranking
-                "rank_fields": ["desc"]
-            }
-        )
+        namespaces = search_namespaces(input_date, input_time, match_date, match_time, time_window_minutes)
+        # Embedded once here; the upsert of this incident reuses the cached vector
+        vectors = _passthrough_vectors([query_text])
+        vector = vectors[0] if vectors else None
+        all_hits = _search_all(namespaces, query_text, top_k, vector)
 
         # DEBUG: Print top 5 raw results before filtering
-        all_hits = results.get('result', {}).get('hits', [])
-        print(f"[find_similar] DEBUG: Found {len(all_hits)} total results from Pinecone")
+        print(f"[find_similar] DEBUG: Found {len(all_hits)} total results from Pinecone in {namespaces}")
         print(f"[find_similar] DEBUG: Top 5 results BEFORE filtering (threshold={similarity_threshold}):")
         for i, hit in enumerate(all_hits[:5]):
             hit_score = float(hit.get('_score', 0.0))
@@ -307,8 +1112,10 @@ def find_similar_incidents(json_data: str, similarity_threshold: float = 0.85, t
             loc_match = "✓" if hit_loc == input_location else "✗"
             date_match = "✓" if hit_date == input_date else "✗"
             time_match = "✓" if _time_within_window(input_time, hit_time, time_window_minutes) else "✗"
+            hit_distance = postal_centroids.distance_km(input_location, hit_loc)
+            distance_text = "?" if hit_distance is None else f"{hit_distance:.1f}km"
             score_match = "✓" if hit_score >= similarity_threshold else "✗"
-            print(f"       Filters: type={type_match} loc={loc_match} date={date_match} time={time_match} score>={similarity_threshold}={score_match}")
+            print(f"       Filters: type={type_match} loc={loc_match} dist={distance_text} date={date_match} time={time_match} score>={similarity_threshold}={score_match}")
 
         q_norm = _norm_text(query_text)
         similar_incidents = []
@@ -326,6 +1133,9 @@ def find_similar_incidents(json_data: str, similarity_threshold: float = 0.85, t
                 continue
             if match_postal_code and hit_location != input_location:
                 continue
+            distance_km = postal_centroids.distance_km(input_location, hit_location)
+            if radius_km is not None and distance_km is not None and distance_km > radius_km:
+                continue
             if match_date and hit_date != input_date:
                 continue
             if match_time and not _time_within_window(input_time, hit_time, time_window_minutes):
@@ -349,6 +1159,7 @@ def find_similar_incidents(json_data: str, similarity_threshold: float = 0.85, t
                     "metadata_match": {
                         "incidentType": hit_type == input_type,
                         "location": hit_location == input_location,
+                        "distance_km": None if distance_km is None else round(distance_km, 2),
                         "date": hit_date == input_date,
                         "time_within_window": _time_within_window(input_time, hit_time, time_window_minutes)
                     }
@@ -359,49 +1170,103 @@ def find_similar_incidents(json_data: str, similarity_threshold: float = 0.85, t
     except json.JSONDecodeError as e:
         print(f"JSON parsing error: {e}")
         return []
+    except VectorStoreUnavailable:
+        raise
     except Exception as e:
         print(f"Error finding similar incidents: {e}")
         return []
 
 
-def get_incident_by_id(incident_id: str) -> Optional[dict]:
+def _fetch_from(namespace: str, incident_id: str) -> Optional[dict]:
+    """The fetched vector (id, values, metadata) from one namespace, or None. Raises on failure."""
+    response = _pinecone_call(lambda: _checked(requests.get(
+        f"https://{get_index_host()}/vectors/fetch",
+        headers={
+            "Api-Key": os.getenv("PINECONE_API_KEY"),
+            "X-Pinecone-Api-Version": "2025-10",
+        },
+        params={"ids": [incident_id], "namespace": namespace},
+        timeout=PINECONE_TIMEOUT_SECONDS,
+    ), allowed=(404,)))
+    if response.status_code == 404:
+        # Nothing was ever written to this bucket
+        return None
+    # Response structure: { "vectors": { "<id>": { "id": "...", "values": [...], "metadata": {...} } } }
+    return loads(response.content).get("vectors", {}).get(incident_id) or None
+
+
+def _fetch_first(incident_id: str, namespaces: List[str]) -> Tuple[Optional[str], Optional[dict]]:
+    """
+    Fetch from all `namespaces` at once. Returns (namespace, vector) for the
+    first namespace in order that has the incident, or (None, None). A failed
+    lookup is only raised if no namespace had it.
+    """
+    if not namespaces:
+        return None, None
+    if len(namespaces) == 1:
+        found = _fetch_from(namespaces[0], incident_id)
+        return (namespaces[0], found) if found else (None, None)
+    futures = [_fetch_pool.submit(_fetch_from, namespace, incident_id) for namespace in namespaces]
+    error = None
+    for namespace, future in zip(namespaces, futures):
+        try:
+            found = future.result()
+        except Exception as e:
+            error = error or e
+            continue
+        if found:
+            for pending in futures:
+                pending.cancel()
+            return namespace, found
+    if error is not None:
+        raise error
+    return None, None
+
+
+def get_incident_by_id(incident_id: str, decode_transcript: bool = True,
+                       date: Optional[str] = None, time_: Optional[str] = None) -> Optional[dict]:
     """
     Fetch a single incident from Pinecone by ULID.
 
+    Pass `decode_transcript=False` when the record is only going to be written
+    back (e.g. a caller-count update); the compact transcript is then left as-is.
+    Pass the incident's `date`/`time_` when known (e.g. from a search hit) so
+    the right partition is fetched first. Otherwise, or if it misses, the
+    buckets around the ULID's timestamp and the legacy namespace are fetched
+    concurrently and the closest one holding the record wins. This blocks on
+    HTTP; call it through asyncio.to_thread from async code.
+
     Returns:
         dict: Incident payload if found.
         None: If no record matches the ULID.
+
+    Raises VectorStoreUnavailable when Pinecone could not be asked (error,
+    timeout or open circuit breaker), so an outage is not taken for a miss.
     """
     if not isinstance(incident_id, str) or len(incident_id) != 26:
         raise ValueError("incident_id must be a 26-character ULID string.")
 
-    try:
-        host = pc.describe_index(index_name).host
-        namespace = "incidents"
-        # Use GET /vectors/fetch with query params (correct Pinecone data-plane endpoint)
-        url = f"https://{host}/vectors/fetch"
-        headers = {
-            "Api-Key": os.getenv("PINECONE_API_KEY"),
-            "X-Pinecone-Api-Version": "2025-10",
-        }
-        params = {
-            "ids": [incident_id],
-            "namespace": namespace,
-        }
-
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()
-        body = response.json()
-        
-        print(f"[get_incident_by_id] Pinecone response: {json.dumps(body)}")
+    cached = incident_cache.get(incident_id)
+    if cached is not None:
+        print(f"[get_incident_by_id] Cache hit for {incident_id}")
+        if decode_transcript:
+            transcript_codec.decode_record_transcript(cached)
+        return cached
 
-        # Response structure: { "vectors": { "<id>": { "id": "...", "values": [...], "metadata": {...} } } }
-        vectors = body.get("vectors", {})
-        record_obj = vectors.get(incident_id)
+    try:
+        namespaces = fetch_namespaces(incident_id, date, time_)
+        if date:
+            # The bucket of a known date/time nearly always has it; the rest only on a miss
+            namespace, record_obj = _fetch_first(incident_id, namespaces[:1])
+            if record_obj is None:
+                namespace, record_obj = _fetch_first(incident_id, namespaces[1:])
+        else:
+            namespace, record_obj = _fetch_first(incident_id, namespaces)
 
         if not record_obj:
             print(f"[get_incident_by_id] No record found for {incident_id}")
             return None
+        print(f"[get_incident_by_id] Found {incident_id} in {namespace}")
 
         # For /vectors/fetch, fields are stored in "metadata"
         metadata = record_obj.get("metadata", {})
@@ -411,21 +1276,24 @@ def get_incident_by_id(incident_id: str) -> Optional[dict]:
             print(f"[get_incident_by_id] Record structure: {json.dumps(record_obj)}")
             return None
 
-        # Transcript is stored as a JSON string; deserialize if needed.
-        transcript_raw = metadata.get("transcript")
-        if isinstance(transcript_raw, str):
-            try:
-                metadata["transcript"] = json.loads(transcript_raw)
-            except json.JSONDecodeError:
-                # Leave as-is if it cannot be parsed
-                pass
-
         metadata["id"] = metadata.get("id") or metadata.get("_id") or incident_id
+        metadata.pop("_id", None)
+        incident_cache.put(incident_id, metadata)
+        _remember_namespace(incident_id, namespace)
+
+        # Transcript is stored encoded (compact codec or legacy JSON string)
+        if decode_transcript:
+            transcript_codec.decode_record_transcript(metadata)
         return metadata
+    except CircuitOpenError as e:
+        print(f"[get_incident_by_id] {e}; not fetching {incident_id}")
+        raise VectorStoreUnavailable(str(e)) from e
     except requests.exceptions.RequestException as e:
         print(f"[get_incident_by_id] HTTP request error: {e}")
         if hasattr(e, "response") and e.response is not None:
             print(f"[get_incident_by_id] Response body: {e.response.text}")
+        if _is_transient(e):
+            raise VectorStoreUnavailable(f"Pinecone fetch failed: {e}") from e
         return None
     except Exception as e:
         print(f"[get_incident_by_id] Unexpected error: {e}")
@@ -434,3 +1302,80 @@ def get_incident_by_id(incident_id: str) -> Optional[dict]:
         return None
 
 
+OUTBOX_REPLAY_INTERVAL_SECONDS = float(os.getenv("OUTBOX_REPLAY_INTERVAL_SECONDS", "5"))
+OUTBOX_REPLAY_BATCH = int(os.getenv("OUTBOX_REPLAY_BATCH", "50"))
+
+
+def _drop_queued(incident_id: str, raw: bytes, entry: dict, error: Exception) -> None:
+    outbox.ack(incident_id, raw)
+    print(f"[outbox] Dropping queued {entry['op']} of {incident_id}, rejected by Pinecone: {error}")
+
+
+def _replay_upserts(upserts: list) -> int:
+    """Upsert (id, raw entry, entry, record) items in one request; raises on a transient failure."""
+    try:
+        _post_upsert([record for *_, record in upserts])
+    except requests.exceptions.RequestException as e:
+        if _is_transient(e):
+            raise
+        if len(upserts) > 1:
+            # One bad record rejects the whole request; find it
+            return sum(_replay_upserts([item]) for item in upserts)
+        _drop_queued(*upserts[0][:3], e)
+        return 0
+    return sum(outbox.ack(incident_id, raw) for incident_id, raw, *_ in upserts)
+
+
+def _replay_batch(entries: list) -> int:
+    replayed = 0
+    upserts = []
+    for incident_id, raw, entry in entries:
+        try:
+            if entry["op"] == outbox.UPDATE and _update_where_stored(entry["record"], entry["fields"]):
+                replayed += outbox.ack(incident_id, raw)
+                continue
+            # Upserts, and updates of incidents whose upsert never reached the index
+            upserts.append((incident_id, raw, entry, _prepare_upsert_record(dumps(entry["record"]))))
+        except requests.exceptions.RequestException as e:
+            if _is_transient(e):
+                raise
+            _drop_queued(incident_id, raw, entry, e)
+        except ValueError as e:
+            _drop_queued(incident_id, raw, entry, e)
+    if upserts:
+        replayed += _replay_upserts(upserts)
+    return replayed
+
+
+def replay_outbox(batch_size: int = OUTBOX_REPLAY_BATCH) -> int:
+    """
+    Write queued incidents to Pinecone, oldest first, until the outbox is
+    empty or Pinecone fails again. Upserts in a batch share one request.
+    Does nothing while the breaker is open. Returns the number of writes replayed.
+    """
+    replayed = 0
+    while pinecone_breaker.state != OPEN:
+        entries = outbox.peek(batch_size)
+        if not entries:
+            break
+        try:
+            replayed += _replay_batch(entries)
+        except (requests.exceptions.RequestException, CircuitOpenError) as e:
+            print(f"[outbox] Replay stopped with {outbox.pending()} write(s) queued: {e}")
+            break
+        if len(entries) < batch_size:
+            break
+    if replayed:
+        print(f"[outbox] Replayed {replayed} queued write(s) to Pinecone")
+    return replayed
+
+
+async def outbox_replay_loop():
+    """Background task: replay queued writes every OUTBOX_REPLAY_INTERVAL_SECONDS (one worker per interval)."""
+    while True:
+        try:
+            if await acquire_interval_lock("outbox_replay", OUTBOX_REPLAY_INTERVAL_SECONDS):
+                await asyncio.to_thread(replay_outbox)
+        except Exception as e:
+            print(f"[outbox] Replay failed: {e}")
+        await asyncio.sleep(OUTBOX_REPLAY_INTERVAL_SECONDS)
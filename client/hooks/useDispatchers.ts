@@ -1,7 +1,7 @@
 "use client";
 
-import { useEffect, useState, useRef, useCallback } from "react";
-import { QueueItem, removeFromQueue } from "@/lib/api";
+import { useEffect, useState, useRef, useCallback, useMemo } from "react";
+import { QueueItem, claimNextCall, completeLease, renewLease } from "@/lib/api";
 import { generateUlid } from "@/lib/ulid";
 
 // TranscriptIn shape (matches backend)
@@ -25,6 +25,8 @@ export interface Dispatcher {
   callId: string | null; // For queue calls: backend ID. For current calls: clientId.
   endTime: number | null;
   isCurrentCall: boolean; // True if this is a current call (client-only, no backend interaction)
+  leaseToken: string | null; // For queue calls: token of the server-side lease
+  leaseExpiresAt: number | null; // Lease expiry (ms since epoch)
 }
 
 // Define the shape of the simulation configuration
@@ -56,6 +58,21 @@ const getHandleDuration = (handleTime: string): number => {
   }
 };
 
+// Server-side lease length; busy dispatchers renew it until the call is done
+const LEASE_SECONDS = 60;
+// Renew a lease once it has less than this long left
+const LEASE_RENEW_MARGIN_MS = 20 * 1000;
+
+const idleDispatcher = (dispatcher: Dispatcher): Dispatcher => ({
+  ...dispatcher,
+  status: "idle",
+  callId: null,
+  endTime: null,
+  isCurrentCall: false,
+  leaseToken: null,
+  leaseExpiresAt: null,
+});
+
 interface UseDispatcherReturn {
   dispatchers: Dispatcher[];
   claimedQueueIds: Set<string>;
@@ -75,16 +92,17 @@ export function useDispatchers(
     onLog?.(message);
   }, [onLog]);
   const [dispatchers, setDispatchers] = useState<Dispatcher[]>([]);
-  const [claimedQueueIds, setClaimedQueueIds] = useState<Set<string>>(
-    new Set()
-  );
   // Queue of pending current calls (client-only) waiting for a dispatcher
   const [pendingCurrentCalls, setPendingCurrentCalls] = useState<CustomCall[]>([]);
 
-  // Track IDs that have already had DELETE called (idempotency guard)
+  // Track IDs whose lease has already been completed (idempotency guard)
   const removedIdsRef = useRef<Set<string>>(new Set());
-  // Track IDs currently being removed (in-flight guard)
+  // Track IDs currently being completed (in-flight guard)
   const removeInFlightRef = useRef<Set<string>>(new Set());
+  // Dispatcher IDs waiting on a POST /queue/claim
+  const claimInFlightRef = useRef<Set<number>>(new Set());
+  // Call IDs waiting on a lease renewal
+  const renewInFlightRef = useRef<Set<string>>(new Set());
 
   // Use a ref to keep track of the latest queue without re-triggering the effect
   const queueRef = useRef(queue);
@@ -128,6 +146,8 @@ export function useDispatchers(
           callId: currentCall.clientId,
           endTime: now + getHandleDuration(config.initialBusyHandleTime),
           isCurrentCall: true,
+          leaseToken: null,
+          leaseExpiresAt: null,
         });
       } else {
         // This dispatcher starts idle
@@ -137,6 +157,8 @@ export function useDispatchers(
           callId: null,
           endTime: null,
           isCurrentCall: false,
+          leaseToken: null,
+          leaseExpiresAt: null,
         });
       }
     }
@@ -148,10 +170,11 @@ export function useDispatchers(
 
     setDispatchers(initialDispatchers);
     setPendingCurrentCalls(overflowCurrentCalls);
-    // Reset claimed IDs on config change
-    setClaimedQueueIds(new Set());
+    // Reset request guards on config change (leases still held run out on the server)
     removedIdsRef.current = new Set();
     removeInFlightRef.current = new Set();
+    claimInFlightRef.current = new Set();
+    renewInFlightRef.current = new Set();
   }, [
     config.dispatchers,
     config.initialBusyDispatchers,
@@ -159,12 +182,84 @@ export function useDispatchers(
     config.customCurrentCalls,
   ]);
 
+  // Ask the server for the most urgent unclaimed call on behalf of an idle dispatcher
+  const claimForDispatcher = useCallback(
+    (dispatcherId: number) => {
+      claimInFlightRef.current.add(dispatcherId);
+      claimNextCall(`dispatcher-${dispatcherId}`, {
+        leaseSeconds: LEASE_SECONDS,
+        exclude: selectedCallId ? [selectedCallId] : [],
+      })
+        .then((lease) => {
+          if (!lease) return;
+          log(
+            `[Dispatcher ${dispatcherId}] claimed queue call ...${lease.id.slice(-8)}`
+          );
+          setDispatchers((prev) =>
+            prev.map((d) =>
+              d.id === dispatcherId && d.status === "idle"
+                ? {
+                    ...d,
+                    status: "busy",
+                    callId: lease.id,
+                    endTime: Date.now() + getHandleDuration(config.handleTime),
+                    isCurrentCall: false,
+                    leaseToken: lease.token,
+                    leaseExpiresAt: lease.expires_at * 1000,
+                  }
+                : d
+            )
+          );
+          refetchQueue();
+        })
+        .catch((err) => {
+          log(
+            `[Dispatcher ${dispatcherId}] failed to claim a queue call: ${err.message || err}`
+          );
+        })
+        .finally(() => {
+          claimInFlightRef.current.delete(dispatcherId);
+        });
+    },
+    [config.handleTime, selectedCallId, refetchQueue, log]
+  );
+
+  const renewDispatcherLease = useCallback(
+    (dispatcher: Dispatcher) => {
+      const callId = dispatcher.callId!;
+      const token = dispatcher.leaseToken!;
+      renewInFlightRef.current.add(callId);
+      renewLease(callId, token, LEASE_SECONDS)
+        .then((lease) => {
+          setDispatchers((prev) =>
+            prev.map((d) =>
+              d.leaseToken === token
+                ? { ...d, leaseExpiresAt: lease.expires_at * 1000 }
+                : d
+            )
+          );
+        })
+        .catch((err) => {
+          // The lease expired and the call went back to the queue; stop working on it
+          log(
+            `[Dispatcher ${dispatcher.id}] lost lease on call ...${callId.slice(-8)}: ${err.message || err}`
+          );
+          setDispatchers((prev) =>
+            prev.map((d) => (d.leaseToken === token ? idleDispatcher(d) : d))
+          );
+        })
+        .finally(() => {
+          renewInFlightRef.current.delete(callId);
+        });
+    },
+    [log]
+  );
+
   const processDispatchers = useCallback(() => {
     const currentQueue = queueRef.current;
 
     setDispatchers((prevDispatchers) => {
       const newDispatchers = [...prevDispatchers];
-      const newClaimedIds = new Set(claimedQueueIds);
 
       // First pass: check if any busy dispatchers are done
       for (let i = 0; i < newDispatchers.length; i++) {
@@ -181,34 +276,28 @@ export function useDispatchers(
             }`
           );
 
-          // If this was a queue call (not current call), send DELETE
-          if (!dispatcher.isCurrentCall && dispatcher.callId) {
+          // If this was a queue call (not current call), complete its lease
+          if (!dispatcher.isCurrentCall && dispatcher.callId && dispatcher.leaseToken) {
             const callIdToRemove = dispatcher.callId;
 
-            // Idempotency check: only remove if not already removed or in-flight
+            // Idempotency check: only complete if not already completed or in-flight
             if (
               !removedIdsRef.current.has(callIdToRemove) &&
               !removeInFlightRef.current.has(callIdToRemove)
             ) {
               removeInFlightRef.current.add(callIdToRemove);
 
-              removeFromQueue(callIdToRemove)
+              completeLease(callIdToRemove, dispatcher.leaseToken)
                 .then(() => {
                   log(
-                    `[Dispatcher ${dispatcher.id}] removed call ...${callIdToRemove.slice(-8)} from backend`
+                    `[Dispatcher ${dispatcher.id}] completed call ...${callIdToRemove.slice(-8)} on backend`
                   );
                   removedIdsRef.current.add(callIdToRemove);
-                  // Remove from claimed set
-                  setClaimedQueueIds((prev) => {
-                    const updated = new Set(prev);
-                    updated.delete(callIdToRemove);
-                    return updated;
-                  });
                   refetchQueue();
                 })
                 .catch((err) => {
                   log(
-                    `[Dispatcher ${dispatcher.id}] failed to remove call ...${callIdToRemove.slice(-8)}: ${err.message || err}`
+                    `[Dispatcher ${dispatcher.id}] failed to complete call ...${callIdToRemove.slice(-8)}: ${err.message || err}`
                   );
                 })
                 .finally(() => {
@@ -218,13 +307,16 @@ export function useDispatchers(
           }
 
           // Reset dispatcher to idle
-          newDispatchers[i] = {
-            ...dispatcher,
-            status: "idle",
-            callId: null,
-            endTime: null,
-            isCurrentCall: false,
-          };
+          newDispatchers[i] = idleDispatcher(dispatcher);
+        } else if (
+          dispatcher.status === "busy" &&
+          dispatcher.leaseToken &&
+          dispatcher.leaseExpiresAt &&
+          dispatcher.leaseExpiresAt - Date.now() < LEASE_RENEW_MARGIN_MS &&
+          !renewInFlightRef.current.has(dispatcher.callId!)
+        ) {
+          // Still on the call: keep the lease alive
+          renewDispatcherLease(dispatcher);
         }
       }
 
@@ -234,7 +326,6 @@ export function useDispatchers(
 
         const remainingPending = [...prevPending];
         const now = Date.now();
-        const assigned: Array<{ dispatcherId: number; callSuffix: string }> = [];
 
         for (let i = 0; i < newDispatchers.length; i++) {
           const dispatcher = newDispatchers[i];
@@ -252,73 +343,62 @@ export function useDispatchers(
               callId: nextCurrentCall.clientId,
               endTime: now + getHandleDuration(config.initialBusyHandleTime),
               isCurrentCall: true,
+              leaseToken: null,
+              leaseExpiresAt: null,
             };
-            assigned.push({
-              dispatcherId: dispatcher.id,
-              callSuffix: nextCurrentCall.clientId.slice(-8),
-            });
           }
         }
 
         return remainingPending;
       });
 
-      // Third pass: only if no pending current calls, idle dispatchers pick from queue
-      // Check if there are still pending current calls
-      // Note: we use a ref-like check since setPendingCurrentCalls is async
-      // For now, we'll block queue pickup if any dispatcher is handling a current call
-      // or if there might be pending ones (conservative approach)
+      // Third pass: only if no pending current calls, idle dispatchers claim from the queue.
+      // The server picks the call and guarantees no two dispatchers get the same one;
+      // the polled queue only tells us whether a claim is worth sending.
       const hasCurrentCallsActive = newDispatchers.some((d) => d.isCurrentCall);
 
       if (!hasCurrentCallsActive && currentQueue && currentQueue.length > 0) {
-        for (let i = 0; i < newDispatchers.length; i++) {
-          const dispatcher = newDispatchers[i];
-
-          if (dispatcher.status === "idle") {
-            // Find a call that:
-            // 1. Is not selected by the user
-            // 2. Has not been claimed by another dispatcher
-            // 3. Has not been removed already
-            const availableCall = currentQueue.find(
-              (call) =>
-                call.id !== selectedCallId &&
-                !newClaimedIds.has(call.id) &&
-                !removedIdsRef.current.has(call.id)
-            );
-
-            if (availableCall) {
-              // Claim this call immediately (client-side)
-              newClaimedIds.add(availableCall.id);
-
-              log(
-                `[Dispatcher ${dispatcher.id}] claiming queue call ...${availableCall.id.slice(-8)}`
-              );
-
-              newDispatchers[i] = {
-                ...dispatcher,
-                status: "busy",
-                callId: availableCall.id,
-                endTime: Date.now() + getHandleDuration(config.handleTime),
-                isCurrentCall: false,
-              };
-            }
+        const leasedIds = new Set(
+          newDispatchers.filter((d) => d.leaseToken).map((d) => d.callId)
+        );
+        let claimable = currentQueue.filter(
+          (call) =>
+            call.id !== selectedCallId &&
+            !leasedIds.has(call.id) &&
+            !removedIdsRef.current.has(call.id)
+        ).length - claimInFlightRef.current.size;
+
+        for (const dispatcher of newDispatchers) {
+          if (claimable <= 0) break;
+          if (
+            dispatcher.status === "idle" &&
+            !claimInFlightRef.current.has(dispatcher.id)
+          ) {
+            claimForDispatcher(dispatcher.id);
+            claimable--;
           }
         }
       }
 
-      // Update claimed IDs state
-      if (newClaimedIds.size !== claimedQueueIds.size) {
-        setClaimedQueueIds(newClaimedIds);
-      }
-
       return newDispatchers;
     });
-  }, [config.handleTime, config.initialBusyHandleTime, selectedCallId, claimedQueueIds, refetchQueue, log]);
+  }, [config.initialBusyHandleTime, selectedCallId, refetchQueue, log, claimForDispatcher, renewDispatcherLease]);
 
   useEffect(() => {
     const interval = setInterval(processDispatchers, 1000); // Check every second
     return () => clearInterval(interval);
   }, [processDispatchers]);
 
+  // Queue calls currently leased by one of our dispatchers
+  const claimedQueueIds = useMemo(
+    () =>
+      new Set(
+        dispatchers
+          .filter((d) => d.status === "busy" && !d.isCurrentCall && d.callId)
+          .map((d) => d.callId!)
+      ),
+    [dispatchers]
+  );
+
   return { dispatchers, claimedQueueIds, pendingCurrentCallsCount: pendingCurrentCalls.length };
 }
@@ -32,6 +32,10 @@ export async function apiFetch<T>(
     );
   }
 
+  if (res.status === 204) {
+    return undefined as T;
+  }
+
   return res.json();
 }
 
@@ -87,6 +91,64 @@ export async function fetchQueue(signal?: AbortSignal): Promise<QueueItem[]> {
   return apiFetch<QueueItem[]>("/queue", { signal });
 }
 
+/**
+ * Helpers for the /queue/claim and /queue/leases endpoints.
+ * A lease gives one dispatcher exclusive ownership of a queue entry until
+ * expires_at (epoch seconds); renew it before then or it returns to the queue.
+ */
+export interface QueueLease {
+  id: string;
+  dispatcher: string;
+  token: string;
+  entry: QueueItem;
+  score: number | null;
+  shard: string;
+  enqueued_at: number | null;
+  claimed_at: number;
+  expires_at: number;
+}
+
+export async function claimNextCall(
+  dispatcher: string,
+  options?: { sector?: string; leaseSeconds?: number; exclude?: string[] }
+): Promise<QueueLease | null> {
+  const lease = await apiFetch<QueueLease | undefined>("/queue/claim", {
+    method: "POST",
+    body: JSON.stringify({
+      dispatcher,
+      sector: options?.sector,
+      lease_seconds: options?.leaseSeconds,
+      exclude: options?.exclude ?? [],
+    }),
+  });
+  return lease ?? null;
+}
+
+export async function renewLease(
+  id: string,
+  token: string,
+  leaseSeconds?: number
+): Promise<QueueLease> {
+  return apiFetch<QueueLease>(`/queue/leases/${id}/renew`, {
+    method: "POST",
+    body: JSON.stringify({ token, lease_seconds: leaseSeconds }),
+  });
+}
+
+export async function releaseLease(id: string, token: string): Promise<void> {
+  await apiFetch(`/queue/leases/${id}/release`, {
+    method: "POST",
+    body: JSON.stringify({ token }),
+  });
+}
+
+export async function completeLease(id: string, token: string): Promise<void> {
+  await apiFetch(`/queue/leases/${id}/complete`, {
+    method: "POST",
+    body: JSON.stringify({ token }),
+  });
+}
+
 /**
  * GET helper for /agent/{id} endpoint.
  */